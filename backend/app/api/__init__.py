@@ -19,12 +19,21 @@ def create_app():
     async def internal_server_error_exception_handler(request: Request, exc: Exception):
         return JSONResponse(status_code=500, content={"detail": str(exc)})
 
-    from .routers import users, videos, auth, banned
+    # A claim relies on unique constraints create_all does not add to an
+    # existing table
+    @app.on_event("startup")
+    def check_database_schema():
+        from .database import engine, check_schema
+
+        check_schema(bind=engine)
+
+    from .routers import users, videos, auth, banned, mentions
     from .internal import admin
 
     app.include_router(users.router)
     app.include_router(videos.router)
     app.include_router(banned.router)
+    app.include_router(mentions.router)
     app.include_router(auth.router)
     app.include_router(admin.router)
 
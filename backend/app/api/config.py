@@ -18,6 +18,9 @@ class Settings(BaseSettings):
     TWITTER_API_KEY_SECRET: str
     TWITTER_ACCESS_TOKEN: str
     TWITTER_ACCESS_TOKEN_SECRET: str
+    TWITTER_POOL_MAXSIZE: int = 10
+    # Seconds after which a claim without reply frees its request of the video
+    CLAIM_TIMEOUT: int = 3600
 
 
 # lru_cache pour par relire le fichier .env à chaque exécution de la fonction
@@ -2,8 +2,34 @@ from api import logger, models, schemas
 from api.tools import basic_tools
 from api.tools.error_tools import exception, retry
 
+from typing import List
+
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 
+# Operations of the banned changes
+CHANGE_CREATED = "created"
+CHANGE_UPDATED = "updated"
+CHANGE_DELETED = "deleted"
+
+
+def _record_change(db: Session, db_banned: models.Banned, operation: str) -> None:
+    # The writers of the changes wait for each other until their commit : a
+    # change gets its "seq" once the changes before it are committed, so a
+    # reader never skips a change committed late under its last "seq" (SQLite
+    # already allows one writer at a time)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE banned_changes IN EXCLUSIVE MODE"))
+    # Committed with the change of the banned
+    db.add(
+        models.BannedChange(
+            user_id=db_banned.user_id,
+            operation=operation,
+            reason=db_banned.reason,
+            banned_at=db_banned.banned_at,
+        )
+    )
+
 
 # Write to database
 @exception(logger)
@@ -20,6 +46,9 @@ def create_banned(db: Session, banned: schemas.BannedCreate) -> models.Banned:
     """
     db_banned = models.Banned(**banned.dict())
     db.add(db_banned)
+    # "banned_at" set by the insert
+    db.flush()
+    _record_change(db=db, db_banned=db_banned, operation=CHANGE_CREATED)
     db.commit()
     db.refresh(db_banned)
     logger.info(f"Banned : {db_banned} created")
@@ -41,6 +70,7 @@ def update_banned(db: Session, db_banned: models.Banned, reason: str) -> models.
     """
     db_banned.banned_at = basic_tools.get_timestamp_utc()
     db_banned.reason = reason
+    _record_change(db=db, db_banned=db_banned, operation=CHANGE_UPDATED)
     db.commit()
     db.refresh(db_banned)
     logger.info(f"Banned : {db_banned} edited")
@@ -62,6 +92,58 @@ def get_banned_by_used_id(db: Session, user_id: str) -> models.Banned:
     return db.query(models.Banned).filter(models.Banned.user_id == user_id).first()
 
 
+@exception(logger)
+def get_banned_changes_since(
+    db: Session, since: int = 0, limit: int = 1000
+) -> List[models.BannedChange]:
+    """Get the changes of the banned after a sequence number, oldest first
+
+    Args:
+        db (Session): DB session
+        since (int, optional): "seq" of the last change already read. Defaults to 0.
+        limit (int, optional): Number of changes to get. Defaults to 1000.
+
+    Returns:
+        List[models.BannedChange]: A list of models.BannedChange instance
+    """
+    return (
+        db.query(models.BannedChange)
+        .filter(models.BannedChange.seq > since)
+        .order_by(models.BannedChange.seq)
+        .limit(limit)
+        .all()
+    )
+
+
+@exception(logger)
+def get_last_banned_change_seq(db: Session) -> int:
+    """Get the sequence number of the last change of the banned
+
+    Args:
+        db (Session): DB session
+
+    Returns:
+        int: "seq" of the last change, 0 if none
+    """
+    return db.query(func.max(models.BannedChange.seq)).scalar() or 0
+
+
+@exception(logger)
+def get_banned_user_ids(db: Session) -> List[str]:
+    """Get the user_id of every banned
+
+    Args:
+        db (Session): DB session
+
+    Returns:
+        List[str]: banned user_ids
+    """
+    return [
+        user_id
+        for (user_id,) in db.query(models.Banned.user_id).order_by(models.Banned.id)
+    ]
+
+
 # Delete from database
 @exception(logger)
 @retry(Exception, tries=3, delay=3, logger=logger)
@@ -76,6 +158,7 @@ def delete_banned(db: Session, db_banned: models.Banned) -> models.Banned:
         models.Banned: models.Banned deteted instance
     """
     db.delete(db_banned)
+    _record_change(db=db, db_banned=db_banned, operation=CHANGE_DELETED)
     db.commit()
     logger.info(f"Banned : {db_banned} deleted")
     return db_banned
@@ -0,0 +1,334 @@
+from api import logger, models, schemas
+from api.tools import basic_tools
+from api.tools.error_tools import exception, retry
+
+from typing import List, Union
+
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+
+class MentionClaimError(Exception):
+    """The mention can not be claimed"""
+
+
+class BannedUserError(MentionClaimError):
+    """The user is banned"""
+
+
+class AlreadyClaimedError(MentionClaimError):
+    """The user already requested the video"""
+
+
+class ClaimLimitError(MentionClaimError):
+    """The video was requested too many times"""
+
+
+# Write to database
+@exception(logger)
+def claim_mention(
+    db: Session,
+    claim: schemas.MentionClaimCreate,
+    claim_timeout: int = 3600,
+    tries: int = 3,
+) -> models.VideoUserLink:
+    """Reserve a videouserlink for a mention, in one transaction : create the user
+    and the video if they don't exist, check the user is not banned, did not already
+    request the video and the video was requested less than "asked_count_max" times.
+    The videouserlink "reply_tweet_id" is set later by "confirm_claim".
+
+    A claim with a "mention_tweet_id" is idempotent : the mention claimed again
+    (a retry after a lost response, a replay after a crash) gets its claim back
+    while it is not confirmed. The claims of the video not confirmed after
+    "claim_timeout" seconds are deleted, so a bot stopped before the reply does
+    not keep the request of the video forever.
+
+    The video row is locked until the commit, so concurrent claims of a video
+    are counted one after the other.
+
+    Args:
+        db (Session): DB session
+        claim (schemas.MentionClaimCreate): schemas.MentionClaimCreate instance
+        claim_timeout (int, optional): seconds after which a claim not confirmed is deleted. Defaults to 3600.
+        tries (int, optional): number of tries when a concurrent claim creates the same rows. Defaults to 3.
+
+    Raises:
+        BannedUserError: the user is banned
+        AlreadyClaimedError: the user already requested the video
+        ClaimLimitError: the video was requested too many times
+
+    Returns:
+        models.VideoUserLink: models.VideoUserLink instance, without reply_tweet_id
+    """
+    for attempt in range(tries):
+        try:
+            db_videouserlink = _claim_mention(
+                db=db, claim=claim, claim_timeout=claim_timeout
+            )
+            db.commit()
+        except MentionClaimError:
+            db.rollback()
+            raise
+        except IntegrityError:
+            # The user, the video or the videouserlink was created by a concurrent claim
+            db.rollback()
+            if attempt == tries - 1:
+                raise
+            continue
+        db.refresh(db_videouserlink)
+        logger.info(f"VideoUserLink : {db_videouserlink} claimed")
+        return db_videouserlink
+
+
+@exception(logger)
+def claim_mentions(
+    db: Session,
+    claims: List[schemas.MentionClaimCreate],
+    claim_timeout: int = 3600,
+    tries: int = 3,
+) -> List[schemas.MentionClaimResult]:
+    """Reserve the videouserlinks of several mentions, in one transaction : each
+    claim is checked like by "claim_mention", a refused claim writes nothing and
+    does not stop the others. The claims see the ones before them in the list.
+
+    The videos are locked in the order of their tweet_id, so concurrent batches
+    do not wait for each other in a loop.
+
+    Args:
+        db (Session): DB session
+        claims (List[schemas.MentionClaimCreate]): schemas.MentionClaimCreate instances
+        claim_timeout (int, optional): seconds after which a claim not confirmed is deleted. Defaults to 3600.
+        tries (int, optional): number of tries when a concurrent claim creates the same rows. Defaults to 3.
+
+    Returns:
+        List[schemas.MentionClaimResult]: result of each claim, in the order of the claims
+    """
+    # Same order as the list for the claims of a video
+    order = sorted(range(len(claims)), key=lambda index: claims[index].video.tweet_id)
+    for attempt in range(tries):
+        results = [None] * len(claims)
+        db_videouserlinks = {}
+        try:
+            for index in order:
+                try:
+                    db_videouserlinks[index] = _claim_mention(
+                        db=db, claim=claims[index], claim_timeout=claim_timeout
+                    )
+                except AlreadyClaimedError as e:
+                    results[index] = schemas.MentionClaimResult(
+                        status_code=409, detail=str(e)
+                    )
+                except MentionClaimError as e:
+                    results[index] = schemas.MentionClaimResult(
+                        status_code=403, detail=str(e)
+                    )
+            db.commit()
+        except IntegrityError:
+            # The whole batch is tried again
+            db.rollback()
+            if attempt == tries - 1:
+                raise
+            continue
+        for index, db_videouserlink in db_videouserlinks.items():
+            db.refresh(db_videouserlink)
+            results[index] = schemas.MentionClaimResult(
+                status_code=200,
+                claim=schemas.VideoUserLink.from_orm(db_videouserlink),
+            )
+        logger.info(
+            f"{len(db_videouserlinks)} VideoUserLinks claimed, {len(claims) - len(db_videouserlinks)} refused"
+        )
+        return results
+
+
+def _claim_mention(
+    db: Session, claim: schemas.MentionClaimCreate, claim_timeout: int
+) -> models.VideoUserLink:
+    # Every check before the first write (but the deletion of the expired
+    # claims) : a refused claim writes nothing
+    screen_name, tweet_id = claim.user.screen_name, claim.video.tweet_id
+
+    if db.query(exists().where(models.Banned.user_id == claim.user.user_id)).scalar():
+        raise BannedUserError(f"User with ID : '{claim.user.user_id}' is banned")
+
+    db_video = (
+        db.query(models.Video)
+        .filter(models.Video.tweet_id == tweet_id)
+        .with_for_update()
+        .first()
+    )
+
+    # Claims left by a bot stopped before the reply
+    db.query(models.VideoUserLink).filter(
+        models.VideoUserLink.tweet_id == tweet_id,
+        models.VideoUserLink.reply_tweet_id.is_(None),
+        models.VideoUserLink.asked_at < basic_tools.get_timestamp_utc() - claim_timeout,
+    ).delete(synchronize_session=False)
+
+    if claim.mention_tweet_id is not None:
+        db_claimed = (
+            db.query(models.VideoUserLink)
+            .filter(models.VideoUserLink.mention_tweet_id == claim.mention_tweet_id)
+            .first()
+        )
+        if db_claimed is not None:
+            if (
+                db_claimed.reply_tweet_id is None
+                and db_claimed.screen_name == screen_name
+                and db_claimed.tweet_id == tweet_id
+            ):
+                return db_claimed
+            raise AlreadyClaimedError(
+                f"Mention : '{claim.mention_tweet_id}' already claimed and replied"
+            )
+
+    if db.query(
+        exists().where(
+            and_(
+                models.VideoUserLink.screen_name == screen_name,
+                models.VideoUserLink.tweet_id == tweet_id,
+            )
+        )
+    ).scalar():
+        raise AlreadyClaimedError(
+            f"Video : '{tweet_id}' already requested by user : '{screen_name}'"
+        )
+
+    videos_count = (
+        db.query(func.count(models.VideoUserLink.id))
+        .filter(models.VideoUserLink.tweet_id == tweet_id)
+        .scalar()
+    )
+    if videos_count >= claim.asked_count_max:
+        raise ClaimLimitError(
+            f"Video : '{tweet_id}' requested too many times : {videos_count}"
+        )
+
+    if db_video is None:
+        db.add(models.Video(**claim.video.dict()))
+        db.flush()
+
+    if not db.query(exists().where(models.User.screen_name == screen_name)).scalar():
+        db.add(models.User(**claim.user.dict()))
+        db.flush()
+
+    db_videouserlink = models.VideoUserLink(
+        screen_name=screen_name,
+        tweet_id=tweet_id,
+        mention_tweet_id=claim.mention_tweet_id,
+    )
+    db.add(db_videouserlink)
+    # Seen by the next claims of the transaction
+    db.flush()
+    return db_videouserlink
+
+
+@exception(logger)
+@retry(Exception, tries=3, delay=3, logger=logger)
+def confirm_claim(
+    db: Session, db_videouserlink: models.VideoUserLink, reply_tweet_id: str
+) -> models.VideoUserLink:
+    """Set the reply_tweet_id of a claimed videouserlink
+
+    Args:
+        db (Session): DB session
+        db_videouserlink (models.VideoUserLink): models.VideoUserLink claimed instance
+        reply_tweet_id (str): reply tweet id
+
+    Returns:
+        models.VideoUserLink: models.VideoUserLink instance
+    """
+    db_videouserlink.reply_tweet_id = reply_tweet_id
+    db.commit()
+    db.refresh(db_videouserlink)
+    logger.info(f"VideoUserLink : {db_videouserlink} confirmed")
+    return db_videouserlink
+
+
+# Read from database
+@exception(logger)
+def get_mention_preflight(
+    db: Session,
+    user_id: str,
+    screen_name: str,
+    tweet_id: str,
+    mention_tweet_id: Union[str, None] = None,
+    claim_timeout: int = 3600,
+) -> schemas.MentionPreflight:
+    """Get everything the bot checks before replying to a mention, in one query.
+    The claims not confirmed after "claim_timeout" seconds, and the claim not
+    confirmed of the mention itself, are not counted : "claim_mention" deletes
+    the first ones and returns the second one
+
+    Args:
+        db (Session): DB session
+        user_id (str): user user_id
+        screen_name (str): user screen_name
+        tweet_id (str): video tweet_id
+        mention_tweet_id (Union[str, None], optional): mention tweet id. Defaults to None.
+        claim_timeout (int, optional): seconds after which a claim not confirmed is deleted. Defaults to 3600.
+
+    Returns:
+        schemas.MentionPreflight: schemas.MentionPreflight instance
+    """
+    counted = or_(
+        models.VideoUserLink.reply_tweet_id.isnot(None),
+        models.VideoUserLink.asked_at
+        >= basic_tools.get_timestamp_utc() - claim_timeout,
+    )
+    if mention_tweet_id is not None:
+        counted = and_(
+            counted,
+            or_(
+                models.VideoUserLink.reply_tweet_id.isnot(None),
+                models.VideoUserLink.mention_tweet_id.is_(None),
+                models.VideoUserLink.mention_tweet_id != mention_tweet_id,
+            ),
+        )
+    row = db.query(
+        exists().where(models.Banned.user_id == user_id).label("is_banned"),
+        exists().where(models.Video.tweet_id == tweet_id).label("video_exists"),
+        exists().where(models.User.screen_name == screen_name).label("user_exists"),
+        exists()
+        .where(
+            and_(
+                models.VideoUserLink.screen_name == screen_name,
+                models.VideoUserLink.tweet_id == tweet_id,
+                counted,
+            )
+        )
+        .label("videouserlink_exists"),
+        select(func.count(models.VideoUserLink.id))
+        .where(and_(models.VideoUserLink.tweet_id == tweet_id, counted))
+        .scalar_subquery()
+        .label("videos_count"),
+    ).one()
+    return schemas.MentionPreflight(
+        user_id=user_id,
+        screen_name=screen_name,
+        tweet_id=tweet_id,
+        is_banned=row.is_banned,
+        video_exists=row.video_exists,
+        user_exists=row.user_exists,
+        videouserlink_exists=row.videouserlink_exists,
+        videos_count=row.videos_count,
+    )
+
+
+@exception(logger)
+def get_claim(db: Session, claim_id: int) -> models.VideoUserLink:
+    """Get a claimed videouserlink by id
+
+    Args:
+        db (Session): DB session
+        claim_id (int): videouserlink id
+
+    Returns:
+        models.VideoUserLink: models.VideoUserLink instance
+    """
+    return (
+        db.query(models.VideoUserLink)
+        .filter(models.VideoUserLink.id == claim_id)
+        .first()
+    )
@@ -37,6 +37,11 @@ def delete_all_rows_of_table(db: Session, table_name: str) -> bool:
         db.commit()
         logger.info("All rows from table 'Banned' deleted")
         return True
+    if table_name == "BannedChange":
+        db.query(models.BannedChange).delete()
+        db.commit()
+        logger.info("All rows from table 'BannedChange' deleted")
+        return True
     if table_name == "Admin":
         db.query(models.Admin).delete()
         db.commit()
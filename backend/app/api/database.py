@@ -1,8 +1,9 @@
 from api import config
 
 import os
+from typing import List
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -20,10 +21,61 @@ def create_sqlalchemy_engine(db_config):
     return engine
 
 
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=create_sqlalchemy_engine(db_config=db_config),
-)
+engine = create_sqlalchemy_engine(db_config=db_config)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+# Migration adding the claims of the mentions to an existing database
+CLAIMS_MIGRATION = "migrations/001_videouserlink_claims.sql"
+
+
+def get_missing_schema(bind) -> List[str]:
+    """Get the parts of the "videos_users_link" schema not applied by
+    "Base.metadata.create_all" on a table created before them
+
+    Args:
+        bind: SQLAlchemy engine or connection
+
+    Returns:
+        List[str]: the missing columns and unique constraints, empty if up to date
+    """
+    inspector = inspect(bind)
+    if not inspector.has_table("videos_users_link"):
+        return []
+    columns = {column["name"] for column in inspector.get_columns("videos_users_link")}
+    # A unique constraint can be read back as a unique index (SQLite)
+    uniques = {
+        tuple(constraint["column_names"])
+        for constraint in inspector.get_unique_constraints("videos_users_link")
+    } | {
+        tuple(index["column_names"])
+        for index in inspector.get_indexes("videos_users_link")
+        if index["unique"]
+    }
+
+    missing = []
+    if "mention_tweet_id" not in columns:
+        missing.append("column mention_tweet_id")
+    if ("screen_name", "tweet_id") not in uniques:
+        missing.append("unique (screen_name, tweet_id)")
+    if ("mention_tweet_id",) not in uniques:
+        missing.append("unique (mention_tweet_id)")
+    return missing
+
+
+def check_schema(bind) -> None:
+    """Check the database schema at startup
+
+    Args:
+        bind: SQLAlchemy engine or connection
+
+    Raises:
+        RuntimeError: the schema is not up to date, "CLAIMS_MIGRATION" must be run
+    """
+    missing = get_missing_schema(bind=bind)
+    if missing:
+        raise RuntimeError(
+            f"Table 'videos_users_link' misses {', '.join(missing)} : run '{CLAIMS_MIGRATION}'"
+        )
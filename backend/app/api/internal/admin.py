@@ -1,4 +1,5 @@
 from api import schemas, dependencies
+from api.tools import twitter_tools
 
 from fastapi import APIRouter, Depends
 
@@ -18,3 +19,18 @@ async def admin(current_admin: schemas.Admin = Depends(dependencies.get_current_
         schemas.Admin: authenticate admin
     """
     return current_admin
+
+
+@router.get("/admin/twitter", response_model=schemas.TwitterApiStats)
+async def read_twitter_api_stats(
+    current_admin: schemas.Admin = Depends(dependencies.get_current_admin),
+):
+    """Get the tweepy API instances statistics, to check that the connections are reused
+
+    Args:
+        current_admin (schemas.Admin, optional): authenticate admin. Defaults to Depends(dependencies.get_current_admin).
+
+    Returns:
+        schemas.TwitterApiStats: instances count, instances reused, HTTP requests sent and connections opened
+    """
+    return twitter_tools.get_twitter_api_stats()
@@ -1,7 +1,7 @@
 from api.database import Base
 from api.tools import basic_tools
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, UniqueConstraint
 
 
 class User(Base):
@@ -34,11 +34,15 @@ class Video(Base):
 
 class VideoUserLink(Base):
     __tablename__ = "videos_users_link"
+    # A user can request a video only once
+    __table_args__ = (UniqueConstraint("screen_name", "tweet_id"),)
 
     id = Column(Integer, primary_key=True)
     screen_name = Column(String(30), ForeignKey("users.screen_name"))
     tweet_id = Column(String, ForeignKey("videos.tweet_id"))
     reply_tweet_id = Column(String, unique=True)
+    # ID of the mention claiming the link : a claim sent again returns it
+    mention_tweet_id = Column(String, unique=True)
     asked_at = Column(Integer, default=basic_tools.get_timestamp_utc)
 
     def __repr__(self) -> str:
@@ -68,3 +72,21 @@ class Banned(Base):
         return (
             f"<Banned(id={self.id}, user_id='{self.user_id}', reason='{self.reason}')>"
         )
+
+
+class BannedChange(Base):
+    """Creation, edition or deletion of a banned, kept after the deletion"""
+
+    __tablename__ = "banned_changes"
+
+    # Order of the changes : the changes after a "seq" are read by one probe
+    # of the primary key index
+    seq = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    operation = Column(String(10))
+    reason = Column(String(15))
+    banned_at = Column(Integer)
+    changed_at = Column(Integer, default=basic_tools.get_timestamp_utc)
+
+    def __repr__(self) -> str:
+        return f"<BannedChange(seq={self.seq}, user_id='{self.user_id}', operation='{self.operation}')>"
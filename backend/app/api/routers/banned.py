@@ -1,10 +1,9 @@
 from api import schemas, dependencies
 from api.crud import crud_banned, crud_users
 
-from fastapi import APIRouter, Path, Depends, HTTPException
+from fastapi import APIRouter, Query, Path, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-
 router = APIRouter(
     prefix="/api/v2/banned",
     tags=["banned"],
@@ -13,6 +12,45 @@ router = APIRouter(
 
 
 # GET
+@router.get("/changes", response_model=schemas.BannedChanges)
+async def read_banned_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    db: Session = Depends(dependencies.get_db),
+):
+    """Get the creations, editions and deletions of banned users after a sequence
+    number, oldest first, to keep a copy of the ban list up to date
+
+    Args:
+        since (int, optional): "last_seq" of the previous poll or of the snapshot. Defaults to Query(default=0, ge=0).
+        limit (int, optional): Changes to get. Defaults to Query(default=1000, ge=1, le=10000).
+        db (Session, optional): DB Session. Defaults to Depends(dependencies.get_db).
+
+    Returns:
+        schemas.BannedChanges: the changes, and the "since" of the next poll
+    """
+    db_changes = crud_banned.get_banned_changes_since(db=db, since=since, limit=limit)
+    return {
+        "changes": db_changes,
+        "last_seq": db_changes[-1].seq if db_changes else since,
+    }
+
+
+@router.get("/snapshot", response_model=schemas.BannedSnapshot)
+async def read_banned_snapshot(db: Session = Depends(dependencies.get_db)):
+    """Get every banned user_id, to start a copy of the ban list
+
+    Args:
+        db (Session, optional): DB Session. Defaults to Depends(dependencies.get_db).
+
+    Returns:
+        schemas.BannedSnapshot: the banned user_ids, and the "since" of the first poll of the changes
+    """
+    # Read first : a change made while the user_ids are read is polled again
+    last_seq = crud_banned.get_last_banned_change_seq(db=db)
+    return {"user_ids": crud_banned.get_banned_user_ids(db=db), "last_seq": last_seq}
+
+
 @router.get("/{user_id}", response_model=schemas.Banned)
 async def read_banned(
     user_id: str = Path(min_length=1, regex="^[0-9]*$"),
@@ -0,0 +1,189 @@
+from api import config, schemas, dependencies
+from api.crud import crud_mentions, crud_videouserlinks
+
+from typing import Union
+
+from fastapi import APIRouter, Query, Path, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+router = APIRouter(
+    prefix="/api/v2/mentions",
+    tags=["mentions"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+# GET
+@router.get("/preflight", response_model=schemas.MentionPreflight)
+async def get_mention_preflight(
+    user_id: str = Query(min_length=1, regex="^[0-9]*$"),
+    screen_name: str = Query(min_length=1),
+    tweet_id: str = Query(min_length=1, regex="^[0-9]*$"),
+    mention_tweet_id: Union[str, None] = Query(
+        default=None, min_length=1, regex="^[0-9]*$"
+    ),
+    db: Session = Depends(dependencies.get_db),
+    settings: config.Settings = Depends(config.get_settings),
+):
+    """Get the checks made by the bot before replying to a mention : is the user banned,
+    do the video, the user and their link exist, how many times the video was requested.
+    The claims not confirmed in time, and the claim not confirmed of the mention, are not counted
+
+    Args:
+        user_id (str): user user_id. Defaults to Query(min_length=1, regex="^[0-9]*$").
+        screen_name (str): user screen_name. Defaults to Query(min_length=1).
+        tweet_id (str): video tweet_id. Defaults to Query(min_length=1, regex="^[0-9]*$").
+        mention_tweet_id (Union[str, None]): mention tweet id. Defaults to Query(default=None, min_length=1, regex="^[0-9]*$").
+        db (Session, optional): DB session. Defaults to Depends(dependencies.get_db).
+        settings (config.Settings, optional): app settings. Defaults to Depends(config.get_settings).
+
+    Returns:
+        schemas.MentionPreflight: schemas.MentionPreflight instance
+    """
+    return crud_mentions.get_mention_preflight(
+        db=db,
+        user_id=user_id,
+        screen_name=screen_name,
+        tweet_id=tweet_id,
+        mention_tweet_id=mention_tweet_id,
+        claim_timeout=settings.CLAIM_TIMEOUT,
+    )
+
+
+# POST
+@router.post("/claims", response_model=schemas.VideoUserLink)
+async def claim_mention(
+    claim: schemas.MentionClaimCreate,
+    db: Session = Depends(dependencies.get_db),
+    settings: config.Settings = Depends(config.get_settings),
+    current_admin: schemas.Admin = Depends(dependencies.get_current_admin),
+):
+    """Reserve a link between an user and a video before replying to a mention.
+    The user and the video are created if they don't exist, the link is reserved only
+    if the user is not banned, did not already request the video, and the video was
+    requested less than "asked_count_max" times (all in one transaction).
+    The same mention claimed again gets the same link while it is not confirmed
+
+    Args:
+        claim (schemas.MentionClaimCreate): user, video, maximum number of requests of the video and mention tweet id
+        db (Session, optional): DB session. Defaults to Depends(dependencies.get_db).
+        settings (config.Settings, optional): app settings. Defaults to Depends(config.get_settings).
+        current_admin (schemas.Admin, optional): to check admin authentication. Defaults to Depends(dependencies.get_current_admin).
+
+    Raises:
+        HTTPException: HTTP 403
+        HTTPException: HTTP 409
+
+    Returns:
+        schemas.VideoUserLink: schemas.VideoUserLink instance, without reply_tweet_id
+    """
+    try:
+        return crud_mentions.claim_mention(
+            db=db, claim=claim, claim_timeout=settings.CLAIM_TIMEOUT
+        )
+    except crud_mentions.AlreadyClaimedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except crud_mentions.MentionClaimError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+@router.post("/claims/batch", response_model=schemas.MentionClaimBatchResults)
+async def claim_mentions(
+    batch: schemas.MentionClaimBatch,
+    db: Session = Depends(dependencies.get_db),
+    settings: config.Settings = Depends(config.get_settings),
+    current_admin: schemas.Admin = Depends(dependencies.get_current_admin),
+):
+    """Reserve the links of several mentions in one transaction, like "POST /claims"
+    for each of them. A refused claim does not stop the others
+
+    Args:
+        batch (schemas.MentionClaimBatch): claims, checked in this order
+        db (Session, optional): DB session. Defaults to Depends(dependencies.get_db).
+        settings (config.Settings, optional): app settings. Defaults to Depends(config.get_settings).
+        current_admin (schemas.Admin, optional): to check admin authentication. Defaults to Depends(dependencies.get_current_admin).
+
+    Returns:
+        schemas.MentionClaimBatchResults: by claim, its status code (200, 403 or 409) and the claimed link if 200
+    """
+    return schemas.MentionClaimBatchResults(
+        results=crud_mentions.claim_mentions(
+            db=db, claims=batch.claims, claim_timeout=settings.CLAIM_TIMEOUT
+        )
+    )
+
+
+# PATCH
+@router.patch("/claims/{claim_id}", response_model=schemas.VideoUserLink)
+async def confirm_claim(
+    claim_confirm: schemas.MentionClaimConfirm,
+    claim_id: int = Path(ge=1),
+    db: Session = Depends(dependencies.get_db),
+    current_admin: schemas.Admin = Depends(dependencies.get_current_admin),
+):
+    """Set the reply tweet id of a claimed link between an user and a video
+
+    Args:
+        claim_confirm (schemas.MentionClaimConfirm): reply tweet id
+        claim_id (int): videouserlink id. Defaults to Path(ge=1).
+        db (Session, optional): DB session. Defaults to Depends(dependencies.get_db).
+        current_admin (schemas.Admin, optional): to check admin authentication. Defaults to Depends(dependencies.get_current_admin).
+
+    Raises:
+        HTTPException: HTTP 404
+        HTTPException: HTTP 400
+
+    Returns:
+        schemas.VideoUserLink: schemas.VideoUserLink instance
+    """
+    db_videouserlink = crud_mentions.get_claim(db=db, claim_id=claim_id)
+    if db_videouserlink is None:
+        raise HTTPException(status_code=404, detail="Claim not found")
+    if db_videouserlink.reply_tweet_id == claim_confirm.reply_tweet_id:
+        return db_videouserlink
+
+    if db_videouserlink.reply_tweet_id is not None:
+        raise HTTPException(status_code=400, detail="Claim already confirmed")
+    if crud_videouserlinks.get_videouserlink_by_reply_tweet_id(
+        db=db, reply_tweet_id=claim_confirm.reply_tweet_id
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Videouserlink already registered with this reply_tweet_id",
+        )
+    return crud_mentions.confirm_claim(
+        db=db,
+        db_videouserlink=db_videouserlink,
+        reply_tweet_id=claim_confirm.reply_tweet_id,
+    )
+
+
+# DELETE
+@router.delete("/claims/{claim_id}", response_model=schemas.VideoUserLink)
+async def release_claim(
+    claim_id: int = Path(ge=1),
+    db: Session = Depends(dependencies.get_db),
+    current_admin: schemas.Admin = Depends(dependencies.get_current_admin),
+):
+    """Delete a claimed link between an user and a video, when no reply was sent
+
+    Args:
+        claim_id (int): videouserlink id. Defaults to Path(ge=1).
+        db (Session, optional): DB session. Defaults to Depends(dependencies.get_db).
+        current_admin (schemas.Admin, optional): to check admin authentication. Defaults to Depends(dependencies.get_current_admin).
+
+    Raises:
+        HTTPException: HTTP 404
+        HTTPException: HTTP 400
+
+    Returns:
+        schemas.VideoUserLink: schemas.VideoUserLink deleted instance
+    """
+    db_videouserlink = crud_mentions.get_claim(db=db, claim_id=claim_id)
+    if db_videouserlink is None:
+        raise HTTPException(status_code=404, detail="Claim not found")
+    if db_videouserlink.reply_tweet_id is not None:
+        raise HTTPException(status_code=400, detail="Claim already confirmed")
+    return crud_videouserlinks.delete_videouserlink(
+        db=db, db_videouserlink=db_videouserlink
+    )
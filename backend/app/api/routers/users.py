@@ -280,6 +280,9 @@ async def delete_user(
     # Deleted reply tweets
     if tweet:
         for db_videouserlink in db_videouserlinks:
+            # Claimed but not replied : no tweet to delete
+            if db_videouserlink.reply_tweet_id is None:
+                continue
             try:
                 twitter_tools.delete_tweet(
                     settings=settings, tweet_id=db_videouserlink.reply_tweet_id
@@ -328,8 +331,8 @@ async def delete_link_between_user_and_video_by_screen_name_and_tweet_id(
     if db_videouserlink is None:
         raise HTTPException(status_code=404, detail="Videouserlink not found")
 
-    # Deleted reply tweets
-    if tweet:
+    # Deleted reply tweets (none if claimed but not replied)
+    if tweet and db_videouserlink.reply_tweet_id is not None:
         try:
             twitter_tools.delete_tweet(
                 settings=settings, tweet_id=db_videouserlink.reply_tweet_id
@@ -190,6 +190,9 @@ async def delete_video(
     # Deleted reply tweets
     if tweet:
         for db_videouserlink in db_videouserlinks:
+            # Claimed but not replied : no tweet to delete
+            if db_videouserlink.reply_tweet_id is None:
+                continue
             try:
                 twitter_tools.delete_tweet(
                     settings=settings, tweet_id=db_videouserlink.reply_tweet_id
@@ -1,6 +1,6 @@
 from typing import Union, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AdminBase(BaseModel):
@@ -18,6 +18,15 @@ class Admin(AdminBase):
         orm_mode = True
 
 
+class TwitterApiStats(BaseModel):
+    clients: int
+    hits: int
+    misses: int
+    requests: int
+    connections: int
+    reused_connections: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -91,6 +100,8 @@ class VideoUserLinkCreate(VideoUserLinkBase):
 class VideoUserLink(VideoUserLinkBase):
     id: int
     screen_name: str
+    # None while the reply of a claimed mention is not confirmed
+    reply_tweet_id: Union[str, None]
     asked_at: int
 
     class Config:
@@ -114,6 +125,31 @@ class Banned(BannedBase):
         orm_mode = True
 
 
+class BannedChange(BaseModel):
+    seq: int
+    user_id: str
+    # "created", "updated" or "deleted"
+    operation: str
+    reason: Union[str, None]
+    banned_at: Union[int, None]
+    changed_at: int
+
+    class Config:
+        orm_mode = True
+
+
+class BannedChanges(BaseModel):
+    changes: List[BannedChange]
+    # To give as "since" to the next poll
+    last_seq: int
+
+
+class BannedSnapshot(BaseModel):
+    user_ids: List[str]
+    # Changes after this one are not in the snapshot
+    last_seq: int
+
+
 class UserVideoCountScreenName(BaseModel):
     screen_name: str
     videos_count: int
@@ -127,3 +163,42 @@ class UserVideoCountTweetId(BaseModel):
 class UserVideos(BaseModel):
     screen_name: str
     videos: List
+
+
+class MentionPreflight(BaseModel):
+    user_id: str
+    screen_name: str
+    tweet_id: str
+    is_banned: bool
+    video_exists: bool
+    user_exists: bool
+    videouserlink_exists: bool
+    videos_count: int
+
+
+class MentionClaimCreate(BaseModel):
+    user: UserCreate
+    video: VideoCreate
+    asked_count_max: int = Field(gt=0)
+    # Key of the claim : the same mention claimed again gets the same link
+    mention_tweet_id: Union[str, None] = Field(default=None, regex="^[0-9]*$")
+
+
+class MentionClaimBatch(BaseModel):
+    claims: List[MentionClaimCreate] = Field(min_items=1, max_items=500)
+
+
+class MentionClaimResult(BaseModel):
+    # 200 if claimed, else the status code of "POST /mentions/claims" refusing it
+    status_code: int
+    claim: Union[VideoUserLink, None] = None
+    detail: Union[str, None] = None
+
+
+class MentionClaimBatchResults(BaseModel):
+    # In the order of the claims
+    results: List[MentionClaimResult]
+
+
+class MentionClaimConfirm(BaseModel):
+    reply_tweet_id: str
@@ -1,14 +1,22 @@
 from api import logger, config
 from api.tools.error_tools import exception, retry
 
+import threading
 from typing import Union
 
 import tweepy
+from requests.adapters import HTTPAdapter
+
+# tweepy API instances, by credentials
+_twitter_apis = {}
+_twitter_apis_lock = threading.Lock()
+_twitter_apis_counts = {"hits": 0, "misses": 0}
 
 
 @exception(logger)
 def get_twitter_api(settings: config.Settings) -> tweepy.API:
-    """Get tweepy API instance
+    """Get tweepy API instance, only one instance is created by credentials
+    so its HTTP session (and the connections of the session) are reused
 
     Args:
         settings (config.Settings): app settings
@@ -16,14 +24,64 @@ def get_twitter_api(settings: config.Settings) -> tweepy.API:
     Returns:
         tweepy.API: tweepy api instance
     """
-    auth = tweepy.OAuth1UserHandler(
+    credentials = (
         settings.TWITTER_API_KEY,
         settings.TWITTER_API_KEY_SECRET,
         settings.TWITTER_ACCESS_TOKEN,
         settings.TWITTER_ACCESS_TOKEN_SECRET,
     )
-    twitter_api = tweepy.API(auth, wait_on_rate_limit=True)
-    return twitter_api
+    with _twitter_apis_lock:
+        twitter_api = _twitter_apis.get(credentials)
+        if twitter_api is not None:
+            _twitter_apis_counts["hits"] += 1
+            return twitter_api
+
+        auth = tweepy.OAuth1UserHandler(*credentials)
+        twitter_api = tweepy.API(auth, wait_on_rate_limit=True)
+        twitter_api.session.mount(
+            "https://", HTTPAdapter(pool_maxsize=settings.TWITTER_POOL_MAXSIZE)
+        )
+        _twitter_apis[credentials] = twitter_api
+        _twitter_apis_counts["misses"] += 1
+        logger.info("tweepy API instance created")
+        return twitter_api
+
+
+def get_twitter_api_stats() -> dict:
+    """Get the tweepy API instances statistics
+
+    Returns:
+        dict: instances count, instances reused, HTTP requests sent and connections opened
+    """
+    requests_count, connections_count = 0, 0
+    with _twitter_apis_lock:
+        for twitter_api in _twitter_apis.values():
+            for adapter in twitter_api.session.adapters.values():
+                pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+                if pools is None:
+                    continue
+                for key in pools.keys():
+                    pool = pools[key]
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+        return {
+            "clients": len(_twitter_apis),
+            "hits": _twitter_apis_counts["hits"],
+            "misses": _twitter_apis_counts["misses"],
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused_connections": requests_count - connections_count,
+        }
+
+
+def clear_twitter_api_cache() -> None:
+    """Remove the tweepy API instances (and close their sessions)"""
+    with _twitter_apis_lock:
+        for twitter_api in _twitter_apis.values():
+            twitter_api.session.close()
+        _twitter_apis.clear()
+        _twitter_apis_counts["hits"] = 0
+        _twitter_apis_counts["misses"] = 0
 
 
 @exception(logger)
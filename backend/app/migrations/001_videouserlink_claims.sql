@@ -0,0 +1,39 @@
+-- Claims of the mentions on an existing database (PostgreSQL)
+--
+-- "Base.metadata.create_all" only creates the missing tables : the unique
+-- request of a Video by a User and the mention of a claim are added here to a
+-- "videos_users_link" table created before them. Checked at the startup of the
+-- backend ("database.check_schema"). Run once, before deploying :
+--     psql -h <HOST> -p <PORT> -U <USER NAME> -d <DB NAME> -f migrations/001_videouserlink_claims.sql
+--
+-- The unique constraint fails on the links requested twice by the former
+-- check-then-insert flow, list them first :
+--     SELECT screen_name, tweet_id, COUNT(*) FROM videos_users_link
+--     GROUP BY screen_name, tweet_id HAVING COUNT(*) > 1;
+
+BEGIN;
+
+ALTER TABLE videos_users_link ADD COLUMN IF NOT EXISTS mention_tweet_id VARCHAR;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'videos_users_link_screen_name_tweet_id_key'
+    ) THEN
+        ALTER TABLE videos_users_link
+            ADD CONSTRAINT videos_users_link_screen_name_tweet_id_key
+            UNIQUE (screen_name, tweet_id);
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'videos_users_link_mention_tweet_id_key'
+    ) THEN
+        ALTER TABLE videos_users_link
+            ADD CONSTRAINT videos_users_link_mention_tweet_id_key
+            UNIQUE (mention_tweet_id);
+    END IF;
+END
+$$;
+
+COMMIT;
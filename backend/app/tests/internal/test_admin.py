@@ -33,3 +33,29 @@ def test_admin_WRONG_HEADER():
     )
     assert response.status_code == 401
     assert response.json() == {"detail": "Could not validate credentials"}
+
+
+def test_read_twitter_api_stats(mocker):
+    # Mock
+    mocker.patch(
+        "api.tools.twitter_tools.get_twitter_api_stats",
+        return_value={
+            "clients": 1,
+            "hits": 2,
+            "misses": 1,
+            "requests": 3,
+            "connections": 1,
+            "reused_connections": 2,
+        },
+    )
+
+    response = client.get(
+        "/api/v2/admin/twitter", headers={"Authorization": "Bearer good-token"}
+    )
+    assert response.status_code == 200
+    assert response.json()["reused_connections"] == 2
+
+
+def test_read_twitter_api_stats_NO_HEADER():
+    response = client.get("/api/v2/admin/twitter")
+    assert response.status_code == 401
@@ -1,5 +1,5 @@
 from wsgi import app
-from api import dependencies, schemas
+from api import dependencies, models, schemas
 from api.crud import crud_users, crud_banned, crud_misc
 from tests import overrided_dependencies
 
@@ -42,6 +42,7 @@ def create_and_remove_sample_db():
     # Suppression des éléments des tables
     crud_misc.delete_all_rows_of_table(db=db, table_name="User")
     crud_misc.delete_all_rows_of_table(db=db, table_name="Banned")
+    crud_misc.delete_all_rows_of_table(db=db, table_name="BannedChange")
 
 
 """ Début des tests """
@@ -92,3 +93,73 @@ def test_post_user_id_ban_WRONG_USER():
     )
     assert response.status_code == 404
     assert response.json() == {"detail": "User not found"}
+
+
+# Feed
+def test_get_banned_snapshot():
+    response = client.get("/api/v2/banned/snapshot")
+    assert response.status_code == 200
+    assert "111" in response.json()["user_ids"]
+    assert response.json()["last_seq"] >= 1
+
+
+def test_get_banned_changes_CREATED_UPDATED_DELETED():
+    last_seq = client.get("/api/v2/banned/snapshot").json()["last_seq"]
+    headers = {"Authorization": "Bearer good-token"}
+
+    # Ban, nouveau ban, puis suppression de l'utilisateur (et de son ban)
+    client.post(
+        "/api/v2/banned", json={"user_id": "333", "reason": "SEX"}, headers=headers
+    )
+    client.post(
+        "/api/v2/banned", json={"user_id": "333", "reason": "DRUG"}, headers=headers
+    )
+    client.delete("/api/v2/users/gauthier", headers=headers)
+
+    response = client.get("/api/v2/banned/changes", params={"since": last_seq})
+    assert response.status_code == 200
+    changes = response.json()["changes"]
+    assert [(change["user_id"], change["operation"]) for change in changes] == [
+        ("333", "created"),
+        ("333", "updated"),
+        ("333", "deleted"),
+    ]
+    assert changes[1]["reason"] == "DRUG"
+    assert response.json()["last_seq"] == changes[-1]["seq"] == last_seq + 3
+    assert "333" not in client.get("/api/v2/banned/snapshot").json()["user_ids"]
+
+
+def test_get_banned_changes_NOTHING_NEW():
+    last_seq = client.get("/api/v2/banned/snapshot").json()["last_seq"]
+
+    response = client.get("/api/v2/banned/changes", params={"since": last_seq})
+    assert response.status_code == 200
+    assert response.json() == {"changes": [], "last_seq": last_seq}
+
+
+def test_get_banned_changes_LIMIT():
+    response = client.get("/api/v2/banned/changes", params={"since": 0, "limit": 1})
+    assert response.status_code == 200
+    assert len(response.json()["changes"]) == 1
+    assert response.json()["last_seq"] == response.json()["changes"][0]["seq"]
+
+
+def test_create_banned_LOCKS_CHANGES_ON_POSTGRESQL(mocker):
+    # Mocks : une session PostgreSQL
+    db = mocker.Mock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+
+    # Appel
+    crud_banned.create_banned(
+        db=db, banned=schemas.BannedCreate(user_id="444", reason="SEX")
+    )
+
+    # Vérif : la table des changements est verrouillée avant l'ajout du changement
+    calls = [name for name, _, _ in db.mock_calls]
+    added = [args[0] for name, args, _ in db.mock_calls if name == "add"]
+    assert isinstance(added[-1], models.BannedChange)
+    assert str(db.execute.call_args.args[0]) == (
+        "LOCK TABLE banned_changes IN EXCLUSIVE MODE"
+    )
+    assert calls.index("execute") < len(calls) - 1 - calls[::-1].index("add")
+    assert calls.index("execute") < calls.index("commit")
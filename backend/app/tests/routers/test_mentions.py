@@ -0,0 +1,549 @@
+from wsgi import app
+from api import config, dependencies, models, schemas
+from api.crud import (
+    crud_users,
+    crud_videos,
+    crud_videouserlinks,
+    crud_banned,
+    crud_misc,
+)
+from api.tools import twitter_tools
+from tests import overrided_dependencies
+from tests.sample_db import engine
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+app.dependency_overrides.update(
+    {
+        dependencies.get_db: overrided_dependencies.override_get_db,
+        dependencies.get_current_admin: (
+            overrided_dependencies.override_get_current_admin
+        ),
+        config.get_settings: overrided_dependencies.override_get_settings,
+    }
+)
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def create_and_remove_sample_db():
+    db = next(overrided_dependencies.override_get_db())
+
+    # Création des éléments des tables
+    crud_users.create_user(
+        db=db, user=schemas.UserCreate(screen_name="david", user_id="111")
+    )
+    crud_users.create_user(
+        db=db, user=schemas.UserCreate(screen_name="joseph", user_id="222")
+    )
+    crud_banned.create_banned(
+        db=db, banned=schemas.BannedCreate(user_id="222", reason="SEX")
+    )
+    crud_videos.create_video(
+        db=db,
+        video=schemas.VideoCreate(
+            creator_screen_name="creator_screen_name",
+            text="text",
+            thumbnail_url="https://thumbnail_url.com",
+            tweet_id="999",
+            tweet_url="https://tweet_url.com",
+            creator_user_id="999",
+            video_url="https://video_url.com",
+        ),
+    )
+    for screen_name, reply_tweet_id in [("david", "0001"), ("joseph", "0002")]:
+        crud_videouserlinks.create_videouserlink(
+            db=db,
+            videouserlink=schemas.VideoUserLinkCreate(
+                tweet_id="999", reply_tweet_id=reply_tweet_id
+            ),
+            screen_name=screen_name,
+        )
+
+    yield
+
+    # Suppression des éléments des tables
+    crud_misc.delete_all_rows_of_table(db=db, table_name="VideoUserLink")
+    crud_misc.delete_all_rows_of_table(db=db, table_name="User")
+    crud_misc.delete_all_rows_of_table(db=db, table_name="Video")
+    crud_misc.delete_all_rows_of_table(db=db, table_name="Banned")
+
+
+""" Début des tests """
+
+
+# GET
+def test_get_preflight_ALREADY_REQUESTED():
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=111&screen_name=david&tweet_id=999"
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": "111",
+        "screen_name": "david",
+        "tweet_id": "999",
+        "is_banned": False,
+        "video_exists": True,
+        "user_exists": True,
+        "videouserlink_exists": True,
+        "videos_count": 2,
+    }
+
+
+def test_get_preflight_BANNED_USER():
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=222&screen_name=joseph&tweet_id=999"
+    )
+    assert response.status_code == 200
+    assert response.json()["is_banned"] is True
+
+
+def test_get_preflight_NEW_USER_NEW_VIDEO():
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=333&screen_name=marcel&tweet_id=888"
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": "333",
+        "screen_name": "marcel",
+        "tweet_id": "888",
+        "is_banned": False,
+        "video_exists": False,
+        "user_exists": False,
+        "videouserlink_exists": False,
+        "videos_count": 0,
+    }
+
+
+def test_get_preflight_ONE_QUERY():
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get(
+            "/api/v2/mentions/preflight?user_id=111&screen_name=david&tweet_id=999"
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_get_preflight_OWN_CLAIM():
+    client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(
+            screen_name="claude", user_id="120", tweet_id="120", mention_tweet_id="1201"
+        ),
+    )
+
+    # La réservation de la mention elle-même n'est pas comptée
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=120&screen_name=claude&tweet_id=120&mention_tweet_id=1201"
+    )
+    assert response.status_code == 200
+    assert response.json()["videouserlink_exists"] is False
+    assert response.json()["videos_count"] == 0
+
+    # Elle l'est pour une autre mention
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=120&screen_name=claude&tweet_id=120&mention_tweet_id=1202"
+    )
+    assert response.json()["videouserlink_exists"] is True
+    assert response.json()["videos_count"] == 1
+
+
+def test_get_preflight_WRONG_TWEET_ID():
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=111&screen_name=david&tweet_id=abc"
+    )
+    assert response.status_code == 422
+
+
+# POST
+def make_claim(
+    screen_name: str,
+    user_id: str,
+    tweet_id: str,
+    asked_count_max: int = 5,
+    mention_tweet_id: str = None,
+):
+    return {
+        "user": {"screen_name": screen_name, "user_id": user_id},
+        "video": {
+            "creator_screen_name": "creator_screen_name",
+            "text": "text",
+            "thumbnail_url": f"https://thumbnail_url.com/{tweet_id}",
+            "tweet_id": tweet_id,
+            "tweet_url": f"https://tweet_url.com/{tweet_id}",
+            "creator_user_id": "999",
+            "video_url": f"https://video_url.com/{tweet_id}",
+        },
+        "asked_count_max": asked_count_max,
+        "mention_tweet_id": mention_tweet_id,
+    }
+
+
+def test_claim_mention_NEW_USER_NEW_VIDEO():
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="paul", user_id="444", tweet_id="777"),
+    )
+    assert response.status_code == 200
+    assert response.json()["screen_name"] == "paul"
+    assert response.json()["tweet_id"] == "777"
+    assert response.json()["reply_tweet_id"] is None
+
+    # L'utilisateur et la vidéo sont créés
+    assert client.get("/api/v2/users/paul").status_code == 200
+    assert client.get("/api/v2/videos/777").status_code == 200
+
+
+def test_claim_mention_ALREADY_REQUESTED():
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="david", user_id="111", tweet_id="999"),
+    )
+    assert response.status_code == 409
+
+
+def test_claim_mention_BANNED_USER():
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="joseph", user_id="222", tweet_id="666"),
+    )
+    assert response.status_code == 403
+
+    # Rien n'est créé
+    assert client.get("/api/v2/videos/666").status_code == 404
+
+
+def test_claim_mention_REQUESTED_TOO_MANY_TIMES():
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(
+            screen_name="jacques", user_id="555", tweet_id="999", asked_count_max=2
+        ),
+    )
+    assert response.status_code == 403
+
+    # L'utilisateur n'est pas créé
+    assert client.get("/api/v2/users/jacques").status_code == 404
+
+
+def test_claim_mention_CAP_RESPECTED():
+    status_codes = [
+        client.post(
+            "/api/v2/mentions/claims",
+            headers={"Authorization": "Bearer good-token"},
+            json=make_claim(
+                screen_name=f"user{i}",
+                user_id=f"60{i}",
+                tweet_id="555",
+                asked_count_max=3,
+            ),
+        ).status_code
+        for i in range(5)
+    ]
+    assert status_codes == [200, 200, 200, 403, 403]
+    assert client.get("/api/v2/videos/555/videos_count").json()["videos_count"] == 3
+
+
+def test_claim_mention_SAME_MENTION():
+    claim = make_claim(
+        screen_name="marc", user_id="130", tweet_id="130", mention_tweet_id="1301"
+    )
+    responses = [
+        client.post(
+            "/api/v2/mentions/claims",
+            headers={"Authorization": "Bearer good-token"},
+            json=claim,
+        )
+        for _ in range(2)
+    ]
+
+    # Envoyée de nouveau (réponse perdue, mention rejouée) : la même réservation
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json()["id"] == responses[1].json()["id"]
+    assert client.get("/api/v2/videos/130/videos_count").json()["videos_count"] == 1
+
+    # Une fois confirmée, la mention n'est plus réservée
+    client.patch(
+        f"/api/v2/mentions/claims/{responses[0].json()['id']}",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "1309"},
+    )
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=claim,
+    )
+    assert response.status_code == 409
+
+
+def test_claim_mention_EXPIRED_CLAIM():
+    claim = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(
+            screen_name="luc", user_id="140", tweet_id="140", asked_count_max=1
+        ),
+    ).json()
+
+    # Réservation jamais confirmée, plus vieille que CLAIM_TIMEOUT
+    db = next(overrided_dependencies.override_get_db())
+    db.query(models.VideoUserLink).filter(
+        models.VideoUserLink.id == claim["id"]
+    ).update({"asked_at": claim["asked_at"] - 2 * 3600})
+    db.commit()
+
+    # Elle ne compte plus, et elle est supprimée par la réservation suivante
+    response = client.get(
+        "/api/v2/mentions/preflight?user_id=141&screen_name=mathieu&tweet_id=140"
+    )
+    assert response.json()["videos_count"] == 0
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(
+            screen_name="mathieu", user_id="141", tweet_id="140", asked_count_max=1
+        ),
+    )
+    assert response.status_code == 200
+    assert client.get("/api/v2/users/luc/videos_link/140").status_code == 404
+
+
+def test_claim_mention_NO_TOKEN():
+    response = client.post(
+        "/api/v2/mentions/claims",
+        json=make_claim(screen_name="paul", user_id="444", tweet_id="444"),
+    )
+    assert response.status_code == 401
+
+
+def test_claim_mentions_BATCH():
+    claims = [
+        make_claim(screen_name="henri", user_id="901", tweet_id="901"),
+        make_claim(screen_name="david", user_id="111", tweet_id="999"),
+        make_claim(screen_name="joseph", user_id="222", tweet_id="902"),
+        make_claim(
+            screen_name="henri", user_id="901", tweet_id="903", asked_count_max=1
+        ),
+        make_claim(
+            screen_name="hugo", user_id="904", tweet_id="903", asked_count_max=1
+        ),
+    ]
+    response = client.post(
+        "/api/v2/mentions/claims/batch",
+        headers={"Authorization": "Bearer good-token"},
+        json={"claims": claims},
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status_code"] for result in results] == [200, 409, 403, 200, 403]
+    assert results[0]["claim"]["screen_name"] == "henri"
+    assert results[0]["claim"]["tweet_id"] == "901"
+    assert results[0]["claim"]["reply_tweet_id"] is None
+    assert results[1]["claim"] is None
+
+    # Les claims acceptés sont créés, les refusés ne créent rien
+    assert client.get("/api/v2/users/henri/videos_link/901").status_code == 200
+    assert client.get("/api/v2/users/henri/videos_link/903").status_code == 200
+    assert client.get("/api/v2/videos/902").status_code == 404
+    assert client.get("/api/v2/users/hugo").status_code == 404
+
+
+def test_claim_mentions_ONE_COMMIT():
+    commits = []
+
+    def count_commit(conn):
+        commits.append(conn)
+
+    event.listen(engine, "commit", count_commit)
+    try:
+        response = client.post(
+            "/api/v2/mentions/claims/batch",
+            headers={"Authorization": "Bearer good-token"},
+            json={
+                "claims": [
+                    make_claim(
+                        screen_name=f"batch{i}", user_id=f"91{i}", tweet_id="910"
+                    )
+                    for i in range(10)
+                ]
+            },
+        )
+    finally:
+        event.remove(engine, "commit", count_commit)
+
+    assert response.status_code == 200
+    assert [result["status_code"] for result in response.json()["results"]] == [
+        200
+    ] * 5 + [403] * 5
+    assert len(commits) == 1
+
+
+def test_claim_mentions_SENT_AGAIN():
+    batch = {
+        "claims": [
+            make_claim(
+                screen_name=f"again{i}",
+                user_id=f"15{i}",
+                tweet_id="150",
+                mention_tweet_id=f"150{i}",
+            )
+            for i in range(3)
+        ]
+    }
+    responses = [
+        client.post(
+            "/api/v2/mentions/claims/batch",
+            headers={"Authorization": "Bearer good-token"},
+            json=batch,
+        )
+        for _ in range(2)
+    ]
+
+    # Les mêmes réservations, aucune refusée
+    results = [response.json()["results"] for response in responses]
+    assert [result["status_code"] for result in results[1]] == [200] * 3
+    assert [result["claim"]["id"] for result in results[0]] == [
+        result["claim"]["id"] for result in results[1]
+    ]
+    assert client.get("/api/v2/videos/150/videos_count").json()["videos_count"] == 3
+
+
+def test_claim_mentions_EMPTY():
+    response = client.post(
+        "/api/v2/mentions/claims/batch",
+        headers={"Authorization": "Bearer good-token"},
+        json={"claims": []},
+    )
+    assert response.status_code == 422
+
+
+# PATCH
+def test_confirm_claim():
+    claim = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="pierre", user_id="700", tweet_id="333"),
+    ).json()
+
+    response = client.patch(
+        f"/api/v2/mentions/claims/{claim['id']}",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "7001"},
+    )
+    assert response.status_code == 200
+    assert response.json()["reply_tweet_id"] == "7001"
+
+    # Même reply_tweet_id : rien ne change
+    response = client.patch(
+        f"/api/v2/mentions/claims/{claim['id']}",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "7001"},
+    )
+    assert response.status_code == 200
+
+    # Autre reply_tweet_id : refusé
+    response = client.patch(
+        f"/api/v2/mentions/claims/{claim['id']}",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "7002"},
+    )
+    assert response.status_code == 400
+
+
+def test_confirm_claim_REPLY_TWEET_ID_ALREADY_USED():
+    claim = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="pierre", user_id="700", tweet_id="222"),
+    ).json()
+
+    response = client.patch(
+        f"/api/v2/mentions/claims/{claim['id']}",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "0001"},
+    )
+    assert response.status_code == 400
+
+
+def test_confirm_claim_NOT_FOUND():
+    response = client.patch(
+        "/api/v2/mentions/claims/9999",
+        headers={"Authorization": "Bearer good-token"},
+        json={"reply_tweet_id": "7003"},
+    )
+    assert response.status_code == 404
+
+
+# DELETE
+def test_release_claim():
+    claim = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="louis", user_id="800", tweet_id="111"),
+    ).json()
+
+    response = client.delete(
+        f"/api/v2/mentions/claims/{claim['id']}",
+        headers={"Authorization": "Bearer good-token"},
+    )
+    assert response.status_code == 200
+    assert client.get("/api/v2/users/louis/videos_link/111").status_code == 404
+
+    # L'utilisateur peut de nouveau demander la vidéo
+    response = client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="louis", user_id="800", tweet_id="111"),
+    )
+    assert response.status_code == 200
+
+
+def test_release_claim_ALREADY_CONFIRMED():
+    db = next(overrided_dependencies.override_get_db())
+    db_videouserlink = (
+        crud_videouserlinks.get_videouserlink_by_screen_name_and_tweet_id(
+            db=db, screen_name="david", tweet_id="999"
+        )
+    )
+
+    response = client.delete(
+        f"/api/v2/mentions/claims/{db_videouserlink.id}",
+        headers={"Authorization": "Bearer good-token"},
+    )
+    assert response.status_code == 400
+
+
+def test_delete_link_TWEET_TRUE_NOT_CONFIRMED(mocker):
+    # Mock
+    mocker.patch("api.tools.twitter_tools.delete_tweet")
+
+    client.post(
+        "/api/v2/mentions/claims",
+        headers={"Authorization": "Bearer good-token"},
+        json=make_claim(screen_name="jean", user_id="160", tweet_id="160"),
+    )
+    response = client.delete(
+        "/api/v2/users/jean/videos_link/160?tweet=true",
+        headers={"Authorization": "Bearer good-token"},
+    )
+    assert response.status_code == 200
+
+    # Pas de réponse, pas de tweet à supprimer
+    twitter_tools.delete_tweet.assert_not_called()
@@ -0,0 +1,37 @@
+from api import database
+from tests.sample_db import engine
+
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+
+def test_check_schema_UP_TO_DATE():
+    assert database.get_missing_schema(bind=engine) == []
+    database.check_schema(bind=engine)
+
+
+def test_check_schema_TABLE_BEFORE_CLAIMS(tmp_path):
+    # Table créée avant les réservations : create_all ne la modifie pas
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old_engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE videos_users_link (id INTEGER PRIMARY KEY, "
+                "screen_name VARCHAR(30), tweet_id VARCHAR, "
+                "reply_tweet_id VARCHAR UNIQUE, asked_at INTEGER)"
+            )
+        )
+
+    assert database.get_missing_schema(bind=old_engine) == [
+        "column mention_tweet_id",
+        "unique (screen_name, tweet_id)",
+        "unique (mention_tweet_id)",
+    ]
+    with pytest.raises(RuntimeError, match="001_videouserlink_claims.sql"):
+        database.check_schema(bind=old_engine)
+
+    # La migration à lancer est livrée avec le backend
+    app_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    assert os.path.exists(os.path.join(app_folder, database.CLAIMS_MIGRATION))
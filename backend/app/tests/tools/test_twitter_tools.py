@@ -1,10 +1,18 @@
 from api.tools import twitter_tools
 from tests import overrided_dependencies
 
+import pytest
 import tweepy
 from unittest.mock import ANY
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    twitter_tools.clear_twitter_api_cache()
+    yield
+    twitter_tools.clear_twitter_api_cache()
+
+
 def test_get_twitter_api(mocker):
     settings = overrided_dependencies.override_get_settings()
 
@@ -29,3 +37,31 @@ def test_delete_tweet(mocker):
 
     # Vérification qu'on a eu un appel de la fonction "tweepy.API.destroy_status"
     tweepy.API.destroy_status.assert_called_once_with(id="1")
+
+
+def test_get_twitter_api_CACHED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Patch de la classe "tweepy.API"
+    mocker.patch("tweepy.API")
+
+    # Deux appels, une seule instance
+    twitter_api = twitter_tools.get_twitter_api(settings=settings)
+    assert twitter_tools.get_twitter_api(settings=settings) is twitter_api
+    tweepy.API.assert_called_once()
+
+    stats = twitter_tools.get_twitter_api_stats()
+    assert stats["clients"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_delete_tweet_REUSE_CLIENT(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Patch de la fonction "tweepy.API.destroy_status"
+    mocker.patch("tweepy.API.destroy_status")
+    twitter_tools.delete_tweet(settings=settings, tweet_id="1")
+    twitter_tools.delete_tweet(settings=settings, tweet_id="2")
+
+    assert twitter_tools.get_twitter_api_stats()["misses"] == 1
@@ -0,0 +1,300 @@
+"""Throughput and latency of the mention pipeline
+
+Feeds mentions to "handle_new_status", called directly or through the worker
+pool, at a given rate, against the fake Twitter API and backend, then reports
+the throughput, the latency percentiles of a mention and the calls made to each
+dependency.
+
+The load is open loop : mention i is due at start + i / rate, whether or not
+the previous ones are handled, and its latency is counted from that due time,
+so a pipeline falling behind shows up in the percentiles.
+
+Usage (from "bot/bot") :
+    python -m benchmarks.bench_mentions --mentions 2000 --rate 200 --mode pool \
+        --twitter-latency lognormal:80:0.5 --backend-latency lognormal:10:0.5
+"""
+
+from twitter_bot import (
+    logger,
+    config,
+    bans,
+    batcher,
+    outbox,
+    ratelimit,
+    resilience,
+    store,
+    stream,
+)
+from twitter_bot.tools import auth_tools, twitter_tools
+from benchmarks import data
+from benchmarks.fakes import FakeBackend, FakeTwitterAPI, Latency
+
+import argparse
+import json
+import logging
+import threading
+import time
+from typing import Union
+from unittest import mock
+
+MODES = ("direct", "pool")
+
+
+def get_settings(api_prefix: str, workers: int) -> config.Settings:
+    """Get bot settings calling the fake backend, without rate limit
+
+    Args:
+        api_prefix (str): fake backend URL
+        workers (int): worker pool size
+
+    Returns:
+        config.Settings: bot settings
+    """
+    return config.Settings(
+        ADMIN_USERNAME="admin",
+        ADMIN_PASSWORD="password",
+        URL_PREFIX="https://example.com/videos",
+        API_PREFIX=api_prefix,
+        TRACK="@bot",
+        TWITTER_API_KEY="key",
+        TWITTER_API_KEY_SECRET="key_secret",
+        TWITTER_ACCESS_TOKEN="access_token",
+        TWITTER_ACCESS_TOKEN_SECRET="access_token_secret",
+        WORKERS_COUNT=workers,
+        QUEUE_MAXSIZE=100_000,
+        RATE_LIMIT_READ_LIMIT=10**9,
+        RATE_LIMIT_READ_WINDOW=1,
+        RATE_LIMIT_POST_LIMIT=10**9,
+        RATE_LIMIT_POST_WINDOW=1,
+        RATE_LIMIT_POST_BURST=10**9,
+        INTAKE_FILE="",
+        STORE_FILE="",
+        OUTBOX_FILE="",
+    )
+
+
+def percentile(values: list, p: float) -> float:
+    """Get the nearest-rank percentile of sorted values
+
+    Args:
+        values (list): sorted values
+        p (float): percentile, between 0 and 100
+
+    Returns:
+        float: the percentile, 0 without values
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def clear_state() -> None:
+    """Start from cold caches and store, closed breakers and no token"""
+    twitter_tools.clear_caches()
+    twitter_tools.clear_rule_engine()
+    twitter_tools.clear_twitter_api_cache()
+    auth_tools.clear_token_managers()
+    ratelimit.clear_rate_limiter()
+    resilience.reset_circuit_breakers()
+    store.clear_known_store()
+    bans.clear_ban_replica()
+    outbox.clear_outbox()
+    batcher.clear_claim_batcher()
+
+
+def run(
+    dataset: data.Dataset,
+    mode: str = "pool",
+    rate: float = 0,
+    workers: int = 4,
+    twitter_latency: str = "0",
+    backend_latency: str = "0",
+    seed: int = 0,
+) -> dict:
+    """Handle the mentions of a dataset and measure the pipeline
+
+    Args:
+        dataset (data.Dataset): mentions to handle
+        mode (str, optional): "direct" (handle_new_status called by the feeder) or "pool" (worker pool). Defaults to "pool".
+        rate (float, optional): mentions per second, 0 to send them all at once. Defaults to 0.
+        workers (int, optional): worker pool size. Defaults to 4.
+        twitter_latency (str, optional): Twitter API latency spec. Defaults to "0".
+        backend_latency (str, optional): backend latency spec. Defaults to "0".
+        seed (int, optional): random seed of the latencies. Defaults to 0.
+
+    Returns:
+        dict: benchmark report
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode : '{mode}', expected one of {MODES}")
+
+    backend = FakeBackend(
+        latency=Latency(backend_latency, seed=seed), banned=dataset.banned
+    )
+    twitter_api = FakeTwitterAPI(
+        parents=dataset.parents, latency=Latency(twitter_latency, seed=seed + 1)
+    )
+    backend.start()
+    clear_state()
+    settings = get_settings(api_prefix=backend.url, workers=workers)
+    statuses = dataset.statuses()
+
+    latencies = []
+    replies = [0]
+    results_lock = threading.Lock()
+    due_at = {}
+
+    def handle(status):
+        replied = twitter_tools.handle_new_status(settings=settings, status=status)
+        elapsed = time.perf_counter() - due_at[status.id]
+        with results_lock:
+            latencies.append(elapsed)
+            replies[0] += bool(replied)
+
+    try:
+        with mock.patch.object(
+            twitter_tools, "get_twitter_api", return_value=twitter_api
+        ):
+            pool = None
+            if mode == "pool":
+                pool = stream.get_worker_pool(settings=settings)
+                pool.handler = handle
+                pool.start()
+
+            started = time.perf_counter()
+            for i, status in enumerate(statuses):
+                due = started + i / rate if rate else started
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                due_at[status.id] = due
+                if pool is not None:
+                    pool.submit(status)
+                else:
+                    handle(status)
+
+            if pool is not None:
+                pool.stop()
+            duration = time.perf_counter() - started
+    finally:
+        backend.stop()
+
+    latencies.sort()
+    twitter_calls = twitter_api.stats()
+    backend_calls = backend.stats()
+    count = len(statuses)
+    report = {
+        "mode": mode,
+        "mentions": count,
+        "rate": rate,
+        "workers": workers if mode == "pool" else 1,
+        "twitter_latency": twitter_latency,
+        "backend_latency": backend_latency,
+        "duration": round(duration, 3),
+        "throughput": round(count / duration, 1) if duration else 0.0,
+        "replies": replies[0],
+        "latency_ms": {
+            "mean": (
+                round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0
+            ),
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "calls": {"twitter": twitter_calls, "backend": backend_calls},
+        "calls_per_mention": {
+            "twitter": round(sum(twitter_calls.values()) / count, 3) if count else 0.0,
+            "backend": round(sum(backend_calls.values()) / count, 3) if count else 0.0,
+        },
+        "parent_cache": twitter_tools.get_parent_tweet_cache(settings=settings).stats(),
+        "single_flight": twitter_tools.get_single_flight_stats(),
+    }
+    clear_state()
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Get a human readable report
+
+    Args:
+        report (dict): report returned by "run"
+
+    Returns:
+        str: the report
+    """
+    latency = report["latency_ms"]
+    lines = [
+        f"mode : {report['mode']}, workers : {report['workers']}, rate : {report['rate'] or 'max'} mentions/s",
+        f"latencies : twitter '{report['twitter_latency']}', backend '{report['backend_latency']}'",
+        f"mentions : {report['mentions']}, replies : {report['replies']}, duration : {report['duration']} s",
+        f"throughput : {report['throughput']} mentions/s",
+        f"latency (ms) : mean {latency['mean']}, p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}, max {latency['max']}",
+        f"calls by mention : twitter {report['calls_per_mention']['twitter']}, backend {report['calls_per_mention']['backend']}",
+    ]
+    for dependency, calls in report["calls"].items():
+        for name, count in sorted(calls.items()):
+            lines.append(f"    {dependency} {name} : {count}")
+    lines.append(f"parent cache : {report['parent_cache']}")
+    lines.append(f"single flight : {report['single_flight']}")
+    return "\n".join(lines)
+
+
+def main(argv: Union[list, None] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mode", choices=MODES, default="pool")
+    parser.add_argument("--mentions", type=int, default=1000, help="synthetic mentions")
+    parser.add_argument("--rate", type=float, default=0, help="mentions/s, 0 for max")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--parents", type=int, default=200, help="synthetic parents")
+    parser.add_argument("--users", type=int, default=5000, help="synthetic users")
+    parser.add_argument("--zipf", type=float, default=1.1, help="parent popularity")
+    parser.add_argument("--no-video-ratio", type=float, default=0.15)
+    parser.add_argument("--sensitive-ratio", type=float, default=0.02)
+    parser.add_argument("--banned-ratio", type=float, default=0.01)
+    parser.add_argument("--not-reply-ratio", type=float, default=0.05)
+    parser.add_argument(
+        "--recorded-mentions", help="JSON lines file of recorded mentions"
+    )
+    parser.add_argument("--recorded-parents", help="JSON lines file of their parents")
+    parser.add_argument("--twitter-latency", default="lognormal:80:0.5")
+    parser.add_argument("--backend-latency", default="lognormal:10:0.5")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logger.setLevel(getattr(logging, args.log_level.upper()))
+    if args.recorded_mentions:
+        dataset = data.load(
+            mentions_file=args.recorded_mentions, parents_file=args.recorded_parents
+        )
+    else:
+        dataset = data.generate(
+            mentions=args.mentions,
+            parents=args.parents,
+            users=args.users,
+            zipf=args.zipf,
+            no_video_ratio=args.no_video_ratio,
+            sensitive_ratio=args.sensitive_ratio,
+            banned_ratio=args.banned_ratio,
+            not_reply_ratio=args.not_reply_ratio,
+            seed=args.seed,
+        )
+
+    report = run(
+        dataset=dataset,
+        mode=args.mode,
+        rate=args.rate,
+        workers=args.workers,
+        twitter_latency=args.twitter_latency,
+        backend_latency=args.backend_latency,
+        seed=args.seed,
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""CPU time and memory of the parsing of a stream message, by status parser
+
+Decodes the raw JSON of the mentions received by the stream and builds the
+object handled by the bot, with the tweepy model ("json" + "Status.parse")
+and with the compact record ("records.loads" + "StatusRecord.from_json"), then
+reports the CPU time by message and the memory held by a parsed message.
+
+The messages are padded with the fields the stream sends and the bot never
+reads (full user profile, entities, ...), so their size is the one of real
+payloads (a few KB).
+
+Usage (from "bot/bot") :
+    python -m benchmarks.bench_parsing --messages 20000
+"""
+
+from twitter_bot import logger, records
+from twitter_bot.tools import twitter_tools
+from benchmarks import data
+
+import argparse
+import gc
+import json
+import logging
+import time
+import tracemalloc
+from typing import Any, Callable, Union
+
+import tweepy
+
+PARSERS = {
+    "tweepy": lambda raw_data: tweepy.models.Status.parse(None, json.loads(raw_data)),
+    "record": lambda raw_data: records.StatusRecord.from_json(records.loads(raw_data)),
+}
+
+
+def stream_payload(mention: dict) -> bytes:
+    """Get the raw JSON of a mention as sent by the stream
+
+    Args:
+        mention (dict): mention JSON, see "data.make_mention"
+
+    Returns:
+        bytes: the JSON, with the fields not read by the bot
+    """
+    user_id = mention["user"]["id"]
+    payload = {
+        "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+        **mention,
+        "text": mention["full_text"],
+        "display_text_range": [0, len(mention["full_text"])],
+        "source": '<a href="http://twitter.com/download/android" rel="nofollow">Twitter for Android</a>',
+        "truncated": False,
+        "in_reply_to_user_id": 1,
+        "in_reply_to_user_id_str": "1",
+        "in_reply_to_screen_name": "creator",
+        "user": {
+            **mention["user"],
+            "name": f"User {user_id}",
+            "location": "Paris, France",
+            "url": None,
+            "description": "Just a user of the bot, with a long enough description",
+            "protected": False,
+            "verified": False,
+            "followers_count": 120,
+            "friends_count": 300,
+            "listed_count": 1,
+            "favourites_count": 4000,
+            "statuses_count": 2500,
+            "created_at": "Tue Mar 01 10:00:00 +0000 2016",
+            "profile_banner_url": f"https://pbs.twimg.com/profile_banners/{user_id}",
+            "profile_image_url_https": f"https://pbs.twimg.com/profile_images/{user_id}.jpg",
+            "default_profile": True,
+            "default_profile_image": False,
+        },
+        "geo": None,
+        "coordinates": None,
+        "place": None,
+        "contributors": None,
+        "is_quote_status": False,
+        "quote_count": 0,
+        "reply_count": 0,
+        "retweet_count": 0,
+        "favorite_count": 0,
+        "entities": {
+            "hashtags": [],
+            "urls": [],
+            "user_mentions": [
+                {
+                    "screen_name": screen_name,
+                    "name": screen_name,
+                    "id": index,
+                    "id_str": str(index),
+                    "indices": [start, start + len(screen_name) + 1],
+                }
+                for index, (screen_name, start) in enumerate(
+                    (("creator", 0), ("bot", 9)), start=1
+                )
+            ],
+            "symbols": [],
+        },
+        "favorited": False,
+        "retweeted": False,
+        "filter_level": "low",
+        "lang": "fr",
+        "timestamp_ms": "1539202764000",
+    }
+    return json.dumps(payload).encode()
+
+
+def measure(parser: Callable[[bytes], Any], payloads: list) -> dict:
+    """Measure a parser
+
+    Args:
+        parser (Callable[[bytes], Any]): raw JSON to parsed status
+        payloads (list): raw JSON of the messages
+
+    Returns:
+        dict: CPU time by message (µs) and memory held by a parsed message (bytes)
+    """
+    # CPU time, parsed statuses dropped at once
+    gc.collect()
+    started = time.process_time()
+    for payload in payloads:
+        parser(payload)
+    cpu = time.process_time() - started
+
+    # Memory held by the parsed statuses, all kept
+    gc.collect()
+    tracemalloc.start()
+    parsed = [parser(payload) for payload in payloads]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del parsed
+
+    return {
+        "cpu_us": round(cpu / len(payloads) * 1e6, 2),
+        "memory_bytes": round(held / len(payloads)),
+    }
+
+
+def accessors(status: Any) -> tuple:
+    """Read a status through the "twitter_tools" accessors
+
+    Args:
+        status (Any): parsed status
+
+    Returns:
+        tuple: what the bot reads from the status
+    """
+    return (
+        twitter_tools.get_in_reply_to_status_id(status=status),
+        twitter_tools.extract_infos_from_status(status=status),
+        twitter_tools.get_video_urls_from_status(status=status),
+        twitter_tools.is_possibly_sensitive(status=status),
+    )
+
+
+def run(dataset: data.Dataset) -> dict:
+    """Compare the status parsers
+
+    Args:
+        dataset (data.Dataset): mentions to parse
+
+    Returns:
+        dict: report, by parser
+    """
+    payloads = [stream_payload(mention) for mention in dataset.mentions]
+    report = {
+        "messages": len(payloads),
+        "payload_bytes": round(sum(map(len, payloads)) / len(payloads)),
+        "orjson": records.orjson is not None,
+        "parsers": {
+            name: measure(parser, payloads) for name, parser in PARSERS.items()
+        },
+    }
+
+    # Same answers from the accessors, with the parent tweets for the videos
+    checked = payloads + [json.dumps(parent) for parent in dataset.parents.values()]
+    report["same_accessors"] = all(
+        accessors(PARSERS["tweepy"](payload)) == accessors(PARSERS["record"](payload))
+        for payload in checked
+    )
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Get a human readable report
+
+    Args:
+        report (dict): report returned by "run"
+
+    Returns:
+        str: the report
+    """
+    lines = [
+        f"messages : {report['messages']}, payload : {report['payload_bytes']} bytes, orjson : {report['orjson']}",
+    ]
+    for name, result in report["parsers"].items():
+        lines.append(
+            f"    {name} : {result['cpu_us']} µs CPU, {result['memory_bytes']} bytes held by message"
+        )
+    lines.append(f"same accessors results : {report['same_accessors']}")
+    return "\n".join(lines)
+
+
+def main(argv: Union[list, None] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logger.setLevel(getattr(logging, args.log_level.upper()))
+    dataset = data.generate(mentions=args.messages, seed=args.seed)
+    report = run(dataset=dataset)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
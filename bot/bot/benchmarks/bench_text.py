@@ -0,0 +1,171 @@
+"""CPU time of the text normalization on long, mention heavy texts
+
+Compares the previous "clean_text" (a "list.remove" by removed word, so
+quadratic in the number of words), the one pass over the words, and the
+slicing at the entity offsets (with and without the "display_text_range"
+leaving out the leading mentions), on texts starting with many mentions and
+with links all along.
+
+Usage (from "bot/bot") :
+    python -m benchmarks.bench_text --mentions 500 --words 500 --links 50
+"""
+
+from twitter_bot.tools import text_tools
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, Union
+
+
+def legacy_clean_text(text: str) -> str:
+    """Previous "basic_tools.clean_text", kept as the baseline
+
+    Args:
+        text (str): a text
+
+    Returns:
+        str: a cleaned text
+    """
+    text_split = text.split(" ")
+    text_split_copy = [x for x in text_split if x]
+
+    leading_at_removed = False
+    for word in text_split:
+        if word:
+            if word.startswith("http"):
+                text_split_copy.remove(word)
+                continue
+
+            if not leading_at_removed:
+                if not word.startswith("@"):
+                    leading_at_removed = True
+                else:
+                    text_split_copy.remove(word)
+
+    return " ".join(text_split_copy)
+
+
+def make_text(mentions: int, words: int, links: int, seed: int = 0) -> tuple:
+    """Get a text starting with mentions, and its entities
+
+    Args:
+        mentions (int): leading mentions
+        words (int): words after the mentions
+        links (int): links among the words
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        tuple: (text, display_text_range without the leading mentions, entities
+            with the offsets of the mentions and links)
+    """
+    rng = random.Random(seed)
+    tokens = [f"@user{rng.randrange(mentions or 1)}" for _ in range(mentions)]
+    body = [f"word{rng.randrange(100)}" for _ in range(words)]
+    for _ in range(links):
+        body.insert(
+            rng.randrange(len(body) + 1), f"https://t.co/{rng.randrange(10**6)}"
+        )
+    tokens += body
+
+    entities = {"user_mentions": [], "urls": []}
+    start = 0
+    for token in tokens:
+        kind = "user_mentions" if token.startswith("@") else "urls"
+        if token.startswith(("@", "http")):
+            entities[kind].append({"indices": [start, start + len(token)]})
+        start += len(token) + 1
+    text = " ".join(tokens)
+    display_start = sum(len(token) + 1 for token in tokens[:mentions])
+    return text, [min(display_start, len(text)), len(text)], entities
+
+
+def measure(clean: Callable[[], str], repeat: int) -> float:
+    """Measure a normalization
+
+    Args:
+        clean (Callable[[], str]): call cleaning the text
+        repeat (int): calls
+
+    Returns:
+        float: CPU time by call (µs)
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        clean()
+    return round((time.process_time() - started) / repeat * 1e6, 2)
+
+
+def run(mentions: int, words: int, links: int, repeat: int = 20) -> dict:
+    """Compare the normalizations
+
+    Args:
+        mentions (int): leading mentions
+        words (int): words after the mentions
+        links (int): links among the words
+        repeat (int, optional): calls by normalization. Defaults to 20.
+
+    Returns:
+        dict: report, by normalization
+    """
+    text, display_text_range, entities = make_text(
+        mentions=mentions, words=words, links=links
+    )
+    normalizations = {
+        "legacy": lambda: legacy_clean_text(text),
+        "words": lambda: text_tools.clean_text(text),
+        "offsets": lambda: text_tools.clean_text(text, entities=entities),
+        "display_range": lambda: text_tools.clean_text(
+            text, display_text_range=display_text_range, entities=entities
+        ),
+    }
+    results = {name: clean() for name, clean in normalizations.items()}
+    return {
+        "chars": len(text),
+        "mentions": mentions,
+        "words": words,
+        "links": links,
+        "same_result": len(set(results.values())) == 1,
+        "cpu_us": {
+            name: measure(clean, repeat) for name, clean in normalizations.items()
+        },
+    }
+
+
+def format_report(report: dict) -> str:
+    """Get a human readable report
+
+    Args:
+        report (dict): report returned by "run"
+
+    Returns:
+        str: the report
+    """
+    lines = [
+        f"text : {report['chars']} chars, {report['mentions']} leading mentions, {report['words']} words, {report['links']} links",
+    ]
+    for name, cpu_us in report["cpu_us"].items():
+        lines.append(f"    {name} : {cpu_us} µs CPU")
+    lines.append(f"same result : {report['same_result']}")
+    return "\n".join(lines)
+
+
+def main(argv: Union[list, None] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mentions", type=int, default=500)
+    parser.add_argument("--words", type=int, default=500)
+    parser.add_argument("--links", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(
+        mentions=args.mentions, words=args.words, links=args.links, repeat=args.repeat
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
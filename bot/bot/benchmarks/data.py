@@ -0,0 +1,183 @@
+"""Mentions fed to the benchmarks : synthetic or recorded
+
+Synthetic mentions follow the shape of real traffic : the parent tweets are
+picked with a Zipf law (a few hot tweets get most of the mentions, then a long
+tail), some parents have no video or are sensitive, some users are banned and
+some mentions are not replies at all.
+"""
+
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Union
+
+import tweepy
+
+
+@dataclass
+class Dataset:
+    """Mentions to handle, and the state of the fake Twitter API and backend"""
+
+    # Raw JSON of the mentions, in arrival order
+    mentions: list
+    # Raw JSON of the parent tweets, by tweet ID
+    parents: dict
+    # Banned user IDs
+    banned: set = field(default_factory=set)
+
+    def statuses(self) -> list:
+        """Get the mentions as tweepy statuses, like the ones of the stream
+
+        Returns:
+            list: tweepy.models.Status instances
+        """
+        return [tweepy.models.Status.parse(None, mention) for mention in self.mentions]
+
+
+def make_parent(tweet_id: int, kind: str = "video") -> dict:
+    """Get the raw JSON of a parent tweet
+
+    Args:
+        tweet_id (int): tweet ID
+        kind (str, optional): "video", "no_video" or "sensitive". Defaults to "video".
+
+    Returns:
+        dict: tweet JSON, as returned by "statuses/show"
+    """
+    parent = {
+        "id": tweet_id,
+        "id_str": str(tweet_id),
+        "full_text": f"Video tweet {tweet_id} https://t.co/{tweet_id}",
+        "in_reply_to_status_id": None,
+        "possibly_sensitive": kind == "sensitive",
+        "user": {
+            "id": tweet_id * 10,
+            "id_str": str(tweet_id * 10),
+            "screen_name": f"creator{tweet_id}",
+        },
+    }
+    if kind != "no_video":
+        parent["extended_entities"] = {
+            "media": [
+                {
+                    "media_url_https": f"https://pbs.twimg.com/{tweet_id}.jpg",
+                    "video_info": {
+                        "variants": [
+                            {"bitrate": 832000, "url": f"https://video/{tweet_id}/low"},
+                            {"bitrate": 2176000, "url": f"https://video/{tweet_id}/hd"},
+                            {"url": f"https://video/{tweet_id}/playlist.m3u8"},
+                        ]
+                    },
+                }
+            ]
+        }
+    return parent
+
+
+def make_mention(
+    tweet_id: int, user_id: int, in_reply_to_status_id: Union[int, None]
+) -> dict:
+    """Get the raw JSON of a mention of the bot
+
+    Args:
+        tweet_id (int): mention tweet ID
+        user_id (int): ID of the user mentioning the bot
+        in_reply_to_status_id (Union[int, None]): parent tweet ID, None if not a reply
+
+    Returns:
+        dict: tweet JSON, as received by the stream
+    """
+    return {
+        "id": tweet_id,
+        "id_str": str(tweet_id),
+        "full_text": "@creator @bot please",
+        "in_reply_to_status_id": in_reply_to_status_id,
+        "in_reply_to_status_id_str": in_reply_to_status_id
+        and str(in_reply_to_status_id),
+        "user": {
+            "id": user_id,
+            "id_str": str(user_id),
+            "screen_name": f"User{user_id}",
+        },
+    }
+
+
+def generate(
+    mentions: int = 1000,
+    parents: int = 200,
+    users: int = 5000,
+    zipf: float = 1.1,
+    no_video_ratio: float = 0.15,
+    sensitive_ratio: float = 0.02,
+    banned_ratio: float = 0.01,
+    not_reply_ratio: float = 0.05,
+    seed: int = 0,
+) -> Dataset:
+    """Generate synthetic mentions
+
+    Args:
+        mentions (int, optional): number of mentions. Defaults to 1000.
+        parents (int, optional): number of parent tweets. Defaults to 200.
+        users (int, optional): number of users mentioning the bot. Defaults to 5000.
+        zipf (float, optional): Zipf exponent of the parent popularity. Defaults to 1.1.
+        no_video_ratio (float, optional): share of parents without video. Defaults to 0.15.
+        sensitive_ratio (float, optional): share of sensitive parents. Defaults to 0.02.
+        banned_ratio (float, optional): share of banned users. Defaults to 0.01.
+        not_reply_ratio (float, optional): share of mentions that are not replies. Defaults to 0.05.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        Dataset: the generated mentions
+    """
+    rng = random.Random(seed)
+
+    parent_ids = [1_000_000 + i for i in range(parents)]
+    parents_json = {}
+    for parent_id in parent_ids:
+        draw = rng.random()
+        if draw < no_video_ratio:
+            kind = "no_video"
+        elif draw < no_video_ratio + sensitive_ratio:
+            kind = "sensitive"
+        else:
+            kind = "video"
+        parents_json[str(parent_id)] = make_parent(parent_id, kind=kind)
+
+    user_ids = [1 + i for i in range(users)]
+    banned = {str(user_id) for user_id in user_ids if rng.random() < banned_ratio}
+
+    # Popularity of the parent of rank k : 1 / k ** zipf
+    weights = [1 / (rank**zipf) for rank in range(1, parents + 1)]
+    picked_parents = rng.choices(parent_ids, weights=weights, k=mentions)
+
+    mentions_json = []
+    for i, parent_id in enumerate(picked_parents):
+        in_reply_to_status_id = None if rng.random() < not_reply_ratio else parent_id
+        mentions_json.append(
+            make_mention(
+                tweet_id=10_000_000 + i,
+                user_id=rng.choice(user_ids),
+                in_reply_to_status_id=in_reply_to_status_id,
+            )
+        )
+
+    return Dataset(mentions=mentions_json, parents=parents_json, banned=banned)
+
+
+def load(mentions_file: str, parents_file: str) -> Dataset:
+    """Load recorded mentions
+
+    Args:
+        mentions_file (str): JSON lines file of the mentions received by the stream
+        parents_file (str): JSON lines file of their parent tweets
+
+    Returns:
+        Dataset: the recorded mentions (without banned users)
+    """
+    with open(mentions_file) as f:
+        mentions = [json.loads(line) for line in f if line.strip()]
+    with open(parents_file) as f:
+        parents = [json.loads(line) for line in f if line.strip()]
+    return Dataset(
+        mentions=mentions, parents={parent["id_str"]: parent for parent in parents}
+    )
@@ -0,0 +1,258 @@
+"""Local stand-ins of the Twitter API and of the backend, with configurable latencies
+
+"FakeTwitterAPI" replaces the tweepy API instance (no HTTP), "FakeBackend" is a
+real HTTP server answering the routes called by the bot, so the bot HTTP client
+code is part of what is measured.
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import requests
+import tweepy
+
+
+class Latency:
+    """Latency distribution of a dependency, in milliseconds
+
+    Specs :
+        - "0": no latency
+        - "const:20": always 20 ms
+        - "uniform:10:50": between 10 and 50 ms
+        - "lognormal:20:0.5": log-normal of median 20 ms and sigma 0.5 (long tail)
+    """
+
+    def __init__(self, spec: str = "0", seed: int = 0):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        if kind not in ("0", "const", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution : '{spec}'")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Draw a latency
+
+        Returns:
+            float: latency in seconds
+        """
+        with self._lock:
+            if self.kind == "const":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._random.uniform(*self.params)
+            elif self.kind == "lognormal":
+                median, sigma = self.params
+                value = median * self._random.lognormvariate(0, sigma)
+            else:
+                value = 0
+        return value / 1000
+
+    def wait(self) -> None:
+        """Sleep for a latency drawn from the distribution"""
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeTwitterAPI:
+    """Answer "get_status" and "update_status" like tweepy.API, from the parent
+    tweets of the dataset"""
+
+    def __init__(self, parents: dict, latency: Latency):
+        self.parents = parents
+        self.latency = latency
+        self.calls = Counter()
+        self._reply_ids = iter(range(50_000_000, 10**12))
+        self._lock = threading.Lock()
+
+    def get_status(self, id: str, **kwargs) -> tweepy.models.Status:
+        self._count("statuses/show")
+        self.latency.wait()
+        parent = self.parents.get(str(id))
+        if parent is None:
+            response = requests.Response()
+            response.status_code, response.reason = 404, "Not Found"
+            response._content = b"{}"
+            raise tweepy.errors.NotFound(response)
+        return tweepy.models.Status.parse(None, parent)
+
+    def update_status(self, status: str, in_reply_to_status_id: str, **kwargs):
+        self._count("statuses/update")
+        self.latency.wait()
+        with self._lock:
+            return SimpleNamespace(id=next(self._reply_ids), text=status)
+
+    def stats(self) -> dict:
+        """Get the calls received, by endpoint
+
+        Returns:
+            dict: {endpoint: calls}
+        """
+        with self._lock:
+            return dict(self.calls)
+
+    def _count(self, endpoint: str) -> None:
+        with self._lock:
+            self.calls[endpoint] += 1
+
+
+class FakeBackend:
+    """In memory backend answering the routes called by "handle_new_status" :
+    login, mention preflight and claims"""
+
+    API_PREFIX = "/api/v2"
+
+    def __init__(self, latency: Latency, banned: set = frozenset()):
+        self.latency = latency
+        self.banned = set(banned)
+        self.calls = Counter()
+        self._links = set()
+        self._videos_count = Counter()
+        self._claims = {}
+        # Claim ID by mention ID : a claim sent again gets it back
+        self._mention_claims = {}
+        self._claim_ids = iter(range(1, 10**12))
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.API_PREFIX}"
+
+    def start(self) -> None:
+        """Start the HTTP server on a free local port"""
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                backend._handle(self, "GET")
+
+            def do_POST(self):
+                backend._handle(self, "POST")
+
+            def do_PATCH(self):
+                backend._handle(self, "PATCH")
+
+            def do_DELETE(self):
+                backend._handle(self, "DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-backend", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the HTTP server"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> dict:
+        """Get the calls received, by route
+
+        Returns:
+            dict: {"METHOD /route": calls}
+        """
+        with self._lock:
+            return dict(self.calls)
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        url = urlparse(request.path)
+        path = url.path[len(self.API_PREFIX) :]
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        route = re.sub(r"/\d+$", "/{id}", path)
+        with self._lock:
+            self.calls[f"{method} {route}"] += 1
+
+        self.latency.wait()
+        status_code, content = self._route(method, route, path, url.query, body)
+
+        data = json.dumps(content).encode()
+        request.send_response(status_code)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _route(self, method: str, route: str, path: str, query: str, body: bytes):
+        if method == "POST" and route == "/auth/login":
+            return 200, {"access_token": self._token(), "token_type": "bearer"}
+
+        if method == "GET" and route == "/mentions/preflight":
+            params = {key: values[0] for key, values in parse_qs(query).items()}
+            with self._lock:
+                return 200, {
+                    **params,
+                    "is_banned": params["user_id"] in self.banned,
+                    "video_exists": params["tweet_id"] in self._videos_count,
+                    "user_exists": False,
+                    "videouserlink_exists": (params["screen_name"], params["tweet_id"])
+                    in self._links,
+                    "videos_count": self._videos_count[params["tweet_id"]],
+                }
+
+        if method == "POST" and route == "/mentions/claims":
+            claim = json.loads(body)
+            link = (claim["user"]["screen_name"], claim["video"]["tweet_id"])
+            mention_tweet_id = claim.get("mention_tweet_id")
+            with self._lock:
+                if claim["user"]["user_id"] in self.banned:
+                    return 403, {"detail": "User banned"}
+                claim_id = self._mention_claims.get(mention_tweet_id)
+                if claim_id in self._claims and self._claims[claim_id] == link:
+                    return 200, {
+                        "id": claim_id,
+                        "screen_name": link[0],
+                        "tweet_id": link[1],
+                    }
+                if link in self._links:
+                    return 409, {"detail": "Video already requested by User"}
+                if self._videos_count[link[1]] >= claim["asked_count_max"]:
+                    return 403, {"detail": "Video requested too many times"}
+                claim_id = next(self._claim_ids)
+                self._links.add(link)
+                self._videos_count[link[1]] += 1
+                self._claims[claim_id] = link
+                if mention_tweet_id is not None:
+                    self._mention_claims[mention_tweet_id] = claim_id
+            return 200, {"id": claim_id, "screen_name": link[0], "tweet_id": link[1]}
+
+        if route == "/mentions/claims/{id}" and method in ("PATCH", "DELETE"):
+            claim_id = int(path.rsplit("/", 1)[1])
+            with self._lock:
+                link = self._claims.get(claim_id)
+                if link is None:
+                    return 404, {"detail": "Claim not found"}
+                if method == "DELETE":
+                    del self._claims[claim_id]
+                    self._links.discard(link)
+                    self._videos_count[link[1]] -= 1
+            return 200, {"id": claim_id}
+
+        return 404, {"detail": "Not Found"}
+
+    @staticmethod
+    def _token() -> str:
+        payload = json.dumps({"sub": "admin", "exp": int(time.time()) + 3600})
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        return f"header.{encoded}.signature"
@@ -1,4 +1,20 @@
 from twitter_bot.stream import run_bot
+from twitter_bot.supervisor import run_supervisor
+
+import argparse
+import os
 
 if __name__ == "__main__":
-    run_bot()
+    parser = argparse.ArgumentParser(description="Twitter video download bot")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes handling the mentions, 1 to handle them in the stream process (CPU count by default)",
+    )
+    args = parser.parse_args()
+
+    if args.processes > 1:
+        run_supervisor(processes=args.processes)
+    else:
+        run_bot()
@@ -1,5 +1,57 @@
 """This file allows to avoid the 'ModuleFoundError'"""
 
+from twitter_bot import bans, batcher, limiter, outbox, resilience, store
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Each test starts with closed circuit breakers"""
+    resilience.reset_circuit_breakers()
+    yield
+    resilience.reset_circuit_breakers()
+
+
+@pytest.fixture(autouse=True)
+def clear_limiters():
+    """Each test starts without concurrency limiter"""
+    limiter.clear_limiters()
+    yield
+    limiter.clear_limiters()
+
+
+@pytest.fixture(autouse=True)
+def clear_known_store():
+    """Each test starts with an empty store of the links known to exist"""
+    store.clear_known_store()
+    yield
+    store.clear_known_store()
+
+
+@pytest.fixture(autouse=True)
+def clear_ban_replica():
+    """Each test starts without ban list replica"""
+    bans.clear_ban_replica()
+    yield
+    bans.clear_ban_replica()
+
+
+@pytest.fixture(autouse=True)
+def clear_claim_batcher():
+    """Each test starts without claim batcher, the claims are sent one by one"""
+    batcher.clear_claim_batcher()
+    yield
+    batcher.clear_claim_batcher()
+
+
+@pytest.fixture(autouse=True)
+def clear_outbox():
+    """Each test starts without outbox, the backend writes are made at once"""
+    outbox.clear_outbox()
+    yield
+    outbox.clear_outbox()
+
 
 def pytest_sessionstart(session):
     """
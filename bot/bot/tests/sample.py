@@ -62,3 +62,8 @@ videouserlink_in_db = videouserlink_create.dict()
 videouserlink_in_db["id"] = 1
 videouserlink_in_db["screen_name"] = "david"
 videouserlink_in_db["asked_at"] = 1_000_000
+
+
+mention_claim_create = schemas.MentionClaimCreate(
+    user=user_create, video=video_create, asked_count_max=5
+)
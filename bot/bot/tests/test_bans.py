@@ -0,0 +1,144 @@
+from twitter_bot import bans
+from twitter_bot.bans import BanReplica
+from tests import overrided_dependencies
+
+import time
+
+
+class FakeBanList:
+    """Ban list of the backend, read like "GET /banned/snapshot" and
+    "GET /banned/changes?since=&limit="
+    """
+
+    def __init__(self, user_ids: list):
+        self.changes = []
+        self.calls = []
+        self.down = False
+        for user_id in user_ids:
+            self.change(user_id, "created")
+
+    def change(self, user_id: str, operation: str) -> None:
+        self.changes.append(
+            {"seq": len(self.changes) + 1, "user_id": user_id, "operation": operation}
+        )
+
+    def fetch_snapshot(self):
+        self.calls.append("snapshot")
+        if self.down:
+            return None
+        banned = set()
+        for change in self.changes:
+            if change["operation"] == "deleted":
+                banned.discard(change["user_id"])
+            else:
+                banned.add(change["user_id"])
+        return {"user_ids": sorted(banned), "last_seq": len(self.changes)}
+
+    def fetch_changes(self, since: int, limit: int):
+        self.calls.append(since)
+        if self.down:
+            return None
+        changes = self.changes[since : since + limit]
+        return {
+            "changes": changes,
+            "last_seq": changes[-1]["seq"] if changes else since,
+        }
+
+
+def make_ban_replica(ban_list: FakeBanList, **kwargs) -> BanReplica:
+    return BanReplica(
+        fetch_snapshot=ban_list.fetch_snapshot,
+        fetch_changes=ban_list.fetch_changes,
+        **kwargs,
+    )
+
+
+def test_ban_replica_INCREMENTAL():
+    ban_list = FakeBanList(["1", "2"])
+    ban_replica = make_ban_replica(ban_list)
+
+    assert ban_replica.sync()
+    ban_list.change("3", "created")
+    ban_list.change("1", "deleted")
+    assert ban_replica.sync()
+
+    # Vérif : seuls les changements depuis le dernier lu sont demandés
+    assert ban_list.calls == ["snapshot", 2, 2]
+    assert ban_replica.is_banned("3")
+    assert not ban_replica.is_banned("1")
+    assert ban_replica.is_banned("2")
+    stats = ban_replica.stats()
+    assert stats["size"] == 2
+    assert stats["high_water"] == 4
+    assert stats["full_syncs"] == 1
+
+
+def test_ban_replica_PAGES():
+    ban_list = FakeBanList([])
+    ban_replica = make_ban_replica(ban_list, page_size=3)
+    ban_replica.sync()
+    for i in range(7):
+        ban_list.change(str(i), "created")
+
+    assert ban_replica.sync()
+
+    assert ban_list.calls == ["snapshot", 0, 0, 3, 6]
+    assert len(ban_replica) == 7
+
+
+def test_ban_replica_FULL():
+    ban_list = FakeBanList(["1", "2"])
+    ban_replica = make_ban_replica(ban_list)
+    ban_replica.sync()
+
+    # Appel : rechargement complet
+    ban_replica.sync(full=True)
+
+    assert ban_list.calls == ["snapshot", 2, "snapshot", 2]
+    assert ban_replica.stats()["full_syncs"] == 2
+    assert len(ban_replica) == 2
+
+
+def test_ban_replica_STALE(mocker):
+    ban_list = FakeBanList(["1"])
+    ban_replica = make_ban_replica(ban_list, max_age=300)
+
+    # Jamais synchronisé : pas de réponse
+    assert ban_replica.is_banned("1") is None
+
+    mocker.patch("time.monotonic", return_value=1000)
+    ban_replica.sync()
+    assert ban_replica.is_banned("1") is True
+
+    # Backend injoignable : la copie garde ses bans mais ne répond plus
+    ban_list.down = True
+    mocker.patch("time.monotonic", return_value=1301)
+    assert not ban_replica.sync()
+    assert ban_replica.is_banned("1") is None
+
+    stats = ban_replica.stats()
+    assert stats["failures"] == 1
+    assert stats["stale_lookups"] == 2
+    assert stats["size"] == 1
+
+
+def test_ban_replica_START_STOP():
+    ban_list = FakeBanList(["1"])
+    ban_replica = make_ban_replica(ban_list, refresh_interval=0.01)
+
+    ban_replica.start()
+    deadline = time.monotonic() + 5
+    while ban_replica.stats()["syncs"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ban_replica.stop()
+
+    assert ban_replica.is_banned("1")
+    assert ban_list.calls[:3] == ["snapshot", 1, 1]
+
+
+def test_get_ban_replica_DISABLED():
+    settings = overrided_dependencies.override_get_settings()
+    settings.BANS_REFRESH_INTERVAL = 0
+
+    assert bans.get_ban_replica(settings=settings) is None
+    assert bans.lookup(settings=settings, user_id="1") is None
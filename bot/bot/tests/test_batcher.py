@@ -0,0 +1,250 @@
+from twitter_bot import batcher, metrics, resilience
+from twitter_bot.batcher import WriteBatcher
+from twitter_bot.tools import api_tools, auth_tools
+from tests import overrided_dependencies, sample
+
+import threading
+import time
+
+import pytest
+import requests
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    auth_tools.clear_token_managers()
+    metrics.clear_metrics()
+    yield
+    auth_tools.clear_token_managers()
+    metrics.clear_metrics()
+
+
+class FakeBulkWrite:
+    """Bulk write doubling each item, slow enough for the next batch to fill"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.batches = []
+        self.fail = False
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(list(items))
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("backend down")
+        return [item * 2 for item in items]
+
+
+def submit_all(write_batcher: WriteBatcher, items: list) -> list:
+    """Submit each item from its own thread, like the workers"""
+    results = [None] * len(items)
+
+    def submit(index, item):
+        try:
+            results[index] = write_batcher.submit(item).result(timeout=5)
+        except Exception as e:
+            results[index] = e
+
+    threads = [
+        threading.Thread(target=submit, args=(index, item))
+        for index, item in enumerate(items)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_write_batcher_GATHERED():
+    write = FakeBulkWrite()
+    write_batcher = WriteBatcher(name="test", flush=write, max_size=100, max_delay=0.2)
+    write_batcher.start()
+
+    # Appel
+    results = submit_all(write_batcher, list(range(20)))
+    write_batcher.stop()
+
+    # Vérif : each caller gets the result of its own item, in few requests
+    assert results == [item * 2 for item in range(20)]
+    assert sorted(item for batch in write.batches for item in batch) == list(range(20))
+    assert len(write.batches) < 20
+    stats = write_batcher.stats()
+    assert stats["submitted"] == 20
+    assert stats["flushed"] == 20
+    assert stats["batches"] == len(write.batches)
+    assert metrics.BATCH_SIZE.count("test") == len(write.batches)
+
+
+def test_write_batcher_MAX_SIZE():
+    write = FakeBulkWrite(delay=0)
+    write_batcher = WriteBatcher(name="test", flush=write, max_size=3, max_delay=10)
+    write_batcher.start()
+
+    # Appel
+    futures = [write_batcher.submit(item) for item in range(7)]
+
+    # Vérif : full batches do not wait for the delay, the rest is sent at stop
+    assert [future.result(timeout=5) for future in futures[:6]] == [0, 2, 4, 6, 8, 10]
+    write_batcher.stop()
+    assert futures[6].result(timeout=0) == 12
+    assert write.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert write_batcher.stats()["full_batches"] == 2
+
+
+def test_write_batcher_MAX_DELAY():
+    write = FakeBulkWrite(delay=0)
+    write_batcher = WriteBatcher(name="test", flush=write, max_size=100, max_delay=0.05)
+    write_batcher.start()
+
+    # Appel
+    started = time.monotonic()
+    assert write_batcher.submit(1).result(timeout=5) == 2
+
+    # Vérif : a lone item waits for the delay only
+    assert time.monotonic() - started < 1
+    assert write.batches == [[1]]
+    write_batcher.stop()
+
+
+def test_write_batcher_FAILED():
+    write = FakeBulkWrite(delay=0)
+    write.fail = True
+    write_batcher = WriteBatcher(name="test", flush=write, max_size=100, max_delay=0.05)
+    write_batcher.start()
+
+    # Appel
+    results = submit_all(write_batcher, [1, 2, 3])
+    write_batcher.stop()
+
+    # Vérif : every item of the batch fails
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert write_batcher.stats()["failures"] >= 1
+
+
+def test_write_batcher_STOPPED():
+    write_batcher = WriteBatcher(name="test", flush=FakeBulkWrite())
+    write_batcher.start()
+    write_batcher.stop()
+
+    # Appel
+    future = write_batcher.submit(1)
+
+    # Vérif
+    with pytest.raises(RuntimeError):
+        future.result(timeout=0)
+
+
+def test_claim_mention_NOT_RUNNING(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.claim_mention", return_value=10)
+    mocker.patch("twitter_bot.tools.api_tools.claim_mentions")
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+
+    # Appel
+    assert (
+        batcher.claim_mention(settings=settings, claim=sample.mention_claim_create)
+        == 10
+    )
+
+    # Vérif : sent alone
+    api_tools.claim_mention.assert_called_once_with(
+        settings=settings,
+        access_token="access_token",
+        claim=sample.mention_claim_create,
+    )
+    api_tools.claim_mentions.assert_not_called()
+
+
+def test_claim_mention_RUNNING(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    settings.CLAIM_BATCH_DELAY = 0.2
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.claim_mention")
+    mocker.patch(
+        "twitter_bot.tools.api_tools.claim_mentions",
+        side_effect=lambda settings, access_token, claims: [
+            10 + index if index % 2 == 0 else None for index in range(len(claims))
+        ],
+    )
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+    batcher.get_claim_batcher(settings=settings).start()
+
+    # Appel
+    results = []
+    lock = threading.Lock()
+
+    def claim():
+        claim_id = batcher.claim_mention(
+            settings=settings, claim=sample.mention_claim_create
+        )
+        with lock:
+            results.append(claim_id)
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Vérif : one request, a claim ID or None by claim
+    api_tools.claim_mention.assert_not_called()
+    api_tools.claim_mentions.assert_called_once()
+    assert api_tools.claim_mentions.call_args.kwargs["access_token"] == "access_token"
+    assert sorted(results, key=str) == [10, 12, None, None]
+
+
+def test_claim_mention_DEADLINE_EXCEEDED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    settings.CLAIM_BATCH_DELAY = 10
+    settings.CLAIM_BATCH_SIZE = 100
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.claim_mentions", return_value=[10])
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+    batcher.get_claim_batcher(settings=settings).start()
+
+    # Appel : the batch waits longer than the deadline of the mention
+    started = time.monotonic()
+    with resilience.deadline(0.05):
+        with pytest.raises(resilience.DeadlineExceededError):
+            batcher.claim_mention(settings=settings, claim=sample.mention_claim_create)
+
+    # Vérif : the worker does not wait for the batch
+    assert time.monotonic() - started < 1
+    batcher.clear_claim_batcher()
+
+
+def test_claim_mention_BATCH_FAILED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mocker.patch(
+        "twitter_bot.tools.api_tools.claim_mentions",
+        side_effect=requests.HTTPError("HTTP 503"),
+    )
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+    batcher.get_claim_batcher(settings=settings).start()
+
+    # Appel + Vérif : the failure is raised to the claim, it is not a refusal
+    with pytest.raises(requests.HTTPError):
+        batcher.claim_mention(settings=settings, claim=sample.mention_claim_create)
+    batcher.clear_claim_batcher()
+
+
+def test_get_claim_batcher_DISABLED():
+    settings = overrided_dependencies.override_get_settings()
+    settings.CLAIM_BATCH_SIZE = 1
+
+    assert batcher.get_claim_batcher(settings=settings) is None
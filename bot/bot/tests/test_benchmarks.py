@@ -0,0 +1,49 @@
+from benchmarks import bench_mentions, bench_parsing, data
+
+
+def test_generate():
+    dataset = data.generate(mentions=500, parents=50, users=100, seed=1)
+
+    assert len(dataset.mentions) == 500
+    assert len(dataset.parents) == 50
+    # Loi de Zipf : le parent le plus mentionné a beaucoup plus de mentions que la médiane
+    counts = {}
+    for mention in dataset.mentions:
+        parent_id = mention["in_reply_to_status_id"]
+        counts[parent_id] = counts.get(parent_id, 0) + 1
+    counts.pop(None, None)
+    ranked = sorted(counts.values(), reverse=True)
+    assert ranked[0] > 5 * ranked[len(ranked) // 2]
+    # Reproductible
+    assert data.generate(mentions=500, parents=50, users=100, seed=1) == dataset
+
+
+def test_run():
+    dataset = data.generate(mentions=60, parents=10, users=20, seed=2)
+
+    for mode in bench_mentions.MODES:
+        report = bench_mentions.run(dataset=dataset, mode=mode, workers=2)
+
+        calls = report["calls"]
+        assert report["mentions"] == 60
+        assert len(report["calls"]) == 2
+        assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+        # Chaque réponse envoyée a été réservée puis confirmée
+        assert calls["twitter"].get("statuses/update", 0) == report["replies"]
+        assert (
+            calls["backend"].get("PATCH /mentions/claims/{id}", 0) == report["replies"]
+        )
+        # Les parents sont lus une fois chacun, au plus
+        assert calls["twitter"]["statuses/show"] <= len(dataset.parents)
+
+
+def test_run_parsing():
+    dataset = data.generate(mentions=200, parents=10, users=20, seed=3)
+
+    report = bench_parsing.run(dataset=dataset)
+
+    assert report["messages"] == 200
+    assert report["same_accessors"]
+    # Le record garde bien moins que le modèle tweepy
+    parsers = report["parsers"]
+    assert parsers["record"]["memory_bytes"] < parsers["tweepy"]["memory_bytes"]
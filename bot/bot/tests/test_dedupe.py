@@ -0,0 +1,96 @@
+from twitter_bot.dedupe import SeenFilter
+
+
+def test_seen_filter_DUPLICATE():
+    seen_filter = SeenFilter(window=60, buckets=6)
+
+    assert not seen_filter.seen(1, now=0)
+    assert not seen_filter.seen("2", now=0)
+    # Renvoyé par le stream après une reconnexion
+    assert seen_filter.seen("1", now=30)
+    assert seen_filter.seen(2, now=59)
+
+    stats = seen_filter.stats()
+    assert stats["checked"] == 4
+    assert stats["duplicates"] == 2
+    assert stats["suppression_rate"] == 0.5
+    assert stats["size"] == 2
+
+
+def test_seen_filter_WINDOW():
+    seen_filter = SeenFilter(window=60, buckets=6)
+
+    seen_filter.seen(1, now=0)
+    seen_filter.seen(2, now=35)
+
+    # Le bucket de l'ID 1 est sorti de la fenêtre
+    assert not seen_filter.seen(1, now=65)
+    assert seen_filter.seen(2, now=65)
+    assert seen_filter.stats()["size"] == 2
+
+
+def test_seen_filter_MAXSIZE():
+    seen_filter = SeenFilter(window=60, buckets=6, maxsize=100)
+
+    for status_id in range(1000):
+        seen_filter.seen(status_id, now=0)
+
+    # La mémoire reste bornée pendant une rafale
+    assert seen_filter.stats()["size"] <= 101
+    assert seen_filter.seen(999, now=0)
+    assert not seen_filter.seen(0, now=0)
+
+
+def test_seen_filter_SNAPSHOT(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen_filter = SeenFilter(window=60, buckets=6, snapshot_file=path)
+    seen_filter.seen(1, now=0)
+    seen_filter.seen(2**63 + 1, now=30)
+    seen_filter.snapshot()
+
+    # Appel
+    reloaded = SeenFilter(window=60, buckets=6, snapshot_file=path)
+    loaded = reloaded.load(now=40)
+
+    # Vérif
+    assert loaded == 2
+    assert reloaded.seen(1, now=40)
+    assert reloaded.seen(2**63 + 1, now=40)
+    assert not reloaded.seen(3, now=40)
+
+
+def test_seen_filter_SNAPSHOT_STALE(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen_filter = SeenFilter(window=60, buckets=6, snapshot_file=path)
+    seen_filter.seen(1, now=0)
+    seen_filter.seen(2, now=50)
+    seen_filter.snapshot()
+
+    reloaded = SeenFilter(window=60, buckets=6, snapshot_file=path)
+
+    # Seuls les IDs encore dans la fenêtre sont relus
+    assert reloaded.load(now=100) == 1
+    assert not reloaded.seen(1, now=100)
+    assert reloaded.seen(2, now=100)
+
+
+def test_seen_filter_START_STOP(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen_filter = SeenFilter(snapshot_file=path)
+    seen_filter.start()
+    seen_filter.seen(1)
+    seen_filter.stop()
+
+    reloaded = SeenFilter(snapshot_file=path)
+    reloaded.start()
+    try:
+        assert reloaded.seen(1)
+    finally:
+        reloaded.stop()
+    assert reloaded.stats()["snapshots"] == 1
+
+
+def test_seen_filter_MISSING_FILE(tmp_path):
+    seen_filter = SeenFilter(snapshot_file=str(tmp_path / "missing.bin"))
+
+    assert seen_filter.load() == 0
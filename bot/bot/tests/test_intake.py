@@ -0,0 +1,120 @@
+from twitter_bot.intake import IntakeLog
+
+import threading
+import time
+
+
+def make_intake_log(path, **kwargs) -> IntakeLog:
+    return IntakeLog(
+        path=str(path),
+        key=lambda item: item["id"],
+        serializer=lambda item: item,
+        deserializer=lambda data: data,
+        **kwargs,
+    )
+
+
+def test_intake_log_COMMITTED_BEFORE_CONSUMED(tmp_path):
+    consumed = []
+    intake_log = make_intake_log(tmp_path / "intake.db")
+
+    def consumer(item):
+        # L'item est déjà sur disque
+        assert intake_log.committed >= 1
+        consumed.append(item)
+
+    intake_log.start(consumer=consumer)
+    intake_log.append({"id": "1"})
+    assert intake_log.flush(timeout=5)
+    stats = intake_log.stats()
+    intake_log.stop()
+
+    assert consumed == [{"id": "1"}]
+    assert stats["pending"] == 0
+    assert stats["unacked"] == 1
+
+
+def test_intake_log_REPLAY_UNACKED(tmp_path):
+    intake_log = make_intake_log(tmp_path / "intake.db")
+    intake_log.start(consumer=lambda item: None)
+    for i in range(3):
+        intake_log.append({"id": str(i)})
+    intake_log.flush(timeout=5)
+    intake_log.ack({"id": "1"})
+    intake_log.stop()
+
+    # Redémarrage : seuls les items non acquittés sont rejoués, dans l'ordre
+    replayed = []
+    intake_log = make_intake_log(tmp_path / "intake.db")
+    intake_log.start(consumer=replayed.append)
+    stats = intake_log.stats()
+    intake_log.stop()
+
+    assert replayed == [{"id": "0"}, {"id": "2"}]
+    assert stats["replayed"] == 2
+    assert stats["unacked"] == 2
+
+
+def test_intake_log_GROUP_COMMIT(tmp_path):
+    consumed = []
+    blocked = threading.Event()
+    intake_log = make_intake_log(tmp_path / "intake.db", batch_size=100)
+
+    def consumer(item):
+        # Le premier item bloque le writer, les suivants s'accumulent
+        blocked.wait(5)
+        consumed.append(item)
+
+    intake_log.start(consumer=consumer)
+    intake_log.append({"id": "0"})
+    while intake_log.committed < 1:
+        time.sleep(0.01)
+    for i in range(1, 251):
+        intake_log.append({"id": str(i)})
+    blocked.set()
+    intake_log.flush(timeout=5)
+    stats = intake_log.stats()
+    intake_log.stop()
+
+    assert len(consumed) == 251
+    assert [item["id"] for item in consumed] == [str(i) for i in range(251)]
+    # 1 + 250 items par lots de 100
+    assert stats["batches"] == 4
+
+
+def test_intake_log_COMPACT(tmp_path):
+    intake_log = make_intake_log(tmp_path / "intake.db", retention=0)
+    intake_log.start(consumer=lambda item: None)
+    intake_log.append({"id": "1"})
+    intake_log.append({"id": "2"})
+    intake_log.flush(timeout=5)
+    intake_log.ack({"id": "1"})
+    # L'acquittement est écrit avec le prochain commit
+    intake_log.append({"id": "3"})
+    intake_log.flush(timeout=5)
+
+    assert intake_log.compact() == 1
+    stats = intake_log.stats()
+    intake_log.stop()
+
+    assert stats["compacted"] == 1
+    assert stats["unacked"] == 2
+
+
+def test_intake_log_UNREADABLE_ITEM_SKIPPED(tmp_path):
+    intake_log = make_intake_log(tmp_path / "intake.db")
+    intake_log.start(consumer=lambda item: None)
+    intake_log.append({"id": "1"})
+    intake_log.stop()
+
+    def deserializer(data):
+        raise ValueError()
+
+    intake_log = make_intake_log(tmp_path / "intake.db")
+    intake_log.deserializer = deserializer
+    intake_log.start(consumer=lambda item: None)
+    stats = intake_log.stats()
+    intake_log.stop()
+
+    assert stats["replayed"] == 0
+    assert stats["unacked"] == 0
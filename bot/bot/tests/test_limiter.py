@@ -0,0 +1,195 @@
+from twitter_bot import limiter, metrics, resilience
+from twitter_bot.limiter import AdaptiveLimiter
+
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear_metrics()
+    yield
+    metrics.clear_metrics()
+
+
+def call(dependency_limiter: AdaptiveLimiter, latency: float, success: bool = True):
+    """A call lasting "latency" seconds"""
+    dependency_limiter.acquire()
+    dependency_limiter.release(time.monotonic() - latency, success=success)
+
+
+def test_adaptive_limiter_RAISED_WHILE_USED():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=2, max_limit=10)
+
+    # Appel : two calls in flight at a time, at the no-load latency
+    for _ in range(30):
+        first = dependency_limiter.acquire()
+        second = dependency_limiter.acquire()
+        dependency_limiter.release(first - 0.01)
+        dependency_limiter.release(second - 0.01)
+
+    # Vérif : raised up to twice the calls in flight
+    assert dependency_limiter.limit == 4
+    assert dependency_limiter.stats()["cuts"] == 0
+
+
+def test_adaptive_limiter_NOT_RAISED_WHEN_IDLE():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=10)
+
+    # Appel : one call at a time
+    for _ in range(50):
+        call(dependency_limiter, latency=0.01)
+
+    # Vérif
+    assert dependency_limiter.limit == 10
+
+
+def test_adaptive_limiter_CUT_ONCE_BY_ROUND():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=10, backoff=0.5)
+
+    # Appel : two calls failing together
+    first = dependency_limiter.acquire()
+    second = dependency_limiter.acquire()
+    dependency_limiter.release(first, success=False)
+    dependency_limiter.release(second, success=False)
+
+    # Vérif : one cut, the second call started before it
+    assert dependency_limiter.limit == 5
+    stats = dependency_limiter.stats()
+    assert stats["cuts"] == 1
+    assert stats["failures"] == 2
+
+    # Vérif : a call started after the cut cuts again
+    call(dependency_limiter, latency=0, success=False)
+    assert dependency_limiter.limit == 2
+
+
+def test_adaptive_limiter_CUT_WHEN_SLOW():
+    dependency_limiter = AdaptiveLimiter(
+        "test", initial_limit=10, tolerance=2, backoff=0.5
+    )
+    for _ in range(5):
+        call(dependency_limiter, latency=0.01)
+
+    # Appel : latency over twice the no-load one
+    dependency_limiter.acquire()
+    dependency_limiter.release(time.monotonic() - 0.05)
+
+    # Vérif
+    assert dependency_limiter.limit == 5
+    assert dependency_limiter.stats()["min_latency_seconds"] == pytest.approx(
+        0.01, abs=0.005
+    )
+
+
+def test_adaptive_limiter_BASELINE_BY_OPERATION():
+    dependency_limiter = AdaptiveLimiter(
+        "test", initial_limit=10, tolerance=2, backoff=0.5
+    )
+    for _ in range(5):
+        started = dependency_limiter.acquire()
+        dependency_limiter.release(started - 0.01, operation="claim_mention")
+
+    # Appel : une opération lente par nature (login, snapshot)
+    for _ in range(5):
+        started = dependency_limiter.acquire()
+        dependency_limiter.release(started - 0.5, operation="get_bearer_token")
+
+    # Vérif : comparée à sa propre latence, elle ne coupe pas la limite
+    assert dependency_limiter.limit == 10
+    stats = dependency_limiter.stats()
+    assert stats["cuts"] == 0
+    assert stats["operations"] == 2
+
+    # Vérif : l'opération rapide ralentie coupe toujours la limite
+    started = dependency_limiter.acquire()
+    dependency_limiter.release(started - 0.05, operation="claim_mention")
+    assert dependency_limiter.limit == 5
+
+
+def test_adaptive_limiter_MIN_LIMIT():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=2, min_limit=1)
+
+    # Appel
+    for _ in range(20):
+        call(dependency_limiter, latency=0, success=False)
+
+    # Vérif
+    assert dependency_limiter.limit == 1
+
+
+def test_adaptive_limiter_QUEUED_OVER_LIMIT():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=1)
+    started = dependency_limiter.acquire()
+    acquired = []
+
+    # Appel : a second call waits for the slot of the first one
+    thread = threading.Thread(
+        target=lambda: acquired.append(dependency_limiter.acquire())
+    )
+    thread.start()
+    time.sleep(0.05)
+    assert dependency_limiter.stats()["waiting"] == 1
+    assert acquired == []
+    dependency_limiter.release(started)
+    thread.join(timeout=5)
+
+    # Vérif
+    assert len(acquired) == 1
+    stats = dependency_limiter.stats()
+    assert stats["in_flight"] == 1
+    assert stats["waiting"] == 0
+    assert stats["last_wait_seconds"] >= 0.04
+    assert metrics.LIMITER_WAIT_SECONDS.count("test") == 2
+
+
+def test_adaptive_limiter_TIMEOUT():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=1)
+    dependency_limiter.acquire()
+
+    # Appel
+    assert dependency_limiter.acquire(timeout=0.01) is None
+
+    # Vérif
+    stats = dependency_limiter.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_flight"] == 1
+
+
+def test_resilient_LIMITED(mocker):
+    mocker.patch("time.sleep")
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=4, backoff=0.5)
+    limiter.configure_limiter("test", dependency_limiter)
+    func = Mock(side_effect=[ConnectionError(), "ok"], __name__="func")
+    decorated = resilience.resilient("test", tries=2)(func)
+
+    # Appel
+    assert decorated() == "ok"
+
+    # Vérif : a slot by try, the failed try cut the limit
+    stats = dependency_limiter.stats()
+    assert stats["calls"] == 2
+    assert stats["failures"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["limit"] == 2
+    assert limiter.get_limiters_stats() == {"test": stats}
+
+
+def test_resilient_DEADLINE_EXCEEDED_WAITING():
+    dependency_limiter = AdaptiveLimiter("test", initial_limit=1)
+    limiter.configure_limiter("test", dependency_limiter)
+    dependency_limiter.acquire()
+    func = Mock(return_value="ok", __name__="func")
+    decorated = resilience.resilient("test", tries=1)(func)
+
+    # Appel
+    with resilience.deadline(0.05):
+        with pytest.raises(resilience.DeadlineExceededError):
+            decorated()
+
+    # Vérif : not called, the breaker does not count it
+    func.assert_not_called()
+    assert resilience.get_circuit_breaker("test").stats()["calls"] == 0
@@ -0,0 +1,96 @@
+from twitter_bot import metrics
+
+import urllib.request
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear_metrics()
+    yield
+    metrics.clear_metrics()
+
+
+def test_counter():
+    counter = metrics.Counter("test_total", "Test counter", labelnames=("outcome",))
+    counter.inc("ok")
+    counter.inc("ok")
+    counter.inc('k"o', amount=3)
+
+    assert counter.get("ok") == 2
+    assert list(counter.render()) == [
+        "# HELP test_total Test counter",
+        "# TYPE test_total counter",
+        'test_total{outcome="k\\"o"} 3',
+        'test_total{outcome="ok"} 2',
+    ]
+
+
+def test_histogram():
+    histogram = metrics.Histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert histogram.count() == 4
+    assert list(histogram.render())[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 2.65",
+        "test_seconds_count 4",
+    ]
+
+
+def test_histogram_TIME():
+    histogram = metrics.Histogram("test_seconds", "Test", labelnames=("stage",))
+
+    with pytest.raises(ValueError):
+        with histogram.time("parent"):
+            raise ValueError()
+
+    # Mesuré même en cas d'exception
+    assert histogram.count("parent") == 1
+
+
+def test_stats_samples():
+    stats = {
+        "backend": {"state": "open", "errors": 5},
+        "twitter_read": {"state": "closed", "errors": 0},
+    }
+
+    assert metrics.stats_samples("cb", stats, label="dependency") == [
+        ("cb_state", {"dependency": "backend", "state": "open"}, 1),
+        ("cb_errors", {"dependency": "backend"}, 5),
+        ("cb_state", {"dependency": "twitter_read", "state": "closed"}, 1),
+        ("cb_errors", {"dependency": "twitter_read"}, 0),
+    ]
+    # Les dicts imbriqués sont ignorés
+    assert metrics.stats_samples("pool", {"busy": True, "endpoints": {}}) == [
+        ("pool_busy", {}, 1)
+    ]
+
+
+def test_render_COLLECTORS():
+    metrics.MENTIONS.inc("replied")
+    metrics.register_collector("bot_test", lambda: {"queue_depth": 3})
+    metrics.register_collector("bot_broken", lambda: 1 / 0)
+
+    text = metrics.render()
+
+    assert 'bot_mentions_total{outcome="replied"} 1' in text
+    assert "# TYPE bot_test_queue_depth gauge\nbot_test_queue_depth 3\n" in text
+    assert "bot_broken" not in text
+
+
+def test_metrics_server():
+    metrics.MENTIONS.inc("banned")
+    server = metrics.start_metrics_server(host="127.0.0.1", port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert 'bot_mentions_total{outcome="banned"} 1' in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
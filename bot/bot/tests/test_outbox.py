@@ -0,0 +1,210 @@
+from twitter_bot import outbox
+from twitter_bot.outbox import Outbox
+from twitter_bot.tools import api_tools, auth_tools
+from tests import overrided_dependencies
+
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_token_managers():
+    auth_tools.clear_token_managers()
+    yield
+    auth_tools.clear_token_managers()
+
+
+class FakeBackend:
+    """Backend receiving the writes, down or refusing some on demand"""
+
+    def __init__(self):
+        self.writes = []
+        self.down = False
+        self.refused = set()
+        self.lock = threading.Lock()
+
+    def send(self, kind: str, payload: dict) -> bool:
+        if self.down:
+            raise ConnectionError("backend down")
+        if payload["claim_id"] in self.refused:
+            return False
+        with self.lock:
+            self.writes.append((kind, payload))
+        return True
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def confirm(claim_id: int) -> dict:
+    return {"claim_id": claim_id, "reply_tweet_id": str(100 + claim_id)}
+
+
+def test_outbox_SENT_IN_ORDER(tmp_path):
+    backend = FakeBackend()
+    box = Outbox(path=str(tmp_path / "outbox.db"), send=backend.send)
+    box.start()
+
+    # Appel
+    for claim_id in range(5):
+        assert box.put(outbox.CONFIRM_CLAIM, f"claim:{claim_id}", confirm(claim_id))
+    assert box.flush(timeout=5)
+
+    # Vérif
+    assert backend.writes == [
+        (outbox.CONFIRM_CLAIM, confirm(claim_id)) for claim_id in range(5)
+    ]
+    stats = box.stats()
+    assert stats["size"] == 0
+    assert stats["lag_seconds"] == 0
+    assert stats["put"] == 5
+    assert stats["sent"] == 5
+    box.stop()
+
+
+def test_outbox_DUPLICATE_KEY_IGNORED(tmp_path):
+    backend = FakeBackend()
+    backend.down = True
+    box = Outbox(path=str(tmp_path / "outbox.db"), send=backend.send, retry_delay=0)
+    box.start()
+
+    # Appel
+    assert box.put(outbox.CONFIRM_CLAIM, "claim:1", confirm(1))
+    assert not box.put(outbox.CONFIRM_CLAIM, "claim:1", confirm(1))
+    backend.down = False
+    assert box.flush(timeout=5)
+
+    # Vérif
+    assert backend.writes == [(outbox.CONFIRM_CLAIM, confirm(1))]
+    assert box.stats()["duplicates"] == 1
+    box.stop()
+
+
+def test_outbox_RETRIED_WHILE_BACKEND_DOWN(tmp_path):
+    backend = FakeBackend()
+    backend.down = True
+    box = Outbox(
+        path=str(tmp_path / "outbox.db"),
+        send=backend.send,
+        retry_delay=0.01,
+        retry_max=0.05,
+    )
+    box.start()
+
+    # Appel
+    box.put(outbox.CONFIRM_CLAIM, "claim:1", confirm(1))
+    box.put(outbox.CONFIRM_CLAIM, "claim:2", confirm(2))
+    wait_for(lambda: box.retries >= 3)
+
+    # Vérif : nothing sent, the writes wait in the outbox
+    stats = box.stats()
+    assert backend.writes == []
+    assert stats["size"] == 2
+    assert stats["lag_seconds"] > 0
+
+    # Vérif : sent in order once the backend is back
+    backend.down = False
+    assert box.flush(timeout=5)
+    assert backend.writes == [
+        (outbox.CONFIRM_CLAIM, confirm(1)),
+        (outbox.CONFIRM_CLAIM, confirm(2)),
+    ]
+    box.stop()
+
+
+def test_outbox_REFUSED_KEPT_ASIDE(tmp_path):
+    backend = FakeBackend()
+    backend.refused.add(1)
+    box = Outbox(path=str(tmp_path / "outbox.db"), send=backend.send)
+    box.start()
+
+    # Appel
+    box.put(outbox.CONFIRM_CLAIM, "claim:1", confirm(1))
+    box.put(outbox.CONFIRM_CLAIM, "claim:2", confirm(2))
+    assert box.flush(timeout=5)
+
+    # Vérif : the refused write does not block the next one
+    assert backend.writes == [(outbox.CONFIRM_CLAIM, confirm(2))]
+    stats = box.stats()
+    assert stats["size"] == 0
+    assert stats["failed"] == 1
+    assert stats["refused"] == 1
+    box.stop()
+
+
+def test_outbox_SENT_AFTER_RESTART(tmp_path):
+    backend = FakeBackend()
+    backend.down = True
+    path = str(tmp_path / "outbox.db")
+    box = Outbox(path=path, send=backend.send, retry_delay=60)
+    box.start()
+    box.put(outbox.CONFIRM_CLAIM, "claim:1", confirm(1))
+    box.stop(timeout=0.1)
+    assert backend.writes == []
+
+    # Appel
+    backend.down = False
+    box = Outbox(path=path, send=backend.send)
+    box.start()
+
+    # Vérif
+    assert box.flush(timeout=5)
+    assert backend.writes == [(outbox.CONFIRM_CLAIM, confirm(1))]
+    box.stop()
+
+
+def test_defer_NOT_RUNNING(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.confirm_claim", return_value=True)
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+
+    # Appel
+    assert outbox.defer(
+        settings=settings,
+        kind=outbox.CONFIRM_CLAIM,
+        key="claim:1",
+        payload=confirm(1),
+    )
+
+    # Vérif : written at once
+    api_tools.confirm_claim.assert_called_once_with(
+        settings=settings, access_token="access_token", **confirm(1)
+    )
+
+
+def test_defer_RUNNING(mocker, tmp_path):
+    settings = overrided_dependencies.override_get_settings()
+    settings.OUTBOX_FILE = str(tmp_path / "outbox.db")
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.confirm_claim", return_value=True)
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    )
+    process_outbox = outbox.get_outbox(settings=settings)
+    process_outbox.start()
+
+    # Appel
+    assert outbox.defer(
+        settings=settings,
+        kind=outbox.CONFIRM_CLAIM,
+        key="claim:1",
+        payload=confirm(1),
+    )
+
+    # Vérif : written by the flusher
+    assert process_outbox.flush(timeout=5)
+    api_tools.confirm_claim.assert_called_once_with(
+        settings=settings, access_token="access_token", **confirm(1)
+    )
+    assert process_outbox.stats()["sent"] == 1
@@ -0,0 +1,152 @@
+from twitter_bot import ratelimit
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+def make_response(url: str, status_code: int = 200, headers: dict = None):
+    return SimpleNamespace(url=url, status_code=status_code, headers=headers or {})
+
+
+def make_rate_limiter(
+    limit: int = 10, window: float = 10, burst: int = None, jitter: float = 0
+):
+    return ratelimit.RateLimiter(limits={None: (limit, window, burst)}, jitter=jitter)
+
+
+def test_endpoint_from_url():
+    assert (
+        ratelimit.endpoint_from_url(
+            "https://api.twitter.com/1.1/statuses/show.json?id=1&tweet_mode=extended"
+        )
+        == ratelimit.GET_STATUS
+    )
+    assert (
+        ratelimit.endpoint_from_url("https://api.twitter.com/1.1/statuses/update.json")
+        == ratelimit.POST_STATUS
+    )
+
+
+def test_token_bucket_BURST_THEN_PACED():
+    bucket = ratelimit.TokenBucket(limit=10, window=10, burst=2)
+    now = bucket.updated_at
+
+    assert bucket.acquire(now) == 0
+    assert bucket.acquire(now) == 0
+    # 1 jeton par seconde
+    assert bucket.acquire(now) == pytest.approx(1, abs=0.01)
+    assert bucket.acquire(now + 1) == 0
+
+
+def test_token_bucket_WINDOW_EXHAUSTED():
+    bucket = ratelimit.TokenBucket(limit=10, window=10)
+    now = bucket.updated_at
+    bucket.update(limit=10, remaining=0, reset_at=now + 5)
+
+    assert bucket.acquire(now) == pytest.approx(5, abs=0.01)
+    # Nouvelle fenêtre
+    assert bucket.acquire(now + 5) == 0
+
+
+def test_token_bucket_HEADERS_ONLY_LOWER():
+    bucket = ratelimit.TokenBucket(limit=10, window=10)
+    now = bucket.updated_at
+
+    # Budget du compte plus grand : la limite configurée est gardée
+    bucket.update(limit=900, remaining=899, reset_at=now + 100)
+    assert bucket.limit == 10
+    assert bucket.rate == 1
+    assert bucket.remaining == 10
+    assert bucket.reset_at == now + 10
+
+    # Moins d'appels restants sur le compte : sa fenêtre s'applique
+    bucket.update(limit=900, remaining=3, reset_at=now + 100)
+    assert bucket.remaining == 3
+    assert bucket.reset_at == now + 100
+
+
+def test_rate_limiter_ACQUIRE_RAISES_RATE_LIMITED():
+    rate_limiter = make_rate_limiter(limit=10, window=10, burst=1)
+
+    rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+    with pytest.raises(ratelimit.RateLimited) as e:
+        rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+
+    assert 0 < e.value.retry_at - time.time() <= 1
+    # Les autres credentials ont leur propre budget
+    rate_limiter.acquire(credentials="other", endpoint=ratelimit.POST_STATUS)
+    assert rate_limiter.stats()["acquired"] == 2
+    assert rate_limiter.stats()["deferred"] == 1
+
+
+def test_rate_limiter_JITTER():
+    rate_limiter = make_rate_limiter(limit=10, window=10, burst=1, jitter=0.5)
+    rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+
+    # Appel
+    retry_ats = set()
+    for _ in range(20):
+        with pytest.raises(ratelimit.RateLimited) as e:
+            rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+        retry_ats.add(e.value.retry_at)
+
+    # Vérif : étalés sur la moitié de l'attente au plus
+    assert len(retry_ats) > 1
+    assert all(0 < retry_at - time.time() <= 1.5 for retry_at in retry_ats)
+
+
+def test_rate_limiter_REFUND():
+    rate_limiter = make_rate_limiter(limit=10, window=10, burst=1)
+    rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+
+    # Appel
+    rate_limiter.refund(credentials="token", endpoint=ratelimit.POST_STATUS)
+
+    # Vérif : le jeton rendu est repris sans attendre
+    rate_limiter.acquire(credentials="token", endpoint=ratelimit.POST_STATUS)
+    stats = rate_limiter.stats()
+    assert stats["acquired"] == 1
+    assert stats["endpoints"][ratelimit.POST_STATUS]["remaining"] == 9
+
+
+def test_rate_limiter_HEADERS():
+    rate_limiter = make_rate_limiter()
+    reset_at = int(time.time()) + 100
+
+    hook = rate_limiter.response_hook(credentials="token")
+    hook(
+        make_response(
+            "https://api.twitter.com/1.1/statuses/show.json?id=1",
+            headers={
+                "x-rate-limit-limit": "900",
+                "x-rate-limit-remaining": "0",
+                "x-rate-limit-reset": str(reset_at),
+            },
+        )
+    )
+
+    assert rate_limiter.stats()["endpoints"][ratelimit.GET_STATUS]["remaining"] == 0
+    with pytest.raises(ratelimit.RateLimited) as e:
+        rate_limiter.acquire(credentials="token", endpoint=ratelimit.GET_STATUS)
+    assert e.value.retry_at == reset_at
+
+
+def test_rate_limiter_429_WITHOUT_HEADERS():
+    rate_limiter = make_rate_limiter()
+
+    rate_limiter.update_from_response(
+        credentials="token",
+        response=make_response(
+            "https://api.twitter.com/1.1/statuses/update.json", status_code=429
+        ),
+    )
+
+    retry_at = rate_limiter.retry_at(
+        credentials="token", endpoint=ratelimit.POST_STATUS
+    )
+    assert retry_at - time.time() == pytest.approx(
+        ratelimit.DEFAULT_RATE_LIMITED_DELAY, abs=1
+    )
+    assert rate_limiter.stats()["rate_limited"] == 1
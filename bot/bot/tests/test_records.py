@@ -0,0 +1,72 @@
+from twitter_bot import records
+from twitter_bot.tools import twitter_tools
+from benchmarks import data
+
+import json
+
+import pytest
+import tweepy
+
+
+def accessors(status):
+    return (
+        twitter_tools.get_in_reply_to_status_id(status=status),
+        twitter_tools.extract_infos_from_status(status=status),
+        twitter_tools.get_video_urls_from_status(status=status),
+        twitter_tools.is_possibly_sensitive(status=status),
+    )
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        data.make_mention(tweet_id=1, user_id=2, in_reply_to_status_id=3),
+        data.make_mention(tweet_id=1, user_id=2, in_reply_to_status_id=None),
+        data.make_parent(tweet_id=4),
+        data.make_parent(tweet_id=4, kind="no_video"),
+        data.make_parent(tweet_id=4, kind="sensitive"),
+    ],
+)
+def test_from_json_SAME_ACCESSORS_AS_TWEEPY(payload):
+    record = records.StatusRecord.from_json(payload)
+    status = tweepy.models.Status.parse(None, payload)
+
+    assert accessors(record) == accessors(status)
+    assert record.id_str == status.id_str
+    # Comme tweepy : un champ absent du JSON n'est pas un attribut
+    for name in ("full_text", "text", "extended_entities", "possibly_sensitive"):
+        assert hasattr(record, name) == hasattr(status, name)
+
+
+def test_from_json_ONLY_READ_FIELDS():
+    payload = data.make_parent(tweet_id=4)
+    payload["extended_entities"]["media"][0]["sizes"] = {"large": {"w": 1280}}
+    payload["extended_entities"]["media"].append({"type": "photo"})
+    payload["entities"] = {"hashtags": []}
+
+    record = records.StatusRecord.from_json(payload)
+
+    # Seuls les offsets des mentions et liens sont gardés
+    assert record.entities == {}
+    assert not hasattr(record, "__dict__")
+    media = record.extended_entities["media"]
+    assert len(media) == 1
+    assert set(media[0]) == {"media_url_https", "video_info"}
+
+
+def test_json_ROUND_TRIP():
+    record = records.StatusRecord.from_json(data.make_parent(tweet_id=4))
+
+    copy = records.StatusRecord.from_json(json.loads(json.dumps(record._json)))
+
+    assert copy._json == record._json
+    assert accessors(copy) == accessors(record)
+
+
+@pytest.mark.parametrize("orjson", [records.orjson, None])
+def test_loads(mocker, orjson):
+    # Mock : sans orjson, le décodeur standard est utilisé
+    mocker.patch.object(records, "orjson", orjson)
+
+    assert records.loads(b'{"id": 1, "text": "\\u00e9"}') == {"id": 1, "text": "é"}
+    assert records.loads('{"id": 1}') == {"id": 1}
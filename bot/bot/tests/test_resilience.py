@@ -0,0 +1,185 @@
+from twitter_bot import resilience
+
+import random
+import time
+from unittest.mock import Mock
+
+import pytest
+
+
+def test_retry_policy_FULL_JITTER(mocker):
+    mocker.patch("random.uniform", side_effect=lambda low, high: high)
+    policy = resilience.RetryPolicy(tries=5, base_delay=0.5, max_delay=1.5)
+
+    # Bornes : 0.5, 1, 2 -> 1.5, 4 -> 1.5
+    assert list(policy.delays()) == [0.5, 1, 1.5, 1.5]
+    assert all(call.args[0] == 0 for call in random.uniform.call_args_list)
+
+
+def test_resilient_RETRIES_THEN_SUCCEEDS(mocker):
+    mocker.patch("time.sleep")
+    func = Mock(
+        side_effect=[ConnectionError(), ConnectionError(), "ok"], __name__="func"
+    )
+    decorated = resilience.resilient("test", tries=3)(func)
+
+    assert decorated() == "ok"
+    assert func.call_count == 3
+    assert time.sleep.call_count == 2
+    assert all(call.args[0] <= 1 for call in time.sleep.call_args_list)
+
+
+def test_resilient_GIVES_UP(mocker):
+    mocker.patch("time.sleep")
+    func = Mock(side_effect=ConnectionError(), __name__="func")
+    decorated = resilience.resilient("test", tries=3)(func)
+
+    with pytest.raises(ConnectionError):
+        decorated()
+    assert func.call_count == 3
+
+
+def test_resilient_SKIP_NOT_RETRIED_NOT_COUNTED(mocker):
+    mocker.patch("time.sleep")
+    func = Mock(side_effect=KeyError(), __name__="func")
+    decorated = resilience.resilient("test", tries=3, skip=KeyError)(func)
+
+    with pytest.raises(KeyError):
+        decorated()
+    assert func.call_count == 1
+    assert resilience.get_circuit_breaker("test").stats()["errors"] == 0
+
+
+def test_resilient_DEADLINE_STOPS_RETRIES(mocker):
+    mocker.patch("random.uniform", side_effect=lambda low, high: high)
+    func = Mock(side_effect=ConnectionError(), __name__="func")
+    decorated = resilience.resilient("test", tries=5, base_delay=10)(func)
+
+    # Le délai de 10s dépasse le temps restant : pas d'attente
+    with resilience.deadline(1):
+        with pytest.raises(ConnectionError):
+            decorated()
+    assert func.call_count == 1
+
+
+def test_resilient_DEADLINE_EXCEEDED():
+    func = Mock(return_value="ok", __name__="func")
+    decorated = resilience.resilient("test")(func)
+
+    with resilience.deadline(0):
+        with pytest.raises(resilience.DeadlineExceededError):
+            decorated()
+    func.assert_not_called()
+
+
+def test_resilient_DEADLINE_EXCEEDED_IN_CALL():
+    func = Mock(side_effect=resilience.DeadlineExceededError("late"), __name__="func")
+    decorated = resilience.resilient("test", tries=3)(func)
+
+    with pytest.raises(resilience.DeadlineExceededError):
+        decorated()
+
+    # Pas réessayé, pas compté comme un échec du service
+    assert func.call_count == 1
+    stats = resilience.get_circuit_breaker("test").stats()
+    assert stats["errors"] == 0
+    assert stats["calls"] == 0
+
+
+def test_deadline_INNER_CAN_NOT_EXTEND_OUTER():
+    assert resilience.remaining() is None
+    with resilience.deadline(1):
+        with resilience.deadline(100):
+            assert resilience.remaining() <= 1
+        assert resilience.remaining() <= 1
+    assert resilience.remaining() is None
+
+
+def test_circuit_breaker_OPENS_AND_FAILS_FAST(mocker):
+    mocker.patch("time.sleep")
+    circuit_breaker = resilience.CircuitBreaker("test", failure_threshold=2)
+    mocker.patch(
+        "twitter_bot.resilience.get_circuit_breaker", return_value=circuit_breaker
+    )
+    func = Mock(side_effect=ConnectionError(), __name__="func")
+    decorated = resilience.resilient("test", tries=1)(func)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            decorated()
+
+    # Le breaker est ouvert : la fonction n'est plus appelée
+    with pytest.raises(resilience.CircuitOpenError):
+        decorated()
+    assert func.call_count == 2
+    stats = circuit_breaker.stats()
+    assert stats["state"] == resilience.OPEN
+    assert stats["opened"] == 1
+    assert stats["rejected"] == 1
+
+
+def test_circuit_breaker_HALF_OPEN():
+    circuit_breaker = resilience.CircuitBreaker(
+        "test", failure_threshold=1, reset_timeout=0.05
+    )
+    circuit_breaker.allow()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == resilience.OPEN
+
+    time.sleep(0.06)
+    assert circuit_breaker.state == resilience.HALF_OPEN
+
+    # Un seul appel de test à la fois
+    circuit_breaker.allow()
+    with pytest.raises(resilience.CircuitOpenError):
+        circuit_breaker.allow()
+
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == resilience.CLOSED
+
+
+def test_circuit_breaker_HALF_OPEN_FAILURE_REOPENS():
+    circuit_breaker = resilience.CircuitBreaker(
+        "test", failure_threshold=3, reset_timeout=0.05
+    )
+    for _ in range(3):
+        circuit_breaker.record_failure()
+    time.sleep(0.06)
+
+    circuit_breaker.allow()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == resilience.OPEN
+    assert circuit_breaker.stats()["opened"] == 2
+
+
+def test_circuit_breaker_HALF_OPEN_INTERRUPTED(mocker):
+    circuit_breaker = resilience.CircuitBreaker(
+        "test", failure_threshold=1, reset_timeout=0.05
+    )
+    mocker.patch(
+        "twitter_bot.resilience.get_circuit_breaker", return_value=circuit_breaker
+    )
+    circuit_breaker.allow()
+    circuit_breaker.record_failure()
+    time.sleep(0.06)
+    func = Mock(side_effect=KeyboardInterrupt(), __name__="func")
+    decorated = resilience.resilient("test", tries=1)(func)
+
+    # Appel : l'appel de test est interrompu
+    with pytest.raises(KeyboardInterrupt):
+        decorated()
+
+    # Vérif : l'appel de test n'est pas laissé en cours
+    assert circuit_breaker.state == resilience.HALF_OPEN
+    circuit_breaker.allow()
+
+
+def test_configure_circuit_breakers():
+    circuit_breaker = resilience.get_circuit_breaker("test")
+    resilience.configure_circuit_breakers(failure_threshold=2, reset_timeout=10)
+    try:
+        assert circuit_breaker.failure_threshold == 2
+        assert resilience.get_circuit_breaker("other").reset_timeout == 10
+        assert resilience.get_circuit_breakers_stats()["other"]["state"] == "closed"
+    finally:
+        resilience.configure_circuit_breakers(failure_threshold=5, reset_timeout=30)
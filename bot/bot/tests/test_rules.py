@@ -0,0 +1,101 @@
+from twitter_bot import rules
+
+import pytest
+
+
+def make_engine(speculate_below: float = 0.25, alpha: float = 0.5):
+    return rules.RuleEngine(
+        rules=[
+            rules.Rule(
+                name="negative",
+                source="cheap",
+                check=lambda data, context: data < 0,
+                message=lambda data, context: f"{data} is negative",
+                rejection_rate=0.1,
+            ),
+            rules.Rule(
+                name="too_big",
+                source="cheap",
+                check=lambda data, context: data > context["max"],
+                message=lambda data, context: f"{data} is too big",
+                rejection_rate=0.1,
+            ),
+            rules.Rule(
+                name="slow_rejection",
+                source="slow",
+                check=lambda data, context: data,
+                message=lambda data, context: "rejected",
+                rejection_rate=0.5,
+            ),
+        ],
+        costs={"cheap": 0.01, "slow": 1},
+        alpha=alpha,
+        speculate_below=speculate_below,
+    )
+
+
+def test_rejection_rate():
+    engine = make_engine()
+
+    assert engine.rejection_rate("cheap") == pytest.approx(1 - 0.9 * 0.9)
+    assert engine.rejection_rate("slow") == pytest.approx(0.5)
+    assert engine.rejection_rate("unknown") == 0
+
+
+def test_order_BY_COST_OF_A_REJECTION():
+    engine = make_engine()
+
+    assert engine.order(["slow", "cheap"]) == ["cheap", "slow"]
+
+    # La source lente devient bien moins chère pour rejeter
+    engine.observe_cost("cheap", 10.01)
+    assert engine.order(["slow", "cheap"]) == ["slow", "cheap"]
+
+
+def test_can_speculate():
+    engine = make_engine()
+
+    assert engine.can_speculate([])
+    assert engine.can_speculate(["cheap"])
+    assert not engine.can_speculate(["slow"])
+    assert not make_engine(speculate_below=0).can_speculate(["cheap"])
+
+
+def test_check_FIRST_REJECTING_RULE():
+    engine = make_engine()
+
+    assert engine.check("cheap", 1, {"max": 10}) is None
+    assert engine.check("cheap", 11, {"max": 10}).name == "too_big"
+    rule = engine.check("cheap", -1, {"max": -5})
+    # Les deux règles rejettent : seule la première est comptée
+    assert rule.name == "negative"
+    assert rule.message(-1, {}) == "-1 is negative"
+
+    stats = engine.stats()
+    assert stats["negative"]["evaluated"] == 3
+    assert stats["negative"]["rejected"] == 1
+    assert stats["negative"]["hit_rate"] == pytest.approx(0.3333)
+    assert stats["too_big"]["evaluated"] == 2
+    assert stats["too_big"]["rejected"] == 1
+    assert stats["slow_rejection"]["evaluated"] == 0
+    assert stats["slow_rejection"]["hit_rate"] == 0.0
+
+
+def test_check_MOVING_REJECTION_RATE():
+    engine = make_engine(alpha=0.5)
+
+    engine.check("slow", True, {})
+    assert engine.stats()["slow_rejection"]["rejection_rate"] == 0.75
+    engine.check("slow", False, {})
+    engine.check("slow", False, {})
+    assert engine.stats()["slow_rejection"]["rejection_rate"] == pytest.approx(0.1875)
+
+
+def test_observe_cost():
+    engine = make_engine(alpha=0.5)
+
+    engine.observe_cost("slow", 3)
+    assert engine.stats()["slow_rejection"]["cost"] == 2
+    # Source sans coût initial : la première mesure est prise telle quelle
+    engine.observe_cost("new", 4)
+    assert engine.order(["new", "cheap"]) == ["cheap", "new"]
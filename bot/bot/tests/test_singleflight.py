@@ -0,0 +1,79 @@
+from twitter_bot.singleflight import SingleFlight
+
+import threading
+import time
+
+import pytest
+
+
+def run_concurrently(count: int, target) -> list:
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(target())) for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_COALESCED():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = run_concurrently(10, lambda: single_flight.do("key", slow_call))
+
+    assert results == ["result"] * 10
+    assert len(calls) == 1
+    assert single_flight.stats() == {"calls": 1, "coalesced": 9, "in_flight": 0}
+
+
+def test_single_flight_DIFFERENT_KEYS():
+    single_flight = SingleFlight()
+
+    assert single_flight.do("a", lambda: 1) == 1
+    assert single_flight.do("b", lambda: 2) == 2
+    assert single_flight.do("a", lambda: 3) == 3
+    assert single_flight.stats()["calls"] == 3
+
+
+def test_single_flight_ERROR_SHARED():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing_call():
+        started.set()
+        release.wait()
+        raise ValueError("failed")
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.do("key", failing_call)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    assert single_flight.stats()["coalesced"] == 1
+
+    # Nouvel appel après l'échec
+    with pytest.raises(ValueError):
+        single_flight.do("key", failing_call)
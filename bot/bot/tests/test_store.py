@@ -0,0 +1,167 @@
+from twitter_bot import store
+from twitter_bot.store import KnownStore
+from tests import overrided_dependencies
+
+import json
+
+
+def test_known_store_CONTAINS():
+    known_store = KnownStore()
+    known_store.add(("didier", "2"))
+
+    assert known_store.contains(("didier", "2"))
+    assert not known_store.contains(("didier", "3"))
+
+    stats = known_store.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["links"] == 1
+
+
+def test_known_store_TTL(mocker):
+    known_store = KnownStore(ttl=60)
+
+    # Mocks
+    mocker.patch("time.time", return_value=1000)
+    known_store.add(("didier", "2"))
+    mocker.patch("time.time", return_value=1061)
+
+    # Vérifié à nouveau par le backend après le TTL (suppression par un admin)
+    assert not known_store.contains(("didier", "2"))
+    assert len(known_store) == 0
+
+
+def test_known_store_SWEEP(mocker):
+    known_store = KnownStore(ttl=60)
+
+    # Mocks
+    mocker.patch("time.time", return_value=1000)
+    known_store.add(("didier", "2"))
+    known_store.add(("david", "2"))
+    mocker.patch("time.time", return_value=1030)
+    known_store.add(("didier", "3"))
+    mocker.patch("time.time", return_value=1061)
+
+    # Appel : les liens expirés jamais relus sont supprimés
+    assert known_store.sweep() == 2
+
+    # Vérif
+    assert len(known_store) == 1
+    assert known_store.stats()["expired"] == 2
+
+
+def test_known_store_MAX_SIZE():
+    known_store = KnownStore(max_size=2)
+    known_store.add(("didier", "1"))
+    known_store.add(("didier", "2"))
+    # Ajouté à nouveau : le plus récent
+    known_store.add(("didier", "1"))
+
+    # Appel
+    known_store.add(("didier", "3"))
+
+    # Vérif : le plus ancien est oublié
+    assert not known_store.contains(("didier", "2"))
+    assert known_store.contains(("didier", "1"))
+    assert known_store.contains(("didier", "3"))
+    assert known_store.stats()["evictions"] == 1
+
+
+def test_known_store_FORGET():
+    known_store = KnownStore()
+    known_store.add(("didier", "2"))
+    known_store.add(("didier", "3"))
+
+    # Appel
+    known_store.forget(("didier", "2"))
+    known_store.forget(("david", "2"))
+
+    # Vérif : seul un lien connu compte comme invalidé
+    assert not known_store.contains(("didier", "2"))
+    assert known_store.contains(("didier", "3"))
+    assert known_store.stats()["invalidations"] == 1
+
+
+def test_known_store_SNAPSHOT(tmp_path):
+    path = str(tmp_path / "store.json")
+    known_store = KnownStore(snapshot_file=path)
+    known_store.start()
+    known_store.add(("didier", "2"))
+    known_store.stop()
+
+    # Appel : chaud dès le redémarrage
+    reloaded = KnownStore(snapshot_file=path)
+    reloaded.start()
+    try:
+        assert reloaded.contains(("didier", "2"))
+        assert reloaded.stats()["links"] == 1
+    finally:
+        reloaded.stop()
+
+
+def test_known_store_SNAPSHOT_EXPIRED(tmp_path, mocker):
+    path = str(tmp_path / "store.json")
+    known_store = KnownStore(ttl=60, snapshot_file=path)
+    mocker.patch("time.time", return_value=1000)
+    known_store.add(("didier", "2"))
+    known_store.snapshot()
+
+    mocker.patch("time.time", return_value=1100)
+    reloaded = KnownStore(ttl=60, snapshot_file=path)
+
+    assert reloaded.load() == 0
+
+
+def test_known_store_SNAPSHOT_UNREADABLE(tmp_path):
+    path = tmp_path / "store.json"
+    path.write_text("{")
+
+    assert KnownStore(snapshot_file=str(path)).load() == 0
+
+
+def test_get_known_store_DISABLED():
+    settings = overrided_dependencies.override_get_settings()
+    settings.STORE_TTL = 0
+
+    assert store.get_known_store(settings=settings) is None
+    store.remember_link(settings=settings, screen_name="didier", tweet_id="2")
+    assert not store.is_known_link(
+        settings=settings, screen_name="didier", tweet_id="2"
+    )
+    store.forget_link(settings=settings, screen_name="didier", tweet_id="2")
+
+
+def test_remember_preflight():
+    settings = overrided_dependencies.override_get_settings()
+
+    # Appel : seul le lien est gardé
+    store.remember_preflight(
+        settings=settings,
+        screen_name="didier",
+        tweet_id="2",
+        preflight={"user_exists": True, "videouserlink_exists": False},
+    )
+    assert not store.is_known_link(
+        settings=settings, screen_name="didier", tweet_id="2"
+    )
+
+    store.remember_preflight(
+        settings=settings,
+        screen_name="didier",
+        tweet_id="2",
+        preflight={"videouserlink_exists": True},
+    )
+    assert store.is_known_link(settings=settings, screen_name="didier", tweet_id="2")
+
+
+def test_clear_known_store_SNAPSHOT_WRITTEN(tmp_path):
+    settings = overrided_dependencies.override_get_settings()
+    settings.STORE_FILE = str(tmp_path / "store.json")
+    store.get_known_store(settings=settings).start()
+    store.remember_link(settings=settings, screen_name="didier", tweet_id="2")
+
+    store.clear_known_store()
+
+    with open(settings.STORE_FILE) as f:
+        content = json.load(f)
+    assert [key for key, _ in content["link"]] == [["didier", "2"]]
@@ -0,0 +1,140 @@
+from twitter_bot import records, stream
+from twitter_bot.tools.error_tools import Deferred
+from tests import overrided_dependencies, sample
+from benchmarks import data
+
+import json
+
+import pytest
+import tweepy
+
+
+def test_on_status_ENQUEUE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    pool = mocker.Mock()
+
+    # Mock
+    mocker.patch("twitter_bot.tools.twitter_tools.handle_new_status")
+
+    streamer = stream.Streamer(settings=settings, pool=pool)
+    status = sample.Status()
+    streamer.on_status(status)
+
+    # The status is only queued, not handled by the stream thread
+    pool.submit.assert_called_once_with(status)
+    stream.twitter_tools.handle_new_status.assert_not_called()
+
+
+def test_get_worker_pool(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock
+    mocker.patch("twitter_bot.tools.twitter_tools.handle_new_status")
+
+    pool = stream.get_worker_pool(settings=settings)
+    pool.handler("status")
+
+    assert pool.workers == settings.WORKERS_COUNT
+    assert pool.maxsize == settings.QUEUE_MAXSIZE
+    stream.twitter_tools.handle_new_status.assert_called_once_with(
+        settings=settings, status="status"
+    )
+
+
+def test_on_status_INTAKE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    pool = mocker.Mock()
+    intake = mocker.Mock()
+
+    streamer = stream.Streamer(settings=settings, pool=pool, intake=intake)
+    status = sample.Status()
+    streamer.on_status(status)
+
+    # Le status passe par le log, qui le donne au pool une fois écrit
+    intake.append.assert_called_once_with(status)
+    pool.submit.assert_not_called()
+
+
+def test_on_status_DUPLICATE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    settings.SEEN_FILE = ""
+    pool = mocker.Mock()
+    intake = mocker.Mock()
+
+    seen = stream.get_seen_filter(settings=settings)
+    streamer = stream.Streamer(settings=settings, pool=pool, intake=intake, seen=seen)
+    status = sample.Status()
+    streamer.on_status(status)
+    # Renvoyé après une reconnexion du stream
+    streamer.on_status(status)
+
+    # Ignoré avant d'être écrit dans le log
+    intake.append.assert_called_once_with(status)
+    assert seen.stats()["duplicates"] == 1
+
+
+def test_get_seen_filter_DISABLED():
+    settings = overrided_dependencies.override_get_settings()
+    settings.SEEN_WINDOW = 0
+
+    assert stream.get_seen_filter(settings=settings) is None
+
+
+def test_get_worker_pool_ACK(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    intake = mocker.Mock()
+
+    # Mock
+    mocker.patch(
+        "twitter_bot.tools.twitter_tools.handle_new_status",
+        side_effect=[True, Deferred("later", retry_at=0)],
+    )
+
+    pool = stream.get_worker_pool(settings=settings, intake=intake)
+    pool.handler("status")
+    with pytest.raises(Deferred):
+        pool.handler("deferred")
+
+    # Seul le status traité est acquitté
+    intake.ack.assert_called_once_with("status")
+
+
+def test_get_intake_log_DISABLED():
+    settings = overrided_dependencies.override_get_settings()
+    settings.INTAKE_FILE = ""
+
+    assert stream.get_intake_log(settings=settings) is None
+
+
+@pytest.mark.parametrize(
+    "parser, status_type",
+    [("record", records.StatusRecord), ("tweepy", tweepy.models.Status)],
+)
+def test_on_data_STATUS_PARSER(mocker, parser, status_type):
+    settings = overrided_dependencies.override_get_settings()
+    settings.STATUS_PARSER = parser
+    pool = mocker.Mock()
+
+    streamer = stream.Streamer(settings=settings, pool=pool)
+    mention = data.make_mention(tweet_id=1, user_id=2, in_reply_to_status_id=3)
+    streamer.on_data(json.dumps(mention).encode())
+
+    status = pool.submit.call_args.args[0]
+    assert isinstance(status, status_type)
+    assert status.in_reply_to_status_id == 3
+    # Relu pareil depuis le log ou le fichier de débordement
+    parsed = stream.get_status_parser(settings=settings)(status._json)
+    assert isinstance(parsed, status_type)
+    assert parsed.user.screen_name == "User2"
+
+
+def test_on_data_OTHER_MESSAGE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    pool = mocker.Mock()
+
+    streamer = stream.Streamer(settings=settings, pool=pool)
+    mocker.patch.object(streamer, "on_limit")
+    streamer.on_data(b'{"limit": {"track": 5}}')
+
+    streamer.on_limit.assert_called_once_with(5)
+    pool.submit.assert_not_called()
@@ -0,0 +1,169 @@
+from twitter_bot import metrics, ratelimit, records, supervisor
+from tests import overrided_dependencies
+from benchmarks import data
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def settings(tmp_path):
+    settings = overrided_dependencies.override_get_settings()
+    settings.INTAKE_FILE = str(tmp_path / "intake.db")
+    settings.QUEUE_SPILL_FILE = str(tmp_path / "spill.jsonl")
+    settings.STORE_FILE = str(tmp_path / "store.json")
+    settings.OUTBOX_FILE = str(tmp_path / "outbox.db")
+    return settings
+
+
+def make_status(tweet_id: int, in_reply_to_status_id=None):
+    return records.StatusRecord.from_json(
+        data.make_mention(
+            tweet_id=tweet_id, user_id=1, in_reply_to_status_id=in_reply_to_status_id
+        )
+    )
+
+
+def wait_for(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.05)
+
+
+def test_shard_of():
+    # Mêmes parents : même process, quelle que soit la mention
+    shards = {
+        supervisor.shard_of(make_status(i, in_reply_to_status_id=42), shards=4)
+        for i in range(20)
+    }
+    assert len(shards) == 1
+    # Les parents sont répartis sur tous les process
+    shards = [
+        supervisor.shard_of(make_status(1, in_reply_to_status_id=parent), shards=4)
+        for parent in range(1000, 1400)
+    ]
+    assert set(shards) == {0, 1, 2, 3}
+    assert min(shards.count(shard) for shard in range(4)) > 60
+    # Pas une réponse : par l'ID de la mention
+    assert supervisor.shard_of(make_status(7), shards=4) == supervisor.shard_of(
+        make_status(1, in_reply_to_status_id=7), shards=4
+    )
+
+
+def test_shard_settings(settings):
+    settings.RATE_LIMIT_POST_LIMIT = 300
+    settings.RATE_LIMIT_POST_BURST = 1
+
+    shard = supervisor.shard_settings(settings, shard=2, shards=4)
+
+    assert shard.INTAKE_FILE.endswith("intake.2.db")
+    assert shard.QUEUE_SPILL_FILE.endswith("spill.2.jsonl")
+    assert shard.RATE_LIMIT_POST_LIMIT == 75
+    assert shard.RATE_LIMIT_POST_BURST == 1
+    assert shard.METRICS_PORT == 0
+    # Les settings du superviseur ne changent pas
+    assert settings.INTAKE_FILE.endswith("intake.db")
+
+
+def test_shard_settings_RATE_LIMIT_SHARE_KEPT(settings):
+    settings.RATE_LIMIT_POST_LIMIT = 300
+    shard = supervisor.shard_settings(settings, shard=0, shards=4)
+    ratelimit.clear_rate_limiter()
+    rate_limiter = ratelimit.get_rate_limiter(settings=shard)
+
+    # Appel : une réponse avec le budget de tout le compte
+    try:
+        rate_limiter.update_from_response(
+            credentials=shard.TWITTER_ACCESS_TOKEN,
+            response=SimpleNamespace(
+                url="https://api.twitter.com/1.1/statuses/update.json",
+                status_code=200,
+                headers={
+                    "x-rate-limit-limit": "300",
+                    "x-rate-limit-remaining": "299",
+                    "x-rate-limit-reset": str(time.time() + 10800),
+                },
+            ),
+        )
+        endpoint = rate_limiter.stats()["endpoints"][ratelimit.POST_STATUS]
+
+        # Vérif : le process garde sa part
+        assert endpoint["remaining"] == 75
+        bucket = rate_limiter._buckets[
+            (shard.TWITTER_ACCESS_TOKEN, ratelimit.POST_STATUS)
+        ]
+        assert bucket.limit == 75
+    finally:
+        ratelimit.clear_rate_limiter()
+
+
+def test_merge():
+    text = metrics.Counter("c", "doc", labelnames=("outcome",))
+    text.inc("replied")
+    rendered = "\n".join(text.render()) + "\n# TYPE g gauge\ng 3\n"
+
+    merged = metrics.merge({0: rendered, 1: rendered}, label="shard")
+
+    assert merged.splitlines() == [
+        "# HELP c doc",
+        "# TYPE c counter",
+        'c{shard="0",outcome="replied"} 1',
+        'c{shard="1",outcome="replied"} 1',
+        "# TYPE g gauge",
+        'g{shard="0"} 3',
+        'g{shard="1"} 3',
+    ]
+
+
+def test_supervisor(settings):
+    pool = supervisor.Supervisor(
+        settings=settings, processes=2, health_interval=3600, health_timeout=10
+    )
+    pool.start()
+    try:
+        # Appel : des mentions qui ne sont pas des réponses, rejetées sans appel réseau
+        for i in range(10):
+            pool.submit(make_status(i))
+
+        # Vérif : chaque process a traité ses mentions
+        stats = pool.stats()
+        assert sum(worker["routed"] for worker in stats.values()) == 10
+        wait_for(
+            lambda: pool.render_metrics().count('outcome="not_reply"}')
+            == len([worker for worker in stats.values() if worker["routed"]])
+        )
+        rendered = pool.render_metrics()
+        for shard, worker in stats.items():
+            if worker["routed"]:
+                assert (
+                    f'bot_mentions_total{{shard="{shard}",outcome="not_reply"}} {worker["routed"]}'
+                    in rendered
+                )
+
+        # Un process mort est relancé, avec les mentions qu'il n'a pas lues
+        assert pool.check() == 0
+        pool._workers[0].process.kill()
+        pool._workers[0].process.join()
+        unread = [
+            make_status(i)
+            for i in range(100, 200)
+            if supervisor.shard_of(make_status(i), shards=2) == 0
+        ]
+        for status in unread:
+            pool.submit(status)
+        assert pool.check() == 1
+        stats = pool.stats()
+        assert stats[0]["alive"]
+        assert stats[0]["restarts"] == 1
+        assert stats[0]["lost"] == 0
+        wait_for(
+            lambda: f'bot_mentions_total{{shard="0",outcome="not_reply"}} {len(unread)}'
+            in pool.render_metrics()
+        )
+    finally:
+        pool.stop()
+
+    assert not any(worker["alive"] for worker in pool.stats().values())
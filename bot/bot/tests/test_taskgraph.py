@@ -0,0 +1,82 @@
+from twitter_bot import resilience
+from twitter_bot.taskgraph import TaskGraph
+
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_task_graph_INDEPENDENT_TASKS_CONCURRENT(executor):
+    graph = TaskGraph(executor=executor)
+    started = time.perf_counter()
+    for name in ("a", "b", "c"):
+        graph.add(name, lambda name=name: time.sleep(0.1) or name)
+
+    assert [graph.result(name) for name in ("a", "b", "c")] == ["a", "b", "c"]
+    # Durée du plus long appel, pas de la somme
+    assert time.perf_counter() - started < 0.25
+
+
+def test_task_graph_REQUIRES(executor):
+    graph = TaskGraph(executor=executor)
+    graph.add("a", lambda: 1)
+    graph.add("b", lambda: 2)
+    graph.add("sum", lambda a, b: a + b, requires=("a", "b"))
+
+    assert graph.result("sum") == 3
+
+
+def test_task_graph_FAILED_DEPENDENCY(executor):
+    graph = TaskGraph(executor=executor)
+    graph.add("a", lambda: 1 / 0)
+    called = []
+    graph.add("b", lambda a: called.append(a), requires=("a",))
+
+    with pytest.raises(ZeroDivisionError):
+        graph.result("b")
+    assert called == []
+
+
+def test_task_graph_CANCEL():
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    graph = TaskGraph(executor=executor)
+    graph.add("slow", release.wait)
+    graph.add("pending", lambda: "pending")
+    graph.add("dependent", lambda slow: "dependent", requires=("slow",))
+
+    # Les appels pas encore démarrés sont abandonnés
+    assert graph.cancel() == 2
+    release.set()
+    executor.shutdown(wait=True)
+
+    assert graph.result("slow") is True
+    with pytest.raises(CancelledError):
+        graph.result("pending")
+    with pytest.raises(CancelledError):
+        graph.result("dependent")
+
+
+def test_task_graph_AS_COMPLETED(executor):
+    graph = TaskGraph(executor=executor)
+    graph.add("slow", lambda: time.sleep(0.1))
+    graph.add("fast", lambda: None)
+
+    assert list(graph.as_completed()) == ["fast", "slow"]
+
+
+def test_task_graph_DEADLINE_PROPAGATED(executor):
+    graph = TaskGraph(executor=executor)
+    with resilience.deadline(5):
+        graph.add("remaining", resilience.remaining)
+
+    assert 0 < graph.result("remaining") <= 5
@@ -0,0 +1,229 @@
+from twitter_bot.workers import WorkerPool
+from twitter_bot.tools.error_tools import Deferred
+
+import threading
+import time
+
+import pytest
+
+
+def test_worker_pool_PROCESS_ALL():
+    handled = []
+    pool = WorkerPool(handler=handled.append, workers=3, maxsize=10)
+    pool.start()
+
+    for i in range(50):
+        assert pool.submit(i) is True
+    pool.stop()
+
+    assert sorted(handled) == list(range(50))
+    stats = pool.stats()
+    assert stats["submitted"] == 50
+    assert stats["processed"] == 50
+    assert stats["queue_depth"] == 0
+    assert stats["busy_workers"] == 0
+
+
+def test_worker_pool_HANDLER_FAILURE():
+    def handler(item):
+        if item % 2:
+            raise ValueError("odd")
+
+    pool = WorkerPool(handler=handler, workers=2, maxsize=10)
+    pool.start()
+    for i in range(10):
+        pool.submit(i)
+    pool.stop()
+
+    assert pool.stats()["processed"] == 10
+    assert pool.stats()["failed"] == 5
+
+
+def test_worker_pool_DROP_OLDEST():
+    # Pool not started : nothing drains the queue
+    pool = WorkerPool(handler=print, workers=1, maxsize=2, overflow="drop_oldest")
+
+    for i in range(5):
+        assert pool.submit(i) is True
+
+    assert pool.stats()["dropped"] == 3
+    assert pool.stats()["queue_depth"] == 2
+    assert [pool._queue.get_nowait() for _ in range(2)] == [3, 4]
+
+
+def test_worker_pool_SPILL(tmp_path):
+    handled = []
+    release = threading.Event()
+
+    def handler(item):
+        release.wait()
+        handled.append(item)
+
+    pool = WorkerPool(
+        handler=handler,
+        workers=1,
+        maxsize=2,
+        overflow="spill",
+        spill_file=str(tmp_path / "spill.jsonl"),
+        serializer=lambda item: {"value": item},
+        deserializer=lambda data: data["value"],
+    )
+    pool.start()
+    for i in range(10):
+        pool.submit(i)
+
+    assert pool.stats()["spilled"] > 0
+    assert pool.stats()["spill_pending"] > 0
+
+    release.set()
+    pool.stop()
+
+    assert handled == list(range(10))
+    assert pool.stats()["spill_pending"] == 0
+
+
+def test_worker_pool_SPILL_RELOADED_FROM_OFFSET(tmp_path):
+    spill_file = tmp_path / "spill.jsonl"
+    offset_file = tmp_path / "spill.jsonl.offset"
+
+    def make_pool(handler):
+        return WorkerPool(
+            handler=handler,
+            workers=1,
+            maxsize=2,
+            overflow="spill",
+            spill_file=str(spill_file),
+            serializer=lambda item: {"value": item},
+            deserializer=lambda data: data["value"],
+        )
+
+    # Pool non démarré : rien ne vide la file
+    pool = make_pool(print)
+    for i in range(5):
+        pool.submit(i)
+    assert len(spill_file.read_text().splitlines()) == 3
+    assert [pool._queue.get_nowait() for _ in range(2)] == [0, 1]
+
+    # Le rechargement lit la suite du fichier, sans le réécrire
+    pool._reload_spill()
+    reloaded = [pool._queue.get_nowait() for _ in range(2)]
+    assert [item.item for item in reloaded] == [2, 3]
+    assert pool.stats()["spill_pending"] == 1
+    assert len(spill_file.read_text().splitlines()) == 3
+
+    # L'offset n'avance pas tant que les items rechargés ne sont pas traités
+    assert not offset_file.exists()
+    pool._commit_spill(reloaded[1].end)
+    assert not offset_file.exists()
+    pool._commit_spill(reloaded[0].end)
+    assert int(offset_file.read_text()) == reloaded[1].end
+
+    # Au prochain démarrage, seuls les items non traités sont rejoués
+    handled = []
+    pool = make_pool(handled.append)
+    pool.start()
+    pool.stop()
+    assert handled == [4]
+    assert spill_file.read_text() == ""
+    assert not offset_file.exists()
+
+
+def test_worker_pool_SPILL_REPLAYED_IF_NOT_HANDLED(tmp_path):
+    spill_file = tmp_path / "spill.jsonl"
+
+    def make_pool(handler):
+        return WorkerPool(
+            handler=handler,
+            workers=1,
+            maxsize=2,
+            overflow="spill",
+            spill_file=str(spill_file),
+            serializer=lambda item: {"value": item},
+            deserializer=lambda data: data["value"],
+        )
+
+    # Items rechargés puis perdus avec le processus, avant d'être traités
+    pool = make_pool(print)
+    for i in range(4):
+        pool.submit(i)
+    [pool._queue.get_nowait() for _ in range(2)]
+    pool._reload_spill()
+
+    # Le redémarrage les rejoue depuis le fichier
+    handled = []
+    pool = make_pool(handled.append)
+    pool.start()
+    pool.stop()
+    assert handled == [2, 3]
+
+
+def test_worker_pool_UNKNOWN_OVERFLOW():
+    with pytest.raises(ValueError):
+        WorkerPool(handler=print, overflow="unknown")
+
+
+def test_worker_pool_SPILL_WITHOUT_FILE():
+    with pytest.raises(ValueError):
+        WorkerPool(handler=print, overflow="spill")
+
+
+def test_worker_pool_DEFERRED():
+    handled = []
+    deferred = set()
+
+    def handler(item):
+        # Chaque item est reporté une fois
+        if item not in deferred:
+            deferred.add(item)
+            raise Deferred("later", retry_at=time.time() + 0.05)
+        handled.append(item)
+
+    pool = WorkerPool(handler=handler, workers=1, maxsize=10)
+    pool.start()
+    for i in range(3):
+        pool.submit(i)
+
+    # Le worker n'attend pas : les items sont parqués
+    while pool.stats()["deferred"] < 3:
+        time.sleep(0.01)
+    assert handled == []
+
+    time.sleep(0.2)
+    pool.stop()
+
+    assert sorted(handled) == [0, 1, 2]
+    assert pool.stats()["failed"] == 0
+    assert pool.stats()["deferred_pending"] == 0
+
+
+def test_worker_pool_DEFERRED_SPILLED_ON_STOP(tmp_path):
+    handled = []
+
+    def handler(item):
+        if item == "late":
+            raise Deferred("later", retry_at=time.time() + 3600)
+        handled.append(item)
+
+    def make_pool(handler):
+        return WorkerPool(
+            handler=handler,
+            workers=1,
+            maxsize=10,
+            spill_file=str(tmp_path / "spill.jsonl"),
+            serializer=lambda item: {"value": item},
+            deserializer=lambda data: data["value"],
+        )
+
+    pool = make_pool(handler)
+    pool.start()
+    pool.submit("late")
+    while pool.stats()["deferred"] < 1:
+        time.sleep(0.01)
+    pool.stop()
+    assert (tmp_path / "spill.jsonl").read_text() == '{"value": "late"}\n'
+
+    # L'item est traité au prochain démarrage
+    pool = make_pool(handled.append)
+    pool.start()
+    pool.stop()
+    assert handled == ["late"]
@@ -1,240 +1,407 @@
-from twitter_bot import schemas
+from twitter_bot import resilience, store
 from twitter_bot.tools import api_tools
+from twitter_bot.tools.error_tools import UnauthorizedError
 from tests import overrided_dependencies
 from tests import sample
 
 import os
 
+import pytest
+import requests
 
-def test_is_banned_user_GET_200(requests_mock):
+
+def test_get_session():
+    settings = overrided_dependencies.override_get_settings()
+    api_tools.clear_session()
+
+    try:
+        session = api_tools.get_session(settings=settings)
+
+        # Une session par process, partagée par les threads
+        assert api_tools.get_session(settings=settings) is session
+        adapter = session.get_adapter(settings.API_PREFIX)
+        assert adapter._pool_maxsize == settings.WORKERS_COUNT + settings.TASK_WORKERS
+    finally:
+        api_tools.clear_session()
+
+
+def test_get_banned_snapshot_GET_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock la requête GET et son retour
-    mock_json = {"user_id": "1", "reason": "SEX", "id": 1, "banned_at": 1_000_000}
+    mock_json = {"user_ids": ["1", "2"], "last_seq": 4}
     requests_mock.get(
-        os.path.join(settings.API_PREFIX, "banned", "1"),
+        os.path.join(settings.API_PREFIX, "banned", "snapshot"),
         json=mock_json,
         status_code=200,
     )
 
-    assert api_tools.is_banned_user(settings=settings, user_id="1") is True
+    assert api_tools.get_banned_snapshot(settings=settings) == mock_json
 
 
-def test_is_banned_user_GET_404(requests_mock):
+def test_get_banned_changes_GET_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock la requête GET et son retour
-    requests_mock.get(os.path.join(settings.API_PREFIX, "banned", "1"), status_code=404)
+    mock_json = {
+        "changes": [
+            {
+                "seq": 5,
+                "user_id": "1",
+                "operation": "deleted",
+                "reason": "SEX",
+                "banned_at": 1_000_000,
+                "changed_at": 1_000_100,
+            }
+        ],
+        "last_seq": 5,
+    }
+    requests_mock.get(
+        os.path.join(settings.API_PREFIX, "banned", "changes"),
+        json=mock_json,
+        status_code=200,
+    )
 
-    assert api_tools.is_banned_user(settings=settings, user_id="1") is False
+    assert (
+        api_tools.get_banned_changes(settings=settings, since=4, limit=10) == mock_json
+    )
+    assert requests_mock.last_request.qs == {"since": ["4"], "limit": ["10"]}
 
 
-def test_create_video_if_doesnt_exist_GET_200(requests_mock):
+def test_get_mention_preflight_GET_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(os.path.join(settings.API_PREFIX, "videos", "1"), status_code=200)
+    mock_json = {
+        "user_id": "3",
+        "screen_name": "didier",
+        "tweet_id": "2",
+        "is_banned": False,
+        "video_exists": True,
+        "user_exists": False,
+        "videouserlink_exists": False,
+        "videos_count": 4,
+    }
+    requests_mock.get(
+        os.path.join(settings.API_PREFIX, "mentions", "preflight"),
+        status_code=200,
+        json=mock_json,
+    )
 
     assert (
-        api_tools.create_video_if_doesnt_exist(
-            settings=settings, access_token="access_token", video=sample.video_create
+        api_tools.get_mention_preflight(
+            settings=settings,
+            user_id="3",
+            screen_name="didier",
+            tweet_id="2",
+            mention_tweet_id="7",
         )
-        is True
+        == mock_json
     )
+    assert requests_mock.last_request.qs == {
+        "user_id": ["3"],
+        "screen_name": ["didier"],
+        "tweet_id": ["2"],
+        "mention_tweet_id": ["7"],
+    }
 
 
-def test_create_video_if_doesnt_exist_GET_404_POST_200(requests_mock):
+def test_get_mention_preflight_TIMEOUT(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(os.path.join(settings.API_PREFIX, "videos", "1"), status_code=404)
-    requests_mock.post(
-        os.path.join(settings.API_PREFIX, "videos"),
+    requests_mock.get(
+        os.path.join(settings.API_PREFIX, "mentions", "preflight"),
         status_code=200,
-        json=sample.video_in_db,
+        json={},
     )
 
-    assert (
-        api_tools.create_video_if_doesnt_exist(
-            settings=settings, access_token="access_token", video=sample.video_create
-        )
-        is True
+    # Hors mention : le timeout de la configuration
+    api_tools.get_mention_preflight(
+        settings=settings, user_id="3", screen_name="didier", tweet_id="2"
     )
+    assert requests_mock.last_request.timeout == settings.API_TIMEOUT
+
+    # Pendant une mention : le temps restant avant sa deadline
+    with resilience.deadline(2):
+        api_tools.get_mention_preflight(
+            settings=settings, user_id="3", screen_name="didier", tweet_id="2"
+        )
+    assert 0 < requests_mock.last_request.timeout <= 2
 
 
-def test_create_video_if_doesnt_exist_GET_404_POST_404(requests_mock):
+def test_get_mention_preflight_GET_200_REMEMBERED(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(os.path.join(settings.API_PREFIX, "videos", "1"), status_code=404)
-    requests_mock.post(os.path.join(settings.API_PREFIX, "videos"), status_code=404)
+    mock_json = {
+        "user_id": "3",
+        "screen_name": "didier",
+        "tweet_id": "2",
+        "is_banned": False,
+        "video_exists": True,
+        "user_exists": True,
+        "videouserlink_exists": True,
+        "videos_count": 4,
+    }
+    requests_mock.get(
+        os.path.join(settings.API_PREFIX, "mentions", "preflight"),
+        status_code=200,
+        json=mock_json,
+    )
 
-    assert (
-        api_tools.create_video_if_doesnt_exist(
-            settings=settings, access_token="access_token", video=sample.video_create
-        )
-        is False
+    api_tools.get_mention_preflight(
+        settings=settings, user_id="3", screen_name="didier", tweet_id="2"
     )
 
+    # Le lien existe : la mention suivante est rejetée sans requête
+    assert store.is_known_link(settings=settings, screen_name="didier", tweet_id="2")
+
 
-def test_create_user_if_doesnt_exist_GET_200(requests_mock):
+def test_get_mention_preflight_GET_422(requests_mock, mocker):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
+    mocker.patch("time.sleep")
     requests_mock.get(
-        os.path.join(settings.API_PREFIX, "users", "david"), status_code=200
+        os.path.join(settings.API_PREFIX, "mentions", "preflight"), status_code=422
     )
 
     assert (
-        api_tools.create_user_if_doesnt_exist(
-            settings=settings, access_token="access_token", user=sample.user_create
+        api_tools.get_mention_preflight(
+            settings=settings, user_id="3", screen_name="didier", tweet_id="2"
         )
-        is True
+        is None
     )
 
 
-def test_create_user_if_doesnt_exist_GET_404_POST_200(requests_mock):
+def test_claim_mention_POST_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "users", "david"), status_code=404
-    )
     requests_mock.post(
-        os.path.join(settings.API_PREFIX, "users"),
+        os.path.join(settings.API_PREFIX, "mentions", "claims"),
         status_code=200,
-        json=sample.user_id_db,
+        json={
+            "id": 10,
+            "screen_name": "david",
+            "tweet_id": "1",
+            "reply_tweet_id": None,
+        },
     )
 
     assert (
-        api_tools.create_user_if_doesnt_exist(
-            settings=settings, access_token="access_token", user=sample.user_create
+        api_tools.claim_mention(
+            settings=settings,
+            access_token="access_token",
+            claim=sample.mention_claim_create,
         )
-        is True
+        == 10
     )
+    assert requests_mock.last_request.json() == sample.mention_claim_create.dict()
+    assert requests_mock.last_request.json()["user"]["screen_name"] == "david"
 
 
-def test_create_user_if_doesnt_exist_GET_404_POST_404(requests_mock):
+def test_claim_mention_POST_409(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "users", "david"), status_code=404
+    requests_mock.post(
+        os.path.join(settings.API_PREFIX, "mentions", "claims"), status_code=409
     )
-    requests_mock.post(os.path.join(settings.API_PREFIX, "users"), status_code=404)
 
     assert (
-        api_tools.create_user_if_doesnt_exist(
-            settings=settings, access_token="access_token", user=sample.user_create
+        api_tools.claim_mention(
+            settings=settings,
+            access_token="access_token",
+            claim=sample.mention_claim_create,
         )
-        is False
+        is None
     )
+    assert requests_mock.call_count == 1
 
 
-def test_create_videouserlink_POST_200(requests_mock):
+def test_claim_mention_POST_401(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
     requests_mock.post(
-        os.path.join(settings.API_PREFIX, "users", "david", "videos_link"),
-        status_code=200,
-        json=sample.videouserlink_in_db,
+        os.path.join(settings.API_PREFIX, "mentions", "claims"), status_code=401
     )
 
-    assert (
-        api_tools.create_videouserlink(
+    with pytest.raises(UnauthorizedError):
+        api_tools.claim_mention(
             settings=settings,
             access_token="access_token",
-            videouserlink=sample.videouserlink_create,
-            screen_name="david",
+            claim=sample.mention_claim_create,
         )
-        is True
+    assert requests_mock.call_count == 1
+
+
+def test_claim_mentions_POST_200(requests_mock):
+    settings = overrided_dependencies.override_get_settings()
+
+    # On mock les requêtes HTTP et leurs retours
+    requests_mock.post(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "batch"),
+        status_code=200,
+        json={
+            "results": [
+                {
+                    "status_code": 200,
+                    "claim": {
+                        "id": 10,
+                        "screen_name": "david",
+                        "tweet_id": "1",
+                        "reply_tweet_id": None,
+                    },
+                    "detail": None,
+                },
+                {"status_code": 409, "claim": None, "detail": "already requested"},
+            ]
+        },
     )
 
+    assert api_tools.claim_mentions(
+        settings=settings,
+        access_token="access_token",
+        claims=[sample.mention_claim_create, sample.mention_claim_create],
+    ) == [10, None]
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.json() == {
+        "claims": [sample.mention_claim_create.dict()] * 2
+    }
+
 
-def test_create_videouserlink_POST_404(requests_mock):
+def test_claim_mentions_POST_401(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
     requests_mock.post(
-        os.path.join(settings.API_PREFIX, "users", "david", "videos_link"),
-        status_code=404,
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "batch"),
+        status_code=401,
     )
 
-    assert (
-        api_tools.create_videouserlink(
+    with pytest.raises(UnauthorizedError):
+        api_tools.claim_mentions(
             settings=settings,
             access_token="access_token",
-            videouserlink=sample.videouserlink_create,
-            screen_name="david",
+            claims=[sample.mention_claim_create],
         )
-        is False
+    assert requests_mock.call_count == 1
+
+
+def test_claim_mention_POST_503(requests_mock, mocker):
+    mocker.patch("time.sleep")
+    settings = overrided_dependencies.override_get_settings()
+
+    # On mock les requêtes HTTP et leurs retours : erreur passagère
+    requests_mock.post(
+        os.path.join(settings.API_PREFIX, "mentions", "claims"), status_code=503
     )
 
+    # Levée pour être envoyée à nouveau, pas un refus
+    with pytest.raises(requests.HTTPError):
+        api_tools.claim_mention(
+            settings=settings,
+            access_token="access_token",
+            claim=sample.mention_claim_create,
+        )
+    assert requests_mock.call_count == 3
 
-def test_get_videouserlink_by_screen_name_and_tweet_id_GET_200(requests_mock):
+
+def test_claim_mentions_POST_503(requests_mock, mocker):
+    mocker.patch("time.sleep")
+    settings = overrided_dependencies.override_get_settings()
+
+    # On mock les requêtes HTTP et leurs retours : erreur passagère
+    requests_mock.post(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "batch"),
+        status_code=503,
+    )
+
+    # Le lot entier est en échec, aucune réservation n'est refusée
+    with pytest.raises(requests.HTTPError):
+        api_tools.claim_mentions(
+            settings=settings,
+            access_token="access_token",
+            claims=[sample.mention_claim_create] * 2,
+        )
+    assert requests_mock.call_count == 3
+
+
+def test_confirm_claim_PATCH_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "users", "david", "videos_link", "9"),
-        status_code=200,
+    requests_mock.patch(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "10"), status_code=200
     )
 
     assert (
-        api_tools.get_videouserlink_by_screen_name_and_tweet_id(
-            settings=settings, screen_name="david", tweet_id="9"
+        api_tools.confirm_claim(
+            settings=settings,
+            access_token="access_token",
+            claim_id=10,
+            reply_tweet_id="100",
         )
         is True
     )
+    assert requests_mock.last_request.json() == {"reply_tweet_id": "100"}
 
 
-def test_get_videouserlink_by_screen_name_and_tweet_id_GET_404(requests_mock):
+def test_confirm_claim_PATCH_404(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
-    # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "users", "david", "videos_link", "9"),
-        status_code=404,
+    # On mock les requêtes HTTP et leurs retours : claim supprimé
+    requests_mock.patch(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "10"), status_code=404
     )
 
     assert (
-        api_tools.get_videouserlink_by_screen_name_and_tweet_id(
-            settings=settings, screen_name="david", tweet_id="9"
+        api_tools.confirm_claim(
+            settings=settings,
+            access_token="access_token",
+            claim_id=10,
+            reply_tweet_id="100",
         )
         is False
     )
 
 
-def test_get_video_count_by_tweet_id_GET_200(requests_mock):
+def test_confirm_claim_PATCH_503(requests_mock, mocker):
+    mocker.patch("time.sleep")
     settings = overrided_dependencies.override_get_settings()
 
-    # On mock les requêtes HTTP et leurs retours
-    mock_json = {"tweet_id": "1", "videos_count": 1}
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "videos", "1", "videos_count"),
-        status_code=200,
-        json=mock_json,
+    # On mock les requêtes HTTP et leurs retours : erreur passagère
+    requests_mock.patch(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "10"), status_code=503
     )
 
-    settings = overrided_dependencies.override_get_settings()
-
-    assert api_tools.get_video_count_by_tweet_id(settings=settings, tweet_id="1") == 1
+    # Levée pour être envoyée à nouveau, pas un refus
+    with pytest.raises(requests.HTTPError):
+        api_tools.confirm_claim(
+            settings=settings,
+            access_token="access_token",
+            claim_id=10,
+            reply_tweet_id="100",
+        )
+    assert requests_mock.call_count == 3
 
 
-def test_get_video_count_by_tweet_id_GET_404(requests_mock):
+def test_release_claim_DELETE_200(requests_mock):
     settings = overrided_dependencies.override_get_settings()
 
     # On mock les requêtes HTTP et leurs retours
-    requests_mock.get(
-        os.path.join(settings.API_PREFIX, "videos", "1", "videos_count"),
-        status_code=404,
+    requests_mock.delete(
+        os.path.join(settings.API_PREFIX, "mentions", "claims", "10"), status_code=200
     )
 
-    settings = overrided_dependencies.override_get_settings()
-
     assert (
-        api_tools.get_video_count_by_tweet_id(settings=settings, tweet_id="1") is None
+        api_tools.release_claim(
+            settings=settings, access_token="access_token", claim_id=10
+        )
+        is True
     )
 
 
@@ -0,0 +1,151 @@
+from twitter_bot.tools import auth_tools
+from twitter_bot.tools.error_tools import UnauthorizedError
+from tests import overrided_dependencies
+
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+
+def make_token(exp: int) -> str:
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"sub": "admin", "exp": exp}).encode()
+    )
+    return f"header.{payload.decode().rstrip('=')}.signature"
+
+
+@pytest.fixture(autouse=True)
+def clear_token_managers():
+    auth_tools.clear_token_managers()
+    yield
+    auth_tools.clear_token_managers()
+
+
+def test_get_token_expiry_JWT():
+    assert auth_tools.get_token_expiry(make_token(exp=1_700_000_000)) == 1_700_000_000
+
+
+def test_get_token_expiry_NOT_JWT():
+    assert auth_tools.get_token_expiry("access_token") is None
+
+
+def test_get_token_REUSED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    token = make_token(exp=int(time.time()) + 1800)
+
+    # Mock
+    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", return_value=token)
+
+    token_manager = auth_tools.get_token_manager(settings=settings)
+    assert token_manager.get_token() == token
+    assert token_manager.get_token() == token
+
+    auth_tools.api_tools.get_bearer_token.assert_called_once_with(settings=settings)
+    assert token_manager.stats()["logins"] == 1
+    assert token_manager.stats()["reused"] == 1
+    assert token_manager.stats()["expires_in"] > 1700
+
+
+def test_get_token_NEAR_EXPIRY(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    old_token = make_token(exp=int(time.time()) + settings.TOKEN_EXPIRY_MARGIN - 1)
+    new_token = make_token(exp=int(time.time()) + 1800)
+
+    # Mock
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token",
+        side_effect=[old_token, new_token],
+    )
+
+    token_manager = auth_tools.get_token_manager(settings=settings)
+    assert token_manager.get_token() == old_token
+    assert token_manager.get_token() == new_token
+
+
+def test_get_token_LOGIN_FAILED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock
+    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", return_value=None)
+
+    assert auth_tools.get_token_manager(settings=settings).get_token() is None
+
+
+def test_get_token_CONCURRENT_LOGIN_DEDUPLICATED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    token = make_token(exp=int(time.time()) + 1800)
+
+    def slow_login(settings):
+        time.sleep(0.05)
+        return token
+
+    # Mock
+    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", side_effect=slow_login)
+
+    token_manager = auth_tools.get_token_manager(settings=settings)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(token_manager.get_token()))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [token] * 10
+    auth_tools.api_tools.get_bearer_token.assert_called_once()
+
+
+def test_background_refresh_SCHEDULED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    token = make_token(exp=int(time.time()) + 1800)
+
+    # Mocks
+    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", return_value=token)
+    mock_timer = mocker.patch("threading.Timer")
+
+    token_manager = auth_tools.get_token_manager(settings=settings)
+    token_manager.get_token()
+
+    delay = mock_timer.call_args[0][0]
+    assert 1800 - settings.TOKEN_REFRESH_BEFORE - 5 < delay <= 1800
+    mock_timer.return_value.start.assert_called_once()
+
+    # Le rafraîchissement en arrière-plan refait un login
+    token_manager._background_refresh()
+    assert token_manager.stats()["logins"] == 2
+
+
+def test_call_RETRY_ONCE_ON_401(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    first_token = make_token(exp=int(time.time()) + 1800)
+    second_token = make_token(exp=int(time.time()) + 1801)
+
+    # Mock
+    mocker.patch(
+        "twitter_bot.tools.api_tools.get_bearer_token",
+        side_effect=[first_token, second_token],
+    )
+    func = mocker.Mock(side_effect=[UnauthorizedError(), True])
+
+    token_manager = auth_tools.get_token_manager(settings=settings)
+    assert token_manager.call(func, settings=settings) is True
+
+    func.assert_called_with(access_token=second_token, settings=settings)
+    assert token_manager.stats()["unauthorized"] == 1
+
+
+def test_call_401_TWICE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock
+    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", return_value="token")
+    func = mocker.Mock(side_effect=UnauthorizedError())
+
+    with pytest.raises(UnauthorizedError):
+        auth_tools.get_token_manager(settings=settings).call(func, settings=settings)
+    assert func.call_count == 2
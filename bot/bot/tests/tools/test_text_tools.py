@@ -0,0 +1,113 @@
+from twitter_bot.tools import text_tools
+from twitter_bot import records
+from benchmarks import bench_text
+
+import pytest
+
+
+def entities_of(text: str) -> dict:
+    # Offsets des mentions et liens du texte, comme ceux donnés par Twitter
+    entities = {"user_mentions": [], "urls": []}
+    start = 0
+    for word in text.split(" "):
+        if word.startswith("@"):
+            entities["user_mentions"].append({"indices": [start, start + len(word)]})
+        elif word.startswith("http"):
+            entities["urls"].append({"indices": [start, start + len(word)]})
+        start += len(word) + 1
+    return entities
+
+
+@pytest.mark.parametrize(
+    "text, cleaned",
+    [
+        ("je tranlfd lfdfd", "je tranlfd lfdfd"),
+        ("@dllfd @ldsl je @tkfdl tranlfd lfdfd", "je @tkfdl tranlfd lfdfd"),
+        ("   @dllfd @ldsl     je @tkfdl tranlfd   ", "je @tkfdl tranlfd"),
+        ("@dllfd @ldsl  http://lfdl je @tkfdl http://lfdl  ", "je @tkfdl"),
+        ("http://lfdl @ldld loi @ldsl", "loi @ldsl"),
+        ("@a b @a", "b @a"),
+        ("@dllfd http://kkf", ""),
+        ("", ""),
+    ],
+)
+def test_clean_text_WORDS_AND_OFFSETS(text, cleaned):
+    assert text_tools.clean_text(text) == cleaned
+    assert text_tools.clean_text(text, entities=entities_of(text)) == cleaned
+
+
+def test_clean_text_DISPLAY_TEXT_RANGE():
+    text = "@creator @bot please @other https://t.co/1 thanks https://t.co/media"
+    entities = entities_of(text)
+    # Mentions de réponse et lien du média hors du texte affiché
+    display_text_range = [14, text.index(" https://t.co/media")]
+
+    assert (
+        text_tools.clean_text(
+            text, display_text_range=display_text_range, entities=entities
+        )
+        == "please @other thanks"
+    )
+
+
+def test_clean_text_OFFSETS_NOT_MATCHING():
+    text = "@creator please http://link"
+
+    # Offsets d'un autre texte : découpage par mots
+    for entities in (
+        {"user_mentions": [{"indices": [1, 5]}]},
+        {"urls": [{"indices": [16, 100]}]},
+    ):
+        assert text_tools.clean_text(text, entities=entities) == "please"
+    assert (
+        text_tools.clean_text(text, display_text_range=[0, 100], entities={})
+        == "please"
+    )
+
+
+def test_clean_status_text():
+    payload = {
+        "id": 1,
+        "user": {"id": 2, "screen_name": "didier"},
+        "full_text": "@creator @bot please https://t.co/1",
+        "display_text_range": [9, 35],
+        "entities": entities_of("@creator @bot please https://t.co/1"),
+    }
+    record = records.StatusRecord.from_json(payload)
+
+    assert text_tools.clean_status_text(record) == "please"
+    del payload["full_text"]
+    payload["text"] = "@bot hello"
+    del payload["display_text_range"], payload["entities"]
+    assert text_tools.clean_status_text(records.StatusRecord.from_json(payload)) == (
+        "hello"
+    )
+
+
+def test_clean_texts():
+    texts = ["@a @b hello http://x", "world", "@c"]
+
+    assert text_tools.clean_texts(texts) == ["hello", "world", ""]
+    statuses = [
+        records.StatusRecord.from_json(
+            {"id": i, "user": {"id": i, "screen_name": "u"}, "text": text}
+        )
+        for i, text in enumerate(texts)
+    ]
+    assert text_tools.clean_status_texts(statuses) == ["hello", "world", ""]
+
+
+def test_clean_text_LONG_TEXT_LINEAR():
+    text, display_text_range, entities = bench_text.make_text(
+        mentions=2000, words=2000, links=200
+    )
+
+    cleaned = text_tools.clean_text(text)
+
+    assert cleaned == text_tools.clean_text(text, entities=entities)
+    assert cleaned == text_tools.clean_text(
+        text, display_text_range=display_text_range, entities=entities
+    )
+    assert cleaned == bench_text.legacy_clean_text(text)
+    assert not cleaned.startswith("@")
+    assert "http" not in cleaned
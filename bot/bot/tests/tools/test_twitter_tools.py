@@ -1,11 +1,32 @@
-from twitter_bot.tools import twitter_tools, api_tools
+from twitter_bot import bans, schemas, resilience, ratelimit, metrics, outbox, store
+from twitter_bot.tools import twitter_tools, api_tools, auth_tools
 from tests import overrided_dependencies, sample
 
+import threading
+import time
 from unittest.mock import ANY
 
+import pytest
 import tweepy
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    twitter_tools.clear_twitter_api_cache()
+    twitter_tools.clear_caches()
+    twitter_tools.clear_rule_engine()
+    auth_tools.clear_token_managers()
+    ratelimit.clear_rate_limiter()
+    metrics.clear_metrics()
+    yield
+    twitter_tools.clear_twitter_api_cache()
+    twitter_tools.clear_caches()
+    twitter_tools.clear_rule_engine()
+    auth_tools.clear_token_managers()
+    ratelimit.clear_rate_limiter()
+    metrics.clear_metrics()
+
+
 def test_get_twitter_api(mocker):
     settings = overrided_dependencies.override_get_settings()
 
@@ -16,13 +37,49 @@ def test_get_twitter_api(mocker):
     twitter_tools.get_twitter_api(settings=settings)
 
     # Vérification qu'on a eu un appel de la fonction "tweepy.API"
-    tweepy.API.assert_called_once_with(ANY, wait_on_rate_limit=True)
+    tweepy.API.assert_called_once_with(ANY, wait_on_rate_limit=False)
 
     # Vérification que l'appel de tweepy.API a bien été appelé avec comme premier argument une instance
     # de la classe tweepy.auth.OAuth1UserHandler
     assert isinstance(mock_twitter_api.call_args[0][0], tweepy.auth.OAuth1UserHandler)
 
 
+def test_get_twitter_api_CACHED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Patch de la classe "tweepy.API"
+    mocker.patch("tweepy.API", side_effect=lambda *args, **kwargs: mocker.MagicMock())
+
+    # Deux appels, une seule instance
+    twitter_api = twitter_tools.get_twitter_api(settings=settings)
+    assert twitter_tools.get_twitter_api(settings=settings) is twitter_api
+    tweepy.API.assert_called_once()
+
+    # D'autres identifiants, une autre instance
+    settings.TWITTER_ACCESS_TOKEN = "other_twitter_access_token"
+    assert twitter_tools.get_twitter_api(settings=settings) is not twitter_api
+
+    stats = twitter_tools.get_twitter_api_stats()
+    assert stats["clients"] == 2
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_get_twitter_api_stats_CONNECTIONS_REUSED():
+    settings = overrided_dependencies.override_get_settings()
+    twitter_api = twitter_tools.get_twitter_api(settings=settings)
+
+    # Simule un pool de connexions ayant envoyé 5 requêtes sur 1 connexion
+    adapter = twitter_api.session.get_adapter("https://api.twitter.com")
+    pool = adapter.poolmanager.connection_from_url("https://api.twitter.com")
+    pool.num_requests, pool.num_connections = 5, 1
+
+    stats = twitter_tools.get_twitter_api_stats()
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["reused_connections"] == 4
+
+
 def test_get_status(mocker):
     settings = overrided_dependencies.override_get_settings()
 
@@ -39,6 +96,86 @@ def test_get_status(mocker):
     assert status == "status"
 
 
+def test_get_status_NOT_FOUND_NOT_RETRIED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock : tweet supprimé
+    response = mocker.Mock(status_code=404, reason="Not Found")
+    response.json.return_value = {}
+    mocker.patch("tweepy.API.get_status", side_effect=tweepy.errors.NotFound(response))
+
+    with pytest.raises(tweepy.errors.NotFound):
+        twitter_tools.get_status(settings=settings, tweet_id="111")
+
+    # Pas de retry, et le breaker de Twitter ne le compte pas
+    tweepy.API.get_status.assert_called_once()
+    stats = resilience.get_circuit_breaker(resilience.TWITTER_READ).stats()
+    assert stats["errors"] == 0
+
+
+def test_get_status_TWITTER_DOWN_FAILS_FAST(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mocker.patch("time.sleep")
+    mocker.patch("tweepy.API.get_status", side_effect=ConnectionError())
+    resilience.configure_circuit_breakers(failure_threshold=3, reset_timeout=30)
+
+    try:
+        with pytest.raises(ConnectionError):
+            twitter_tools.get_status(settings=settings, tweet_id="111")
+        with pytest.raises(resilience.CircuitOpenError):
+            twitter_tools.get_status(settings=settings, tweet_id="111")
+    finally:
+        resilience.configure_circuit_breakers(failure_threshold=5, reset_timeout=30)
+    assert tweepy.API.get_status.call_count == 3
+
+
+def test_get_status_RATE_LIMITED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks : plus de budget jusqu'au reset
+    mocker.patch("tweepy.API.get_status", return_value="status")
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    reset_at = time.time() + 100
+    rate_limiter.update_from_response(
+        credentials=settings.TWITTER_ACCESS_TOKEN,
+        response=mocker.Mock(
+            url="https://api.twitter.com/1.1/statuses/show.json",
+            status_code=200,
+            headers={"x-rate-limit-remaining": "0", "x-rate-limit-reset": reset_at},
+        ),
+    )
+
+    with pytest.raises(ratelimit.RateLimited) as e:
+        twitter_tools.get_status(settings=settings, tweet_id="111")
+
+    # Twitter n'est pas appelé, le breaker ne compte rien
+    assert reset_at <= e.value.retry_at <= reset_at + 100 * rate_limiter.jitter
+    tweepy.API.get_status.assert_not_called()
+    stats = resilience.get_circuit_breaker(resilience.TWITTER_READ).stats()
+    assert stats["calls"] == 0
+    assert stats["errors"] == 0
+
+
+def test_post_reply_status_TOO_MANY_REQUESTS(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock : HTTP 429
+    response = mocker.Mock(status_code=429, reason="Too Many Requests")
+    response.json.return_value = {}
+    mocker.patch(
+        "tweepy.API.update_status",
+        side_effect=tweepy.errors.TooManyRequests(response),
+    )
+
+    with pytest.raises(ratelimit.RateLimited):
+        twitter_tools.post_reply_status(settings=settings, text="text", tweet_id="12")
+
+    # Pas de retry
+    tweepy.API.update_status.assert_called_once()
+
+
 def test_in_reply_to_status_id_ALL_GOOD():
     status = sample.Status()
 
@@ -141,167 +278,296 @@ def test_post_reply_status(mocker):
     assert status_id == "1"
 
 
-def test_handle_new_status_ALL_GOOD(mocker):
+def test_post_reply_status_RESERVED_TOKEN(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Patch
+    mocker.patch("tweepy.API.update_status", return_value=status)
+
+    # Appel : le jeton pris avant l'appel est utilisé par l'appel
+    with twitter_tools.reserved_token(
+        settings=settings, endpoint=ratelimit.POST_STATUS
+    ):
+        twitter_tools.post_reply_status(settings=settings, text="oui", tweet_id="12")
+
+    # Vérif : un seul jeton pris, non rendu
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    assert rate_limiter.stats()["acquired"] == 1
+    assert (
+        rate_limiter.stats()["endpoints"][ratelimit.POST_STATUS]["remaining"]
+        == settings.RATE_LIMIT_POST_LIMIT - 1
+    )
+
 
+def test_resolve_parent_tweet_VIDEO(mocker):
     settings = overrided_dependencies.override_get_settings()
 
-    # Mocks
+    # Mock
     mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
+        "twitter_bot.tools.twitter_tools.get_status",
+        return_value=sample.StatusComplete(),
     )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
+
+    parent = twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+    assert parent == schemas.ParentTweet(
+        tweet_id="2",
+        verdict=schemas.PARENT_VIDEO,
+        video_url="good_url",
+        thumbnail_url="thumbnail_url",
+        screen_name="jeannot",
+        user_id="4",
+        text="fsllfd",
     )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
+    assert not hasattr(parent, "__dict__")
+
+    # Deuxième appel servi par le cache
+    assert twitter_tools.resolve_parent_tweet(settings=settings, tweet_id="2") is parent
+    twitter_tools.get_status.assert_called_once()
+    assert twitter_tools.get_parent_tweet_cache(settings=settings).stats()["hits"] == 1
+
+
+def test_resolve_parent_tweet_NO_VIDEO(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    status = sample.StatusComplete()
+    del status.extended_entities
+
+    # Mock
+    mocker.patch("twitter_bot.tools.twitter_tools.get_status", return_value=status)
+
+    parent = twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+    assert parent.verdict == schemas.PARENT_NO_VIDEO
+    assert parent.video_url is None
+
+    # Le verdict négatif est aussi en cache
+    twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+    twitter_tools.get_status.assert_called_once()
+
+
+def test_resolve_parent_tweet_SENSITIVE(mocker):
+    settings = overrided_dependencies.override_get_settings()
+    status = sample.StatusComplete()
+    status.possibly_sensitive = True
+
+    # Mock
+    mocker.patch("twitter_bot.tools.twitter_tools.get_status", return_value=status)
+
+    parent = twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+    assert parent.verdict == schemas.PARENT_SENSITIVE
+
+
+def test_resolve_parent_tweet_ERROR_NOT_CACHED(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mock
     mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+        "twitter_bot.tools.twitter_tools.get_status",
+        side_effect=[Exception("Twitter down"), sample.StatusComplete()],
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
+
+    with pytest.raises(Exception):
+        twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+    assert (
+        twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2).verdict
+        == schemas.PARENT_VIDEO
     )
+
+
+def test_resolve_parent_tweet_CONCURRENT_MENTIONS(mocker):
+    settings = overrided_dependencies.override_get_settings()
+
+    def slow_get_status(settings, tweet_id):
+        time.sleep(0.1)
+        return sample.StatusComplete()
+
+    # Mock
     mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
+        "twitter_bot.tools.twitter_tools.get_status", side_effect=slow_get_status
+    )
+
+    parents = []
+    threads = [
+        threading.Thread(
+            target=lambda: parents.append(
+                twitter_tools.resolve_parent_tweet(settings=settings, tweet_id=2)
+            )
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(parents) == 5
+    assert all(parent is parents[0] for parent in parents)
+    twitter_tools.get_status.assert_called_once()
+    assert twitter_tools.get_single_flight_stats()["coalesced"] >= 4
+
+
+def mock_handle_new_status_dependencies(mocker, in_reply_status=None, **overrides):
+    """Mock every call made by "handle_new_status", the happy path by default
+
+    Args:
+        mocker: pytest-mock fixture
+        in_reply_status (optional): status returned by "get_status". Defaults to sample.StatusComplete().
+        **overrides: return values replacing the default ones, by mocked function name
+    """
+    preflight = {
+        "is_banned": False,
+        "video_exists": False,
+        "user_exists": False,
+        "videouserlink_exists": False,
+        "videos_count": 0,
+    }
+    preflight.update(overrides.pop("preflight", {}))
+    return_values = {
+        "twitter_bot.tools.twitter_tools.get_status": in_reply_status
+        or sample.StatusComplete(),
+        "twitter_bot.tools.twitter_tools.get_video_urls_from_status": {
+            "video_url": "video_url",
+            "thumbnail_url": "thumbnail_url",
+        },
+        "twitter_bot.tools.api_tools.get_mention_preflight": preflight,
+        "twitter_bot.tools.api_tools.get_bearer_token": "access_token",
+        "twitter_bot.tools.api_tools.claim_mention": 10,
+        "twitter_bot.tools.twitter_tools.post_reply_status": "100",
+        "twitter_bot.tools.api_tools.confirm_claim": True,
+        "twitter_bot.tools.api_tools.release_claim": True,
+    }
+    for target, return_value in return_values.items():
+        name = target.split(".")[-1]
+        mocker.patch(target, return_value=overrides.get(name, return_value))
+
+
+def test_handle_new_status_ALL_GOOD(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker)
+
+    # Appel
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is True
+
+    # Vérif
+    # Demandé en même temps que le tweet parent : avec l'ID du parent de la mention
+    api_tools.get_mention_preflight.assert_called_once_with(
+        settings=settings,
+        user_id="3",
+        screen_name="didier",
+        tweet_id="12",
+        mention_tweet_id="1",
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
+    api_tools.claim_mention.assert_called_once_with(
+        settings=settings, access_token="access_token", claim=ANY
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
+    claim = api_tools.claim_mention.call_args.kwargs["claim"]
+    assert claim.user.screen_name == "didier"
+    assert claim.video.tweet_id == "2"
+    assert claim.asked_count_max == settings.ASKED_COUNT_MAX
+    assert claim.mention_tweet_id == "1"
+    twitter_tools.post_reply_status.assert_called_once_with(
+        settings=settings, text="@didier Download link here! \n/2", tweet_id="1"
     )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
+    api_tools.confirm_claim.assert_called_once_with(
+        settings=settings,
+        access_token="access_token",
+        claim_id=10,
+        reply_tweet_id="100",
     )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    api_tools.release_claim.assert_not_called()
+
+    # Vérif des métriques
+    assert metrics.MENTIONS.get("replied") == 1
+    assert metrics.MENTION_SECONDS.count() == 1
+    for stage in ("parent", "preflight", "login", "claim", "reply", "confirm"):
+        assert metrics.MENTION_STAGE_SECONDS.count(stage) == 1
+
+
+def test_handle_new_status_CONFIRM_BY_OUTBOX(mocker, tmp_path):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+    settings.OUTBOX_FILE = str(tmp_path / "outbox.db")
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker)
+    api_tools.confirm_claim.side_effect = ConnectionError("backend down")
+    process_outbox = outbox.get_outbox(settings=settings)
+    process_outbox.start()
 
     # Appel
     assert twitter_tools.handle_new_status(settings=settings, status=status) is True
 
-    # Vérif
-    twitter_tools.post_reply_status.assert_called_once_with(
-        settings=settings, text="@didier Download link here! \n/2", tweet_id="1"
+    # Vérif : replied, the confirmation waits in the outbox for the backend
+    twitter_tools.post_reply_status.assert_called_once()
+    assert process_outbox.stats()["size"] == 1
+    assert metrics.MENTIONS.get("replied") == 1
+
+    api_tools.confirm_claim.side_effect = None
+    process_outbox.retry_delay = 0
+    assert process_outbox.flush(timeout=5)
+    api_tools.confirm_claim.assert_called_with(
+        settings=settings,
+        access_token="access_token",
+        claim_id=10,
+        reply_tweet_id="100",
     )
 
 
 def test_handle_new_status_NO_REPLY_IN_STATUS(mocker):
     status = sample.Status()
     status.in_reply_to_status_id = None
-
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch("twitter_bot.tools.twitter_tools.get_status", return_value=None)
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    mock_handle_new_status_dependencies(mocker)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
     # Verif des appels
+    twitter_tools.get_status.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
+    assert metrics.MENTIONS.get("not_reply") == 1
 
 
 def test_handle_new_status_NO_URL(mocker):
     status = sample.Status()
     in_reply_status = sample.StatusComplete()
     del in_reply_status.extended_entities
-
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status", return_value=None
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+    mock_handle_new_status_dependencies(
+        mocker, in_reply_status=in_reply_status, get_video_urls_from_status=None
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
-    # Verif des appels
+    # Verif des appels (le preflight a pu partir en parallèle, son résultat est ignoré)
+    api_tools.claim_mention.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
 
 
 def test_handle_new_status_NO_ACCESS_TOKEN(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-    del in_reply_status.extended_entities
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker, get_bearer_token=None)
+
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
+    # Verif des appels
+    twitter_tools.post_reply_status.assert_not_called()
+
+
+def test_handle_new_status_NO_PREFLIGHT(mocker):
+    status = sample.Status()
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch("twitter_bot.tools.api_tools.get_bearer_token", return_value=None)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    mock_handle_new_status_dependencies(mocker, get_mention_preflight=None)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
@@ -313,300 +579,313 @@ def test_handle_new_status_POSSIBLY_SENSITIVE(mocker):
     status = sample.Status()
     in_reply_status = sample.StatusComplete()
     in_reply_status.possibly_sensitive = True
-
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    mock_handle_new_status_dependencies(mocker, in_reply_status=in_reply_status)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
-    # Verif des appels
+    # Verif des appels (le preflight a pu partir en parallèle, son résultat est ignoré)
+    api_tools.claim_mention.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
 
 
 def test_handle_new_status_BANNED_USER(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=True)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    mock_handle_new_status_dependencies(mocker, preflight={"is_banned": True})
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
     # Verif des appels
+    api_tools.claim_mention.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
+    assert metrics.MENTIONS.get("banned") == 1
+    assert metrics.MENTION_STAGE_SECONDS.count("claim") == 0
 
 
-def test_handle_new_status_VIDEO_IS_NOT_IN_DB_AND_CANNOT_BE_CREATED(mocker):
+def test_handle_new_status_BANNED_USER_WITHOUT_WAITING_PARENT(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-
     settings = overrided_dependencies.override_get_settings()
+    parent_released = threading.Event()
 
-    # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=False
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
+    # Mocks : le tweet parent est lent, le preflight répond tout de suite
+    mock_handle_new_status_dependencies(mocker, preflight={"is_banned": True})
     mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
+        "twitter_bot.tools.twitter_tools.get_status",
+        side_effect=lambda **kwargs: parent_released.wait(5)
+        and sample.StatusComplete(),
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
+
+    try:
+        started = time.perf_counter()
+        assert not twitter_tools.handle_new_status(settings=settings, status=status)
+        assert time.perf_counter() - started < 1
+    finally:
+        parent_released.set()
+    assert metrics.MENTIONS.get("banned") == 1
+
+
+def test_handle_new_status_CACHED_PARENT_NO_VIDEO(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks : tweet parent sans vidéo déjà en cache
+    mock_handle_new_status_dependencies(mocker)
+    twitter_tools.get_parent_tweet_cache(settings=settings).set(
+        "12",
+        schemas.ParentTweet(
+            tweet_id="12",
+            verdict=schemas.PARENT_NO_VIDEO,
+            video_url=None,
+            thumbnail_url=None,
+            screen_name=None,
+            user_id=None,
+            text=None,
+        ),
     )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
 
+    # Appel
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
-    # Vérif des appels
-    twitter_tools.post_reply_status.assert_not_called()
+    # Vérif : rejetée sans aucun appel
+    twitter_tools.get_status.assert_not_called()
+    api_tools.get_mention_preflight.assert_not_called()
+    api_tools.get_bearer_token.assert_not_called()
+    assert metrics.MENTIONS.get("no_video") == 1
+    assert twitter_tools.get_rule_engine(settings=settings).stats()["no_video"] == {
+        "source": "parent",
+        "evaluated": 1,
+        "rejected": 1,
+        "hit_rate": 1.0,
+        "rejection_rate": pytest.approx(0.1925),
+        "cost": 0.1,
+    }
 
 
-def test_handle_new_status_USER_IS_NOT_IN_DB_AND_CANNOT_BE_CREATED(mocker):
+def test_handle_new_status_NO_SPECULATION(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-
     settings = overrided_dependencies.override_get_settings()
+    settings.RULES_SPECULATE_BELOW = 0
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=False
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    mock_handle_new_status_dependencies(mocker, preflight={"is_banned": True})
+
+    # Appel
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is False
+
+    # Vérif : le preflight rejette souvent, il part seul et le reste n'est pas demandé
+    api_tools.get_mention_preflight.assert_called_once()
+    twitter_tools.get_status.assert_not_called()
+    api_tools.get_bearer_token.assert_not_called()
+    assert metrics.MENTIONS.get("banned") == 1
+
+
+def test_handle_new_status_CLAIM_REFUSED(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks : la vidéo a atteint la limite entre le preflight et le claim
+    mock_handle_new_status_dependencies(mocker, claim_mention=None)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
     # Vérif des appels
     twitter_tools.post_reply_status.assert_not_called()
+    api_tools.confirm_claim.assert_not_called()
 
+    # Le jeton de la réponse est rendu
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    assert rate_limiter.stats()["acquired"] == 0
 
-def test_handle_new_status_VIDEO_ALREADY_REQUESTED_BY_USER(mocker):
+
+def test_handle_new_status_CLAIM_REFUSED_FORGETS_LINK(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks : le lien est retenu (par le preflight d'une autre mention)
+    # pendant la réservation, refusée
+    mock_handle_new_status_dependencies(mocker)
 
+    def claim_mention(settings, access_token, claim):
+        store.remember_link(settings=settings, screen_name="didier", tweet_id="12")
+        return None
+
+    mocker.patch("twitter_bot.tools.api_tools.claim_mention", side_effect=claim_mention)
+
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is False
+
+    # Vérif : la réponse du backend remplace le lien retenu
+    assert not store.is_known_link(
+        settings=settings, screen_name="didier", tweet_id="12"
+    )
+
+
+def test_handle_new_status_REPLY_NOT_SENT(mocker):
+    status = sample.Status()
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
+    mock_handle_new_status_dependencies(mocker)
+
+    def post_reply_status(settings, text, tweet_id):
+        # Retenu par le preflight d'une autre mention pendant la réponse
+        store.remember_link(settings=settings, screen_name="didier", tweet_id="12")
+        raise Exception("Twitter error")
+
     mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
+        "twitter_bot.tools.twitter_tools.post_reply_status",
+        side_effect=post_reply_status,
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=True,
+
+    assert not twitter_tools.handle_new_status(settings=settings, status=status)
+
+    # Le claim est libéré
+    api_tools.release_claim.assert_called_once_with(
+        settings=settings, access_token="access_token", claim_id=10
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
+    api_tools.confirm_claim.assert_not_called()
+    # Le lien libéré est oublié
+    assert not store.is_known_link(
+        settings=settings, screen_name="didier", tweet_id="12"
     )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
+
+
+def test_handle_new_status_VIDEO_ALREADY_REQUESTED_BY_USER(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(
+        mocker, preflight={"videouserlink_exists": True}
     )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
     # Verif des appels
+    api_tools.claim_mention.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
 
 
-def test_handle_new_status_VIDEO_REQUESTED_TOO_MANY_TIMES(mocker):
+def test_handle_new_status_BANNED_REPLICA(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-
     settings = overrided_dependencies.override_get_settings()
 
-    # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
+    # Mocks : l'auteur de la mention est dans la copie de la liste des bans
+    mock_handle_new_status_dependencies(mocker)
     mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
+        "twitter_bot.tools.api_tools.get_banned_snapshot",
+        return_value={"user_ids": ["3"], "last_seq": 1},
     )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
     mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
+        "twitter_bot.tools.api_tools.get_banned_changes",
+        return_value={"changes": [], "last_seq": 1},
     )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=10
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=True)
+    bans.get_ban_replica(settings=settings).sync()
+
+    # Appel
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is False
+
+    # Vérif : rejetée sans aucun appel
+    twitter_tools.get_status.assert_not_called()
+    api_tools.get_mention_preflight.assert_not_called()
+    assert metrics.MENTIONS.get("banned_replica") == 1
+
+
+def test_handle_new_status_KNOWN_LINK(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker)
+
+    # Appel : la même mention, une fois la réponse envoyée
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is True
+    assert twitter_tools.handle_new_status(settings=settings, status=status) is False
+
+    # Vérif : le lien connu la rejette sans aucun appel
+    twitter_tools.get_status.assert_called_once()
+    api_tools.get_mention_preflight.assert_called_once()
+    api_tools.claim_mention.assert_called_once()
+    twitter_tools.post_reply_status.assert_called_once()
+    assert metrics.MENTIONS.get("known_link") == 1
+
+
+def test_handle_new_status_VIDEO_REQUESTED_TOO_MANY_TIMES(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker, preflight={"videos_count": 10})
 
     assert twitter_tools.handle_new_status(settings=settings, status=status) is False
 
     # Verif des appels
+    api_tools.claim_mention.assert_not_called()
     twitter_tools.post_reply_status.assert_not_called()
 
 
-def test_handle_new_status_LINKS_BETWEEN_USER_AND_VIDEO_NOT_CREATED(mocker):
+def test_handle_new_status_CLAIM_NOT_CONFIRMED(mocker):
     status = sample.Status()
-    in_reply_status = sample.StatusComplete()
-
     settings = overrided_dependencies.override_get_settings()
 
     # Mocks
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_status", return_value=in_reply_status
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.get_video_urls_from_status",
-        return_value={"video_url": "video_url", "thumbnail_url": "thumbnail_url"},
-    )
-    mocker.patch("twitter_bot.tools.api_tools.is_banned_user", return_value=False)
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_bearer_token", return_value="access_token"
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_video_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.create_user_if_doesnt_exist", return_value=True
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_videouserlink_by_screen_name_and_tweet_id",
-        return_value=False,
-    )
-    mocker.patch(
-        "twitter_bot.tools.api_tools.get_video_count_by_tweet_id", return_value=0
-    )
-    mocker.patch(
-        "twitter_bot.tools.twitter_tools.post_reply_status", return_value="100"
-    )
-    mocker.patch("twitter_bot.tools.api_tools.create_videouserlink", return_value=False)
+    mock_handle_new_status_dependencies(mocker, confirm_claim=False)
 
+    # La réponse est déjà envoyée
     assert twitter_tools.handle_new_status(settings=settings, status=status) is True
 
-    # Verif des appels
     twitter_tools.post_reply_status.assert_called_once_with(
         settings=settings, text="@didier Download link here! \n/2", tweet_id="1"
     )
-    api_tools.create_videouserlink.assert_called_once_with(
-        settings=settings,
-        access_token="access_token",
-        videouserlink=ANY,
-        screen_name="didier",
+    api_tools.release_claim.assert_not_called()
+
+
+def test_handle_new_status_RATE_LIMITED_BEFORE_CLAIM(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks : plus de budget pour répondre
+    mock_handle_new_status_dependencies(mocker)
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    rate_limiter.update_from_response(
+        credentials=settings.TWITTER_ACCESS_TOKEN,
+        response=mocker.Mock(
+            url="https://api.twitter.com/1.1/statuses/update.json",
+            status_code=200,
+            headers={
+                "x-rate-limit-remaining": "0",
+                "x-rate-limit-reset": time.time() + 100,
+            },
+        ),
+    )
+
+    # Reporté avant tout claim
+    with pytest.raises(ratelimit.RateLimited):
+        twitter_tools.handle_new_status(settings=settings, status=status)
+
+    api_tools.claim_mention.assert_not_called()
+    api_tools.release_claim.assert_not_called()
+
+
+def test_handle_new_status_RATE_LIMITED(mocker):
+    status = sample.Status()
+    settings = overrided_dependencies.override_get_settings()
+
+    # Mocks
+    mock_handle_new_status_dependencies(mocker)
+    mocker.patch(
+        "twitter_bot.tools.twitter_tools.post_reply_status",
+        side_effect=ratelimit.RateLimited("later", retry_at=time.time() + 60),
+    )
+
+    # Remonté au worker pool pour être reporté
+    with pytest.raises(ratelimit.RateLimited):
+        twitter_tools.handle_new_status(settings=settings, status=status)
+
+    api_tools.release_claim.assert_called_once_with(
+        settings=settings, access_token="access_token", claim_id=10
     )
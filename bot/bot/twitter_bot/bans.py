@@ -0,0 +1,249 @@
+"""Replica of the ban list of the backend
+
+The ban list is tiny and rarely changes, so the bot keeps every banned
+user_id in a set, and a ban check is a set lookup instead of a request. The
+set is loaded once from the snapshot of the backend, then only the changes
+(bans created, edited and deleted) after the last one read ("seq" high-water
+mark) are fetched every "refresh_interval" seconds. The backend commits the
+changes in "seq" order, so none is skipped under the high-water mark. The
+whole list is still loaded again every "full_refresh_interval" seconds.
+
+A replica not synced for "max_age" seconds (backend down, not started yet)
+does not answer, the ban is checked by the preflight request of the mention.
+"""
+
+from twitter_bot import logger, config
+from twitter_bot.tools import api_tools
+
+import math
+import threading
+import time
+from typing import Callable, Union
+
+
+class BanReplica:
+    """Set of the banned user_ids, kept up to date by a background thread"""
+
+    def __init__(
+        self,
+        fetch_snapshot: Callable[[], Union[dict, None]],
+        fetch_changes: Callable[[int, int], Union[dict, None]],
+        refresh_interval: float = 30,
+        full_refresh_interval: float = 3600,
+        max_age: float = 300,
+        page_size: int = 1000,
+    ):
+        """
+        Args:
+            fetch_snapshot (Callable[[], Union[dict, None]]): returns {"user_ids", "last_seq"}, or None on failure
+            fetch_changes (Callable[[int, int], Union[dict, None]]): called with (since, limit), returns {"changes", "last_seq"} with the changes after "since", oldest first, or None on failure
+            refresh_interval (float, optional): seconds between two updates. Defaults to 30.
+            full_refresh_interval (float, optional): seconds between two loads of the whole list. Defaults to 3600.
+            max_age (float, optional): seconds without a sync before the replica stops answering. Defaults to 300.
+            page_size (int, optional): changes fetched by request. Defaults to 1000.
+        """
+        self.fetch_snapshot = fetch_snapshot
+        self.fetch_changes = fetch_changes
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.max_age = max_age
+        self.page_size = page_size
+
+        # Replaced at once by a sync, read without lock
+        self._banned = frozenset()
+        self._high_water = 0
+        self._synced_at = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.syncs = 0
+        self.full_syncs = 0
+        self.failures = 0
+        self.lookups = 0
+        self.stale_lookups = 0
+
+    def start(self) -> None:
+        """Start the background sync, the first one loads the whole list"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._sync_loop, name="ban-replica", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background sync"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def sync(self, full: bool = False) -> bool:
+        """Apply the changes after the high-water mark, or load the whole list
+
+        Args:
+            full (bool, optional): load the snapshot before the changes. Defaults to False.
+
+        Returns:
+            bool: True if the replica is up to date
+        """
+        with self._lock:
+            full = full or self._loaded_at is None
+            if full:
+                snapshot = self.fetch_snapshot()
+                if snapshot is None:
+                    return self._failed()
+                banned = set(snapshot["user_ids"])
+                since = snapshot["last_seq"]
+            else:
+                banned = set(self._banned)
+                since = self._high_water
+
+            # Changes made while the snapshot was read are applied again
+            while True:
+                page = self.fetch_changes(since, self.page_size)
+                if page is None:
+                    return self._failed()
+                for change in page["changes"]:
+                    if change["operation"] == "deleted":
+                        banned.discard(change["user_id"])
+                    else:
+                        banned.add(change["user_id"])
+                since = page["last_seq"]
+                if len(page["changes"]) < self.page_size:
+                    break
+
+            self._banned = frozenset(banned)
+            self._high_water = since
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+            if full:
+                self._loaded_at = self._synced_at
+                self.full_syncs += 1
+            return True
+
+    def is_banned(self, user_id: str) -> Union[bool, None]:
+        """Check if a user is banned
+
+        Args:
+            user_id (str): User user_id
+
+        Returns:
+            Union[bool, None]: True if banned, None if the replica is older than "max_age"
+        """
+        self.lookups += 1
+        if self.age() > self.max_age:
+            self.stale_lookups += 1
+            return None
+        return user_id in self._banned
+
+    def age(self) -> float:
+        """Get the seconds since the last sync
+
+        Returns:
+            float: seconds, infinite if never synced
+        """
+        synced_at = self._synced_at
+        if synced_at is None:
+            return math.inf
+        return time.monotonic() - synced_at
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def stats(self) -> dict:
+        """Get the replica counters
+
+        Returns:
+            dict: banned users, age (seconds, -1 if never synced), last change applied, syncs, full syncs, failed syncs, lookups and lookups sent to the backend
+        """
+        age = self.age()
+        return {
+            "size": len(self._banned),
+            "age_seconds": round(age, 3) if age != math.inf else -1,
+            "high_water": self._high_water,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "failures": self.failures,
+            "lookups": self.lookups,
+            "stale_lookups": self.stale_lookups,
+        }
+
+    def _failed(self) -> bool:
+        self.failures += 1
+        logger.error("Ban list can not be synced")
+        return False
+
+    def _sync_loop(self) -> None:
+        wait = 0
+        while not self._stopping.wait(wait):
+            loaded_at = self._loaded_at
+            full = (
+                loaded_at is not None
+                and time.monotonic() - loaded_at >= self.full_refresh_interval
+            )
+            try:
+                self.sync(full=full)
+            except Exception:
+                self.failures += 1
+                logger.exception("Ban list can not be synced")
+            wait = self.refresh_interval
+
+
+_ban_replica = None
+_ban_replica_lock = threading.Lock()
+
+
+def get_ban_replica(settings: config.Settings) -> Union[BanReplica, None]:
+    """Get the process replica of the ban list
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[BanReplica, None]: the replica (not started), or None if "BANS_REFRESH_INTERVAL" is 0
+    """
+    global _ban_replica
+    if not settings.BANS_REFRESH_INTERVAL:
+        return None
+    with _ban_replica_lock:
+        if _ban_replica is None:
+            _ban_replica = BanReplica(
+                fetch_snapshot=lambda: api_tools.get_banned_snapshot(settings=settings),
+                fetch_changes=lambda since, limit: api_tools.get_banned_changes(
+                    settings=settings, since=since, limit=limit
+                ),
+                refresh_interval=settings.BANS_REFRESH_INTERVAL,
+                full_refresh_interval=settings.BANS_FULL_REFRESH_INTERVAL,
+                max_age=settings.BANS_MAX_AGE,
+            )
+        return _ban_replica
+
+
+def clear_ban_replica() -> None:
+    """Stop the process replica of the ban list, and remove it"""
+    global _ban_replica
+    with _ban_replica_lock:
+        if _ban_replica is not None:
+            _ban_replica.stop()
+        _ban_replica = None
+
+
+def lookup(settings: config.Settings, user_id: str) -> Union[bool, None]:
+    """Check if a user is banned by the process replica only
+
+    Args:
+        settings (config.Settings): bot settings
+        user_id (str): User user_id
+
+    Returns:
+        Union[bool, None]: True if banned, None if the replica is disabled or not up to date
+    """
+    ban_replica = get_ban_replica(settings=settings)
+    if ban_replica is None:
+        return None
+    return ban_replica.is_banned(user_id)
@@ -0,0 +1,245 @@
+"""Micro-batched writes to the backend
+
+Under load, many workers claim mentions at the same time, each claim being a
+request and a transaction of the backend. The claims are instead queued, and
+a flusher thread sends the ones received during "max_delay" seconds (or the
+first "max_size") in one bulk request, committed in one transaction. Each
+worker waits for the result of its own claim.
+
+A batch is sent while the next one fills : the batches are bigger when the
+backend is slower, and a lone claim waits at most "max_delay".
+"""
+
+from twitter_bot import logger, config, metrics, resilience, schemas
+from twitter_bot.tools import api_tools, auth_tools
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, List, Union
+
+
+class WriteBatcher:
+    """Items gathered into bulk writes, with a result by item"""
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[list], list],
+        max_size: int = 50,
+        max_delay: float = 0.01,
+    ):
+        """
+        Args:
+            name (str): label of the batch size histogram
+            flush (Callable[[list], list]): writes a batch, returns the result of each item in order, raises to fail every item
+            max_size (int, optional): max items by batch. Defaults to 50.
+            max_delay (float, optional): max seconds an item waits for its batch to fill. Defaults to 0.01.
+        """
+        self.name = name
+        self.flush = flush
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        # [(item, future, monotonic time queued)]
+        self._pending = []
+        self._condition = threading.Condition()
+        self._flusher = None
+        self._stopping = False
+
+        self.submitted = 0
+        self.batches = 0
+        self.flushed = 0
+        self.failures = 0
+        self.full_batches = 0
+
+    @property
+    def running(self) -> bool:
+        """True once started, until stopped"""
+        return self._flusher is not None
+
+    def start(self) -> None:
+        """Start the flusher"""
+        if self._flusher is not None:
+            return
+        self._stopping = False
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name=f"{self.name}-batcher", daemon=True
+        )
+        self._flusher.start()
+
+    def stop(self) -> None:
+        """Send the items queued, then stop the flusher"""
+        if self._flusher is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._flusher.join()
+        self._flusher = None
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch
+
+        Args:
+            item (Any): item to write
+
+        Returns:
+            Future: result of the item, set once its batch is written
+        """
+        future = Future()
+        with self._condition:
+            if self._stopping:
+                future.set_exception(RuntimeError(f"'{self.name}' batcher stopped"))
+                return future
+            self._pending.append((item, future, time.monotonic()))
+            self.submitted += 1
+            self._condition.notify_all()
+        return future
+
+    def stats(self) -> dict:
+        """Get the batcher counters
+
+        Returns:
+            dict: items queued, items submitted, batches sent, items sent, mean items by batch, batches failed and batches sent full
+        """
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "batches": self.batches,
+                "flushed": self.flushed,
+                "mean_size": (
+                    round(self.flushed / self.batches, 2) if self.batches else 0.0
+                ),
+                "failures": self.failures,
+                "full_batches": self.full_batches,
+            }
+
+    def _flush_loop(self) -> None:
+        """Wait for a first item, then for the batch to fill or the delay of
+        the first item to expire, then write the batch"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+                deadline = self._pending[0][2] + self.max_delay
+                self._condition.wait_for(
+                    lambda: len(self._pending) >= self.max_size or self._stopping,
+                    max(deadline - time.monotonic(), 0),
+                )
+                batch = self._pending[: self.max_size]
+                del self._pending[: self.max_size]
+            self._write(batch)
+
+    def _write(self, batch: list) -> None:
+        items = [item for item, _, _ in batch]
+        metrics.BATCH_SIZE.observe(len(items), self.name)
+        try:
+            results = self.flush(items)
+            if len(results) != len(items):
+                raise ValueError(
+                    f"{len(results)} results for a batch of {len(items)} items"
+                )
+        except Exception as e:
+            logger.exception(f"Batch of {len(items)} '{self.name}' items failed")
+            with self._condition:
+                self.batches += 1
+                self.failures += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        with self._condition:
+            self.batches += 1
+            self.flushed += len(items)
+            if len(items) >= self.max_size:
+                self.full_batches += 1
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+
+_claim_batcher = None
+_claim_batcher_lock = threading.Lock()
+
+
+def claim_mentions(
+    settings: config.Settings, claims: List[schemas.MentionClaimCreate]
+) -> List[Union[int, None]]:
+    """Claim a batch of mentions with the token of the process
+
+    Args:
+        settings (config.Settings): bot settings
+        claims (List[schemas.MentionClaimCreate]): schemas.MentionClaimCreate instances
+
+    Returns:
+        List[Union[int, None]]: by claim, in order, the claim ID or None if refused
+
+    Raises:
+        Exception: the batch failed as a whole, raised to each waiting claim
+    """
+    return auth_tools.get_token_manager(settings=settings).call(
+        api_tools.claim_mentions, settings=settings, claims=claims
+    )
+
+
+def get_claim_batcher(settings: config.Settings) -> Union[WriteBatcher, None]:
+    """Get the process batcher of the claims
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[WriteBatcher, None]: the batcher (not started), or None if "CLAIM_BATCH_SIZE" is 1 or less
+    """
+    global _claim_batcher
+    if settings.CLAIM_BATCH_SIZE <= 1:
+        return None
+    with _claim_batcher_lock:
+        if _claim_batcher is None:
+            _claim_batcher = WriteBatcher(
+                name="claim",
+                flush=lambda claims: claim_mentions(settings=settings, claims=claims),
+                max_size=settings.CLAIM_BATCH_SIZE,
+                max_delay=settings.CLAIM_BATCH_DELAY,
+            )
+        return _claim_batcher
+
+
+def clear_claim_batcher() -> None:
+    """Stop the process batcher of the claims (the claims queued are sent), and remove it"""
+    global _claim_batcher
+    with _claim_batcher_lock:
+        if _claim_batcher is not None:
+            _claim_batcher.stop()
+        _claim_batcher = None
+
+
+def claim_mention(
+    settings: config.Settings, claim: schemas.MentionClaimCreate
+) -> Union[int, None]:
+    """Claim a mention in the next batch, or at once if the batcher is not running
+
+    Args:
+        settings (config.Settings): bot settings
+        claim (schemas.MentionClaimCreate): schemas.MentionClaimCreate instance
+
+    Returns:
+        Union[int, None]: the claim ID, or None if refused
+
+    Raises:
+        resilience.DeadlineExceededError: the deadline of the mention expired before the batch was written
+    """
+    claim_batcher = get_claim_batcher(settings=settings)
+    if claim_batcher is not None and claim_batcher.running:
+        try:
+            return claim_batcher.submit(claim).result(timeout=resilience.remaining())
+        except TimeoutError:
+            # The batch may still be written : the claim, sent again with the
+            # same mention ID, gets the same claim back
+            raise resilience.DeadlineExceededError(
+                "Deadline exceeded waiting for the batch of the claim"
+            )
+    return auth_tools.get_token_manager(settings=settings).call(
+        api_tools.claim_mention, settings=settings, claim=claim
+    )
@@ -8,6 +8,9 @@ import dotenv
 ENV_FILE_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 dotenv.load_dotenv(os.path.join(ENV_FILE_FOLDER, ".env"))
 
+# "max_items" of the backend "MentionClaimBatch"
+CLAIM_BATCH_MAX = 500
+
 
 @dataclass
 class Settings:
@@ -23,6 +26,64 @@ class Settings:
     TWITTER_API_KEY_SECRET: str = os.environ.get("TWITTER_API_KEY_SECRET")
     TWITTER_ACCESS_TOKEN: str = os.environ.get("TWITTER_ACCESS_TOKEN")
     TWITTER_ACCESS_TOKEN_SECRET: str = os.environ.get("TWITTER_ACCESS_TOKEN_SECRET")
+    TOKEN_EXPIRY_MARGIN: int = int(os.environ.get("TOKEN_EXPIRY_MARGIN", 60))
+    TOKEN_REFRESH_BEFORE: int = int(os.environ.get("TOKEN_REFRESH_BEFORE", 120))
+    PARENT_CACHE_MAXSIZE: int = int(os.environ.get("PARENT_CACHE_MAXSIZE", 10000))
+    PARENT_CACHE_TTL: int = int(os.environ.get("PARENT_CACHE_TTL", 3600))
+    PARENT_CACHE_NEGATIVE_TTL: int = int(
+        os.environ.get("PARENT_CACHE_NEGATIVE_TTL", 600)
+    )
+    WORKERS_COUNT: int = int(os.environ.get("WORKERS_COUNT", 4))
+    QUEUE_MAXSIZE: int = int(os.environ.get("QUEUE_MAXSIZE", 1000))
+    QUEUE_OVERFLOW: str = os.environ.get("QUEUE_OVERFLOW", "block")
+    QUEUE_SPILL_FILE: str = os.environ.get(
+        "QUEUE_SPILL_FILE", os.path.join(ENV_FILE_FOLDER, "spill.jsonl")
+    )
+    STATUS_PARSER: str = os.environ.get("STATUS_PARSER", "record")
+    MENTION_DEADLINE: float = float(os.environ.get("MENTION_DEADLINE", 60))
+    API_TIMEOUT: float = float(os.environ.get("API_TIMEOUT", 10))
+    TASK_WORKERS: int = int(os.environ.get("TASK_WORKERS", 16))
+    RULES_SPECULATE_BELOW: float = float(os.environ.get("RULES_SPECULATE_BELOW", 0.25))
+    BREAKER_FAILURE_THRESHOLD: int = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+    BREAKER_RESET_TIMEOUT: float = float(os.environ.get("BREAKER_RESET_TIMEOUT", 30))
+    BACKEND_LIMIT_INITIAL: int = int(os.environ.get("BACKEND_LIMIT_INITIAL", 10))
+    BACKEND_LIMIT_MAX: int = int(os.environ.get("BACKEND_LIMIT_MAX", 100))
+    BACKEND_LIMIT_TOLERANCE: float = float(os.environ.get("BACKEND_LIMIT_TOLERANCE", 2))
+    RATE_LIMIT_READ_LIMIT: int = int(os.environ.get("RATE_LIMIT_READ_LIMIT", 900))
+    RATE_LIMIT_READ_WINDOW: int = int(os.environ.get("RATE_LIMIT_READ_WINDOW", 900))
+    RATE_LIMIT_POST_LIMIT: int = int(os.environ.get("RATE_LIMIT_POST_LIMIT", 300))
+    RATE_LIMIT_POST_WINDOW: int = int(os.environ.get("RATE_LIMIT_POST_WINDOW", 10800))
+    RATE_LIMIT_POST_BURST: int = int(os.environ.get("RATE_LIMIT_POST_BURST", 5))
+    INTAKE_FILE: str = os.environ.get(
+        "INTAKE_FILE", os.path.join(ENV_FILE_FOLDER, "intake.db")
+    )
+    INTAKE_BATCH_SIZE: int = int(os.environ.get("INTAKE_BATCH_SIZE", 500))
+    INTAKE_RETENTION: int = int(os.environ.get("INTAKE_RETENTION", 86400))
+    SEEN_WINDOW: int = int(os.environ.get("SEEN_WINDOW", 3600))
+    SEEN_MAXSIZE: int = int(os.environ.get("SEEN_MAXSIZE", 100000))
+    SEEN_FILE: str = os.environ.get(
+        "SEEN_FILE", os.path.join(ENV_FILE_FOLDER, "seen.bin")
+    )
+    STORE_TTL: int = int(os.environ.get("STORE_TTL", 300))
+    STORE_MAX_SIZE: int = int(os.environ.get("STORE_MAX_SIZE", 100000))
+    STORE_FILE: str = os.environ.get(
+        "STORE_FILE", os.path.join(ENV_FILE_FOLDER, "store.json")
+    )
+    BANS_REFRESH_INTERVAL: float = float(os.environ.get("BANS_REFRESH_INTERVAL", 30))
+    BANS_FULL_REFRESH_INTERVAL: float = float(
+        os.environ.get("BANS_FULL_REFRESH_INTERVAL", 3600)
+    )
+    BANS_MAX_AGE: float = float(os.environ.get("BANS_MAX_AGE", 300))
+    OUTBOX_FILE: str = os.environ.get(
+        "OUTBOX_FILE", os.path.join(ENV_FILE_FOLDER, "outbox.db")
+    )
+    OUTBOX_RETRY_MAX: float = float(os.environ.get("OUTBOX_RETRY_MAX", 300))
+    CLAIM_BATCH_SIZE: int = min(
+        int(os.environ.get("CLAIM_BATCH_SIZE", 50)), CLAIM_BATCH_MAX
+    )
+    CLAIM_BATCH_DELAY: float = float(os.environ.get("CLAIM_BATCH_DELAY", 0.01))
+    METRICS_HOST: str = os.environ.get("METRICS_HOST", "0.0.0.0")
+    METRICS_PORT: int = int(os.environ.get("METRICS_PORT", 9108))
 
 
 @lru_cache()
@@ -0,0 +1,205 @@
+"""Filter of the statuses already received
+
+On reconnect, the stream can deliver again the statuses received just
+before. They are dropped by the stream thread, before being logged or
+handled, by a set of the IDs received during the last "window" seconds.
+
+The IDs are kept in a ring of buckets, one bucket by "window / buckets"
+seconds : the oldest bucket is dropped as a whole when a new one starts, so
+memory is bounded by the IDs of one window (and by "maxsize" during a burst,
+the ring then turns faster). The status IDs are 64 bits integers and kept as
+is (no hash, no false positive). A snapshot of the ring is written to a small
+binary file, to drop the statuses delivered again right after a restart.
+"""
+
+from twitter_bot import logger
+
+import array
+import os
+import struct
+import threading
+import time
+from typing import Union
+
+# Snapshot file : magic, then by bucket its start slot, its IDs count and its
+# IDs (unsigned 64 bits)
+_MAGIC = b"SEEN1"
+_BUCKET_HEADER = struct.Struct("<qQ")
+
+
+class SeenFilter:
+    """IDs received during the last "window" seconds"""
+
+    def __init__(
+        self,
+        window: float = 3600,
+        buckets: int = 12,
+        maxsize: int = 100000,
+        snapshot_file: Union[str, None] = None,
+        snapshot_interval: float = 60,
+    ):
+        """
+        Args:
+            window (float, optional): seconds an ID is remembered. Defaults to 3600.
+            buckets (int, optional): buckets of the ring. Defaults to 12.
+            maxsize (int, optional): max IDs remembered. Defaults to 100000.
+            snapshot_file (Union[str, None], optional): file of the snapshots, None to keep the IDs only in memory. Defaults to None.
+            snapshot_interval (float, optional): seconds between two snapshots. Defaults to 60.
+        """
+        self.window = window
+        self.buckets = buckets
+        self.maxsize = maxsize
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.span = window / buckets
+
+        # [(slot, IDs)], the newest last
+        self._ring = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.checked = 0
+        self.duplicates = 0
+        self.rotations = 0
+        self.snapshots = 0
+
+    def start(self) -> None:
+        """Load the snapshot, then start the snapshot thread"""
+        if not self.snapshot_file:
+            return
+        self.load()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._snapshot_loop, name="seen-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the snapshot thread, and write a last snapshot"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_file:
+            self.snapshot()
+
+    def seen(self, status_id: Union[int, str], now: Union[float, None] = None) -> bool:
+        """Check if a status was received, and remember it
+
+        Args:
+            status_id (Union[int, str]): status ID
+            now (Union[float, None], optional): current timestamp. Defaults to None.
+
+        Returns:
+            bool: True if already received during the window
+        """
+        status_id = int(status_id)
+        slot = int((time.time() if now is None else now) // self.span)
+        with self._lock:
+            self.checked += 1
+            # The buckets out of the window are dropped before the lookup
+            if not self._ring or self._ring[-1][0] < slot:
+                self._rotate(slot)
+            for _, ids in self._ring:
+                if status_id in ids:
+                    self.duplicates += 1
+                    return True
+            if self._size >= self.maxsize:
+                # Burst : the ring turns before the end of the bucket
+                self._rotate(self._ring[-1][0])
+            self._ring[-1][1].add(status_id)
+            self._size += 1
+            return False
+
+    def snapshot(self) -> None:
+        """Write the IDs to the snapshot file (replaced at once)"""
+        with self._lock:
+            ring = [(slot, array.array("Q", ids)) for slot, ids in self._ring]
+        temporary = f"{self.snapshot_file}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(_MAGIC)
+            for slot, ids in ring:
+                f.write(_BUCKET_HEADER.pack(slot, len(ids)))
+                f.write(ids.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_file)
+        self.snapshots += 1
+
+    def load(self, now: Union[float, None] = None) -> int:
+        """Read the IDs of the snapshot file still in the window
+
+        Args:
+            now (Union[float, None], optional): current timestamp. Defaults to None.
+
+        Returns:
+            int: IDs read
+        """
+        try:
+            with open(self.snapshot_file, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return 0
+        if not content.startswith(_MAGIC):
+            logger.error(f"Seen filter snapshot '{self.snapshot_file}' unreadable")
+            return 0
+
+        oldest = int((time.time() if now is None else now) // self.span) - (
+            self.buckets - 1
+        )
+        ring = []
+        offset = len(_MAGIC)
+        while offset < len(content):
+            slot, count = _BUCKET_HEADER.unpack_from(content, offset)
+            offset += _BUCKET_HEADER.size
+            ids = array.array("Q")
+            ids.frombytes(content[offset : offset + count * ids.itemsize])
+            offset += count * ids.itemsize
+            if slot >= oldest:
+                ring.append((slot, set(ids)))
+        with self._lock:
+            self._ring = ring[-self.buckets :]
+            self._size = sum(len(ids) for _, ids in self._ring)
+            loaded = self._size
+        logger.info(f"Seen filter loaded : {loaded} status IDs")
+        return loaded
+
+    def stats(self) -> dict:
+        """Get the filter counters
+
+        Returns:
+            dict: statuses checked, duplicates dropped, share dropped, IDs remembered, buckets rotated and snapshots written
+        """
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "suppression_rate": (
+                    round(self.duplicates / self.checked, 4) if self.checked else 0.0
+                ),
+                "size": self._size,
+                "rotations": self.rotations,
+                "snapshots": self.snapshots,
+            }
+
+    def _rotate(self, slot: int) -> None:
+        # self._lock must be held : a new bucket, the buckets out of the
+        # window (or the oldest one, for a burst) are dropped
+        self._ring.append((slot, set()))
+        self.rotations += 1
+        oldest = slot - (self.buckets - 1)
+        while len(self._ring) > self.buckets or (
+            len(self._ring) > 1 and self._ring[0][0] < oldest
+        ):
+            self._size -= len(self._ring.pop(0)[1])
+        if self._size >= self.maxsize and len(self._ring) > 1:
+            self._size -= len(self._ring.pop(0)[1])
+
+    def _snapshot_loop(self) -> None:
+        while not self._stopping.wait(self.snapshot_interval):
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Seen filter snapshot can not be written")
@@ -0,0 +1,297 @@
+"""Durable intake log of the received statuses
+
+Every status received by the stream is appended to a SQLite table in WAL mode
+before being handled. The appends are group committed : the writer thread
+commits everything received during the previous commit in one transaction, so
+one fsync covers a whole burst. A status is given to the consumer (the worker
+pool) only once it is on disk, and acknowledged once handled. At start, the
+statuses not acknowledged (received before a crash or a restart) are replayed.
+"""
+
+from twitter_bot import logger
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS intake (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    acked_at REAL
+);
+CREATE INDEX IF NOT EXISTS intake_key ON intake (key);
+CREATE INDEX IF NOT EXISTS intake_acked_at ON intake (acked_at);
+"""
+
+
+class IntakeLog:
+    """Append-only log of the items to handle, replayed until acknowledged"""
+
+    def __init__(
+        self,
+        path: str,
+        key: Callable[[Any], str],
+        serializer: Callable[[Any], dict],
+        deserializer: Callable[[dict], Any],
+        batch_size: int = 500,
+        retention: float = 86400,
+        compact_interval: float = 600,
+    ):
+        """
+        Args:
+            path (str): SQLite database file
+            key (Callable[[Any], str]): unique key of an item, used to acknowledge it
+            serializer (Callable[[Any], dict]): item to JSON
+            deserializer (Callable[[dict], Any]): JSON to item
+            batch_size (int, optional): max items by commit. Defaults to 500.
+            retention (float, optional): seconds an acknowledged item is kept. Defaults to 86400.
+            compact_interval (float, optional): seconds between two compactions. Defaults to 600.
+        """
+        self.path = path
+        self.key = key
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.batch_size = batch_size
+        self.retention = retention
+        self.compact_interval = compact_interval
+
+        self._connection = None
+        self._db_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._appends = []
+        self._acks = []
+        self._writer = None
+        self._stopping = False
+        self._consumer = None
+        self._compacted_at = 0.0
+
+        self.appended = 0
+        self.committed = 0
+        self.unlogged = 0
+        self.batches = 0
+        self.acked = 0
+        self.replayed = 0
+        self.compacted = 0
+
+    def start(self, consumer: Callable[[Any], Any]) -> None:
+        """Open the log, give the items not acknowledged to the consumer,
+        then start the writer thread
+
+        Args:
+            consumer (Callable[[Any], Any]): called with each item once it is on disk
+        """
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # One fsync of the WAL by commit
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(_SCHEMA)
+        self._consumer = consumer
+        self._compacted_at = time.monotonic()
+        self._replay()
+
+        self._stopping = False
+        self._writer = threading.Thread(
+            target=self._write, name="intake-writer", daemon=True
+        )
+        self._writer.start()
+        logger.info(
+            f"Intake log started : '{self.path}', {self.replayed} items replayed"
+        )
+
+    def append(self, item: Any) -> None:
+        """Write an item to the log, it is given to the consumer after the commit
+
+        Args:
+            item (Any): received item
+        """
+        payload = json.dumps(self.serializer(item))
+        with self._condition:
+            self._appends.append((self.key(item), payload, time.time(), item))
+            self.appended += 1
+            self._condition.notify_all()
+
+    def ack(self, item: Any) -> None:
+        """Mark an item as handled, it will not be replayed
+
+        Args:
+            item (Any): handled item
+        """
+        with self._condition:
+            self._acks.append(self.key(item))
+            self._condition.notify_all()
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """Wait until the items appended so far are committed
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait. Defaults to None.
+
+        Returns:
+            bool: True if they are committed, False if the timeout expired
+        """
+        with self._condition:
+            appended = self.appended
+            return self._condition.wait_for(
+                lambda: self.committed + self.unlogged >= appended
+                or self._writer is None,
+                timeout,
+            )
+
+    def stop(self, timeout: Union[float, None] = None) -> None:
+        """Commit the pending items and acknowledgements, then close the log
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait for the writer. Defaults to None.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        with self._condition:
+            self._writer = None
+            self._condition.notify_all()
+        with self._db_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        logger.info(f"Intake log stopped : {self.stats()}")
+
+    def compact(self) -> int:
+        """Delete the items acknowledged for more than "retention" seconds,
+        and truncate the WAL file
+
+        Returns:
+            int: number of items deleted
+        """
+        with self._db_lock:
+            cursor = self._connection.execute(
+                "DELETE FROM intake WHERE acked_at < ?",
+                (time.time() - self.retention,),
+            )
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._compacted_at = time.monotonic()
+        with self._condition:
+            self.compacted += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Get the log counters
+
+        Returns:
+            dict: items appended, committed, not logged (commit failed), acknowledged, replayed and compacted, commits made, items waiting for a commit and items not acknowledged
+        """
+        unacked = None
+        with self._db_lock:
+            if self._connection is not None:
+                unacked = self._connection.execute(
+                    "SELECT COUNT(*) FROM intake WHERE acked_at IS NULL"
+                ).fetchone()[0]
+        with self._condition:
+            return {
+                "appended": self.appended,
+                "committed": self.committed,
+                "unlogged": self.unlogged,
+                "batches": self.batches,
+                "acked": self.acked,
+                "replayed": self.replayed,
+                "compacted": self.compacted,
+                "pending": len(self._appends),
+                "unacked": unacked,
+            }
+
+    def _replay(self) -> None:
+        with self._db_lock:
+            rows = self._connection.execute(
+                "SELECT key, payload FROM intake WHERE acked_at IS NULL ORDER BY id"
+            ).fetchall()
+        for key, payload in rows:
+            try:
+                item = self.deserializer(json.loads(payload))
+            except Exception:
+                # Never replayed again
+                logger.exception(f"Intake item '{key}' can not be read, skipped")
+                with self._db_lock:
+                    self._connection.execute(
+                        "UPDATE intake SET acked_at = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                continue
+            self.replayed += 1
+            self._consumer(item)
+
+    def _write(self) -> None:
+        """Commit the appends and acknowledgements received during the previous
+        commit, then give the committed items to the consumer"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._appends or self._acks or self._stopping,
+                    self._compact_timeout(),
+                )
+                appends = self._appends[: self.batch_size]
+                del self._appends[: self.batch_size]
+                acks, self._acks = self._acks, []
+                stopping = self._stopping and not self._appends
+
+            if appends or acks:
+                try:
+                    self._commit(appends, acks)
+                except Exception:
+                    # Better handled without a copy on disk than not handled
+                    logger.exception(
+                        f"Intake commit failed, {len(appends)} items not logged"
+                    )
+                    with self._condition:
+                        self.unlogged += len(appends)
+                        self._condition.notify_all()
+                for _, _, _, item in appends:
+                    try:
+                        self._consumer(item)
+                    except Exception:
+                        logger.exception("Intake consumer failed")
+
+            if self._compact_timeout() == 0:
+                try:
+                    self.compact()
+                except Exception:
+                    logger.exception("Intake log compaction failed")
+            if stopping:
+                return
+
+    def _commit(self, appends: list, acks: list) -> None:
+        now = time.time()
+        with self._db_lock:
+            # One transaction, so one fsync
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT INTO intake (key, payload, received_at) VALUES (?, ?, ?)",
+                    [
+                        (key, payload, received_at)
+                        for key, payload, received_at, _ in appends
+                    ],
+                )
+                self._connection.executemany(
+                    "UPDATE intake SET acked_at = ? WHERE key = ? AND acked_at IS NULL",
+                    [(now, key) for key in acks],
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        with self._condition:
+            self.committed += len(appends)
+            self.acked += len(acks)
+            self.batches += 1
+            self._condition.notify_all()
+
+    def _compact_timeout(self) -> float:
+        return max(self.compact_interval - (time.monotonic() - self._compacted_at), 0)
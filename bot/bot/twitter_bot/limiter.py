@@ -0,0 +1,254 @@
+"""Adaptive limit of the concurrent calls to a dependency
+
+Too many concurrent requests saturate the database pool of the backend and
+every request gets slower, too few leave it idle. The limit of in-flight
+calls follows the backend with AIMD : each call answered fast raises it by
+1 / limit (about +1 by round trip), a failed call or a call slower than
+"tolerance" times the no-load latency cuts it by "backoff". The calls over
+the limit wait in the process for a slot.
+
+The no-load latency is the lowest latency of the last "window" seconds (two
+half windows), so it is learned again when the backend changes. It is kept by
+operation (the function called) : a call is slow compared to the calls of the
+same operation, so a login or a snapshot, slow by nature, does not cut the
+limit of the fast calls, nor hide their slowdown. A cut is made
+at most once by round : the calls started before the last cut are slow
+because of the previous limit, and do not cut it again.
+"""
+
+from twitter_bot import metrics
+
+import threading
+import time
+from typing import Hashable, Union
+
+
+class AdaptiveLimiter:
+    """Max in-flight calls, raised while the latency holds, cut when it grows"""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = 10,
+        min_limit: float = 1,
+        max_limit: float = 100,
+        tolerance: float = 2,
+        backoff: float = 0.9,
+        window: float = 60,
+    ):
+        """
+        Args:
+            name (str): dependency name, label of the waiting time histogram
+            initial_limit (float, optional): in-flight calls allowed at start. Defaults to 10.
+            min_limit (float, optional): lowest limit. Defaults to 1.
+            max_limit (float, optional): highest limit. Defaults to 100.
+            tolerance (float, optional): latency, as a multiple of the no-load latency, cutting the limit. Defaults to 2.
+            backoff (float, optional): factor of a cut. Defaults to 0.9.
+            window (float, optional): seconds the no-load latency is kept. Defaults to 60.
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+
+        self._limit = min(max(initial_limit, min_limit), max_limit)
+        self._in_flight = 0
+        self._waiting = 0
+        # By operation, lowest latency of the current and of the previous
+        # half window
+        self._min_latency = {}
+        self._window_started_at = time.monotonic()
+        self._cut_at = 0.0
+        self._condition = threading.Condition()
+
+        self.calls = 0
+        self.failures = 0
+        self.increases = 0
+        self.cuts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+
+    @property
+    def limit(self) -> int:
+        """In-flight calls allowed now"""
+        with self._condition:
+            return int(self._limit)
+
+    def acquire(self, timeout: Union[float, None] = None) -> Union[float, None]:
+        """Wait for a slot
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait. Defaults to None.
+
+        Returns:
+            Union[float, None]: start time of the call, to give to "release", or None if the timeout expired
+        """
+        queued_at = time.monotonic()
+        with self._condition:
+            self._waiting += 1
+            acquired = self._condition.wait_for(
+                lambda: self._in_flight < int(self._limit), timeout
+            )
+            self._waiting -= 1
+            started = time.monotonic()
+            waited = started - queued_at
+            self.wait_seconds += waited
+            self.last_wait_seconds = waited
+            if not acquired:
+                self.timeouts += 1
+            else:
+                self._in_flight += 1
+                self.calls += 1
+        metrics.LIMITER_WAIT_SECONDS.observe(waited, self.name)
+        return started if acquired else None
+
+    def release(
+        self,
+        started: float,
+        success: Union[bool, None] = True,
+        operation: Hashable = None,
+    ) -> None:
+        """Free the slot of a call, and adapt the limit to its outcome
+
+        Args:
+            started (float): value returned by "acquire"
+            success (Union[bool, None], optional): True if answered, False if failed, None to not count the call (not made). Defaults to True.
+            operation (Hashable, optional): operation called, its latency is compared to the no-load latency of this operation. Defaults to None.
+        """
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            in_flight = self._in_flight
+            self._in_flight -= 1
+            if success is not None:
+                self._adapt(latency, started, now, success, in_flight, operation)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Get the limiter state and counters
+
+        Returns:
+            dict: limit, calls in flight, calls waiting, lowest no-load latency of the operations (seconds, -1 if unknown), operations tracked, last and total waiting time (seconds), calls, failed calls, raises, cuts and waits timed out
+        """
+        with self._condition:
+            baselines = [
+                baseline
+                for baseline in map(self._baseline, self._min_latency)
+                if baseline is not None
+            ]
+            baseline = min(baselines) if baselines else None
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "min_latency_seconds": (
+                    round(baseline, 4) if baseline is not None else -1
+                ),
+                "operations": len(self._min_latency),
+                "last_wait_seconds": round(self.last_wait_seconds, 4),
+                "wait_seconds": round(self.wait_seconds, 3),
+                "calls": self.calls,
+                "failures": self.failures,
+                "increases": self.increases,
+                "cuts": self.cuts,
+                "timeouts": self.timeouts,
+            }
+
+    def _baseline(self, operation: Hashable) -> Union[float, None]:
+        # self._condition must be held
+        latencies = [
+            latency
+            for latency in self._min_latency.get(operation, ())
+            if latency is not None
+        ]
+        return min(latencies) if latencies else None
+
+    def _adapt(
+        self,
+        latency: float,
+        started: float,
+        now: float,
+        success: bool,
+        in_flight: int,
+        operation: Hashable,
+    ) -> None:
+        # self._condition must be held
+        if now - self._window_started_at >= self.window / 2:
+            # The operations not called for a whole window are forgotten
+            self._min_latency = {
+                name: [None, latencies[0]]
+                for name, latencies in self._min_latency.items()
+                if latencies[0] is not None
+            }
+            self._window_started_at = now
+        if success:
+            latencies = self._min_latency.setdefault(operation, [None, None])
+            current = latencies[0]
+            latencies[0] = latency if current is None else min(current, latency)
+        else:
+            self.failures += 1
+
+        baseline = self._baseline(operation)
+        slow = baseline is not None and latency > baseline * self.tolerance
+        if not success or slow:
+            if started >= self._cut_at:
+                self._limit = max(self._limit * self.backoff, self.min_limit)
+                self._cut_at = now
+                self.cuts += 1
+        elif in_flight * 2 >= self._limit:
+            # Raised only while used : an idle limit would grow without bound
+            limit = min(self._limit + 1 / self._limit, self.max_limit)
+            if int(limit) > int(self._limit):
+                self.increases += 1
+            self._limit = limit
+
+
+# Limiters, by dependency
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_limiter(name: str, limiter: Union[AdaptiveLimiter, None]) -> None:
+    """Set the process limiter of a dependency
+
+    Args:
+        name (str): dependency name
+        limiter (Union[AdaptiveLimiter, None]): the limiter, None to not limit the dependency
+    """
+    with _limiters_lock:
+        if limiter is None:
+            _limiters.pop(name, None)
+        else:
+            _limiters[name] = limiter
+
+
+def get_limiter(name: str) -> Union[AdaptiveLimiter, None]:
+    """Get the process limiter of a dependency
+
+    Args:
+        name (str): dependency name
+
+    Returns:
+        Union[AdaptiveLimiter, None]: the limiter, or None if the dependency is not limited
+    """
+    return _limiters.get(name)
+
+
+def get_limiters_stats() -> dict:
+    """Get the state and counters of every limiter
+
+    Returns:
+        dict: {dependency name: limiter stats}
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def clear_limiters() -> None:
+    """Remove every limiter"""
+    with _limiters_lock:
+        _limiters.clear()
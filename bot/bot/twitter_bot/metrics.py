@@ -0,0 +1,436 @@
+"""Bot metrics, exposed in Prometheus text format
+
+Counters and histograms are updated by the code being measured : a few
+dictionary and list operations under a lock, so instrumenting a stage costs
+a few microseconds. The "stats()" of the other components (worker pool,
+circuit breakers, rate limiter, caches, ...) are read by collectors only when
+the metrics are scraped.
+"""
+
+from twitter_bot import logger
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator, Union
+
+# Latency buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+# Items by bulk request
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, by label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        """Increment the counter
+
+        Args:
+            *labelvalues (str): values of the labels, in "labelnames" order
+            amount (float, optional): increment. Defaults to 1.
+        """
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        """Get the counter value
+
+        Args:
+            *labelvalues (str): values of the labels, in "labelnames" order
+
+        Returns:
+            float: the value
+        """
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def clear(self) -> None:
+        """Reset the counter"""
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> Iterator[str]:
+        """Get the counter lines of the exposition format
+
+        Yields:
+            str: exposition line
+        """
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            labels = _format_labels(dict(zip(self.labelnames, labelvalues)))
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, by label values"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # {labelvalues: [bucket counts..., +Inf count, sum]}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Add a value
+
+        Args:
+            value (float): observed value
+            *labelvalues (str): values of the labels, in "labelnames" order
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 2)
+                self._values[labelvalues] = counts
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        """Observe the duration of a "with" block, in seconds
+
+        Args:
+            *labelvalues (str): values of the labels, in "labelnames" order
+
+        Returns:
+            _Timer: context manager
+        """
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        """Get the number of observed values
+
+        Args:
+            *labelvalues (str): values of the labels, in "labelnames" order
+
+        Returns:
+            int: number of values
+        """
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            return sum(counts[:-1]) if counts else 0
+
+    def clear(self) -> None:
+        """Reset the histogram"""
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> Iterator[str]:
+        """Get the histogram lines of the exposition format
+
+        Yields:
+            str: exposition line
+        """
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for labelvalues, counts in values:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class _Timer:
+    # A class rather than "contextmanager" : no generator to create by block
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+def stats_samples(prefix: str, stats: dict, label: Union[str, None] = None) -> list:
+    """Turn the "stats()" dict of a component into gauge samples
+
+    Numbers become "<prefix>_<key>" gauges, strings become a "<prefix>_<key>"
+    gauge of value 1 with the string as label, and if "label" is given, the
+    stats are a dict by label value (like the circuit breakers, by dependency)
+
+    Args:
+        prefix (str): metric name prefix
+        stats (dict): stats of the component
+        label (Union[str, None], optional): label of the keys of the stats. Defaults to None.
+
+    Returns:
+        list: (metric name, labels, value)
+    """
+    if label is not None:
+        samples = []
+        for key, sub_stats in stats.items():
+            for name, labels, value in stats_samples(prefix, sub_stats):
+                samples.append((name, {label: key, **labels}, value))
+        return samples
+
+    samples = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            samples.append((f"{prefix}_{key}", {}, int(value)))
+        elif isinstance(value, (int, float)):
+            samples.append((f"{prefix}_{key}", {}, value))
+        elif isinstance(value, str):
+            samples.append((f"{prefix}_{key}", {key: value}, 1))
+    return samples
+
+
+# Instruments of the mention pipeline
+MENTION_SECONDS = Histogram("bot_mention_seconds", "Time spent handling a mention")
+MENTION_STAGE_SECONDS = Histogram(
+    "bot_mention_stage_seconds",
+    "Time spent in each stage of the handling of a mention",
+    labelnames=("stage",),
+)
+MENTIONS = Counter(
+    "bot_mentions_total", "Mentions handled, by outcome", labelnames=("outcome",)
+)
+
+BATCH_SIZE = Histogram(
+    "bot_batch_size",
+    "Items sent by bulk request to the backend",
+    labelnames=("batch",),
+    buckets=SIZE_BUCKETS,
+)
+
+LIMITER_WAIT_SECONDS = Histogram(
+    "bot_limiter_wait_seconds",
+    "Time waited for a slot of the concurrency limiter of a dependency",
+    labelnames=("dependency",),
+)
+
+_instruments = [
+    MENTION_SECONDS,
+    MENTION_STAGE_SECONDS,
+    MENTIONS,
+    BATCH_SIZE,
+    LIMITER_WAIT_SECONDS,
+]
+_collectors = {}
+_collectors_lock = threading.Lock()
+
+
+def timed(stage: str) -> _Timer:
+    """Observe the duration of a stage of the handling of a mention
+
+    Args:
+        stage (str): stage name
+
+    Returns:
+        _Timer: context manager
+    """
+    return MENTION_STAGE_SECONDS.time(stage)
+
+
+def timed_call(
+    stage: str, func: Callable[..., Any], *args, **kwargs
+) -> Callable[[], Any]:
+    """Get a function calling func and observing its duration as a stage of
+    the handling of a mention
+
+    Args:
+        stage (str): stage name
+        func (Callable[..., Any]): function to call
+        *args, **kwargs: func arguments
+
+    Returns:
+        Callable[[], Any]: function without arguments returning the func result
+    """
+
+    def call():
+        with timed(stage):
+            return func(*args, **kwargs)
+
+    return call
+
+
+def register_collector(
+    prefix: str, stats: Callable[[], dict], label: Union[str, None] = None
+) -> None:
+    """Expose the stats of a component, read at each scrape
+
+    Args:
+        prefix (str): metric name prefix, like "bot_worker_pool"
+        stats (Callable[[], dict]): "stats()" method of the component
+        label (Union[str, None], optional): label of the keys of the stats, see "stats_samples". Defaults to None.
+    """
+    with _collectors_lock:
+        _collectors[prefix] = (stats, label)
+
+
+def render() -> str:
+    """Get every metric in Prometheus text format
+
+    Returns:
+        str: exposition text
+    """
+    lines = []
+    for instrument in _instruments:
+        lines.extend(instrument.render())
+
+    with _collectors_lock:
+        collectors = list(_collectors.items())
+    for prefix, (stats, label) in collectors:
+        try:
+            samples = stats_samples(prefix, stats(), label=label)
+        except Exception:
+            logger.exception(f"Metrics of '{prefix}' can not be collected")
+            continue
+        typed = set()
+        for name, labels, value in samples:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def merge(texts: dict, label: str) -> str:
+    """Merge the metrics of several processes, told apart by a label
+
+    Args:
+        texts (dict): {label value: exposition text of a process}
+        label (str): label added to the samples of each process
+
+    Returns:
+        str: exposition text, with the samples of a metric grouped
+    """
+    # {metric name: [HELP and TYPE lines, samples]}
+    families = {}
+    for value, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                name = line.split(" ", 3)[2]
+                family = families.setdefault(name, [[], []])
+                if line not in family[0]:
+                    family[0].append(line)
+                continue
+            if not line or family is None:
+                continue
+            name, _, sample = line.partition(" ")
+            metric, brace, labels = name.partition("{")
+            labels = f'{label}="{_escape(str(value))}"' + (
+                "," + labels if brace else "}"
+            )
+            family[1].append(f"{metric}{{{labels} {sample}")
+
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def clear_metrics() -> None:
+    """Reset the instruments and remove the collectors"""
+    for instrument in _instruments:
+        instrument.clear()
+    with _collectors_lock:
+        _collectors.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.source().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics request : {format % args}")
+
+
+def start_metrics_server(
+    host: str, port: int, source: Callable[[], str] = render
+) -> ThreadingHTTPServer:
+    """Serve the metrics on "http://<host>:<port>/metrics", in a daemon thread
+
+    Args:
+        host (str): listening address
+        port (int): listening port (0 for a free port)
+        source (Callable[[], str], optional): returns the exposition text. Defaults to render.
+
+    Returns:
+        ThreadingHTTPServer: the server, stopped with "shutdown()"
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.source = source
+    thread = threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    )
+    thread.start()
+    logger.info(f"Metrics served on http://{host}:{server.server_address[1]}/metrics")
+    return server
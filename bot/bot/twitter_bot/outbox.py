@@ -0,0 +1,349 @@
+"""Durable outbox of the backend writes made after the reply
+
+Once a mention is claimed and replied to, the writes left (the reply Tweet ID
+of the claim) do not change what the User sees : they are written to a SQLite
+table in WAL mode, and the reply is done. A flusher thread sends them to the
+backend in order, one at a time. A write failing (backend down, timeout,
+HTTP 5xx or 429) is tried again after an exponential backoff, and blocks the
+ones after it, so they keep their order. A write refused by the backend (claim
+deleted, HTTP 404) is kept aside, not tried again. The writes not sent (before a crash or a restart) are
+sent at the next start.
+
+A write has a unique key : put twice, it is kept once. The backend writes are
+idempotent (a claim confirmed again with the same reply is accepted), so a
+write sent but not deleted before a crash can be sent again.
+"""
+
+from twitter_bot import logger, config
+from twitter_bot.tools import api_tools, auth_tools
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL NOT NULL DEFAULT 0,
+    failed_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_failed_at ON outbox (failed_at);
+"""
+
+# Kinds of writes : name of the api_tools function sending them
+CONFIRM_CLAIM = "confirm_claim"
+KINDS = (CONFIRM_CLAIM,)
+
+
+class Outbox:
+    """Writes to send to the backend, in order, until sent or refused"""
+
+    def __init__(
+        self,
+        path: str,
+        send: Callable[[str, dict], bool],
+        retry_delay: float = 1,
+        retry_max: float = 300,
+    ):
+        """
+        Args:
+            path (str): SQLite database file
+            send (Callable[[str, dict], bool]): called with (kind, payload), returns True if written, False if refused, raises to be tried again
+            retry_delay (float, optional): seconds before the first retry, doubled at each one. Defaults to 1.
+            retry_max (float, optional): max seconds between two retries. Defaults to 300.
+        """
+        self.path = path
+        self.send = send
+        self.retry_delay = retry_delay
+        self.retry_max = retry_max
+
+        self._connection = None
+        self._db_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._flusher = None
+        self._stopping = False
+
+        self.put_count = 0
+        self.duplicates = 0
+        self.sent = 0
+        self.refused = 0
+        self.retries = 0
+
+    @property
+    def running(self) -> bool:
+        """True once started, until stopped"""
+        return self._flusher is not None
+
+    def start(self) -> None:
+        """Open the outbox, then start the flusher (the writes left are sent first)"""
+        if self._flusher is not None:
+            return
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # A write is on disk once "put" returns
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(_SCHEMA)
+        # The writes left are tried at once, without their backoff
+        self._connection.execute(
+            "UPDATE outbox SET retry_at = 0 WHERE failed_at IS NULL"
+        )
+        pending = self._pending()
+
+        self._stopping = False
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="outbox-flusher", daemon=True
+        )
+        self._flusher.start()
+        logger.info(f"Outbox started : '{self.path}', {pending} writes to send")
+
+    def put(self, kind: str, key: str, payload: dict) -> bool:
+        """Write a backend write to the outbox, it is sent by the flusher
+
+        Args:
+            kind (str): kind of write, see "KINDS"
+            key (str): unique key of the write
+            payload (dict): arguments of the write
+
+        Returns:
+            bool: True if added, False if a write with this key is already in the outbox
+        """
+        with self._db_lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO outbox (kind, key, payload, created_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), time.time()),
+            )
+        with self._condition:
+            if cursor.rowcount:
+                self.put_count += 1
+            else:
+                self.duplicates += 1
+            self._condition.notify_all()
+        return bool(cursor.rowcount)
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """Wait until the writes put so far are sent or refused
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait. Defaults to None.
+
+        Returns:
+            bool: True if the outbox is empty, False if the timeout expired
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._flusher is None or not self._pending(), timeout
+            )
+
+    def stop(self, timeout: Union[float, None] = 10) -> None:
+        """Send the writes left, then stop the flusher and close the outbox (the
+        writes still not sent are sent at the next start)
+
+        Args:
+            timeout (Union[float, None], optional): max time to send the writes left. Defaults to 10.
+        """
+        if self._flusher is None:
+            return
+        self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._flusher.join()
+        with self._condition:
+            self._flusher = None
+            self._condition.notify_all()
+        logger.info(f"Outbox stopped : {self.stats()}")
+        with self._db_lock:
+            self._connection.close()
+            self._connection = None
+
+    def stats(self) -> dict:
+        """Get the outbox counters
+
+        Returns:
+            dict: writes to send, age of the oldest one (seconds), writes refused kept aside, writes put, put again (ignored), sent, refused and retries
+        """
+        size, lag, failed = 0, 0.0, 0
+        with self._db_lock:
+            if self._connection is not None:
+                size, oldest = self._connection.execute(
+                    "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE failed_at IS NULL"
+                ).fetchone()
+                failed = self._connection.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE failed_at IS NOT NULL"
+                ).fetchone()[0]
+                if oldest is not None:
+                    lag = max(time.time() - oldest, 0.0)
+        with self._condition:
+            return {
+                "size": size,
+                "lag_seconds": round(lag, 3),
+                "failed": failed,
+                "put": self.put_count,
+                "duplicates": self.duplicates,
+                "sent": self.sent,
+                "refused": self.refused,
+                "retries": self.retries,
+            }
+
+    def _pending(self) -> int:
+        with self._db_lock:
+            if self._connection is None:
+                return 0
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM outbox WHERE failed_at IS NULL"
+            ).fetchone()[0]
+
+    def _head(self) -> Union[tuple, None]:
+        with self._db_lock:
+            return self._connection.execute(
+                "SELECT id, kind, key, payload, attempts, retry_at FROM outbox WHERE failed_at IS NULL ORDER BY id LIMIT 1"
+            ).fetchone()
+
+    def _flush_loop(self) -> None:
+        """Send the oldest write, wait for a new one or for its retry time"""
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                # Read before the head : a write put meanwhile is not missed
+                put_count = self.put_count
+            head = self._head()
+            if head is None:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._stopping or self.put_count > put_count
+                    )
+                continue
+
+            row_id, kind, key, payload, attempts, retry_at = head
+            wait = retry_at - time.time()
+            if wait > 0:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopping, wait)
+                continue
+
+            try:
+                written = self.send(kind, json.loads(payload))
+            except Exception:
+                delay = min(self.retry_delay * 2**attempts, self.retry_max)
+                logger.exception(
+                    f"Outbox write '{key}' can not be sent, tried again in {delay}s"
+                )
+                with self._db_lock:
+                    self._connection.execute(
+                        "UPDATE outbox SET attempts = ?, retry_at = ? WHERE id = ?",
+                        (attempts + 1, time.time() + delay, row_id),
+                    )
+                with self._condition:
+                    self.retries += 1
+                continue
+
+            # With the counters, for "flush" to see both at once
+            with self._condition:
+                with self._db_lock:
+                    if written:
+                        self._connection.execute(
+                            "DELETE FROM outbox WHERE id = ?", (row_id,)
+                        )
+                    else:
+                        # Kept aside for an admin, the next writes are sent
+                        self._connection.execute(
+                            "UPDATE outbox SET failed_at = ? WHERE id = ?",
+                            (time.time(), row_id),
+                        )
+                if written:
+                    self.sent += 1
+                else:
+                    self.refused += 1
+                    logger.error(f"Outbox write '{key}' refused by the backend")
+                self._condition.notify_all()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def send(settings: config.Settings, kind: str, payload: dict) -> bool:
+    """Send a write to the backend
+
+    Args:
+        settings (config.Settings): bot settings
+        kind (str): kind of write, see "KINDS"
+        payload (dict): arguments of the write
+
+    Returns:
+        bool: True if written, False if refused
+    """
+    return bool(
+        auth_tools.get_token_manager(settings=settings).call(
+            getattr(api_tools, kind), settings=settings, **payload
+        )
+    )
+
+
+def get_outbox(settings: config.Settings) -> Union[Outbox, None]:
+    """Get the process outbox
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[Outbox, None]: the outbox (not started), or None if "OUTBOX_FILE" is empty
+    """
+    global _outbox
+    if not settings.OUTBOX_FILE:
+        return None
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(
+                path=settings.OUTBOX_FILE,
+                send=lambda kind, payload: send(
+                    settings=settings, kind=kind, payload=payload
+                ),
+                retry_max=settings.OUTBOX_RETRY_MAX,
+            )
+        return _outbox
+
+
+def clear_outbox(timeout: Union[float, None] = 10) -> None:
+    """Stop the process outbox (the writes left are sent first), and remove it
+
+    Args:
+        timeout (Union[float, None], optional): max time to send the writes left. Defaults to 10.
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is not None:
+            _outbox.stop(timeout)
+        _outbox = None
+
+
+def defer(settings: config.Settings, kind: str, key: str, payload: dict) -> bool:
+    """Write to the backend by the process outbox, or at once if it is not running
+
+    Args:
+        settings (config.Settings): bot settings
+        kind (str): kind of write, see "KINDS"
+        key (str): unique key of the write
+        payload (dict): arguments of the write
+
+    Returns:
+        bool: True if put in the outbox or written, False if refused
+    """
+    outbox = get_outbox(settings=settings)
+    if outbox is not None and outbox.running:
+        try:
+            outbox.put(kind=kind, key=key, payload=payload)
+            return True
+        except Exception:
+            logger.exception(f"Outbox write '{key}' can not be put, sent at once")
+    return send(settings=settings, kind=kind, payload=payload)
@@ -0,0 +1,317 @@
+"""Twitter rate limits, by credentials and endpoint
+
+Each endpoint has a token bucket refilled at "limit / window" tokens per second,
+holding at most "burst" tokens, and capped by the budget of the current window
+read from the "x-rate-limit-*" headers of the responses. The headers only
+lower the budget : the configured limit is an upper bound (the share of a
+process when the account budget is split). A call without budget is not made :
+"RateLimited" tells when it can be made again, so the worker pool parks the
+status instead of blocking a thread until the window resets. The time given is
+spread by a random jitter, so the statuses parked together are not all tried
+again at the same time.
+"""
+
+from twitter_bot import logger, config
+from twitter_bot.tools.error_tools import Deferred
+
+import random
+import threading
+import time
+from typing import Any, Callable, Hashable, Union
+from urllib.parse import urlparse
+
+# Endpoints called by the bot (Twitter API v1.1)
+GET_STATUS = "statuses/show"
+POST_STATUS = "statuses/update"
+
+# Delay before calling an endpoint again after a HTTP 429 without reset header
+DEFAULT_RATE_LIMITED_DELAY = 60
+
+
+class RateLimited(Deferred):
+    """The rate limit of the endpoint is reached"""
+
+
+def endpoint_from_url(url: str) -> str:
+    """Get the endpoint of a Twitter API URL
+
+    Args:
+        url (str): request URL, like "https://api.twitter.com/1.1/statuses/show.json?id=1"
+
+    Returns:
+        str: endpoint, like "statuses/show"
+    """
+    path = urlparse(url).path.strip("/")
+    version, _, endpoint = path.partition("/")
+    if not endpoint:
+        endpoint = version
+    if endpoint.endswith(".json"):
+        endpoint = endpoint[: -len(".json")]
+    return endpoint
+
+
+class TokenBucket:
+    """Budget of an endpoint : "burst" tokens refilled at "limit / window" per second,
+    and at most "remaining" calls before "reset_at" (timestamp)
+    """
+
+    def __init__(self, limit: int, window: float, burst: Union[int, None] = None):
+        now = time.time()
+        self.max_limit = limit
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window
+        self.burst = burst or limit
+        self.tokens = float(self.burst)
+        self.updated_at = now
+        self.remaining = limit
+        self.reset_at = now + window
+
+    def acquire(self, now: float) -> float:
+        """Take a token if possible
+
+        Args:
+            now (float): current timestamp
+
+        Returns:
+            float: 0 if a token was taken, or the seconds to wait before the next one
+        """
+        self.refill(now)
+        if self.remaining <= 0:
+            return max(self.reset_at - now, 0)
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.remaining -= 1
+        return 0
+
+    def update(self, limit: int, remaining: int, reset_at: float) -> None:
+        """Lower the budget of the current window with the response headers, the
+        configured limit and remaining calls stay an upper bound
+
+        Args:
+            limit (int): calls allowed by window
+            remaining (int): calls left in the window
+            reset_at (float): timestamp of the window reset
+        """
+        self.limit = min(self.max_limit, limit)
+        self.rate = self.limit / self.window
+        # The account has less left than this bucket : its window applies
+        if remaining < self.remaining:
+            self.remaining = remaining
+            self.reset_at = reset_at
+
+    def refill(self, now: float) -> None:
+        """Add the tokens earned since the last update, start a new window if the
+        current one is over
+
+        Args:
+            now (float): current timestamp
+        """
+        elapsed = max(now - self.updated_at, 0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = max(now, self.updated_at)
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+
+
+class RateLimiter:
+    """Token buckets of the Twitter endpoints, by credentials"""
+
+    def __init__(self, limits: dict, jitter: float = 0.1):
+        """
+        Args:
+            limits (dict): {endpoint: (limit, window, burst)}, budget of the endpoints before any response
+            jitter (float, optional): max random delay added to a "retry_at", as a fraction of the wait. Defaults to 0.1.
+        """
+        self.limits = limits
+        self.jitter = jitter
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.deferred = 0
+        self.rate_limited = 0
+
+    def acquire(self, credentials: Hashable, endpoint: str) -> None:
+        """Take a token of the endpoint
+
+        Args:
+            credentials (Hashable): credentials making the call
+            endpoint (str): endpoint called
+
+        Raises:
+            RateLimited: no budget left, "retry_at" is when the next token is available
+        """
+        now = time.time()
+        with self._lock:
+            wait = self._bucket(credentials, endpoint).acquire(now)
+            if wait > 0:
+                self.deferred += 1
+            else:
+                self.acquired += 1
+        if wait > 0:
+            raise RateLimited(
+                f"Rate limit of '{endpoint}' reached, next call in {wait:.1f} seconds",
+                retry_at=self._jittered(now, wait),
+            )
+
+    def refund(self, credentials: Hashable, endpoint: str) -> None:
+        """Give back a token taken for a call not made
+
+        Args:
+            credentials (Hashable): credentials making the call
+            endpoint (str): endpoint called
+        """
+        with self._lock:
+            bucket = self._bucket(credentials, endpoint)
+            bucket.tokens = min(bucket.tokens + 1, bucket.burst)
+            bucket.remaining = min(bucket.remaining + 1, bucket.limit)
+            self.acquired -= 1
+
+    def update_from_response(self, credentials: Hashable, response: Any) -> None:
+        """Update the budget of the endpoint with the response headers
+
+        Args:
+            credentials (Hashable): credentials making the call
+            response (Any): requests.Response instance
+        """
+        endpoint = endpoint_from_url(response.url)
+        headers = response.headers
+        with self._lock:
+            bucket = self._bucket(credentials, endpoint)
+            if "x-rate-limit-remaining" in headers:
+                bucket.update(
+                    limit=int(headers.get("x-rate-limit-limit", bucket.limit)),
+                    remaining=int(headers["x-rate-limit-remaining"]),
+                    reset_at=float(headers.get("x-rate-limit-reset", bucket.reset_at)),
+                )
+            if response.status_code == 429:
+                self.rate_limited += 1
+                bucket.remaining = 0
+                if "x-rate-limit-reset" in headers:
+                    bucket.reset_at = float(headers["x-rate-limit-reset"])
+                else:
+                    bucket.reset_at = time.time() + DEFAULT_RATE_LIMITED_DELAY
+                logger.warning(f"Rate limit of '{endpoint}' reached (HTTP 429)")
+
+    def retry_at(self, credentials: Hashable, endpoint: str) -> float:
+        """Get when the endpoint can be called again
+
+        Args:
+            credentials (Hashable): credentials making the call
+            endpoint (str): endpoint called
+
+        Returns:
+            float: timestamp, with its jitter
+        """
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(credentials, endpoint)
+            bucket.refill(now)
+            if bucket.remaining <= 0:
+                wait = max(bucket.reset_at - now, 0)
+            else:
+                wait = max(1 - bucket.tokens, 0) / bucket.rate
+        return self._jittered(now, wait)
+
+    def response_hook(self, credentials: Hashable) -> Callable[..., None]:
+        """Get a "requests" response hook updating the budgets of the credentials
+
+        Args:
+            credentials (Hashable): credentials of the session
+
+        Returns:
+            Callable[..., None]: response hook
+        """
+
+        def hook(response, *args, **kwargs):
+            try:
+                self.update_from_response(credentials=credentials, response=response)
+            except Exception:
+                logger.exception("Rate limit headers can not be read")
+
+        return hook
+
+    def stats(self) -> dict:
+        """Get the rate limiter counters and the budget of each endpoint
+
+        Returns:
+            dict: calls allowed, calls deferred, HTTP 429 received, and by endpoint the calls and tokens left and seconds before reset
+        """
+        now = time.time()
+        with self._lock:
+            endpoints = {}
+            for (_, endpoint), bucket in self._buckets.items():
+                bucket.refill(now)
+                endpoints[endpoint] = {
+                    "remaining": bucket.remaining,
+                    "tokens": round(bucket.tokens, 2),
+                    "reset_in": max(int(bucket.reset_at - now), 0),
+                }
+            return {
+                "acquired": self.acquired,
+                "deferred": self.deferred,
+                "rate_limited": self.rate_limited,
+                "endpoints": endpoints,
+            }
+
+    def _jittered(self, now: float, wait: float) -> float:
+        return now + wait + random.uniform(0, wait * self.jitter)
+
+    def _bucket(self, credentials: Hashable, endpoint: str) -> TokenBucket:
+        # self._lock must be held
+        key = (credentials, endpoint)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit, window, burst = self.limits.get(endpoint, self.limits[None])
+            bucket = TokenBucket(limit=limit, window=window, burst=burst)
+            self._buckets[key] = bucket
+        return bucket
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(settings: config.Settings) -> RateLimiter:
+    """Get the process rate limiter
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        RateLimiter: the rate limiter
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                limits={
+                    GET_STATUS: (
+                        settings.RATE_LIMIT_READ_LIMIT,
+                        settings.RATE_LIMIT_READ_WINDOW,
+                        None,
+                    ),
+                    POST_STATUS: (
+                        settings.RATE_LIMIT_POST_LIMIT,
+                        settings.RATE_LIMIT_POST_WINDOW,
+                        settings.RATE_LIMIT_POST_BURST,
+                    ),
+                    # Other endpoints
+                    None: (
+                        settings.RATE_LIMIT_READ_LIMIT,
+                        settings.RATE_LIMIT_READ_WINDOW,
+                        None,
+                    ),
+                }
+            )
+        return _rate_limiter
+
+
+def clear_rate_limiter() -> None:
+    """Remove the process rate limiter"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
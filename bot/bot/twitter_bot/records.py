@@ -0,0 +1,141 @@
+"""Compact statuses, parsed from the raw JSON of the stream
+
+A "tweepy.models.Status" turns every field of the tweet (user profile,
+entities, ...) into attributes and nested models, while the bot reads only a
+few of them. A "StatusRecord" keeps only these fields, in slots, and is used
+by the stream instead of the tweepy model (see "STATUS_PARSER").
+
+Like tweepy, a field absent from the JSON is not set, so "hasattr" checks of
+"twitter_tools" ("full_text", "extended_entities", "possibly_sensitive") give
+the same answers. The entities keep only the offsets "text_tools" cuts the
+text at. "orjson" decodes the JSON if installed, "json" otherwise.
+"""
+
+import json
+from typing import Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(raw_data: Union[str, bytes]) -> dict:
+    """Decode JSON, with orjson if installed
+
+    Args:
+        raw_data (Union[str, bytes]): JSON document
+
+    Returns:
+        dict: decoded document
+    """
+    if orjson is not None:
+        return orjson.loads(raw_data)
+    return json.loads(raw_data)
+
+
+class UserRecord:
+    """Author of a status"""
+
+    __slots__ = ("id", "id_str", "screen_name")
+
+    def __init__(self, id: int, id_str: str, screen_name: str):
+        self.id = id
+        self.id_str = id_str
+        self.screen_name = screen_name
+
+
+class StatusRecord:
+    """Status with only the fields read by the bot"""
+
+    __slots__ = (
+        "id",
+        "id_str",
+        "in_reply_to_status_id",
+        "user",
+        "full_text",
+        "text",
+        "display_text_range",
+        "entities",
+        "extended_entities",
+        "possibly_sensitive",
+    )
+
+    @classmethod
+    def from_json(cls, data: dict) -> "StatusRecord":
+        """Get a record from the JSON of a status
+
+        Args:
+            data (dict): decoded JSON of the status, or the "_json" of a record
+
+        Returns:
+            StatusRecord: the record
+        """
+        record = cls()
+        record.id = data["id"]
+        record.id_str = data.get("id_str") or str(data["id"])
+        record.in_reply_to_status_id = data.get("in_reply_to_status_id")
+        user = data["user"]
+        record.user = UserRecord(
+            id=user["id"],
+            id_str=user.get("id_str") or str(user["id"]),
+            screen_name=user["screen_name"],
+        )
+        if "full_text" in data:
+            record.full_text = data["full_text"]
+        if "text" in data:
+            record.text = data["text"]
+        if "display_text_range" in data:
+            record.display_text_range = data["display_text_range"]
+        if "entities" in data:
+            # Only the offsets of the entities cut from the text are read
+            record.entities = {
+                kind: [{"indices": entity["indices"]} for entity in entities]
+                for kind, entities in data["entities"].items()
+                if kind in ("user_mentions", "urls", "media") and entities
+            }
+        if "possibly_sensitive" in data:
+            record.possibly_sensitive = data["possibly_sensitive"]
+        if "extended_entities" in data:
+            # Only the first media is read
+            media = data["extended_entities"]["media"][0]
+            record.extended_entities = {
+                "media": [
+                    {
+                        key: media[key]
+                        for key in ("media_url_https", "video_info")
+                        if key in media
+                    }
+                ]
+            }
+        return record
+
+    @property
+    def _json(self) -> dict:
+        """JSON of the record, read back by "from_json" (like the "_json" of
+        the tweepy models, used to log and spill the statuses)
+        """
+        data = {
+            "id": self.id,
+            "id_str": self.id_str,
+            "in_reply_to_status_id": self.in_reply_to_status_id,
+            "user": {
+                "id": self.user.id,
+                "id_str": self.user.id_str,
+                "screen_name": self.user.screen_name,
+            },
+        }
+        for name in (
+            "full_text",
+            "text",
+            "display_text_range",
+            "entities",
+            "extended_entities",
+            "possibly_sensitive",
+        ):
+            if hasattr(self, name):
+                data[name] = getattr(self, name)
+        return data
+
+    def __repr__(self) -> str:
+        return f"StatusRecord(id={self.id}, in_reply_to_status_id={self.in_reply_to_status_id})"
@@ -0,0 +1,405 @@
+"""Retries with full jitter, per mention deadlines and per dependency circuit breakers
+
+A call decorated with "resilient" is retried after a random delay between 0 and
+an exponential bound, as long as the deadline of the current mention is not
+exceeded, and fails fast while the circuit breaker of its dependency is open.
+If its dependency has a concurrency limiter, each try waits for a slot first.
+"""
+
+from twitter_bot import limiter
+from twitter_bot.tools.error_tools import Deferred
+
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Iterator, Union
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Dependencies of the bot
+BACKEND = "backend"
+TWITTER_READ = "twitter_read"
+TWITTER_WRITE = "twitter_write"
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker of the dependency is open, the call is not made"""
+
+
+class DeadlineExceededError(Exception):
+    """The deadline of the current mention is exceeded"""
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter : the delay before the retry n is
+    a random value between 0 and min(max_delay, base_delay * multiplier ** n)
+    """
+
+    def __init__(
+        self,
+        tries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 5,
+        multiplier: float = 2,
+    ):
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delays(self) -> Iterator[float]:
+        """Get the delays before each retry
+
+        Yields:
+            float: delay in seconds
+        """
+        for attempt in range(self.tries - 1):
+            bound = min(self.max_delay, self.base_delay * self.multiplier**attempt)
+            yield random.uniform(0, bound)
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after "failure_threshold" consecutive failures,
+    for "reset_timeout" seconds, then let one call through to test it
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5, reset_timeout: float = 30
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.successes = 0
+        self.errors = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> None:
+        """Check if a call can be made
+
+        Raises:
+            CircuitOpenError: the breaker is open, or half open with a trial call running
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._trial_running):
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+            if state == HALF_OPEN:
+                self._trial_running = True
+            self.calls += 1
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call"""
+        with self._lock:
+            self.successes += 1
+            self._failures = 0
+            self._trial_running = False
+            self._state = CLOSED
+
+    def release(self) -> None:
+        """Forget a call allowed but not made"""
+        with self._lock:
+            self.calls -= 1
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Count a failed call, open the breaker if needed"""
+        with self._lock:
+            self.errors += 1
+            self._failures += 1
+            state = self._current_state()
+            self._trial_running = False
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        """Close the breaker and reset the counters"""
+        with self._lock:
+            self._state, self._failures, self._trial_running = CLOSED, 0, False
+            self.calls, self.successes, self.errors = 0, 0, 0
+            self.rejected, self.opened = 0, 0
+
+    def stats(self) -> dict:
+        """Get the circuit breaker state and counters
+
+        Returns:
+            dict: state, consecutive failures, calls, successes, errors, calls rejected and times opened
+        """
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "failures": self._failures,
+                "calls": self.calls,
+                "successes": self.successes,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "opened": self.opened,
+            }
+
+    def _current_state(self) -> str:
+        # self._lock must be held
+        if (
+            self._state == OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = HALF_OPEN
+        return self._state
+
+
+# Circuit breakers, by dependency
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+_circuit_breakers_config = {"failure_threshold": 5, "reset_timeout": 30}
+
+
+def configure_circuit_breakers(failure_threshold: int, reset_timeout: float) -> None:
+    """Set the thresholds of the circuit breakers (existing ones included)
+
+    Args:
+        failure_threshold (int): consecutive failures opening a breaker
+        reset_timeout (float): seconds before an open breaker lets a call through
+    """
+    with _circuit_breakers_lock:
+        _circuit_breakers_config["failure_threshold"] = failure_threshold
+        _circuit_breakers_config["reset_timeout"] = reset_timeout
+        for circuit_breaker in _circuit_breakers.values():
+            circuit_breaker.failure_threshold = failure_threshold
+            circuit_breaker.reset_timeout = reset_timeout
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the process circuit breaker of a dependency
+
+    Args:
+        name (str): dependency name
+
+    Returns:
+        CircuitBreaker: the circuit breaker
+    """
+    with _circuit_breakers_lock:
+        circuit_breaker = _circuit_breakers.get(name)
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(name=name, **_circuit_breakers_config)
+            _circuit_breakers[name] = circuit_breaker
+        return circuit_breaker
+
+
+def get_circuit_breakers_stats() -> dict:
+    """Get the state and counters of every circuit breaker
+
+    Returns:
+        dict: {dependency name: circuit breaker stats}
+    """
+    with _circuit_breakers_lock:
+        circuit_breakers = list(_circuit_breakers.values())
+    return {
+        circuit_breaker.name: circuit_breaker.stats()
+        for circuit_breaker in circuit_breakers
+    }
+
+
+def reset_circuit_breakers() -> None:
+    """Close every circuit breaker and reset their counters"""
+    with _circuit_breakers_lock:
+        for circuit_breaker in _circuit_breakers.values():
+            circuit_breaker.reset()
+
+
+# Deadline of the mention being handled (time.monotonic() value)
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Union[float, None]):
+    """Set the time budget of the calls made in the block, an inner deadline
+    can not extend an outer one
+
+    Args:
+        seconds (Union[float, None]): time budget in seconds, no deadline if None
+    """
+    if seconds is None:
+        yield
+        return
+
+    expires_at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        expires_at = min(expires_at, outer)
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Union[float, None]:
+    """Get the time left before the deadline
+
+    Returns:
+        Union[float, None]: seconds left (0 if exceeded), or None without deadline
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(expires_at - time.monotonic(), 0)
+
+
+def _check_deadline(func_name: str) -> None:
+    if remaining() == 0:
+        raise DeadlineExceededError(f"Deadline exceeded before calling {func_name}")
+
+
+def _can_wait(delay: float) -> bool:
+    time_left = remaining()
+    return time_left is None or delay < time_left
+
+
+def _acquire(
+    dependency_limiter: Union[limiter.AdaptiveLimiter, None],
+    circuit_breaker: CircuitBreaker,
+    func_name: str,
+) -> Union[float, None]:
+    # Slot of the try, within the deadline
+    if dependency_limiter is None:
+        return None
+    started = dependency_limiter.acquire(timeout=remaining())
+    if started is None:
+        circuit_breaker.release()
+        raise DeadlineExceededError(
+            f"Deadline exceeded waiting for a slot to call {func_name}"
+        )
+    return started
+
+
+def _release(
+    dependency_limiter: Union[limiter.AdaptiveLimiter, None],
+    started: Union[float, None],
+    success: Union[bool, None],
+    func_name: str,
+) -> None:
+    if dependency_limiter is not None:
+        dependency_limiter.release(started, success=success, operation=func_name)
+
+
+def resilient(
+    dependency: str,
+    tries: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5,
+    retry_on=Exception,
+    skip=(),
+    logger=None,
+):
+    """Retry the decorated function with full jitter, within the current deadline,
+    through the circuit breaker of its dependency
+
+    Args:
+        dependency (str): dependency name (BACKEND, TWITTER_READ, TWITTER_WRITE)
+        tries (int, optional): number of times to try. Defaults to 3.
+        base_delay (float, optional): bound of the first delay. Defaults to 0.5.
+        max_delay (float, optional): maximum bound of a delay. Defaults to 5.
+        retry_on (optional): exceptions failing a call. Defaults to Exception.
+        skip (optional): exceptions raised right away, not counted as failures (like "Deferred"). Defaults to ().
+        logger (optional): logger used for the retries. Defaults to None.
+    """
+    policy = RetryPolicy(tries=tries, base_delay=base_delay, max_delay=max_delay)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            circuit_breaker = get_circuit_breaker(dependency)
+            dependency_limiter = limiter.get_limiter(dependency)
+            delays = policy.delays()
+            while True:
+                _check_deadline(func.__name__)
+                circuit_breaker.allow()
+                started = _acquire(dependency_limiter, circuit_breaker, func.__name__)
+                try:
+                    result = func(*args, **kwargs)
+                except Deferred:
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=None,
+                        func_name=func.__name__,
+                    )
+                    circuit_breaker.release()
+                    raise
+                except DeadlineExceededError:
+                    # Out of time, not a failure of the dependency
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=None,
+                        func_name=func.__name__,
+                    )
+                    circuit_breaker.release()
+                    raise
+                except skip:
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=True,
+                        func_name=func.__name__,
+                    )
+                    circuit_breaker.record_success()
+                    raise
+                except retry_on as e:
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=False,
+                        func_name=func.__name__,
+                    )
+                    circuit_breaker.record_failure()
+                    delay = next(delays, None)
+                    if delay is None or not _can_wait(delay):
+                        raise
+                    if logger:
+                        logger.warning(f"{e}, Retrying in {delay:.2f} seconds...")
+                    time.sleep(delay)
+                except BaseException:
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=None,
+                        func_name=func.__name__,
+                    )
+                    # A trial call of the half open breaker is not left running
+                    circuit_breaker.release()
+                    raise
+                else:
+                    _release(
+                        dependency_limiter,
+                        started,
+                        success=True,
+                        func_name=func.__name__,
+                    )
+                    circuit_breaker.record_success()
+                    return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,177 @@
+"""Rejection rules of the mentions, ordered by cost and observed rejection rate
+
+Each rule reads one source of data (the status, the parent tweet, the backend
+preflight, the access token), and the sources are fetched in order of
+"cost / probability of rejecting the mention" : the cheapest way to reject a
+mention comes first. Costs are the observed fetch times, and rejection rates
+are measured on the traffic (exponential moving averages), so the order
+follows what the bot actually receives.
+
+A source starts at once, in parallel of the previous ones, only while these
+are unlikely to reject the mention. Otherwise it waits for their verdict, so
+the calls of mentions rejected anyway are not made.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Union
+
+
+@dataclass
+class Rule:
+    """A reason to reject a mention
+
+    Args:
+        name (str): rule name, also the outcome of the mentions it rejects
+        source (str): data read by the rule
+        check (Callable[[Any, dict], bool]): called with the source data and the mention context, True to reject
+        message (Callable[[Any, dict], str]): log message of a rejection
+        rejection_rate (float): expected share of the mentions rejected, before any observation
+    """
+
+    name: str
+    source: str
+    check: Callable[[Any, dict], bool]
+    message: Callable[[Any, dict], str]
+    rejection_rate: float = 0.1
+
+
+class RuleEngine:
+    """Order the sources of the rules, check the rules and measure them
+
+    The rules of a source are checked in their declaration order, so a
+    mention breaking several rules is always counted under the same one.
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[Rule],
+        costs: dict,
+        alpha: float = 0.05,
+        speculate_below: float = 0.25,
+    ):
+        """
+        Args:
+            rules (Iterable[Rule]): rules, by declaration order
+            costs (dict): {source: expected fetch time in seconds}, before any observation
+            alpha (float, optional): weight of a new observation in the moving averages. Defaults to 0.05.
+            speculate_below (float, optional): a source starts before the verdict of the running ones if they reject less than this share of the mentions. Defaults to 0.25.
+        """
+        self.rules = list(rules)
+        self.alpha = alpha
+        self.speculate_below = speculate_below
+        self._costs = dict(costs)
+        self._rates = {rule.name: rule.rejection_rate for rule in self.rules}
+        self._evaluated = {rule.name: 0 for rule in self.rules}
+        self._rejected = {rule.name: 0 for rule in self.rules}
+        self._lock = threading.Lock()
+
+    def rejection_rate(self, source: str) -> float:
+        """Get the probability a source rejects a mention
+
+        Args:
+            source (str): source name
+
+        Returns:
+            float: probability that at least one rule of the source rejects
+        """
+        with self._lock:
+            return self._rejection_rate(source)
+
+    def order(self, sources: Iterable[str]) -> list:
+        """Sort sources by expected cost of a rejection
+
+        Args:
+            sources (Iterable[str]): source names
+
+        Returns:
+            list: source names, the cheapest way to reject first
+        """
+        with self._lock:
+            return sorted(
+                sources,
+                key=lambda source: self._costs.get(source, 0)
+                / max(self._rejection_rate(source), 1e-6),
+            )
+
+    def can_speculate(self, running: Iterable[str]) -> bool:
+        """Check if another source can start before the verdict of the running ones
+
+        Args:
+            running (Iterable[str]): sources fetched but not checked yet
+
+        Returns:
+            bool: True if the running sources are unlikely to reject the mention
+        """
+        with self._lock:
+            passing = 1.0
+            for source in running:
+                passing *= 1 - self._rejection_rate(source)
+            return 1 - passing < self.speculate_below
+
+    def check(self, source: str, data: Any, context: dict) -> Union[Rule, None]:
+        """Check the rules of a source
+
+        Args:
+            source (str): source name
+            data (Any): source data
+            context (dict): mention context given to the rules
+
+        Returns:
+            Union[Rule, None]: the first rule rejecting the mention, or None
+        """
+        for rule in self.rules:
+            if rule.source != source:
+                continue
+            rejected = bool(rule.check(data, context))
+            with self._lock:
+                self._evaluated[rule.name] += 1
+                self._rejected[rule.name] += rejected
+                self._rates[rule.name] += self.alpha * (
+                    rejected - self._rates[rule.name]
+                )
+            if rejected:
+                return rule
+        return None
+
+    def observe_cost(self, source: str, seconds: float) -> None:
+        """Add an observed fetch time of a source
+
+        Args:
+            source (str): source name
+            seconds (float): fetch time
+        """
+        with self._lock:
+            cost = self._costs.get(source, seconds)
+            self._costs[source] = cost + self.alpha * (seconds - cost)
+
+    def stats(self) -> dict:
+        """Get the rules counters
+
+        Returns:
+            dict: by rule, its source, mentions checked and rejected, share rejected, estimated rejection rate and source cost
+        """
+        with self._lock:
+            return {
+                rule.name: {
+                    "source": rule.source,
+                    "evaluated": self._evaluated[rule.name],
+                    "rejected": self._rejected[rule.name],
+                    "hit_rate": (
+                        round(self._rejected[rule.name] / self._evaluated[rule.name], 4)
+                        if self._evaluated[rule.name]
+                        else 0.0
+                    ),
+                    "rejection_rate": round(self._rates[rule.name], 4),
+                    "cost": round(self._costs.get(rule.source, 0), 6),
+                }
+                for rule in self.rules
+            }
+
+    def _rejection_rate(self, source: str) -> float:
+        # self._lock must be held
+        passing = 1.0
+        for rule in self.rules:
+            if rule.source == source:
+                passing *= 1 - self._rates[rule.name]
+        return 1 - passing
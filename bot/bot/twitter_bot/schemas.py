@@ -1,4 +1,10 @@
 from dataclasses import dataclass, asdict
+from typing import Union
+
+# Verdicts of a resolved parent tweet
+PARENT_VIDEO = "video"
+PARENT_NO_VIDEO = "no_video"
+PARENT_SENSITIVE = "sensitive"
 
 
 @dataclass
@@ -31,3 +37,38 @@ class VideoUserLinkCreate:
 
     def dict(self):
         return {key: value for key, value in asdict(self).items()}
+
+
+@dataclass
+class MentionClaimCreate:
+    user: UserCreate
+    video: VideoCreate
+    asked_count_max: int
+    mention_tweet_id: Union[str, None] = None
+
+    def dict(self):
+        return {key: value for key, value in asdict(self).items()}
+
+
+@dataclass
+class ParentTweet:
+    """Resolved tweet a mention replies to, only the video fields are set
+    when verdict is PARENT_VIDEO
+    """
+
+    __slots__ = (
+        "tweet_id",
+        "verdict",
+        "video_url",
+        "thumbnail_url",
+        "screen_name",
+        "user_id",
+        "text",
+    )
+    tweet_id: str
+    verdict: str
+    video_url: Union[str, None]
+    thumbnail_url: Union[str, None]
+    screen_name: Union[str, None]
+    user_id: Union[str, None]
+    text: Union[str, None]
@@ -0,0 +1,327 @@
+"""Links known to exist in the backend
+
+A link between a User and a Video is almost never deleted once created (only
+by the admin DELETE endpoints, or when its claim is released), so the bot
+keeps the ones the backend confirmed : a known link rejects a mention before
+the preflight request.
+
+Each link expires after "ttl" seconds, so an admin delete is seen at worst
+after "ttl". A claim refused or released forgets the link at once : the answer
+of the backend is newer than the store.
+
+The expired links are swept every "interval" seconds, and the store holds at
+most "max_size" links : the oldest one (the first to expire) is evicted by an
+insert over it. The links are written to a JSON snapshot file at each sweep,
+read back at startup so the store is warm after a restart.
+"""
+
+from twitter_bot import logger, config
+
+import json
+import os
+import threading
+import time
+from typing import Tuple, Union
+
+# A link : (screen_name, tweet_id)
+Link = Tuple[str, str]
+
+
+class KnownStore:
+    """Links confirmed by the backend, each expiring after its TTL"""
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        max_size: int = 100000,
+        snapshot_file: Union[str, None] = None,
+        interval: float = 60,
+    ):
+        """
+        Args:
+            ttl (float, optional): seconds a link is trusted. Defaults to 300.
+            max_size (int, optional): max links. Defaults to 100000.
+            snapshot_file (Union[str, None], optional): file of the snapshots, None to keep the links only in memory. Defaults to None.
+            interval (float, optional): seconds between two sweeps (and snapshots). Defaults to 60.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+
+        # {link: expiry timestamp}, in insertion order (the same TTL for every
+        # link : the first one expires first). Wall clock timestamps, read back
+        # from the snapshot after a restart
+        self._links = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.expired = 0
+        self.evictions = 0
+        self.snapshots = 0
+
+    def start(self) -> None:
+        """Load the snapshot, then start the sweep thread"""
+        if self._thread is not None:
+            return
+        if self.snapshot_file:
+            self.load()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._sweep_loop, name="store-sweep", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sweep thread, and write a last snapshot"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        if self.snapshot_file:
+            self.snapshot()
+
+    def contains(self, link: Link) -> bool:
+        """Check if a link is known to exist in the backend
+
+        Args:
+            link (Link): (screen_name, tweet_id)
+
+        Returns:
+            bool: True if confirmed by the backend less than "ttl" seconds ago
+        """
+        with self._lock:
+            expires_at = self._links.get(link)
+            if expires_at is not None and expires_at <= time.time():
+                del self._links[link]
+                expires_at = None
+            if expires_at is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, link: Link) -> None:
+        """Remember a link confirmed by the backend
+
+        Args:
+            link (Link): (screen_name, tweet_id)
+        """
+        with self._lock:
+            self._insert(link, time.time() + self.ttl)
+
+    def forget(self, link: Link) -> None:
+        """Forget a link deleted from the backend
+
+        Args:
+            link (Link): (screen_name, tweet_id)
+        """
+        with self._lock:
+            if self._links.pop(link, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Forget all links and reset the counters"""
+        with self._lock:
+            self._links.clear()
+            self.hits, self.misses, self.invalidations = 0, 0, 0
+            self.expired, self.evictions = 0, 0
+
+    def sweep(self) -> int:
+        """Delete the expired links
+
+        Returns:
+            int: links deleted
+        """
+        now = time.time()
+        with self._lock:
+            expired = [
+                link for link, expires_at in self._links.items() if expires_at <= now
+            ]
+            for link in expired:
+                del self._links[link]
+            self.expired += len(expired)
+        return len(expired)
+
+    def snapshot(self) -> None:
+        """Write the links not expired to the snapshot file (replaced at once)"""
+        now = time.time()
+        with self._lock:
+            content = {
+                "link": [
+                    [list(link), expires_at]
+                    for link, expires_at in self._links.items()
+                    if expires_at > now
+                ]
+            }
+        temporary = f"{self.snapshot_file}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(content, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_file)
+        self.snapshots += 1
+
+    def load(self) -> int:
+        """Read the links of the snapshot file not expired
+
+        Returns:
+            int: links read
+        """
+        try:
+            with open(self.snapshot_file) as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logger.error(f"Store snapshot '{self.snapshot_file}' unreadable")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            # Oldest first, for the eviction order
+            for link, expires_at in sorted(
+                content.get("link", ()), key=lambda entry: entry[1]
+            ):
+                if expires_at <= now:
+                    continue
+                self._insert(tuple(link), min(expires_at, now + self.ttl))
+                loaded += 1
+        logger.info(f"Store loaded : {loaded} links")
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    def stats(self) -> dict:
+        """Get the store counters
+
+        Returns:
+            dict: links, hits (requests skipped), misses, invalidations, links expired and evicted, and snapshots written
+        """
+        with self._lock:
+            return {
+                "links": len(self._links),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "snapshots": self.snapshots,
+            }
+
+    def _insert(self, link: Link, expires_at: float) -> None:
+        # self._lock must be held
+        # Moved to the end : the newest link
+        self._links.pop(link, None)
+        self._links[link] = expires_at
+        while len(self._links) > self.max_size:
+            del self._links[next(iter(self._links))]
+            self.evictions += 1
+
+    def _sweep_loop(self) -> None:
+        while not self._stopping.wait(self.interval):
+            self.sweep()
+            if not self.snapshot_file:
+                continue
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Store snapshot can not be written")
+
+
+_known_store = None
+_known_store_lock = threading.Lock()
+
+
+def get_known_store(settings: config.Settings) -> Union[KnownStore, None]:
+    """Get the process store of the links known to exist in the backend
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[KnownStore, None]: the store (not started), or None if "STORE_TTL" is 0
+    """
+    global _known_store
+    if not settings.STORE_TTL:
+        return None
+    with _known_store_lock:
+        if _known_store is None:
+            _known_store = KnownStore(
+                ttl=settings.STORE_TTL,
+                max_size=settings.STORE_MAX_SIZE,
+                snapshot_file=settings.STORE_FILE or None,
+            )
+        return _known_store
+
+
+def clear_known_store() -> None:
+    """Stop the process store (a last snapshot is written if started), and remove it"""
+    global _known_store
+    with _known_store_lock:
+        if _known_store is not None:
+            _known_store.stop()
+        _known_store = None
+
+
+def is_known_link(settings: config.Settings, screen_name: str, tweet_id: str) -> bool:
+    """Check if a link is known to exist in the backend, by the process store
+
+    Args:
+        settings (config.Settings): bot settings
+        screen_name (str): User screen_name
+        tweet_id (str): Video tweet_id
+
+    Returns:
+        bool: True if known, False if unknown or the store is disabled
+    """
+    known_store = get_known_store(settings=settings)
+    return known_store is not None and known_store.contains((screen_name, tweet_id))
+
+
+def remember_link(settings: config.Settings, screen_name: str, tweet_id: str) -> None:
+    """Remember a link confirmed by the backend in the process store
+
+    Args:
+        settings (config.Settings): bot settings
+        screen_name (str): User screen_name
+        tweet_id (str): Video tweet_id
+    """
+    known_store = get_known_store(settings=settings)
+    if known_store is not None:
+        known_store.add((screen_name, tweet_id))
+
+
+def forget_link(settings: config.Settings, screen_name: str, tweet_id: str) -> None:
+    """Forget a link in the process store, when its claim is refused or released
+
+    Args:
+        settings (config.Settings): bot settings
+        screen_name (str): User screen_name
+        tweet_id (str): Video tweet_id
+    """
+    known_store = get_known_store(settings=settings)
+    if known_store is not None:
+        known_store.forget((screen_name, tweet_id))
+
+
+def remember_preflight(
+    settings: config.Settings, screen_name: str, tweet_id: str, preflight: dict
+) -> None:
+    """Remember the link a preflight answer confirms
+
+    Args:
+        settings (config.Settings): bot settings
+        screen_name (str): User screen_name
+        tweet_id (str): Video tweet_id
+        preflight (dict): answer of the preflight request
+    """
+    if preflight.get("videouserlink_exists"):
+        remember_link(settings=settings, screen_name=screen_name, tweet_id=tweet_id)
@@ -1,12 +1,144 @@
-from twitter_bot import logger, config
-from twitter_bot.tools import twitter_tools
+from twitter_bot import (
+    logger,
+    config,
+    bans,
+    batcher,
+    limiter,
+    resilience,
+    ratelimit,
+    metrics,
+    outbox,
+    records,
+    store,
+    taskgraph,
+)
+from twitter_bot.tools import auth_tools, twitter_tools
 from twitter_bot.tools.error_tools import exception
+from twitter_bot.dedupe import SeenFilter
+from twitter_bot.intake import IntakeLog
+from twitter_bot.workers import WorkerPool
+
+from typing import Any, Callable, Union
 
 import tweepy
 
 
+def get_status_parser(settings: config.Settings) -> Callable[[dict], Any]:
+    """Get the function turning the JSON of a status into the object handled
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Callable[[dict], Any]: "StatusRecord.from_json" if "STATUS_PARSER" is "record", the tweepy model parser either
+    """
+    if settings.STATUS_PARSER == "record":
+        return records.StatusRecord.from_json
+    return lambda data: tweepy.models.Status.parse(None, data)
+
+
+def get_backend_limiter(
+    settings: config.Settings,
+) -> Union[limiter.AdaptiveLimiter, None]:
+    """Get a limiter of the concurrent requests to the backend
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[limiter.AdaptiveLimiter, None]: a limiter, or None if "BACKEND_LIMIT_MAX" is 0
+    """
+    if not settings.BACKEND_LIMIT_MAX:
+        return None
+    return limiter.AdaptiveLimiter(
+        name=resilience.BACKEND,
+        initial_limit=settings.BACKEND_LIMIT_INITIAL,
+        max_limit=settings.BACKEND_LIMIT_MAX,
+        tolerance=settings.BACKEND_LIMIT_TOLERANCE,
+    )
+
+
+def get_intake_log(settings: config.Settings) -> Union[IntakeLog, None]:
+    """Get the log of the statuses received by the stream
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[IntakeLog, None]: an intake log (not started), or None if "INTAKE_FILE" is empty
+    """
+    if not settings.INTAKE_FILE:
+        return None
+    return IntakeLog(
+        path=settings.INTAKE_FILE,
+        key=lambda status: status.id_str,
+        serializer=lambda status: status._json,
+        deserializer=get_status_parser(settings=settings),
+        batch_size=settings.INTAKE_BATCH_SIZE,
+        retention=settings.INTAKE_RETENTION,
+    )
+
+
+def get_seen_filter(settings: config.Settings) -> Union[SeenFilter, None]:
+    """Get the filter of the statuses delivered again by the stream
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[SeenFilter, None]: a seen filter (not started), or None if "SEEN_WINDOW" is 0
+    """
+    if not settings.SEEN_WINDOW:
+        return None
+    return SeenFilter(
+        window=settings.SEEN_WINDOW,
+        maxsize=settings.SEEN_MAXSIZE,
+        snapshot_file=settings.SEEN_FILE or None,
+    )
+
+
+def get_worker_pool(
+    settings: config.Settings, intake: Union[IntakeLog, None] = None
+) -> WorkerPool:
+    """Get the worker pool handling the statuses received by the stream
+
+    Args:
+        settings (config.Settings): bot settings
+        intake (Union[IntakeLog, None], optional): log acknowledging the handled statuses. Defaults to None.
+
+    Returns:
+        WorkerPool: a worker pool (not started)
+    """
+
+    def handler(status):
+        twitter_tools.handle_new_status(settings=settings, status=status)
+        # Not reached if the status is deferred : replayed if the bot stops before.
+        # A spilled status is acknowledged here too, once handled : after a crash
+        # it can come back from both the spill file and the intake log, the
+        # claim by mention makes the second handling a no-op
+        if intake is not None:
+            intake.ack(status)
+
+    return WorkerPool(
+        handler=handler,
+        workers=settings.WORKERS_COUNT,
+        maxsize=settings.QUEUE_MAXSIZE,
+        overflow=settings.QUEUE_OVERFLOW,
+        spill_file=settings.QUEUE_SPILL_FILE,
+        serializer=lambda status: status._json,
+        deserializer=get_status_parser(settings=settings),
+    )
+
+
 class Streamer(tweepy.Stream):
-    def __init__(self, settings: config.Settings, **kwargs):
+    def __init__(
+        self,
+        settings: config.Settings,
+        pool: WorkerPool,
+        intake: Union[IntakeLog, None] = None,
+        seen: Union[SeenFilter, None] = None,
+        **kwargs,
+    ):
         super().__init__(
             settings.TWITTER_API_KEY,
             settings.TWITTER_API_KEY_SECRET,
@@ -15,11 +147,31 @@ class Streamer(tweepy.Stream):
             **kwargs,
         )
         self.settings = settings
+        self.pool = pool
+        self.intake = intake
+        self.seen = seen
+
+    def on_data(self, raw_data):
+        if self.settings.STATUS_PARSER != "record":
+            return super().on_data(raw_data)
+        data = records.loads(raw_data)
+        if "in_reply_to_status_id" in data:
+            return self.on_status(records.StatusRecord.from_json(data))
+        # Other messages (disconnect, limit, warning, ...) : tweepy dispatch
+        return super().on_data(raw_data)
 
     @exception(logger)
     def on_status(self, status):
+        # Delivered again after a reconnection : dropped before any I/O
+        if self.seen is not None and self.seen.seen(status.id):
+            logger.info(f"Status with ID : '{status.id}' already received, dropped")
+            return
         logger.info("Bot mentionned")
-        twitter_tools.handle_new_status(settings=self.settings, status=status)
+        # Queued once on disk
+        if self.intake is not None:
+            self.intake.append(status)
+        else:
+            self.pool.submit(status)
 
     def on_disconnect_message(self, message):
         logger.debug(f"Disconnect message : {message}")
@@ -40,7 +192,7 @@ class Streamer(tweepy.Stream):
         logger.error(f"Closed by Twitter : {response}")
 
     def on_disconnect(self):
-        logger.info(f"Disconnected")
+        logger.info(f"Disconnected, worker pool : {self.pool.stats()}")
 
     def on_exception(self, exception):
         logger.error(f"Exception : {exception}")
@@ -49,8 +201,133 @@ class Streamer(tweepy.Stream):
         logger.error(f"Request error : {status_code}")
 
 
+def register_metrics(
+    settings: config.Settings, pool: WorkerPool, intake: Union[IntakeLog, None]
+) -> None:
+    """Expose the stats of the bot components as metrics
+
+    Args:
+        settings (config.Settings): bot settings
+        pool (WorkerPool): worker pool
+        intake (Union[IntakeLog, None]): intake log
+    """
+    metrics.register_collector("bot_worker_pool", pool.stats)
+    if intake is not None:
+        metrics.register_collector("bot_intake", intake.stats)
+    metrics.register_collector(
+        "bot_circuit_breaker",
+        resilience.get_circuit_breakers_stats,
+        label="dependency",
+    )
+    metrics.register_collector(
+        "bot_limiter", limiter.get_limiters_stats, label="dependency"
+    )
+    metrics.register_collector(
+        "bot_rate_limiter", ratelimit.get_rate_limiter(settings=settings).stats
+    )
+    metrics.register_collector(
+        "bot_parent_cache",
+        twitter_tools.get_parent_tweet_cache(settings=settings).stats,
+    )
+    metrics.register_collector(
+        "bot_single_flight", twitter_tools.get_single_flight_stats
+    )
+    metrics.register_collector("bot_twitter_api", twitter_tools.get_twitter_api_stats)
+    metrics.register_collector(
+        "bot_rule", twitter_tools.get_rule_engine(settings=settings).stats, label="rule"
+    )
+    known_store = store.get_known_store(settings=settings)
+    if known_store is not None:
+        metrics.register_collector("bot_store", known_store.stats)
+    ban_replica = bans.get_ban_replica(settings=settings)
+    if ban_replica is not None:
+        metrics.register_collector("bot_bans", ban_replica.stats)
+    process_outbox = outbox.get_outbox(settings=settings)
+    if process_outbox is not None:
+        metrics.register_collector("bot_outbox", process_outbox.stats)
+    claim_batcher = batcher.get_claim_batcher(settings=settings)
+    if claim_batcher is not None:
+        metrics.register_collector("bot_claim_batcher", claim_batcher.stats)
+    metrics.register_collector(
+        "bot_token_manager", auth_tools.get_token_manager(settings=settings).stats
+    )
+
+
+def start_pipeline(settings: config.Settings) -> tuple:
+    """Start the handling of the statuses : known store, ban list replica,
+    outbox, claim batcher, intake log, worker pool and metrics
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        tuple: (intake log or None, worker pool), to give to "stop_pipeline"
+    """
+    resilience.configure_circuit_breakers(
+        failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.BREAKER_RESET_TIMEOUT,
+    )
+    limiter.configure_limiter(
+        resilience.BACKEND, get_backend_limiter(settings=settings)
+    )
+    # Warm before the first mention
+    known_store = store.get_known_store(settings=settings)
+    if known_store is not None:
+        known_store.start()
+    ban_replica = bans.get_ban_replica(settings=settings)
+    if ban_replica is not None:
+        ban_replica.start()
+    # The writes left by the previous run are sent first
+    process_outbox = outbox.get_outbox(settings=settings)
+    if process_outbox is not None:
+        process_outbox.start()
+    claim_batcher = batcher.get_claim_batcher(settings=settings)
+    if claim_batcher is not None:
+        claim_batcher.start()
+    intake = get_intake_log(settings=settings)
+    pool = get_worker_pool(settings=settings, intake=intake)
+    register_metrics(settings=settings, pool=pool, intake=intake)
+    pool.start()
+    if intake is not None:
+        intake.start(consumer=pool.submit)
+    return intake, pool
+
+
+def stop_pipeline(intake: Union[IntakeLog, None], pool: WorkerPool) -> None:
+    """Stop the handling of the statuses, after the ones received
+
+    Args:
+        intake (Union[IntakeLog, None]): intake log
+        pool (WorkerPool): worker pool
+    """
+    if intake is not None:
+        intake.flush()
+    pool.stop()
+    if intake is not None:
+        intake.stop()
+    taskgraph.clear_executor()
+    batcher.clear_claim_batcher()
+    outbox.clear_outbox()
+    bans.clear_ban_replica()
+    store.clear_known_store()
+
+
 @exception(logger)
 def run_bot():
     settings = config.get_settings()
-    streamer = Streamer(settings=settings)
-    streamer.filter(track=[settings.TRACK])
+    if settings.METRICS_PORT:
+        metrics.start_metrics_server(
+            host=settings.METRICS_HOST, port=settings.METRICS_PORT
+        )
+    intake, pool = start_pipeline(settings=settings)
+    seen = get_seen_filter(settings=settings)
+    if seen is not None:
+        seen.start()
+        metrics.register_collector("bot_seen_filter", seen.stats)
+    try:
+        streamer = Streamer(settings=settings, pool=pool, intake=intake, seen=seen)
+        streamer.filter(track=[settings.TRACK])
+    finally:
+        if seen is not None:
+            seen.stop()
+        stop_pipeline(intake=intake, pool=pool)
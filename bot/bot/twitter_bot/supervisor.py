@@ -0,0 +1,384 @@
+"""Mentions handled by several processes, partitioned by parent tweet
+
+Twitter allows one filter stream by account : the supervisor process reads
+it, and routes each status to one of N worker processes, by a hash of the
+tweet it replies to. The mentions of a video always land on the same process,
+so its parent tweet cache, single flight and rule engine keep working as with
+a single process. Each worker runs the pipeline of "run_bot" (intake log,
+worker pool, ...) with its own files, and a share of the Twitter rate limits.
+The budget is not shared : a burst of mentions of one viral video lands on one
+process, which replies with 1/N of the account budget and defers the rest,
+while the other processes keep theirs.
+
+The supervisor pings the workers, restarts the dead or unresponsive ones (their
+intake log replays the statuses they had not handled), and serves the metrics
+of every process, with a "shard" label.
+"""
+
+from twitter_bot import logger, config, metrics, stream
+from twitter_bot.tools.error_tools import exception
+
+import dataclasses
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Any, Union
+
+# Label of the metrics of the supervisor process itself
+SUPERVISOR_SHARD = "supervisor"
+
+
+def shard_of(status: Any, shards: int) -> int:
+    """Get the worker process of a status, the same in every process and run
+    (unlike "hash")
+
+    Args:
+        status (Any): a tweepy status or a status record
+        shards (int): number of worker processes
+
+    Returns:
+        int: worker process index, by the replied tweet ID (the status ID if not a reply)
+    """
+    key = status.in_reply_to_status_id or status.id
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def _shard_path(path: str, shard: int) -> str:
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{shard}{extension}"
+
+
+def shard_settings(
+    settings: config.Settings, shard: int, shards: int
+) -> config.Settings:
+    """Get the settings of a worker process : its own files, a share of the
+    rate limits, no metrics server (served by the supervisor)
+
+    Args:
+        settings (config.Settings): bot settings
+        shard (int): worker process index
+        shards (int): number of worker processes
+
+    Returns:
+        config.Settings: worker process settings
+    """
+    return dataclasses.replace(
+        settings,
+        INTAKE_FILE=_shard_path(settings.INTAKE_FILE, shard),
+        QUEUE_SPILL_FILE=_shard_path(settings.QUEUE_SPILL_FILE, shard),
+        STORE_FILE=_shard_path(settings.STORE_FILE, shard),
+        OUTBOX_FILE=_shard_path(settings.OUTBOX_FILE, shard),
+        RATE_LIMIT_READ_LIMIT=max(settings.RATE_LIMIT_READ_LIMIT // shards, 1),
+        RATE_LIMIT_POST_LIMIT=max(settings.RATE_LIMIT_POST_LIMIT // shards, 1),
+        RATE_LIMIT_POST_BURST=max(settings.RATE_LIMIT_POST_BURST // shards, 1),
+        BACKEND_LIMIT_INITIAL=max(settings.BACKEND_LIMIT_INITIAL // shards, 1),
+        BACKEND_LIMIT_MAX=(
+            settings.BACKEND_LIMIT_MAX and max(settings.BACKEND_LIMIT_MAX // shards, 1)
+        ),
+        METRICS_PORT=0,
+    )
+
+
+def _answer_control(connection: Any) -> None:
+    # Requests of the supervisor : health check and metrics
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            return
+        if request == "ping":
+            connection.send("pong")
+        elif request == "metrics":
+            connection.send(metrics.render())
+
+
+def worker_main(settings: config.Settings, items: Any, connection: Any) -> None:
+    """Worker process : handle the statuses routed by the supervisor
+
+    Args:
+        settings (config.Settings): worker process settings, see "shard_settings"
+        items (multiprocessing.connection.Connection): JSON of the statuses, None to stop
+        connection (multiprocessing.connection.Connection): control requests
+    """
+    parse = stream.get_status_parser(settings=settings)
+    intake, pool = stream.start_pipeline(settings=settings)
+    consumer = intake.append if intake is not None else pool.submit
+    threading.Thread(
+        target=_answer_control, args=(connection,), name="control", daemon=True
+    ).start()
+    try:
+        while True:
+            try:
+                data = items.recv()
+            except EOFError:
+                # Supervisor gone
+                break
+            if data is None:
+                break
+            try:
+                consumer(parse(data))
+            except Exception:
+                logger.exception(f"Status can not be handled : {data}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop_pipeline(intake=intake, pool=pool)
+
+
+class _Worker:
+    """A worker process, the pipe of its statuses and its control connection"""
+
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.process = None
+        self.connection = None
+        # Both ends are kept : the statuses a dead process did not read are
+        # read back, and sent to the next one
+        self.reader = None
+        self.writer = None
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.routed = 0
+        self.restarts = 0
+        self.lost = 0
+
+    def send(self, data: Any) -> None:
+        # Waits while the pipe is full
+        with self.send_lock:
+            self.writer.send(data)
+
+    def request(self, message: str, timeout: float) -> Union[Any, None]:
+        # Answer of the process, None if it does not answer in time
+        with self.lock:
+            try:
+                # Late answers of the previous requests
+                while self.connection.poll():
+                    self.connection.recv()
+                self.connection.send(message)
+                if self.connection.poll(timeout):
+                    return self.connection.recv()
+            except (EOFError, OSError):
+                pass
+            return None
+
+    def unread(self) -> list:
+        # Statuses left in the pipe of a stopped process
+        items = []
+        try:
+            while self.reader.poll():
+                items.append(self.reader.recv())
+        except Exception:
+            # Message cut by the process death
+            self.lost += 1
+            logger.exception(f"Statuses of worker process {self.shard} lost")
+        return items
+
+
+class Supervisor:
+    """Route the statuses to worker processes, and keep them running
+
+    Has the "submit" and "stats" of a worker pool, to be given to "Streamer".
+    """
+
+    def __init__(
+        self,
+        settings: config.Settings,
+        processes: int,
+        health_interval: float = 5,
+        health_timeout: float = 10,
+    ):
+        """
+        Args:
+            settings (config.Settings): bot settings
+            processes (int): number of worker processes
+            health_interval (float, optional): seconds between two health checks. Defaults to 5.
+            health_timeout (float, optional): seconds a worker has to answer a health check. Defaults to 10.
+        """
+        self.settings = settings
+        self.processes = processes
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # Spawned : the supervisor threads (stream, metrics) are not forked
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(shard) for shard in range(processes)]
+        self._stopping = threading.Event()
+        self._health_thread = None
+
+    def start(self) -> None:
+        """Start the worker processes and their health checks"""
+        for worker in self._workers:
+            self._start_worker(worker)
+        self._health_thread = threading.Thread(
+            target=self._check_health_loop, name="health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    def submit(self, status: Any) -> bool:
+        """Route a status to its worker process, waiting if its pipe is full
+
+        Args:
+            status (Any): a tweepy status or a status record
+
+        Returns:
+            bool: True once queued
+        """
+        worker = self._workers[shard_of(status, self.processes)]
+        worker.send(status._json)
+        worker.routed += 1
+        return True
+
+    def check(self) -> int:
+        """Restart the dead or unresponsive worker processes
+
+        Returns:
+            int: number of worker processes restarted
+        """
+        restarted = 0
+        for worker in self._workers:
+            if self._stopping.is_set():
+                break
+            if not worker.process.is_alive():
+                logger.error(
+                    f"Worker process {worker.shard} exited with code {worker.process.exitcode}, restarted"
+                )
+            elif worker.request("ping", timeout=self.health_timeout) != "pong":
+                logger.error(
+                    f"Worker process {worker.shard} does not answer, restarted"
+                )
+                worker.process.terminate()
+                worker.process.join(self.health_timeout)
+            else:
+                continue
+            worker.restarts += 1
+            self._restart_worker(worker)
+            restarted += 1
+        return restarted
+
+    def render_metrics(self) -> str:
+        """Get the metrics of the supervisor and of the worker processes
+
+        Returns:
+            str: exposition text, with a "shard" label
+        """
+        texts = {SUPERVISOR_SHARD: metrics.render()}
+        for worker in self._workers:
+            text = worker.request("metrics", timeout=self.health_timeout)
+            if text is not None:
+                texts[worker.shard] = text
+        return metrics.merge(texts, label="shard")
+
+    def stats(self) -> dict:
+        """Get the counters of the worker processes
+
+        Returns:
+            dict: by worker process, if alive, statuses routed to it, restarts and pipe reads failed at a restart
+        """
+        return {
+            worker.shard: {
+                "alive": worker.process is not None and worker.process.is_alive(),
+                "routed": worker.routed,
+                "restarts": worker.restarts,
+                "lost": worker.lost,
+            }
+            for worker in self._workers
+        }
+
+    def stop(self, timeout: float = 30) -> None:
+        """Stop the worker processes, after the statuses routed
+
+        Args:
+            timeout (float, optional): seconds a worker process has to stop. Defaults to 30.
+        """
+        self._stopping.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.send(None)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logger.error(f"Worker process {worker.shard} did not stop, killed")
+                worker.process.terminate()
+                worker.process.join()
+            for connection in (worker.connection, worker.reader, worker.writer):
+                connection.close()
+
+    def _start_worker(self, worker: _Worker) -> None:
+        connection, worker_connection = self._context.Pipe()
+        worker.connection = connection
+        worker.reader, worker.writer = self._context.Pipe(duplex=False)
+        worker.process = self._context.Process(
+            target=worker_main,
+            args=(
+                shard_settings(self.settings, worker.shard, self.processes),
+                worker.reader,
+                worker_connection,
+            ),
+            name=f"bot-worker-{worker.shard}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker_connection.close()
+
+    def _restart_worker(self, worker: _Worker) -> None:
+        # A "submit" may be waiting on the full pipe of the dead process :
+        # the pipe is read until it is done
+        items = worker.unread()
+        while not worker.send_lock.acquire(timeout=0.1):
+            items += worker.unread()
+        try:
+            items += worker.unread()
+            for connection in (worker.connection, worker.reader, worker.writer):
+                connection.close()
+            self._start_worker(worker)
+        finally:
+            worker.send_lock.release()
+        for data in items:
+            worker.send(data)
+        if items:
+            logger.info(
+                f"{len(items)} statuses sent again to worker process {worker.shard}"
+            )
+
+    def _check_health_loop(self) -> None:
+        while not self._stopping.wait(self.health_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Health check of the worker processes failed")
+
+
+@exception(logger)
+def run_supervisor(processes: int) -> None:
+    """Run the bot with a stream in this process and "processes" worker processes
+
+    Args:
+        processes (int): number of worker processes
+    """
+    settings = config.get_settings()
+    supervisor = Supervisor(settings=settings, processes=processes)
+    metrics.register_collector("bot_supervisor", supervisor.stats, label="worker")
+    if settings.METRICS_PORT:
+        metrics.start_metrics_server(
+            host=settings.METRICS_HOST,
+            port=settings.METRICS_PORT,
+            source=supervisor.render_metrics,
+        )
+    seen = stream.get_seen_filter(settings=settings)
+    if seen is not None:
+        seen.start()
+        metrics.register_collector("bot_seen_filter", seen.stats)
+    supervisor.start()
+    try:
+        streamer = stream.Streamer(settings=settings, pool=supervisor, seen=seen)
+        streamer.filter(track=[settings.TRACK])
+    finally:
+        if seen is not None:
+            seen.stop()
+        supervisor.stop()
@@ -0,0 +1,160 @@
+"""Calls of a mention run as a small dependency graph
+
+Independent calls run at the same time on a shared thread pool, a call starts
+as soon as the calls it requires are done, and cancelling the graph (when a
+check rejects the mention) drops the calls not started yet. A running call
+can not be interrupted, its result is just not waited for.
+
+The calls run in a copy of the caller context, so the deadline of the mention
+("resilience.deadline") applies to them.
+"""
+
+from twitter_bot import config
+
+import contextvars
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, Union
+
+
+class TaskGraph:
+    """Named calls and the calls they require"""
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self._futures = {}
+        self._cancelled = threading.Event()
+
+    def add(self, name: str, func: Callable[..., Any], requires: tuple = ()) -> Future:
+        """Add a call, started once the calls it requires are done
+
+        Args:
+            name (str): call name
+            func (Callable[..., Any]): called with the results of "requires" as keyword arguments
+            requires (tuple, optional): names of the calls added before it needs. Defaults to ().
+
+        Returns:
+            Future: the call future
+        """
+        if name in self._futures:
+            raise ValueError(f"Task '{name}' already added")
+        future = Future()
+        self._futures[name] = future
+        dependencies = [self._futures[required] for required in requires]
+        context = contextvars.copy_context()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                kwargs = {
+                    required: self._futures[required].result() for required in requires
+                }
+                result = context.run(func, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        waiting = [len(dependencies)]
+        lock = threading.Lock()
+
+        def on_dependency_done(dependency: Future):
+            if future.done():
+                return
+            # A failed or cancelled dependency fails or cancels the call
+            if dependency.cancelled():
+                future.cancel()
+                return
+            if dependency.exception() is not None:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(dependency.exception())
+                return
+            with lock:
+                waiting[0] -= 1
+                ready = waiting[0] == 0
+            if ready:
+                self._submit(future, run)
+
+        if dependencies:
+            for dependency in dependencies:
+                dependency.add_done_callback(on_dependency_done)
+        else:
+            self._submit(future, run)
+        return future
+
+    def result(self, name: str, timeout: Union[float, None] = None) -> Any:
+        """Wait for the result of a call
+
+        Args:
+            name (str): call name
+            timeout (Union[float, None], optional): max time to wait. Defaults to None.
+
+        Returns:
+            Any: the call result (its exception is raised)
+        """
+        return self._futures[name].result(timeout)
+
+    def as_completed(self, timeout: Union[float, None] = None) -> Iterator[str]:
+        """Get the names of the calls as they complete
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait for all of them. Defaults to None.
+
+        Yields:
+            str: call name
+        """
+        names = {future: name for name, future in self._futures.items()}
+        for future in as_completed(names, timeout):
+            yield names[future]
+
+    def cancel(self) -> int:
+        """Drop the calls not started yet
+
+        Returns:
+            int: number of calls dropped
+        """
+        self._cancelled.set()
+        return sum(future.cancel() for future in self._futures.values())
+
+    def _submit(self, future: Future, run: Callable[[], None]) -> None:
+        if self._cancelled.is_set():
+            future.cancel()
+            return
+        try:
+            self.executor.submit(run)
+        except RuntimeError as e:
+            # Executor shut down
+            if future.set_running_or_notify_cancel():
+                future.set_exception(e)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(settings: config.Settings) -> ThreadPoolExecutor:
+    """Get the process thread pool running the calls of the mentions
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        ThreadPoolExecutor: the thread pool
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TASK_WORKERS, thread_name_prefix="task"
+            )
+        return _executor
+
+
+def clear_executor() -> None:
+    """Shut the process thread pool down, after its running calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
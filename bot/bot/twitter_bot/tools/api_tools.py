@@ -1,171 +1,319 @@
-from twitter_bot import logger, config, schemas
-from twitter_bot.tools.error_tools import exception, retry
+from twitter_bot import logger, config, schemas, store
+from twitter_bot.resilience import resilient, remaining, BACKEND, DeadlineExceededError
+from twitter_bot.tools.error_tools import exception, UnauthorizedError
 
 import os
-from typing import Union
+import threading
+from typing import List, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 
+# Session of the backend requests, shared by the threads of the process
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
 
-@exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
-def is_banned_user(settings: config.Settings, user_id: str) -> bool:
-    """Check if a user is banned
+
+def get_session(settings: config.Settings) -> requests.Session:
+    """Get the session of the backend requests : its connections are kept
+    alive and reused by the threads of the process
 
     Args:
         settings (config.Settings): bot settings
-        user_id (str): User user_id
 
     Returns:
-        bool: True if the User is banned, False either
+        requests.Session: the session of the process
     """
-    r_get_banned = requests.get(os.path.join(settings.API_PREFIX, "banned", user_id))
-    if r_get_banned.status_code == 200:
-        return True
-    return False
+    global _session, _session_pid
+    with _session_lock:
+        # A forked process does not share the connections of its parent
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            # One connection by thread calling the backend : the workers and
+            # the threads of their concurrent checks
+            adapter = HTTPAdapter(
+                pool_maxsize=settings.WORKERS_COUNT + settings.TASK_WORKERS
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def clear_session() -> None:
+    """Close the session of the backend requests, and remove it"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session, _session_pid = None, None
+
+
+def _timeout(settings: config.Settings) -> float:
+    """Get the timeout of a backend request : the time left before the
+    deadline of the mention, or "API_TIMEOUT" without deadline
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        float: timeout in seconds
+    """
+    time_left = remaining()
+    if time_left is None:
+        return settings.API_TIMEOUT
+    if time_left <= 0:
+        raise DeadlineExceededError("Deadline exceeded before the backend request")
+    return time_left
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
-def create_video_if_doesnt_exist(
-    settings: config.Settings, access_token: str, video: schemas.VideoCreate
-) -> bool:
-    """Create a Video if it doesn't exist
+@resilient(BACKEND, tries=3, logger=logger)
+def get_banned_snapshot(settings: config.Settings) -> Union[dict, None]:
+    """Get every banned user_id, to start a copy of the ban list
 
     Args:
         settings (config.Settings): bot settings
-        access_token (str): API access token
-        video (schemas.VideoCreate): schemas.VideoCreate instance
 
     Returns:
-        bool: True if the Video is created or already exists, False either
+        Union[dict, None]: {"user_ids", "last_seq"}, or None if the list can not be read
     """
-    r_get_video = requests.get(
-        os.path.join(settings.API_PREFIX, "videos", video.tweet_id)
+    r_get_snapshot = get_session(settings=settings).get(
+        f"{settings.API_PREFIX}/banned/snapshot",
+        timeout=_timeout(settings),
     )
-    if r_get_video.status_code == 200:
-        return True
+    if r_get_snapshot.status_code == 200:
+        return r_get_snapshot.json()
+    return None
 
-    headers = {"Authorization": f"Bearer {access_token}"}
-    r_post_video = requests.post(
-        os.path.join(settings.API_PREFIX, "videos"), json=video.dict(), headers=headers
+
+@exception(logger)
+@resilient(BACKEND, tries=3, logger=logger)
+def get_banned_changes(
+    settings: config.Settings, since: int = 0, limit: int = 1000
+) -> Union[dict, None]:
+    """Get the changes of the ban list after a sequence number, oldest first
+
+    Args:
+        settings (config.Settings): bot settings
+        since (int, optional): "last_seq" of the previous changes or of the snapshot. Defaults to 0.
+        limit (int, optional): max number of changes. Defaults to 1000.
+
+    Returns:
+        Union[dict, None]: {"changes": [{"seq", "user_id", "operation", ...}], "last_seq"}, or None if the changes can not be read
+    """
+    r_get_changes = get_session(settings=settings).get(
+        f"{settings.API_PREFIX}/banned/changes",
+        params={"since": since, "limit": limit},
+        timeout=_timeout(settings),
     )
-    if r_post_video.status_code == 200:
-        return True
-    return False
+    if r_get_changes.status_code == 200:
+        return r_get_changes.json()
+    return None
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
-def create_user_if_doesnt_exist(
-    settings: config.Settings, access_token: str, user: schemas.UserCreate
-) -> bool:
-    """Create a User if he doesn't exist
+@resilient(BACKEND, tries=3, logger=logger)
+def get_mention_preflight(
+    settings: config.Settings,
+    user_id: str,
+    screen_name: str,
+    tweet_id: str,
+    mention_tweet_id: Union[str, None] = None,
+) -> Union[dict, None]:
+    """Get every check needed before replying to a mention, in one request
 
     Args:
         settings (config.Settings): bot settings
-        access_token (str): API access token
-        user (schemas.UserCreate): schemas.UserCreate instance
+        user_id (str): User user_id
+        screen_name (str): User screen_name
+        tweet_id (str): Video tweet_id
+        mention_tweet_id (Union[str, None], optional): ID of the mention, its own unconfirmed claim is not counted. Defaults to None.
 
     Returns:
-        bool: True if the Video is created or already exists, False either
+        Union[dict, None]: {"is_banned", "video_exists", "user_exists", "videouserlink_exists", "videos_count", ...}, or None if the checks can not be made
     """
-    r_get_user = requests.get(
-        os.path.join(settings.API_PREFIX, "users", user.screen_name)
+    r_get_preflight = get_session(settings=settings).get(
+        f"{settings.API_PREFIX}/mentions/preflight",
+        params={
+            "user_id": user_id,
+            "screen_name": screen_name,
+            "tweet_id": tweet_id,
+            "mention_tweet_id": mention_tweet_id,
+        },
+        timeout=_timeout(settings),
     )
-    if r_get_user.status_code == 200:
-        return True
+    if r_get_preflight.status_code == 200:
+        preflight = r_get_preflight.json()
+        store.remember_preflight(
+            settings=settings,
+            screen_name=screen_name,
+            tweet_id=tweet_id,
+            preflight=preflight,
+        )
+        return preflight
+    return None
+
+
+@exception(logger)
+@resilient(BACKEND, tries=3, logger=logger, skip=UnauthorizedError)
+def claim_mention(
+    settings: config.Settings, access_token: str, claim: schemas.MentionClaimCreate
+) -> Union[int, None]:
+    """Reserve the request of a Video by a User before replying to a mention,
+    the User and the Video are created if they don't exist
+
+    Args:
+        settings (config.Settings): bot settings
+        access_token (str): API access token
+        claim (schemas.MentionClaimCreate): schemas.MentionClaimCreate instance
 
+    Returns:
+        Union[int, None]: the claim ID, or None if the User is banned, already requested the Video or the Video was requested too many times
+
+    Raises:
+        requests.HTTPError: any other answer (HTTP 5xx, 429), the claim can be sent again
+    """
     headers = {"Authorization": f"Bearer {access_token}"}
-    r_post_user = requests.post(
-        os.path.join(settings.API_PREFIX, "users"), json=user.dict(), headers=headers
+    r_post_claim = get_session(settings=settings).post(
+        f"{settings.API_PREFIX}/mentions/claims",
+        json=claim.dict(),
+        headers=headers,
+        timeout=_timeout(settings),
+    )
+    if r_post_claim.status_code == 401:
+        raise UnauthorizedError("Access token refused")
+    if r_post_claim.status_code == 200:
+        return r_post_claim.json()["id"]
+    if r_post_claim.status_code in (403, 409):
+        return None
+    raise requests.HTTPError(
+        f"Mention '{claim.mention_tweet_id}' can not be claimed : HTTP {r_post_claim.status_code}",
+        response=r_post_claim,
     )
-    if r_post_user.status_code == 200:
-        return True
-    return False
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
-def create_videouserlink(
+@resilient(BACKEND, tries=3, logger=logger, skip=UnauthorizedError)
+def claim_mentions(
     settings: config.Settings,
     access_token: str,
-    videouserlink: schemas.VideoUserLinkCreate,
-    screen_name: str,
-) -> bool:
-    """Create a link between a User and Video
+    claims: List[schemas.MentionClaimCreate],
+) -> List[Union[int, None]]:
+    """Reserve the requests of several mentions in one request (and one
+    transaction of the backend), each one checked like by "claim_mention"
 
     Args:
         settings (config.Settings): bot settings
         access_token (str): API access token
-        videouserlink (schemas.VideoUserLinkCreate): schemas.VideoUserLinkCreate instance
-        screen_name (str): User screen_name
+        claims (List[schemas.MentionClaimCreate]): schemas.MentionClaimCreate instances
 
     Returns:
-        bool: True if the VideoUserLink is created or already exists, False either
+        List[Union[int, None]]: by claim, in order, the claim ID or None if refused
+
+    Raises:
+        requests.HTTPError: the batch failed as a whole (HTTP 5xx, 429, 422), the claims can be sent again
     """
     headers = {"Authorization": f"Bearer {access_token}"}
-    r_post_videouserlink = requests.post(
-        os.path.join(settings.API_PREFIX, "users", screen_name, "videos_link"),
-        json=videouserlink.dict(),
+    r_post_claims = get_session(settings=settings).post(
+        f"{settings.API_PREFIX}/mentions/claims/batch",
+        json={"claims": [claim.dict() for claim in claims]},
         headers=headers,
+        timeout=_timeout(settings),
+    )
+    if r_post_claims.status_code == 401:
+        raise UnauthorizedError("Access token refused")
+    if r_post_claims.status_code == 200:
+        return [
+            result["claim"]["id"] if result["status_code"] == 200 else None
+            for result in r_post_claims.json()["results"]
+        ]
+    raise requests.HTTPError(
+        f"{len(claims)} mentions can not be claimed : HTTP {r_post_claims.status_code}",
+        response=r_post_claims,
     )
-    if r_post_videouserlink.status_code == 200:
-        return True
-    return False
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
-def get_videouserlink_by_screen_name_and_tweet_id(
-    settings: config.Settings, screen_name: str, tweet_id: str
+@resilient(BACKEND, tries=3, logger=logger, skip=UnauthorizedError)
+def confirm_claim(
+    settings: config.Settings, access_token: str, claim_id: int, reply_tweet_id: str
 ) -> bool:
-    """Get a link between a User and a Video
+    """Set the reply Tweet ID of a claim
 
     Args:
         settings (config.Settings): bot settings
-        screen_name (str): User screen_name
-        tweet_id (str): Video tweet_id
+        access_token (str): API access token
+        claim_id (int): claim ID
+        reply_tweet_id (str): reply Tweet ID
 
     Returns:
-        bool: True if the link exists, False either
+        bool: True if the claim is confirmed, False if refused (claim deleted, confirmed with another reply)
+
+    Raises:
+        requests.HTTPError: any other answer (HTTP 5xx, 429), the confirmation can be sent again
     """
-    r_get_videouserlink = requests.get(
-        os.path.join(settings.API_PREFIX, "users", screen_name, "videos_link", tweet_id)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    r_patch_claim = get_session(settings=settings).patch(
+        f"{settings.API_PREFIX}/mentions/claims/{claim_id}",
+        json={"reply_tweet_id": reply_tweet_id},
+        headers=headers,
+        timeout=_timeout(settings),
     )
-    if r_get_videouserlink.status_code == 200:
+    if r_patch_claim.status_code == 401:
+        raise UnauthorizedError("Access token refused")
+    if r_patch_claim.status_code == 200:
         return True
-    return False
+    if r_patch_claim.status_code in (400, 404, 409, 422):
+        return False
+    raise requests.HTTPError(
+        f"Claim '{claim_id}' can not be confirmed : HTTP {r_patch_claim.status_code}",
+        response=r_patch_claim,
+    )
 
 
 @exception(logger)
-@retry(Exception, tries=1, delay=3, logger=logger)
-def get_video_count_by_tweet_id(
-    settings: config.Settings, tweet_id: str
-) -> Union[int, None]:
-    """Get the number of time a Video is requested
+@resilient(BACKEND, tries=3, logger=logger, skip=UnauthorizedError)
+def release_claim(settings: config.Settings, access_token: str, claim_id: int) -> bool:
+    """Delete a claim when no reply was sent
 
     Args:
         settings (config.Settings): bot settings
-        tweet_id (str): Video tweet_id
+        access_token (str): API access token
+        claim_id (int): claim ID
 
     Returns:
-        Union[int, None]: The number of times a Video is requested, or None if the Video was not requested
+        bool: True if the claim is deleted, False either
     """
-    r_videos_count = requests.get(
-        os.path.join(settings.API_PREFIX, "videos", tweet_id, "videos_count")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    r_delete_claim = get_session(settings=settings).delete(
+        f"{settings.API_PREFIX}/mentions/claims/{claim_id}",
+        headers=headers,
+        timeout=_timeout(settings),
     )
-    if r_videos_count.status_code == 200:
-        return r_videos_count.json()["videos_count"]
-    return None
+    if r_delete_claim.status_code == 401:
+        raise UnauthorizedError("Access token refused")
+    if r_delete_claim.status_code == 200:
+        return True
+    return False
 
 
 @exception(logger)
-@retry(Exception, tries=1, delay=3, logger=logger)
+@resilient(BACKEND, tries=1, logger=logger)
 def get_bearer_token(settings: config.Settings) -> Union[None, str]:
-    r_post_login = requests.post(
-        os.path.join(settings.API_PREFIX, "auth", "login"),
+    """Get an API access token (prefer "auth_tools.get_token_manager" to reuse it)
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        Union[None, str]: the access token, or None if the login failed
+    """
+    r_post_login = get_session(settings=settings).post(
+        f"{settings.API_PREFIX}/auth/login",
         data={"username": settings.ADMIN_USERNAME, "password": settings.ADMIN_PASSWORD},
+        timeout=_timeout(settings),
     )
 
     if r_post_login.status_code == 200:
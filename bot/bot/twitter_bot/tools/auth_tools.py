@@ -0,0 +1,189 @@
+from twitter_bot import logger, config
+from twitter_bot.tools import api_tools
+from twitter_bot.tools.error_tools import exception, UnauthorizedError
+
+import base64
+import json
+import threading
+import time
+from typing import Any, Callable, Union
+
+
+@exception(logger)
+def get_token_expiry(token: str) -> Union[int, None]:
+    """Read the "exp" claim of a JWT access token (the signature is not checked,
+    the backend does it)
+
+    Args:
+        token (str): JWT access token
+
+    Returns:
+        Union[int, None]: expiry timestamp, or None if the token can not be decoded
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class BearerTokenManager:
+    """Keep the backend access token and reuse it until shortly before it expires
+
+    The token is refreshed in the background "TOKEN_REFRESH_BEFORE" seconds before
+    its expiry, and is not used anymore "TOKEN_EXPIRY_MARGIN" seconds before it.
+    Only one login request runs at a time, concurrent callers wait for its token.
+    """
+
+    def __init__(self, settings: config.Settings):
+        self.settings = settings
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+        self.logins = 0
+        self.reused = 0
+        self.unauthorized = 0
+
+    def get_token(self) -> Union[str, None]:
+        """Get a valid access token, login if needed
+
+        Returns:
+            Union[str, None]: the access token, or None if the login failed
+        """
+        token = self._valid_token()
+        if token is None:
+            with self._lock:
+                token = self._valid_token()
+                if token is None:
+                    return self._login()
+        self.reused += 1
+        return token
+
+    def invalidate(self, token: str) -> None:
+        """Forget a token refused by the backend
+
+        Args:
+            token (str): the refused access token
+        """
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+
+    def call(self, func: Callable[..., Any], **kwargs) -> Any:
+        """Call func with an access token ("access_token" keyword argument),
+        if the backend refuses the token, call it again once with a new token
+
+        Args:
+            func (Callable[..., Any]): a function taking an "access_token" argument
+            **kwargs: other arguments of func
+
+        Raises:
+            UnauthorizedError: the backend refused the new token too
+
+        Returns:
+            Any: func result
+        """
+        token = self.get_token()
+        try:
+            return func(access_token=token, **kwargs)
+        except UnauthorizedError:
+            self.unauthorized += 1
+            logger.warning("Access token refused, login again")
+            self.invalidate(token)
+            return func(access_token=self.get_token(), **kwargs)
+
+    def stats(self) -> dict:
+        """Get the token manager counters
+
+        Returns:
+            dict: login requests, tokens reused, tokens refused and seconds before expiry
+        """
+        return {
+            "logins": self.logins,
+            "reused": self.reused,
+            "unauthorized": self.unauthorized,
+            "expires_in": max(int(self._expires_at - time.time()), 0),
+        }
+
+    def close(self) -> None:
+        """Cancel the background refresh"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _valid_token(self) -> Union[str, None]:
+        if (
+            self._token is not None
+            and time.time() < self._expires_at - self.settings.TOKEN_EXPIRY_MARGIN
+        ):
+            return self._token
+        return None
+
+    def _login(self) -> Union[str, None]:
+        # self._lock must be held
+        self.logins += 1
+        token = api_tools.get_bearer_token(settings=self.settings)
+        if token is None:
+            self._token, self._expires_at = None, 0
+            return None
+
+        # A token without "exp" is used once
+        self._token, self._expires_at = token, get_token_expiry(token) or 0
+        self._schedule_refresh()
+        return token
+
+    def _schedule_refresh(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._expires_at:
+            return
+        delay = self._expires_at - self.settings.TOKEN_REFRESH_BEFORE - time.time()
+        if delay > 0:
+            self._timer = threading.Timer(delay, self._background_refresh)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                self._login()
+                logger.info("Access token refreshed in background")
+            except Exception:
+                logger.exception("Access token background refresh failed")
+
+
+# Token managers, by backend and admin
+_token_managers = {}
+_token_managers_lock = threading.Lock()
+
+
+def get_token_manager(settings: config.Settings) -> BearerTokenManager:
+    """Get the process token manager of the settings backend and admin
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        BearerTokenManager: the token manager
+    """
+    key = (settings.API_PREFIX, settings.ADMIN_USERNAME)
+    with _token_managers_lock:
+        token_manager = _token_managers.get(key)
+        if token_manager is None:
+            token_manager = BearerTokenManager(settings=settings)
+            _token_managers[key] = token_manager
+        return token_manager
+
+
+def clear_token_managers() -> None:
+    """Remove the token managers (and cancel their background refresh)"""
+    with _token_managers_lock:
+        for token_manager in _token_managers.values():
+            token_manager.close()
+        _token_managers.clear()
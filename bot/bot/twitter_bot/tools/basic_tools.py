@@ -1,4 +1,5 @@
 from twitter_bot import logger
+from twitter_bot.tools import text_tools
 from twitter_bot.tools.error_tools import exception
 
 from datetime import datetime, timezone
@@ -20,6 +21,7 @@ def get_timestamp_utc() -> int:
 @exception(logger)
 def clean_text(text: str) -> str:
     """Remove leading "@" + empty strings from text + http links
+    (see "text_tools.clean_text")
 
     Args:
         text (str): a text
@@ -27,21 +29,4 @@ def clean_text(text: str) -> str:
     Returns:
         str: a cleaned text
     """
-    text_split = text.split(" ")
-    text_split_copy = [x for x in text_split if x]
-
-    leading_at_removed = False
-    for word in text_split:
-        if word:
-            if word.startswith("http"):
-                text_split_copy.remove(word)
-                continue
-
-            if not leading_at_removed:
-                if not word.startswith("@"):
-                    leading_at_removed = True
-                else:
-                    text_split_copy.remove(word)
-
-    new_text = " ".join(text_split_copy)
-    return new_text
+    return text_tools.clean_text(text)
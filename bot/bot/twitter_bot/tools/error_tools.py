@@ -1,9 +1,22 @@
 import logging
-import time
 from sys import stdout
 from functools import wraps
 
 
+class UnauthorizedError(Exception):
+    """The backend refused the access token (HTTP 401)"""
+
+
+class Deferred(Exception):
+    """The call can not be made now, it should be made again at "retry_at"
+    (timestamp). Not an error : it is not logged by "exception"
+    """
+
+    def __init__(self, message: str, retry_at: float):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
 def get_logger(logger_name: str) -> logging.Logger:
     # Création du logger
     logger = logging.getLogger(logger_name)
@@ -28,6 +41,8 @@ def exception(logger):
         def wrapper(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
+            except Deferred:
+                raise
             except:
                 issue = "exception in " + func.__name__ + "\n"
                 issue = issue + "=============\n"
@@ -37,44 +52,3 @@ def exception(logger):
         return wrapper
 
     return decorator
-
-
-def retry(ExceptionToCheck, tries=4, delay=3, backoff=2, logger=None):
-    """Retry calling the decorated function using an exponential backoff.
-    http://www.saltycrane.com/blog/2009/11/trying-out-retry-decorator-python/
-    original from: http://wiki.python.org/moin/PythonDecoratorLibrary#Retry
-    :param ExceptionToCheck: the exception to check. may be a tuple of
-        exceptions to check
-    :type ExceptionToCheck: Exception or tuple
-    :param tries: number of times to try (not retry) before giving up
-    :type tries: int
-    :param delay: initial delay between retries in seconds
-    :type delay: int
-    :param backoff: backoff multiplier e.g. value of 2 will double the delay
-        each retry
-    :type backoff: int
-    :param logger: logger to use. If None, print
-    :type logger: logging.Logger instance
-    """
-
-    def deco_retry(f):
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            mtries, mdelay = tries, delay
-            while mtries > 1:
-                try:
-                    return f(*args, **kwargs)
-                except ExceptionToCheck as e:
-                    msg = "%s, Retrying in %d seconds..." % (str(e), mdelay)
-                    if logger:
-                        logger.warning(msg)
-                    else:
-                        print(msg)
-                    time.sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
-            return f(*args, **kwargs)
-
-        return f_retry  # true decorator
-
-    return deco_retry
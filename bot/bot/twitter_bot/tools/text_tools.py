@@ -0,0 +1,162 @@
+from twitter_bot import logger
+from twitter_bot.tools.error_tools import exception
+
+import bisect
+from typing import Any, Iterable, Union
+
+# Entities removed from the text : always for the links, only at its start
+# for the mentions
+_LINK_ENTITIES = ("urls", "media")
+_MENTION_ENTITIES = ("user_mentions",)
+
+
+def _clean_words(text: str) -> str:
+    # One pass over the words : links dropped, leading mentions dropped
+    words = []
+    leading = True
+    for word in text.split(" "):
+        if not word or word.startswith("http"):
+            continue
+        if leading:
+            if word.startswith("@"):
+                continue
+            leading = False
+        words.append(word)
+    return " ".join(words)
+
+
+def _clean_slices(
+    text: str, display_text_range: Union[list, None], entities: dict
+) -> Union[str, None]:
+    # Slices of the text between the removed entities, None if the offsets
+    # do not match the text (entities of another text, or of another encoding)
+    start, end = display_text_range or (0, len(text))
+    if not 0 <= start <= end <= len(text):
+        return None
+    spans = [
+        (*entity["indices"], False)
+        for kind in _LINK_ENTITIES
+        for entity in entities.get(kind) or ()
+    ]
+    spans += [
+        (*entity["indices"], True)
+        for kind in _MENTION_ENTITIES
+        for entity in entities.get(kind) or ()
+    ]
+    spans.sort()
+
+    pieces = []
+    cursor = start
+    leading = True
+    # The reply mentions, before the displayed text, are already cut
+    for index in range(bisect.bisect_left(spans, (start,)), len(spans)):
+        span_start, span_end, is_mention = spans[index]
+        if span_start >= end:
+            # After the displayed text (media link)
+            break
+        if span_start < cursor:
+            # Overlapping a removed entity
+            continue
+        if span_end > len(text) or text[span_start] not in (
+            "@＠" if is_mention else "h"
+        ):
+            return None
+        blank = cursor == span_start or text[cursor:span_start].isspace()
+        if is_mention:
+            if leading and blank:
+                cursor = span_end
+            else:
+                # Kept, in the next slice
+                leading = False
+            continue
+        if not blank:
+            leading = False
+        pieces.append(text[cursor:span_start])
+        cursor = min(span_end, end)
+    pieces.append(text[cursor:end])
+    return " ".join(word for word in "".join(pieces).split(" ") if word)
+
+
+def _clean(
+    text: str,
+    display_text_range: Union[list, None] = None,
+    entities: Union[dict, None] = None,
+) -> str:
+    if entities is not None:
+        cleaned = _clean_slices(text, display_text_range, entities)
+        if cleaned is not None:
+            return cleaned
+    return _clean_words(text)
+
+
+def _status_text(status: Any) -> tuple:
+    # (text, display_text_range, entities) of a tweepy status or status record
+    if hasattr(status, "full_text"):
+        text = status.full_text
+    else:
+        text = status.text
+    return (
+        text,
+        getattr(status, "display_text_range", None),
+        getattr(status, "entities", None),
+    )
+
+
+@exception(logger)
+def clean_text(
+    text: str,
+    display_text_range: Union[list, None] = None,
+    entities: Union[dict, None] = None,
+) -> str:
+    """Remove leading "@" mentions, http links and empty strings from text.
+    With the tweet entities, the text is sliced at their offsets, without
+    splitting it into words
+
+    Args:
+        text (str): a text
+        display_text_range (Union[list, None], optional): [start, end] of the displayed text (without the reply mentions and the media link). Defaults to None.
+        entities (Union[dict, None], optional): tweet entities of the text ("user_mentions", "urls", "media", with their "indices"). Defaults to None.
+
+    Returns:
+        str: a cleaned text
+    """
+    return _clean(text, display_text_range, entities)
+
+
+@exception(logger)
+def clean_status_text(status: Any) -> str:
+    """Get the cleaned text of a status, using its entities if it has any
+
+    Args:
+        status (Any): a tweepy status or a status record
+
+    Returns:
+        str: a cleaned text
+    """
+    return _clean(*_status_text(status))
+
+
+@exception(logger)
+def clean_texts(texts: Iterable[str]) -> list:
+    """Clean texts, for replays and backfills
+
+    Args:
+        texts (Iterable[str]): texts
+
+    Returns:
+        list: cleaned texts, in the same order
+    """
+    return [_clean_words(text) for text in texts]
+
+
+@exception(logger)
+def clean_status_texts(statuses: Iterable[Any]) -> list:
+    """Get the cleaned texts of statuses, for replays and backfills
+
+    Args:
+        statuses (Iterable[Any]): tweepy statuses or status records
+
+    Returns:
+        list: cleaned texts, in the same order
+    """
+    return [_clean(*_status_text(status)) for status in statuses]
@@ -1,16 +1,60 @@
-from twitter_bot import logger, config, schemas
-from twitter_bot.tools import basic_tools, api_tools
-from twitter_bot.tools.error_tools import exception, retry
-
+from twitter_bot import (
+    logger,
+    config,
+    bans,
+    batcher,
+    schemas,
+    resilience,
+    ratelimit,
+    metrics,
+    outbox,
+    rules,
+    store,
+    taskgraph,
+)
+from twitter_bot.cache import LRUCache
+from twitter_bot.singleflight import SingleFlight
+from twitter_bot.tools import api_tools, auth_tools, text_tools
+from twitter_bot.tools.error_tools import exception
+
+import contextvars
 import os
-from typing import Union
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Union
 
 import tweepy
+from requests.adapters import HTTPAdapter
+
+# tweepy API instances, by credentials
+_twitter_apis = {}
+_twitter_apis_lock = threading.Lock()
+_twitter_apis_counts = {"hits": 0, "misses": 0}
+
+# Token taken ahead of a call, by endpoint : {endpoint: True once used}
+_reserved_tokens = contextvars.ContextVar("reserved_tokens", default=None)
+
+# Resolved parent tweets, by tweet ID
+_caches = {}
+_caches_lock = threading.Lock()
+
+# Concurrent parent tweet resolutions, by tweet ID
+_single_flight = SingleFlight()
+
+# Errors caused by the request, not by Twitter : not retried, and not counted
+# by the circuit breakers
+TWITTER_CLIENT_ERRORS = (
+    tweepy.errors.BadRequest,
+    tweepy.errors.Forbidden,
+    tweepy.errors.NotFound,
+)
 
 
 @exception(logger)
 def get_twitter_api(settings: config.Settings) -> tweepy.API:
-    """Get tweepy API instance
+    """Get tweepy API instance, only one instance is created by credentials
+    so its HTTP session (and the connections of the session) are reused
 
     Args:
         settings (config.Settings): bot settings
@@ -18,18 +62,134 @@ def get_twitter_api(settings: config.Settings) -> tweepy.API:
     Returns:
         tweepy.API: tweepy api instance
     """
-    auth = tweepy.OAuth1UserHandler(
+    credentials = (
         settings.TWITTER_API_KEY,
         settings.TWITTER_API_KEY_SECRET,
         settings.TWITTER_ACCESS_TOKEN,
         settings.TWITTER_ACCESS_TOKEN_SECRET,
     )
-    twitter_api = tweepy.API(auth, wait_on_rate_limit=True)
-    return twitter_api
+    with _twitter_apis_lock:
+        twitter_api = _twitter_apis.get(credentials)
+        if twitter_api is not None:
+            _twitter_apis_counts["hits"] += 1
+            return twitter_api
+
+        auth = tweepy.OAuth1UserHandler(*credentials)
+        # Rate limits are handled by "ratelimit" : no thread sleeps until a reset
+        twitter_api = tweepy.API(auth, wait_on_rate_limit=False)
+        # One connection by worker, the workers share the session
+        twitter_api.session.mount(
+            "https://", HTTPAdapter(pool_maxsize=settings.WORKERS_COUNT)
+        )
+        twitter_api.session.hooks["response"].append(
+            ratelimit.get_rate_limiter(settings=settings).response_hook(
+                credentials=settings.TWITTER_ACCESS_TOKEN
+            )
+        )
+        _twitter_apis[credentials] = twitter_api
+        _twitter_apis_counts["misses"] += 1
+        logger.info("tweepy API instance created")
+        return twitter_api
+
+
+def get_twitter_api_stats() -> dict:
+    """Get the tweepy API instances statistics
+
+    Returns:
+        dict: instances count, instances reused, HTTP requests sent and connections opened
+    """
+    requests_count, connections_count = 0, 0
+    with _twitter_apis_lock:
+        for twitter_api in _twitter_apis.values():
+            for adapter in twitter_api.session.adapters.values():
+                pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+                if pools is None:
+                    continue
+                for key in pools.keys():
+                    pool = pools[key]
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+        return {
+            "clients": len(_twitter_apis),
+            "hits": _twitter_apis_counts["hits"],
+            "misses": _twitter_apis_counts["misses"],
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused_connections": requests_count - connections_count,
+        }
+
+
+def clear_twitter_api_cache() -> None:
+    """Remove the tweepy API instances (and close their sessions)"""
+    with _twitter_apis_lock:
+        for twitter_api in _twitter_apis.values():
+            twitter_api.session.close()
+        _twitter_apis.clear()
+        _twitter_apis_counts["hits"] = 0
+        _twitter_apis_counts["misses"] = 0
+
+
+@contextmanager
+def rate_limited(settings: config.Settings, endpoint: str):
+    """Take a token of the endpoint before calling it, and turn a HTTP 429
+    into "ratelimit.RateLimited"
+
+    Args:
+        settings (config.Settings): bot settings
+        endpoint (str): endpoint called
+
+    Raises:
+        ratelimit.RateLimited: the rate limit of the endpoint is reached
+    """
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    reserved_tokens = _reserved_tokens.get()
+    if reserved_tokens is not None and reserved_tokens.get(endpoint) is False:
+        reserved_tokens[endpoint] = True
+    else:
+        rate_limiter.acquire(
+            credentials=settings.TWITTER_ACCESS_TOKEN, endpoint=endpoint
+        )
+    try:
+        yield
+    except tweepy.errors.TooManyRequests:
+        raise ratelimit.RateLimited(
+            f"Rate limit of '{endpoint}' reached (HTTP 429)",
+            retry_at=rate_limiter.retry_at(
+                credentials=settings.TWITTER_ACCESS_TOKEN, endpoint=endpoint
+            ),
+        )
+
+
+@contextmanager
+def reserved_token(settings: config.Settings, endpoint: str):
+    """Take a token of the endpoint ahead of the call : the first call of the
+    endpoint in the block uses it, it is given back if the call is not made
+
+    Args:
+        settings (config.Settings): bot settings
+        endpoint (str): endpoint called
+
+    Raises:
+        ratelimit.RateLimited: the rate limit of the endpoint is reached
+    """
+    rate_limiter = ratelimit.get_rate_limiter(settings=settings)
+    rate_limiter.acquire(credentials=settings.TWITTER_ACCESS_TOKEN, endpoint=endpoint)
+    reserved_tokens = {endpoint: False}
+    token = _reserved_tokens.set(reserved_tokens)
+    try:
+        yield
+    finally:
+        _reserved_tokens.reset(token)
+        if not reserved_tokens[endpoint]:
+            rate_limiter.refund(
+                credentials=settings.TWITTER_ACCESS_TOKEN, endpoint=endpoint
+            )
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=3, logger=logger)
+@resilience.resilient(
+    resilience.TWITTER_READ, tries=3, skip=TWITTER_CLIENT_ERRORS, logger=logger
+)
 def get_status(
     settings: config.Settings, tweet_id: Union[str, int]
 ) -> tweepy.models.Status:
@@ -42,7 +202,8 @@ def get_status(
         tweepy.models.Status: a tweet status
     """
     twitter_api = get_twitter_api(settings=settings)
-    status = twitter_api.get_status(id=str(tweet_id), tweet_mode="extended")
+    with rate_limited(settings=settings, endpoint=ratelimit.GET_STATUS):
+        status = twitter_api.get_status(id=str(tweet_id), tweet_mode="extended")
     logger.info(f"Status with ID : '{tweet_id}' found")
     return status
 
@@ -119,11 +280,7 @@ def extract_infos_from_status(status: tweepy.models.Status) -> dict:
     tweet_info["user_id"] = str(status.user.id)
     tweet_info["screen_name"] = status.user.screen_name.lower()
     tweet_info["screen_name_at"] = f"@{status.user.screen_name.lower()}"
-    if hasattr(status, "full_text"):
-        text = status.full_text
-    else:
-        text = status.text
-    tweet_info["text"] = basic_tools.clean_text(text)
+    tweet_info["text"] = text_tools.clean_status_text(status)
     logger.debug(f"Infos from Status with ID : '{tweet_info['tweet_id']}' extracted")
     return tweet_info
 
@@ -145,7 +302,13 @@ def is_possibly_sensitive(status: tweepy.models.Status) -> bool:
 
 
 @exception(logger)
-@retry(Exception, tries=3, delay=5, logger=logger)
+@resilience.resilient(
+    resilience.TWITTER_WRITE,
+    tries=3,
+    base_delay=1,
+    skip=TWITTER_CLIENT_ERRORS,
+    logger=logger,
+)
 def post_reply_status(
     settings: config.Settings, text: str, tweet_id: Union[str, int]
 ) -> str:
@@ -159,16 +322,261 @@ def post_reply_status(
         str: Reply Tweet ID
     """
     twitter_api = get_twitter_api(settings=settings)
-    status = twitter_api.update_status(status=text, in_reply_to_status_id=tweet_id)
+    with rate_limited(settings=settings, endpoint=ratelimit.POST_STATUS):
+        status = twitter_api.update_status(status=text, in_reply_to_status_id=tweet_id)
     status_id = str(status.id)
     logger.info(f"Reply sent, reply Status ID : '{status_id}'")
     return status_id
 
 
+def _get_cache(name: str, maxsize: int, ttl: int) -> LRUCache:
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(maxsize=maxsize, ttl=ttl)
+        return _caches[name]
+
+
+def get_parent_tweet_cache(settings: config.Settings) -> LRUCache:
+    """Get the process cache of resolved parent tweets
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        LRUCache: parent tweets cache
+    """
+    return _get_cache(
+        "parent_tweets", settings.PARENT_CACHE_MAXSIZE, settings.PARENT_CACHE_TTL
+    )
+
+
+def get_single_flight_stats() -> dict:
+    """Get the counters of the calls shared between concurrent mentions
+
+    Returns:
+        dict: calls made, calls coalesced and calls running
+    """
+    return _single_flight.stats()
+
+
+def clear_caches() -> None:
+    """Remove the parent tweets cache"""
+    with _caches_lock:
+        _caches.clear()
+
+
+@exception(logger)
+def resolve_parent_tweet(
+    settings: config.Settings, tweet_id: Union[str, int]
+) -> schemas.ParentTweet:
+    """Get the video of the tweet a mention replies to, and check if it can be sent.
+    The result is cached, "no video" and "sensitive" verdicts for a shorter time
+
+    Args:
+        settings (config.Settings): bot settings
+        tweet_id (Union[str, int]): parent tweet ID
+
+    Returns:
+        schemas.ParentTweet: the resolved parent tweet
+    """
+    parent = get_parent_tweet_cache(settings=settings).get(str(tweet_id))
+    if parent is not None:
+        logger.debug(f"Status with ID : '{tweet_id}' found in cache")
+        return parent
+
+    # Mentions of the same tweet received at the same time share one resolution
+    return _single_flight.do(
+        ("parent_tweet", str(tweet_id)),
+        _fetch_parent_tweet,
+        settings=settings,
+        tweet_id=tweet_id,
+    )
+
+
+def _fetch_parent_tweet(
+    settings: config.Settings, tweet_id: Union[str, int]
+) -> schemas.ParentTweet:
+    cache = get_parent_tweet_cache(settings=settings)
+    in_reply_status = get_status(settings=settings, tweet_id=tweet_id)
+    urls = get_video_urls_from_status(status=in_reply_status)
+    if not urls:
+        parent = schemas.ParentTweet(
+            tweet_id=str(tweet_id),
+            verdict=schemas.PARENT_NO_VIDEO,
+            video_url=None,
+            thumbnail_url=None,
+            screen_name=None,
+            user_id=None,
+            text=None,
+        )
+    elif is_possibly_sensitive(status=in_reply_status):
+        parent = schemas.ParentTweet(
+            tweet_id=str(tweet_id),
+            verdict=schemas.PARENT_SENSITIVE,
+            video_url=None,
+            thumbnail_url=None,
+            screen_name=None,
+            user_id=None,
+            text=None,
+        )
+    else:
+        tweet_info_reply = extract_infos_from_status(status=in_reply_status)
+        parent = schemas.ParentTweet(
+            tweet_id=tweet_info_reply["tweet_id"],
+            verdict=schemas.PARENT_VIDEO,
+            video_url=urls["video_url"],
+            thumbnail_url=urls["thumbnail_url"],
+            screen_name=tweet_info_reply["screen_name"],
+            user_id=tweet_info_reply["user_id"],
+            text=tweet_info_reply["text"],
+        )
+
+    if parent.verdict == schemas.PARENT_VIDEO:
+        cache.set(str(tweet_id), parent)
+    else:
+        cache.set(str(tweet_id), parent, ttl=settings.PARENT_CACHE_NEGATIVE_TTL)
+    return parent
+
+
+# Rejection rules of the mentions, by source : "status" (the mention), "parent"
+# (the parent tweet), "bans" (the ban list replica), "store" (the links known
+# to exist), "preflight" (the backend checks) and "token" (the API access token)
+MENTION_RULES = (
+    rules.Rule(
+        name="not_reply",
+        source="status",
+        check=lambda status, context: not get_in_reply_to_status_id(status=status),
+        message=lambda status, context: f"No reply sent, Status with ID : '{status.id}' is not a reply",
+        rejection_rate=0.05,
+    ),
+    rules.Rule(
+        name="no_video",
+        source="parent",
+        check=lambda parent, context: parent.verdict == schemas.PARENT_NO_VIDEO,
+        message=lambda parent, context: f"No reply sent to User : '{context['screen_name']}', no video in Status with ID : '{parent.tweet_id}'",
+        rejection_rate=0.15,
+    ),
+    rules.Rule(
+        name="sensitive",
+        source="parent",
+        check=lambda parent, context: parent.verdict == schemas.PARENT_SENSITIVE,
+        message=lambda parent, context: f"No reply sent to User : '{context['screen_name']}', Status with ID : '{parent.tweet_id}' has ensitive content",
+        rejection_rate=0.02,
+    ),
+    rules.Rule(
+        name="banned_replica",
+        source="bans",
+        check=lambda banned, context: bool(banned),
+        message=lambda banned, context: f"No reply sent to User : '{context['screen_name']}', this User with ID : '{context['user_id']}' is banned (ban list replica)",
+        rejection_rate=0.01,
+    ),
+    rules.Rule(
+        name="known_link",
+        source="store",
+        check=lambda known, context: known,
+        message=lambda known, context: f"No reply sent to User : '{context['screen_name']}', Video with ID '{context['parent_tweet_id']}' already requested by User (known link)",
+        rejection_rate=0.05,
+    ),
+    rules.Rule(
+        name="no_preflight",
+        source="preflight",
+        check=lambda preflight, context: preflight is None,
+        message=lambda preflight, context: f"No reply sent to User : '{context['screen_name']}', backend checks can not be made",
+        rejection_rate=0.01,
+    ),
+    rules.Rule(
+        name="banned",
+        source="preflight",
+        check=lambda preflight, context: preflight["is_banned"],
+        message=lambda preflight, context: f"No reply sent to User : '{context['screen_name']}', this User with ID : '{context['user_id']}' is banned",
+        rejection_rate=0.01,
+    ),
+    rules.Rule(
+        name="already_asked",
+        source="preflight",
+        check=lambda preflight, context: preflight["videouserlink_exists"],
+        message=lambda preflight, context: f"No reply sent to User : '{context['screen_name']}', Video with ID '{context['parent_tweet_id']}' already requested by User",
+        rejection_rate=0.05,
+    ),
+    rules.Rule(
+        name="over_cap",
+        source="preflight",
+        check=lambda preflight, context: preflight["videos_count"]
+        >= context["asked_count_max"],
+        message=lambda preflight, context: f"No reply sent to User : '{context['screen_name']}', Video with ID '{context['parent_tweet_id']}' requested to many time : {preflight['videos_count']}",
+        rejection_rate=0.05,
+    ),
+    rules.Rule(
+        name="no_token",
+        source="token",
+        check=lambda token, context: not token,
+        message=lambda token, context: f"No reply sent to User : '{context['screen_name']}', access token can not be generated",
+        rejection_rate=0.001,
+    ),
+)
+
+# Expected fetch time of the sources (seconds), before any observation
+MENTION_RULES_COSTS = {
+    "status": 0,
+    "bans": 0,
+    "store": 0,
+    "parent": 0.1,
+    "preflight": 0.02,
+    "token": 0.001,
+}
+
+_rule_engine = None
+_rule_engine_lock = threading.Lock()
+
+
+def get_rule_engine(settings: config.Settings) -> rules.RuleEngine:
+    """Get the process rule engine of the mentions
+
+    Args:
+        settings (config.Settings): bot settings
+
+    Returns:
+        rules.RuleEngine: the rule engine
+    """
+    global _rule_engine
+    with _rule_engine_lock:
+        if _rule_engine is None:
+            _rule_engine = rules.RuleEngine(
+                rules=MENTION_RULES,
+                costs=MENTION_RULES_COSTS,
+                speculate_below=settings.RULES_SPECULATE_BELOW,
+            )
+        return _rule_engine
+
+
+def clear_rule_engine() -> None:
+    """Forget the observed costs and rejection rates of the rules"""
+    global _rule_engine
+    with _rule_engine_lock:
+        _rule_engine = None
+
+
+def _measured(
+    engine: rules.RuleEngine, source: str, func: Callable[[], Any]
+) -> Callable[[], Any]:
+    def call():
+        started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            engine.observe_cost(source, time.perf_counter() - started)
+
+    return call
+
+
 @exception(logger)
 def handle_new_status(settings: config.Settings, status: tweepy.models.Status) -> bool:
     """Handle new status received
 
+    The rejection rules are checked source by source, in the order of the rule
+    engine, then the request is claimed in the backend (the only write before
+    the reply) and the reply is sent
+
     Args:
         settings (config.Settings): bot settings
         status (tweepy.models.Status): a tweet Status
@@ -176,127 +584,194 @@ def handle_new_status(settings: config.Settings, status: tweepy.models.Status) -
     Returns:
         bool: True if the a reply is sent, False either
     """
+    started = time.perf_counter()
     try:
-        # Check if the tweet is a reply to another
-        in_reply_to_status_id = get_in_reply_to_status_id(status=status)
-        if not in_reply_to_status_id:
-            return False
-
-        else:
-            # Get the reply tweet and extract the video url from it (if it exits)
-            in_reply_status = get_status(
-                settings=settings, tweet_id=in_reply_to_status_id
-            )
-            urls = get_video_urls_from_status(status=in_reply_status)
-            if not urls:
+        # Time budget of the mention, shared by all its retries
+        with resilience.deadline(settings.MENTION_DEADLINE):
+            engine = get_rule_engine(settings=settings)
+
+            # Check if the tweet is a reply to another (no call needed)
+            rule = engine.check("status", status, {})
+            if rule is not None:
+                logger.info(rule.message(status, {}))
+                metrics.MENTIONS.inc(rule.name)
                 return False
 
-            else:
-                # Extract infos from reply status
-                tweet_info = extract_infos_from_status(status=status)
-                tweet_info_reply = extract_infos_from_status(status=in_reply_status)
+            # Extract infos from status
+            tweet_info = extract_infos_from_status(status=status)
+            parent_tweet_id = str(status.in_reply_to_status_id)
+            token_manager = auth_tools.get_token_manager(settings=settings)
+            context = {
+                "screen_name": tweet_info["screen_name"],
+                "user_id": tweet_info["user_id"],
+                "parent_tweet_id": parent_tweet_id,
+                "asked_count_max": settings.ASKED_COUNT_MAX,
+            }
+            fetchers = {
+                "parent": metrics.timed_call(
+                    "parent",
+                    resolve_parent_tweet,
+                    settings=settings,
+                    tweet_id=status.in_reply_to_status_id,
+                ),
+                "preflight": metrics.timed_call(
+                    "preflight",
+                    api_tools.get_mention_preflight,
+                    settings=settings,
+                    user_id=tweet_info["user_id"],
+                    screen_name=tweet_info["screen_name"],
+                    tweet_id=parent_tweet_id,
+                    mention_tweet_id=tweet_info["tweet_id"],
+                ),
+                "token": metrics.timed_call("login", token_manager.get_token),
+            }
 
-                # Check if its sensitive
-                if is_possibly_sensitive(status=in_reply_status):
-                    logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', Status with ID : '{tweet_info_reply['tweet_id']}' has ensitive content"
-                    )
-                    return False
+            # A ban in the replica rejects the mention before any call
+            banned = bans.lookup(settings=settings, user_id=tweet_info["user_id"])
+            rule = engine.check("bans", banned, context)
+            if rule is not None:
+                logger.info(rule.message(banned, context))
+                metrics.MENTIONS.inc(rule.name)
+                return False
 
-                # Check if the user is banned
-                if api_tools.is_banned_user(
-                    settings=settings, user_id=tweet_info["user_id"]
-                ):
-                    logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', this User with ID : '{tweet_info['user_id']}' is banned"
-                    )
-                    return False
+            # A link known to exist rejects the mention before any call
+            known = store.is_known_link(
+                settings=settings,
+                screen_name=tweet_info["screen_name"],
+                tweet_id=parent_tweet_id,
+            )
+            rule = engine.check("store", known, context)
+            if rule is not None:
+                logger.info(rule.message(known, context))
+                metrics.MENTIONS.inc(rule.name)
+                return False
 
-                # Get API access token
-                api_access_token = api_tools.get_bearer_token(settings=settings)
-                if not api_access_token:
-                    logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', access token can not be generated"
-                    )
+            # A parent tweet in cache is checked before any call
+            results = {}
+            parent = get_parent_tweet_cache(settings=settings).get(parent_tweet_id)
+            if parent is not None:
+                results["parent"] = parent
+                rule = engine.check("parent", parent, context)
+                if rule is not None:
+                    logger.info(rule.message(parent, context))
+                    metrics.MENTIONS.inc(rule.name)
                     return False
 
-                # Create video in DB if it doesnt exist
-                video = schemas.VideoCreate(
-                    creator_screen_name=tweet_info_reply["screen_name"],
-                    text=tweet_info_reply["text"],
-                    thumbnail_url=urls["thumbnail_url"],
-                    tweet_id=tweet_info_reply["tweet_id"],
-                    tweet_url=urls["video_url"],
-                    creator_user_id=tweet_info_reply["user_id"],
-                    video_url=f'https://twitter.com/twitter/statuses/{tweet_info_reply["tweet_id"]}',
-                )
-                if (
-                    api_tools.create_video_if_doesnt_exist(
-                        settings=settings, access_token=api_access_token, video=video
-                    )
-                    is False
-                ):
-                    logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', the Video with ID : '{tweet_info_reply['tweet_id']}' is not in DB and can not be created"
+            # The sources are fetched in the engine order, a source starts
+            # before the verdict of the running ones if they rarely reject
+            graph = taskgraph.TaskGraph(
+                executor=taskgraph.get_executor(settings=settings)
+            )
+            waiting = engine.order(
+                source for source in fetchers if source not in results
+            )
+            running = []
+            try:
+                while waiting or running:
+                    while waiting and (not running or engine.can_speculate(running)):
+                        source = waiting.pop(0)
+                        graph.add(source, _measured(engine, source, fetchers[source]))
+                        running.append(source)
+
+                    source = next(
+                        name for name in graph.as_completed() if name in running
                     )
-                    return False
-
-                # Create user in DB if he doesnt exist
-                user = schemas.UserCreate(
-                    screen_name=tweet_info["screen_name"], user_id=tweet_info["user_id"]
+                    running.remove(source)
+                    results[source] = graph.result(source)
+                    rule = engine.check(source, results[source], context)
+                    if rule is not None:
+                        logger.info(rule.message(results[source], context))
+                        metrics.MENTIONS.inc(rule.name)
+                        return False
+            finally:
+                # A rejection cancels the calls not started
+                graph.cancel()
+
+            parent = results["parent"]
+            api_access_token = results["token"]
+
+            # The reply token is taken before the claim : without budget the
+            # mention is deferred before any write
+            with reserved_token(settings=settings, endpoint=ratelimit.POST_STATUS):
+                # Reserve the request of the Video by the User, the User and
+                # the Video are created in DB if they don't exist
+                claim = schemas.MentionClaimCreate(
+                    user=schemas.UserCreate(
+                        screen_name=tweet_info["screen_name"],
+                        user_id=tweet_info["user_id"],
+                    ),
+                    video=schemas.VideoCreate(
+                        creator_screen_name=parent.screen_name,
+                        text=parent.text,
+                        thumbnail_url=parent.thumbnail_url,
+                        tweet_id=parent.tweet_id,
+                        tweet_url=parent.video_url,
+                        creator_user_id=parent.user_id,
+                        video_url=f"https://twitter.com/twitter/statuses/{parent.tweet_id}",
+                    ),
+                    asked_count_max=settings.ASKED_COUNT_MAX,
+                    # A claim sent again (retry, replay) gets the same claim back
+                    mention_tweet_id=tweet_info["tweet_id"],
                 )
-                if (
-                    api_tools.create_user_if_doesnt_exist(
-                        settings=settings, access_token=api_access_token, user=user
-                    )
-                    is False
-                ):
+                with metrics.timed("claim"):
+                    # Sent with the claims of the other workers
+                    claim_id = batcher.claim_mention(settings=settings, claim=claim)
+                if claim_id is None:
                     logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', the User : '{tweet_info['screen_name']}' is not in DB and can not be created"
+                        f"No reply sent to User : '{tweet_info['screen_name']}', the request of Video with ID '{parent.tweet_id}' can not be claimed"
                     )
-                    return False
-
-                # Check if user already asked this video
-                if api_tools.get_videouserlink_by_screen_name_and_tweet_id(
-                    settings=settings,
-                    screen_name=tweet_info["screen_name"],
-                    tweet_id=tweet_info_reply["tweet_id"],
-                ):
-                    logger.info(
-                        f"No reply sent to User : '{tweet_info['screen_name']}', Video with ID '{tweet_info_reply['tweet_id']}' already requested by User"
+                    store.forget_link(
+                        settings=settings,
+                        screen_name=tweet_info["screen_name"],
+                        tweet_id=parent_tweet_id,
                     )
+                    metrics.MENTIONS.inc("claim_refused")
                     return False
 
-                # Check if video was asked more than settings.ASKED_COUNT_MAX times
-                video_count = api_tools.get_video_count_by_tweet_id(
-                    settings=settings, tweet_id=tweet_info_reply["tweet_id"]
-                )
-                if video_count:
-                    if video_count >= settings.ASKED_COUNT_MAX:
-                        logger.info(
-                            f"No reply sent to User : '{tweet_info['screen_name']}', Video with ID '{tweet_info_reply['tweet_id']}' requested to many time : {video_count}"
+                # Post status, release the claim if it can not be sent
+                text = f'{tweet_info["screen_name_at"]} Download link here! \n{os.path.join(settings.URL_PREFIX, parent.tweet_id)}'
+                try:
+                    with metrics.timed("reply"):
+                        reply_status_id = post_reply_status(
+                            settings=settings, text=text, tweet_id=str(status.id)
                         )
-                        return False
-
-                # Post status
-                text = f'{tweet_info["screen_name_at"]} Download link here! \n{os.path.join(settings.URL_PREFIX, tweet_info_reply["tweet_id"])}'
-                reply_status_id = post_reply_status(
-                    settings=settings, text=text, tweet_id=str(status.id)
-                )
+                except Exception:
+                    token_manager.call(
+                        api_tools.release_claim,
+                        settings=settings,
+                        claim_id=claim_id,
+                    )
+                    store.forget_link(
+                        settings=settings,
+                        screen_name=tweet_info["screen_name"],
+                        tweet_id=parent_tweet_id,
+                    )
+                    raise
 
-                # Create videouserlink in DB
-                videuserlink = schemas.VideoUserLinkCreate(
-                    tweet_id=tweet_info_reply["tweet_id"],
-                    reply_tweet_id=reply_status_id,
-                )
-                api_tools.create_videouserlink(
+            # Confirm the claim with the reply, by the outbox : the reply is
+            # sent, the User does not wait for the backend
+            with metrics.timed("confirm"):
+                outbox.defer(
                     settings=settings,
-                    access_token=api_access_token,
-                    videouserlink=videuserlink,
-                    screen_name=tweet_info["screen_name"],
+                    kind=outbox.CONFIRM_CLAIM,
+                    key=f"claim:{claim_id}",
+                    payload={"claim_id": claim_id, "reply_tweet_id": reply_status_id},
                 )
+            store.remember_link(
+                settings=settings,
+                screen_name=tweet_info["screen_name"],
+                tweet_id=parent_tweet_id,
+            )
 
-                return True
+            metrics.MENTIONS.inc("replied")
+            return True
 
+    except ratelimit.RateLimited:
+        # Handled again by the worker pool when the rate limit allows it
+        metrics.MENTIONS.inc("rate_limited")
+        raise
     except Exception as e:
+        metrics.MENTIONS.inc("error")
         logger.error(f"Error occured : {e}")
+    finally:
+        metrics.MENTION_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,391 @@
+from twitter_bot import logger
+from twitter_bot.tools.error_tools import Deferred
+
+import collections
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Union
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+_STOP = object()
+
+
+class _Reloaded:
+    """Item queued back from the spill file, "end" is the offset after its line"""
+
+    __slots__ = ("item", "end")
+
+    def __init__(self, item: Any, end: int):
+        self.item = item
+        self.end = end
+
+
+class WorkerPool:
+    """Bounded queue drained by a pool of worker threads
+
+    When the queue is full, "overflow" decides what happens to a new item :
+        - "block": the caller waits until a slot is free
+        - "drop_oldest": the oldest queued item is dropped to make room
+        - "spill": the item is written to "spill_file" and queued back later,
+          in chunks, once the queue is down to half its size. The file offset
+          only moves past an item once a worker has handled it, so a crash
+          replays the spilled items still queued or in progress
+
+    An item whose handler raises "Deferred" is parked, without holding a worker,
+    and queued again at its "retry_at" timestamp.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Any],
+        workers: int = 4,
+        maxsize: int = 1000,
+        overflow: str = "block",
+        spill_file: Union[str, None] = None,
+        serializer: Callable[[Any], dict] = None,
+        deserializer: Callable[[dict], Any] = None,
+    ):
+        """
+        Args:
+            handler (Callable[[Any], Any]): called with each item by a worker
+            workers (int, optional): worker threads. Defaults to 4.
+            maxsize (int, optional): max queued items. Defaults to 1000.
+            overflow (str, optional): policy when the queue is full, see "OVERFLOW_POLICIES". Defaults to "block".
+            spill_file (Union[str, None], optional): file of the spilled items. Defaults to None.
+            serializer (Callable[[Any], dict], optional): item to JSON. Defaults to None.
+            deserializer (Callable[[dict], Any], optional): JSON to item. Defaults to None.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy : '{overflow}', expected one of {OVERFLOW_POLICIES}"
+            )
+        if overflow == "spill" and not (spill_file and serializer and deserializer):
+            raise ValueError(
+                "'spill' overflow policy needs a spill_file, a serializer and a deserializer"
+            )
+
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.spill_file = spill_file
+        self.serializer = serializer
+        self.deserializer = deserializer
+        # Spilled items are queued back under it, a chunk at a time
+        self.low_watermark = maxsize // 2
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        # Bytes of the spill file already handled, saved to "{spill_file}.offset"
+        self._spill_offset = 0
+        # Bytes of the spill file already queued back
+        self._spill_read_offset = 0
+        # End offsets of the items queued back and not handled yet, in file order,
+        # with the handled ones waiting for the items before them
+        self._spill_in_progress = collections.deque()
+        self._spill_handled = set()
+        self._threads = []
+        self._started_at = None
+
+        # Parked items : heap of (retry_at, sequence, item)
+        self._deferred = []
+        self._deferred_sequence = itertools.count()
+        self._deferred_condition = threading.Condition()
+        self._scheduler = None
+        self._stopping = False
+
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._spilled = 0
+        self._spill_pending = 0
+        self._deferred_count = 0
+        self._busy = 0
+        self._busy_time = 0.0
+
+    def start(self) -> None:
+        """Start the worker threads, queue the items left in the spill file"""
+        self._started_at = time.monotonic()
+        if self._can_spill() and os.path.exists(self.spill_file):
+            self._spill_offset = self._read_spill_offset()
+            self._spill_read_offset = self._spill_offset
+            with open(self.spill_file, "rb") as f:
+                f.seek(self._spill_offset)
+                self._spill_pending = sum(1 for line in f if line.strip())
+            self._reload_spill()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        self._stopping = False
+        self._scheduler = threading.Thread(
+            target=self._schedule_deferred, name="worker-scheduler", daemon=True
+        )
+        self._scheduler.start()
+        logger.info(
+            f"Worker pool started : {self.workers} workers, queue size : {self.maxsize}, overflow : '{self.overflow}'"
+        )
+
+    def stop(self, timeout: Union[float, None] = None) -> None:
+        """Let the workers finish the queued items, then stop them
+
+        Args:
+            timeout (Union[float, None], optional): max time to wait for each worker. Defaults to None.
+        """
+        # Spilled items are older than the stop signal
+        while self._threads:
+            self._queue.join()
+            if not self._spill_pending:
+                break
+            self._reload_spill()
+
+        # Parked items are not waited for
+        with self._deferred_condition:
+            self._stopping = True
+            self._deferred_condition.notify()
+        if self._scheduler is not None:
+            self._scheduler.join(timeout)
+            self._scheduler = None
+        self._save_deferred()
+
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info(f"Worker pool stopped : {self.stats()}")
+
+    def submit(self, item: Any) -> bool:
+        """Queue an item for the workers, following the overflow policy
+
+        Args:
+            item (Any): item given to the handler
+
+        Returns:
+            bool: True if the item is queued (or spilled), False if it was dropped
+        """
+        with self._lock:
+            self._submitted += 1
+
+        if self.overflow == "block":
+            self._queue.put(item)
+            return True
+
+        if self.overflow == "drop_oldest":
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                    except queue.Empty:
+                        continue
+                    with self._lock:
+                        self._dropped += 1
+                    logger.warning("Queue full, oldest item dropped")
+
+        # "spill" : keep FIFO order, items wait on disk while older ones are spilled
+        if not self._spill_pending:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+        self._spill(item)
+        return True
+
+    def stats(self) -> dict:
+        """Get the pool counters
+
+        Returns:
+            dict: queue depth, worker utilization and item counters
+        """
+        with self._lock:
+            uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+            utilization = (
+                self._busy_time / (uptime * self.workers) if uptime > 0 else 0.0
+            )
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_maxsize": self.maxsize,
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "utilization": round(min(utilization, 1.0), 4),
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "spilled": self._spilled,
+                "spill_pending": self._spill_pending,
+                "deferred": self._deferred_count,
+                "deferred_pending": len(self._deferred),
+            }
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            reloaded = None
+            if isinstance(item, _Reloaded):
+                reloaded, item = item, item.item
+
+            started = time.monotonic()
+            with self._lock:
+                self._busy += 1
+            failed = False
+            try:
+                self.handler(item)
+            except Deferred as e:
+                self._defer(item, e.retry_at)
+            except Exception:
+                failed = True
+                logger.exception("Worker handler failed")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._busy -= 1
+                    self._busy_time += elapsed
+                    self._processed += 1
+                    self._failed += failed
+                if reloaded is not None:
+                    self._commit_spill(reloaded.end)
+                self._queue.task_done()
+
+            if self._spill_pending and self._queue.qsize() <= self.low_watermark:
+                self._reload_spill()
+
+    def _defer(self, item: Any, retry_at: float) -> None:
+        with self._deferred_condition:
+            heapq.heappush(
+                self._deferred, (retry_at, next(self._deferred_sequence), item)
+            )
+            self._deferred_condition.notify()
+        with self._lock:
+            self._deferred_count += 1
+        logger.info(f"Item deferred for {max(retry_at - time.time(), 0):.1f} seconds")
+
+    def _schedule_deferred(self) -> None:
+        """Queue the parked items again when their time comes"""
+        while True:
+            with self._deferred_condition:
+                while not self._stopping and (
+                    not self._deferred or self._deferred[0][0] > time.time()
+                ):
+                    timeout = (
+                        self._deferred[0][0] - time.time() if self._deferred else None
+                    )
+                    self._deferred_condition.wait(timeout)
+                if self._stopping:
+                    return
+                _, _, item = heapq.heappop(self._deferred)
+            self._queue.put(item)
+
+    def _save_deferred(self) -> None:
+        """Spill the parked items if possible (queued again at the next start),
+        they are lost otherwise"""
+        with self._deferred_condition:
+            items = [item for _, _, item in sorted(self._deferred)]
+            self._deferred = []
+        if not items:
+            return
+        if self._can_spill():
+            for item in items:
+                self._spill(item)
+            logger.info(f"{len(items)} deferred items spilled")
+        else:
+            logger.warning(f"{len(items)} deferred items dropped")
+
+    def _can_spill(self) -> bool:
+        return bool(self.spill_file and self.serializer and self.deserializer)
+
+    def _spill(self, item: Any) -> None:
+        line = json.dumps(self.serializer(item))
+        with self._spill_lock:
+            with open(self.spill_file, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                self._spilled += 1
+                self._spill_pending += 1
+
+    def _spill_offset_file(self) -> str:
+        return f"{self.spill_file}.offset"
+
+    def _read_spill_offset(self) -> int:
+        try:
+            with open(self._spill_offset_file()) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _reload_spill(self) -> None:
+        """Move as many spilled items as possible back to the queue, reading
+        the spill file from where the previous reload stopped"""
+        with self._spill_lock:
+            if not self._spill_pending or not os.path.exists(self.spill_file):
+                return
+
+            reloaded = 0
+            with open(self.spill_file, "rb") as f:
+                f.seek(self._spill_read_offset)
+                while not self._queue.full():
+                    line = f.readline()
+                    if not line:
+                        break
+                    end = self._spill_read_offset + len(line)
+                    if line.strip():
+                        item = _Reloaded(self.deserializer(json.loads(line)), end)
+                        try:
+                            self._queue.put_nowait(item)
+                        except queue.Full:
+                            break
+                        self._spill_in_progress.append(end)
+                        reloaded += 1
+                    self._spill_read_offset = end
+
+            with self._lock:
+                self._spill_pending = max(self._spill_pending - reloaded, 0)
+
+    def _commit_spill(self, end: int) -> None:
+        """Move the spill offset past the items handled, once every item
+        before them is handled too"""
+        with self._spill_lock:
+            self._spill_handled.add(end)
+            committed = self._spill_offset
+            while self._spill_in_progress and (
+                self._spill_in_progress[0] in self._spill_handled
+            ):
+                committed = self._spill_in_progress.popleft()
+                self._spill_handled.discard(committed)
+            if committed == self._spill_offset:
+                return
+            self._spill_offset = committed
+
+            with self._lock:
+                pending = self._spill_pending
+            if pending or self._spill_in_progress:
+                with open(self._spill_offset_file(), "w") as f:
+                    f.write(str(self._spill_offset))
+            else:
+                # Everything handled : the file starts over
+                open(self.spill_file, "w").close()
+                self._spill_offset = 0
+                self._spill_read_offset = 0
+                if os.path.exists(self._spill_offset_file()):
+                    os.remove(self._spill_offset_file())